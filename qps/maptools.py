@@ -101,6 +101,8 @@ class MapTools(enum.Enum):
     ZoomPixelScale = 'ZOOM_PIXEL_SCALE'
     CursorLocation = 'CURSOR_LOCATION'
     SpectralProfile = 'SPECTRAL_PROFILE'
+    SpectralProfileTransect = 'SPECTRAL_PROFILE_TRANSECT'
+    SpectralProfilePolygon = 'SPECTRAL_PROFILE_POLYGON'
     TemporalProfile = 'TEMPORAL_PROFILE'
     MoveToCenter = 'MOVE_CENTER'
     AddFeature = 'ADD_FEATURE'
@@ -159,6 +161,10 @@ class MapTools(enum.Enum):
             mapTool.sigLocationRequest.connect(lambda crs, pt, c=canvas: c.setCenter(pt))
         elif mapToolEnum == MapTools.SpectralProfile:
             mapTool = SpectralProfileMapTool(canvas, *args, **kwds)
+        elif mapToolEnum == MapTools.SpectralProfileTransect:
+            mapTool = SpectralProfileGeometryMapTool(canvas, QgsWkbTypes.LineGeometry)
+        elif mapToolEnum == MapTools.SpectralProfilePolygon:
+            mapTool = SpectralProfileGeometryMapTool(canvas, QgsWkbTypes.PolygonGeometry)
         elif mapToolEnum == MapTools.TemporalProfile:
             mapTool = TemporalProfileMapTool(canvas, *args, **kwds)
         elif mapToolEnum == MapTools.AddFeature:
@@ -586,9 +592,197 @@ class TemporalProfileMapTool(CursorLocationMapTool):
 
 
 class SpectralProfileMapTool(CursorLocationMapTool):
+    """
+    A map tool to collect spectral profiles.
+    In live-hover mode it also requests the profiles under the cursor while the mouse moves.
+    Mouse moves are throttled: sigHoverLocationRequest is emitted at most once per hover interval,
+    for the latest cursor position only, and not if the cursor stays on the same screen pixel.
+    """
+    sigHoverLocationRequest = pyqtSignal(QgsCoordinateReferenceSystem, QgsPointXY)
+    # emitted when hover requests end, e.g. because the tool was deactivated or live-hover was disabled
+    sigHoverFinished = pyqtSignal()
+
     def __init__(self, *args, **kwds):
         super(SpectralProfileMapTool, self).__init__(*args, **kwds)
 
+        self.mLiveHover: bool = False
+        self.mLastHoverPixel: Optional[QPoint] = None
+        self.mPendingHoverPixel: Optional[QPoint] = None
+        self.mHoverTimer = QTimer()
+        self.mHoverTimer.setSingleShot(True)
+        self.mHoverTimer.setInterval(50)
+        self.mHoverTimer.timeout.connect(self.emitHoverLocationRequest)
+
+    def setLiveHover(self, b: bool):
+        """
+        Enables or disables the live-hover mode
+        """
+        if not (isinstance(b, bool)):
+            raise AssertionError
+        if b == self.mLiveHover:
+            return
+        self.mLiveHover = b
+        if not b:
+            self.stopHover()
+
+    def liveHover(self) -> bool:
+        return self.mLiveHover
+
+    def setHoverInterval(self, msec: int):
+        """
+        Sets the minimum time in milliseconds between two hover location requests
+        """
+        if not (msec >= 0):
+            raise AssertionError
+        self.mHoverTimer.setInterval(msec)
+
+    def hoverInterval(self) -> int:
+        return self.mHoverTimer.interval()
+
+    def canvasMoveEvent(self, e: QgsMapMouseEvent):
+        super().canvasMoveEvent(e)
+        if not self.mLiveHover:
+            return
+        self.mPendingHoverPixel = QPoint(e.pixelPoint())
+        if not self.mHoverTimer.isActive():
+            self.mHoverTimer.start()
+
+    def emitHoverLocationRequest(self):
+        pixelPoint = self.mPendingHoverPixel
+        self.mPendingHoverPixel = None
+        if not (self.mLiveHover and isinstance(pixelPoint, QPoint)) or pixelPoint == self.mLastHoverPixel:
+            return
+        self.mLastHoverPixel = pixelPoint
+        crs = self.canvas().mapSettings().destinationCrs()
+        geoPoint: QgsPointXY = self.toMapCoordinates(pixelPoint)
+        self.sigHoverLocationRequest[QgsCoordinateReferenceSystem, QgsPointXY].emit(crs, geoPoint)
+
+    def stopHover(self):
+        """
+        Stops pending hover requests and emits sigHoverFinished
+        """
+        self.mHoverTimer.stop()
+        self.mPendingHoverPixel = None
+        self.mLastHoverPixel = None
+        self.sigHoverFinished.emit()
+
+    def deactivate(self):
+        self.stopHover()
+        super().deactivate()
+
+
+class SpectralProfileGeometryMapTool(QgsMapTool):
+    """
+    A map tool to draw the line or polygon along / within which spectral profiles are collected.
+    Left clicks add vertices, a right click or double click finishes the geometry,
+    Backspace removes the last vertex and Escape cancels the drawing.
+    """
+    sigGeometryRequest = pyqtSignal(QgsCoordinateReferenceSystem, QgsGeometry)
+
+    def __init__(self, canvas: QgsMapCanvas, geometryType: QgsWkbTypes.GeometryType = QgsWkbTypes.LineGeometry):
+        super(SpectralProfileGeometryMapTool, self).__init__(canvas)
+        if geometryType not in [QgsWkbTypes.LineGeometry, QgsWkbTypes.PolygonGeometry]:
+            raise AssertionError('geometryType needs to be LineGeometry or PolygonGeometry')
+        self.mGeometryType = geometryType
+        self.mPoints: List[QgsPointXY] = []
+        self.mRubberBand = QgsRubberBand(canvas, geometryType)
+        self.mRubberBand.setColor(QColor('red'))
+        self.mRubberBand.setWidth(2)
+        # True to ignore the left button release that follows a double click
+        self.mIgnoreRelease: bool = False
+        self.setCursor(Qt.CrossCursor)
+
+    def geometryType(self) -> QgsWkbTypes.GeometryType:
+        return self.mGeometryType
+
+    def flags(self) -> QgsMapTool.Flags:
+        return QgsMapTool.EditTool
+
+    def setStyle(self, color: QColor = None, width: int = None):
+        if isinstance(color, QColor):
+            self.mRubberBand.setColor(color)
+        if isinstance(width, int):
+            self.mRubberBand.setWidth(width)
+
+    def points(self) -> List[QgsPointXY]:
+        """
+        Returns the vertices drawn so far
+        """
+        return self.mPoints[:]
+
+    def geometry(self) -> Optional[QgsGeometry]:
+        """
+        Returns the geometry of the drawn vertices or None, if there are not enough vertices
+        """
+        if self.mGeometryType == QgsWkbTypes.LineGeometry:
+            if len(self.mPoints) < 2:
+                return None
+            return QgsGeometry.fromPolylineXY(self.mPoints)
+        else:
+            if len(self.mPoints) < 3:
+                return None
+            return QgsGeometry.fromPolygonXY([self.mPoints + [self.mPoints[0]]])
+
+    def addPoint(self, point: QgsPointXY):
+        self.mPoints.append(QgsPointXY(point))
+        self.mRubberBand.addPoint(QgsPointXY(point), True)
+        self.mRubberBand.show()
+
+    def reset(self):
+        """
+        Removes all drawn vertices
+        """
+        self.mPoints.clear()
+        self.mRubberBand.reset(self.mGeometryType)
+
+    def finish(self):
+        """
+        Emits the drawn geometry, if valid, and starts a new drawing
+        """
+        crs = self.canvas().mapSettings().destinationCrs()
+        g = self.geometry()
+        self.reset()
+        if isinstance(g, QgsGeometry):
+            self.sigGeometryRequest[QgsCoordinateReferenceSystem, QgsGeometry].emit(crs, g)
+
+    def canvasReleaseEvent(self, e: QgsMapMouseEvent):
+        if e.button() == Qt.LeftButton:
+            if self.mIgnoreRelease:
+                self.mIgnoreRelease = False
+                return
+            self.addPoint(self.toMapCoordinates(e.pos()))
+        elif e.button() == Qt.RightButton:
+            self.finish()
+
+    def canvasDoubleClickEvent(self, e: QgsMapMouseEvent):
+        if e.button() == Qt.LeftButton:
+            # Qt sends press, release, double click, release. The release of the 1st click has
+            # added the last vertex, the release that follows the double click must not start a new geometry
+            self.mIgnoreRelease = True
+            self.finish()
+
+    def canvasMoveEvent(self, e: QgsMapMouseEvent):
+        if len(self.mPoints) > 0:
+            # let the last rubberband vertex follow the cursor
+            self.mRubberBand.reset(self.mGeometryType)
+            for p in self.mPoints:
+                self.mRubberBand.addPoint(p, False)
+            self.mRubberBand.addPoint(self.toMapCoordinates(e.pos()), True)
+
+    def keyPressEvent(self, e: QKeyEvent):
+        if e.key() == Qt.Key_Escape:
+            self.reset()
+            e.ignore()
+        elif e.key() in [Qt.Key_Backspace, Qt.Key_Delete] and len(self.mPoints) > 0:
+            self.mPoints.pop()
+            self.mRubberBand.removeLastPoint()
+            e.ignore()
+
+    def deactivate(self):
+        self.reset()
+        self.mIgnoreRelease = False
+        super().deactivate()
+
 
 class QgsFeatureAction(QAction):
     """
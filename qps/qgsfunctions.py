@@ -30,6 +30,7 @@ import os
 import pathlib
 import re
 import sys
+import threading
 from json import JSONDecodeError
 from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
@@ -39,9 +40,9 @@ from qgis.PyQt.QtCore import NULL, QByteArray, QCoreApplication
 from qgis.core import (
     Qgis, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsExpression, QgsExpressionContext,
     QgsExpressionContextScope, QgsExpressionFunction, QgsExpressionNode, QgsExpressionNodeFunction, QgsFeature,
-    QgsFeatureRequest, QgsGeometry, QgsMapLayer, QgsMapToPixel, QgsMessageLog, QgsPointXY, QgsProject,
-    QgsRasterDataProvider, QgsRasterLayer)
-from .qgsrasterlayerproperties import QgsRasterLayerSpectralProperties
+    QgsFeatureRequest, QgsGeometry, QgsMapLayer, QgsMapLayerStore, QgsMessageLog, QgsPointXY, QgsProject,
+    QgsRasterDataProvider, QgsRasterLayer, QgsVectorLayer)
+from .qgsrasterlayerproperties import SpectralPropertiesCache
 from .speclib.core import is_profile_field
 from .speclib.core.spectrallibrary import FIELD_VALUES
 from .speclib.core.spectralprofile import (
@@ -50,7 +51,9 @@ from .speclib.core.spectralprofile import (
 from .speclib.io.asd import ASDBinaryFile
 from .speclib.io.spectralevolution import SEDFile
 from .speclib.io.svc import SVCSigFile
-from .utils import _geometryIsSinglePoint, aggregateArray, MapGeometryToPixel, noDataValues, rasterArray
+from .unitmodel import UnitLookup
+from .utils import _geometryIsSinglePoint, aggregateArray, CoordinateTransformCache, MapGeometryToPixel, \
+    MapLayerIndex, RasterBlockCache, rasterPixelWindow, rasterPixelWindowExtent
 
 SPECLIB_FUNCTION_GROUP = "Spectral Libraries"
 
@@ -474,65 +477,28 @@ class ExpressionFunctionUtils(object):
     @staticmethod
     def cachedNoDataValues(context: QgsExpressionContext,
                            rasterLayer: QgsRasterLayer) -> Dict[int, List[Union[float, int]]]:
-
-        k = f'nodatavalues_{rasterLayer.id()}'
-        dump = context.cachedValue(k)
-        if dump is None:
-            NODATA: Dict = noDataValues(rasterLayer)
-            dump = json.dumps(NODATA, ensure_ascii=False)
-            context.setCachedValue(k, dump)
-            return NODATA
-        else:
-            NODATA = json.loads(dump)
-            NODATA = {int(k): v for k, v in NODATA.items()}
-        return NODATA
+        """
+        Returns the no-data values of the rasterLayer.
+        Values are cached process-wide in the SpectralPropertiesCache.
+        """
+        return SpectralPropertiesCache.noDataValues(rasterLayer)
 
     @staticmethod
     def cachedScaleValues(context: QgsExpressionContext,
                           rasterLayer: QgsRasterLayer) -> Dict[int, Tuple[float, float]]:
-
-        k = f'scalevalues_{rasterLayer.id()}'
-        dump = context.cachedValue(k)
-        if dump is None:
-            SCALEVALUES: Dict = dict()
-            dp: QgsRasterDataProvider = rasterLayer.dataProvider()
-            for b in range(1, rasterLayer.bandCount() + 1):
-                SCALEVALUES[b] = (dp.bandOffset(b), dp.bandScale(b))
-            dump = json.dumps(SCALEVALUES, ensure_ascii=False)
-            context.setCachedValue(k, dump)
-            return SCALEVALUES
-        else:
-            SCALEVALUES = json.loads(dump)
-            SCALEVALUES = {int(k): v for k, v in SCALEVALUES.items()}
-        return SCALEVALUES
+        """
+        Returns the (offset, scale) values of the rasterLayer.
+        Values are cached process-wide in the SpectralPropertiesCache.
+        """
+        return SpectralPropertiesCache.scaleValues(rasterLayer)
 
     @staticmethod
     def cachedSpectralProperties(context: QgsExpressionContext, rasterLayer: QgsRasterLayer) -> dict:
         """
         Returns the spectral properties of the rasterLayer.
+        Values are cached process-wide in the SpectralPropertiesCache.
         """
-        k = ExpressionFunctionUtils.cachedSpectralPropertiesKey(rasterLayer)
-        dump = context.cachedValue(k)
-        if dump is None:
-            sp = QgsRasterLayerSpectralProperties.fromRasterLayer(rasterLayer)
-            bbl = sp.badBands()
-            wl = sp.wavelengths()
-            wlu = sp.wavelengthUnits()
-
-            if bbl.count(None) == len(bbl):
-                bbl = None
-
-            if wl.count(None) == len(wl):
-                wl = None
-
-            if wlu.count(None) == len(wlu):
-                wlu = None
-
-            dump = json.dumps(dict(bbl=bbl, wl=wl, wlu=wlu), ensure_ascii=False)
-            context.setCachedValue(k, dump)
-
-        spectral_properties = json.loads(dump)
-        return spectral_properties
+        return SpectralPropertiesCache.spectralProperties(rasterLayer)
 
     @staticmethod
     def cachedCrsTransformationKey(context: QgsExpressionContext, source_layer: QgsMapLayer) -> str:
@@ -545,35 +511,17 @@ class ExpressionFunctionUtils(object):
         layer: QgsMapLayer
     ) -> QgsCoordinateTransform:
         """
-        Returns a CRS Transformation from the context to the layer CRS
+        Returns a CRS Transformation from the context to the layer CRS.
+        Transformations are taken from the process-wide CoordinateTransformCache.
         """
-        context_crs = QgsExpression('@layer_crs').evaluate(context)
+        context_crs = context.variable('layer_crs')
         if context_crs:
             context_crs = QgsCoordinateReferenceSystem(context_crs)
         else:
             # no other CRS defined, we must assume that context and layer CRS are the same
             context_crs = layer.crs()
 
-        if True:
-            # seems there is no way to store QgsCoordinateTransform in the QgsExpressionContext
-            # so we need to create a QgsCoordinateTransformation each time
-            trans = QgsCoordinateTransform()
-            trans.setSourceCrs(context_crs)
-            trans.setDestinationCrs(layer.crs())
-            return trans
-        else:
-            # we cannot store QgsCoordinateTransform instance in the context
-            k = ExpressionFunctionUtils.cachedCrsTransformationKey(context, layer)
-            trans = context.cachedValue(k)
-            if not isinstance(trans, QgsCoordinateTransform):
-                if isinstance(context_crs, QgsCoordinateReferenceSystem) and context_crs.isValid():
-                    trans = QgsCoordinateTransform()
-                    trans.setSourceCrs(context_crs)
-                    trans.setDestinationCrs(layer.crs())
-                    context.setCachedValue(k, trans)
-                    ExpressionFunctionUtils.CONTEXT_CACHE[k] = trans
-                    # print(f'Added: {k}', flush=True)
-        return trans
+        return CoordinateTransformCache.transform(context_crs, layer.crs())
 
     @staticmethod
     def extractSpectralProfileEncoding(p: QgsExpressionFunction.Parameter,
@@ -582,6 +530,32 @@ class ExpressionFunctionUtils(object):
 
         return ProfileEncoding.fromInput(value)
 
+    @staticmethod
+    def contextLayerStores(context: QgsExpressionContext) -> List[Union[QgsMapLayerStore, QgsProject]]:
+        """
+        Returns the layer stores to search for layers in
+        """
+        stores = [QgsProject.instance()]
+        if Qgis.versionInt() >= 33000 and isinstance(context, QgsExpressionContext):
+            stores = context.layerStores() + stores
+        return stores
+
+    @staticmethod
+    def extractMapLayer(value,
+                        context: QgsExpressionContext,
+                        layerType=QgsMapLayer) -> Optional[QgsMapLayer]:
+        """
+        Extracts a QgsMapLayer instance of type layerType from a layer, layer id, layer name or layer source.
+        Layers are looked up in the MapLayerIndex of the context and project layer stores.
+        """
+        if isinstance(value, layerType):
+            return value
+        if isinstance(value, str):
+            return MapLayerIndex.findLayer(value,
+                                           stores=ExpressionFunctionUtils.contextLayerStores(context),
+                                           layerType=layerType)
+        return None
+
     @staticmethod
     def extractRasterLayer(p: QgsExpressionFunction.Parameter,
                            value,
@@ -589,24 +563,16 @@ class ExpressionFunctionUtils(object):
         """
         Extracts a QgsRasterLayer instance
         """
-        if isinstance(value, str):
-            layers = QgsExpression('@layers').evaluate(context)
-            if layers is None:
-                layers = []
-            stores = [QgsProject.instance().layerStore()]
-            if Qgis.versionInt() >= 33000:
-                stores = context.layerStores() + stores
-            for s in stores:
-                layers.extend(s.mapLayers().values())
-            layers = set(layers)
-            for lyr in layers:
-                if isinstance(lyr, QgsRasterLayer) and value in [lyr.name(), lyr.id()]:
-                    return lyr
-
-        if isinstance(value, QgsRasterLayer):
-            return value
-        else:
-            return None
+        return ExpressionFunctionUtils.extractMapLayer(value, context, layerType=QgsRasterLayer)
+
+    @staticmethod
+    def extractVectorLayer(p: QgsExpressionFunction.Parameter,
+                           value,
+                           context: QgsExpressionContext) -> QgsVectorLayer:
+        """
+        Extracts a QgsVectorLayer instance
+        """
+        return ExpressionFunctionUtils.extractMapLayer(value, context, layerType=QgsVectorLayer)
 
     @staticmethod
     def extractSpectralProfile(p: QgsExpressionFunction.Parameter,
@@ -651,9 +617,9 @@ class ExpressionFunctionUtils(object):
         for p, v in zip(f.parameters(), values):
             name = p.name()
             if re.search(name, '.*vector.*', re.I):
-                v = ExpressionFunctionUtils.extractVectorLayer(p, v)
+                v = ExpressionFunctionUtils.extractVectorLayer(p, v, context)
             elif re.search(name, '.*raster.*', re.I):
-                v = ExpressionFunctionUtils.extractRasterLayer(p, v)
+                v = ExpressionFunctionUtils.extractRasterLayer(p, v, context)
             elif re.search(name, '.*profile.*', re.I):
                 v = ExpressionFunctionUtils.extractSpectralProfileField(p, v)
             results.append(v)
@@ -734,31 +700,32 @@ class RasterArray(QgsExpressionFunction):
             bbox = e.intersect(bbox)
         else:
             # expand the bounding box to include all touched pixel
-            if True:
-                bbox = e.intersect(bbox)
-                bbox.setXMinimum(e.xMinimum() + math.floor((bbox.xMinimum() - e.xMinimum()) / resX) * resX)
-                bbox.setXMaximum(e.xMinimum() + math.ceil((bbox.xMaximum() - e.xMinimum()) / resX) * resX)
-                bbox.setYMinimum(e.yMinimum() + math.floor((bbox.yMinimum() - e.yMinimum()) / resY) * resY)
-                bbox.setYMaximum(e.yMinimum() + math.ceil((bbox.yMaximum() - e.yMinimum()) / resY) * resY)
-                bbox = e.intersect(bbox)
-        # bbox = e
+            bbox = e.intersect(bbox)
+            bbox.setXMinimum(e.xMinimum() + math.floor((bbox.xMinimum() - e.xMinimum()) / resX) * resX)
+            bbox.setXMaximum(e.xMinimum() + math.ceil((bbox.xMaximum() - e.xMinimum()) / resX) * resX)
+            bbox.setYMinimum(e.yMinimum() + math.floor((bbox.yMinimum() - e.yMinimum()) / resY) * resY)
+            bbox.setYMaximum(e.yMinimum() + math.ceil((bbox.yMaximum() - e.yMinimum()) / resY) * resY)
+            bbox = e.intersect(bbox)
+
         try:
             dp: QgsRasterDataProvider = lyrR.dataProvider()
 
-            # read the geometry bounding box only
-            array = rasterArray(dp, rect=bbox)
+            # read the pixels of the geometry bounding box from the raster block cache
+            window = rasterPixelWindow(lyrR, bbox)
+            if window is None:
+                return None
+            array = RasterBlockCache.readWindow(lyrR, window)
+            if not isinstance(array, np.ndarray):
+                return None
             nb, nl, ns = array.shape
 
-            mapUnitsPerPixel = lyrR.rasterUnitsPerPixelX()
-
             # get pixel locations within array subset
-            MG2P = MapGeometryToPixel.fromExtent(bbox, ns, nl,
-                                                 mapUnitsPerPixel=mapUnitsPerPixel,
+            MG2P = MapGeometryToPixel.fromExtent(rasterPixelWindowExtent(lyrR, window), ns, nl,
+                                                 mapUnitsPerPixel=resX,
                                                  crs=dp.crs())
             if geom.wkbType() == Qgis.WkbType.PolygonZ:
                 geom = geom.coerceToType(Qgis.WkbType.Polygon)[0]
             i_y, i_x = MG2P.geometryPixelPositions(geom, all_touched=all_touched)
-            # print(array.shape)
             if not isinstance(i_x, np.ndarray):
                 return None
             pixels = array[:, i_y, i_x]
@@ -771,41 +738,25 @@ class RasterArray(QgsExpressionFunction):
                     band = pixels[b, :]
                     pixels[b, :] = np.where(band == ndv, np.nan, band)
                 # set scaling - is already applied by QGIS API
-                # if False:
-                #    pixels[b, :] = SCALING[bandNo][0] + SCALING[bandNo][1] * pixels[b, :]
-
-            # keep only pixels where not all bands are NaN -> either masked or out of image pixel
-            is_not_all_nan = np.logical_not(np.all(np.isnan(pixels), axis=0))
-
-            # map pixel indices from the subset array to the entire-raster array
-            M2P = QgsMapToPixel(mapUnitsPerPixel,
-                                lyrR.extent().center().x(),
-                                lyrR.extent().center().y(),
-                                lyrR.width(),
-                                lyrR.height(),
-                                0)
-
-            # calculate geo-coordinates
-            px_geo_x, px_geo_y = MG2P.px2geoArrays(i_x + 0.5, i_y + 0.5)
 
-            # keep only pixels that are within the image extent
-            is_in_image = (e.xMinimum() <= px_geo_x) * (px_geo_x <= e.xMaximum()) * \
-                          (e.yMinimum() <= px_geo_y) * (px_geo_y <= e.yMaximum())
-
-            i_valid = np.where(is_in_image * is_not_all_nan)[0]
-            # i_y = i_y[i_valid]
-            # i_x = i_x[i_valid]
+            # keep only pixels where not all bands are NaN -> masked pixels
+            i_valid = np.where(np.logical_not(np.all(np.isnan(pixels), axis=0)))[0]
             if len(i_valid) == 0:
                 return None
 
             pixels = pixels[:, i_valid]
             pixels = aggregateArray(aggr, pixels, axis=1, keepdims=True)
 
-            px_geo = [QgsPointXY(x, y) for x, y in zip(px_geo_x[i_valid], px_geo_y[i_valid])]
-            # calculate pixel-coordinates in raster image
-            px_px = [M2P.transform(p) for p in px_geo]
-            px_x = [int(p.x()) for p in px_px]
-            px_y = [int(p.y()) for p in px_px]
+            i_x = i_x[i_valid]
+            i_y = i_y[i_valid]
+
+            # calculate the geo-coordinates of the pixel centers
+            px_geo_x, px_geo_y = MG2P.px2geoArrays(i_x + 0.5, i_y + 0.5)
+            px_geo = [QgsPointXY(x, y) for x, y in zip(px_geo_x, px_geo_y)]
+
+            # pixel-coordinates in raster image
+            px_x = (i_x + window.x()).tolist()
+            px_y = (i_y + window.y()).tolist()
 
             scope = QgsExpressionContextScope('raster_array_extraction')
             scope.setVariable('raster_array_px', (px_x, px_y))
@@ -898,17 +849,11 @@ class RasterProfile(QgsExpressionFunction):
             return None
 
         try:
-            spectral_properties = ExpressionFunctionUtils.cachedSpectralProperties(context, lyrR)
-            wl = spectral_properties['wl']
-            wlu = spectral_properties['wlu']
-            if isinstance(wlu, list):
-                for _wlu in wlu:
-                    if _wlu is not None:
-                        wlu = _wlu
-                        break
-            if isinstance(wlu, list):
-                wlu = None
-            bbl = spectral_properties['bbl']
+            # copy the cached lists, as the returned profile dictionaries might get modified
+            spectral_properties = SpectralPropertiesCache.entry(lyrR)
+            wl = list(spectral_properties.wl) if spectral_properties.wl else None
+            wlu = spectral_properties.wavelengthUnit
+            bbl = list(spectral_properties.bbl) if spectral_properties.bbl else None
 
             if not has_multiple_profiles:
                 results = [results]
@@ -1081,12 +1026,292 @@ class SpectralMath(QgsExpressionFunction):
         return True
 
 
+class SpectralResampling(object):
+    """
+    Resamples spectral profiles to the band settings of another sensor.
+
+    The resampling is described by a sparse spectral response matrix of shape (target bands, source bands).
+    The 'gaussian' method models each target band as gaussian spectral response function (SRF)
+    with the target band's FWHM. Target bands without FWHM, and all bands of the 'linear' method,
+    are linearly interpolated between the two neighbouring source bands.
+    Response matrices are cached process-wide for each (source axis, target axis, method).
+    """
+    METHODS = ['gaussian', 'linear']
+    MAX_ENTRIES: int = 64
+
+    # SRF weights beyond this number of standard deviations are ignored
+    GAUSS_SIGMA_RANGE: float = 3.0
+
+    _LOCK = threading.RLock()
+    _MATRICES: Dict[tuple, Any] = dict()
+
+    @staticmethod
+    def axisKey(values) -> Optional[tuple]:
+        if values is None:
+            return None
+        return tuple(float('nan') if v is None else float(v) for v in values)
+
+    @classmethod
+    def responseMatrix(cls,
+                       sourceX,
+                       targetX,
+                       targetFWHM=None,
+                       method: str = 'gaussian'):
+        """
+        Returns the sparse spectral response matrix of shape (target bands, source bands).
+        Source and target axis need to be in the same unit.
+        Rows of target bands that are not covered by the source axis are empty.
+        :param sourceX: source band wavelengths
+        :param targetX: target band wavelengths
+        :param targetFWHM: target band full width at half maximum. Required by the gaussian method.
+        :param method: 'gaussian' or 'linear'
+        :return: scipy.sparse.csr_matrix
+        """
+        method = str(method).lower()
+        if method not in cls.METHODS:
+            raise AssertionError(f'Unknown resampling method "{method}". Use one of {cls.METHODS}')
+        if method == 'linear':
+            targetFWHM = None
+
+        key = (cls.axisKey(sourceX), cls.axisKey(targetX), cls.axisKey(targetFWHM), method)
+        with cls._LOCK:
+            matrix = cls._MATRICES.pop(key, None)
+            if matrix is not None:
+                cls._MATRICES[key] = matrix
+                return matrix
+
+        matrix = cls._createResponseMatrix(np.asarray(key[0]), np.asarray(key[1]),
+                                           None if key[2] is None else np.asarray(key[2]))
+        with cls._LOCK:
+            cls._MATRICES[key] = matrix
+            while len(cls._MATRICES) > cls.MAX_ENTRIES:
+                cls._MATRICES.pop(next(iter(cls._MATRICES)))
+        return matrix
+
+    @classmethod
+    def _createResponseMatrix(cls, sourceX: np.ndarray, targetX: np.ndarray, targetFWHM: Optional[np.ndarray]):
+        from scipy.sparse import csr_matrix
+
+        # work on the sorted and valid source bands
+        iSrc = np.where(np.isfinite(sourceX))[0]
+        iSrc = iSrc[np.argsort(sourceX[iSrc], kind='stable')]
+        xSrc = sourceX[iSrc]
+
+        rows, cols, weights = [], [], []
+        for j, c in enumerate(targetX):
+            if not np.isfinite(c) or len(xSrc) == 0:
+                continue
+            fwhm = targetFWHM[j] if targetFWHM is not None else np.nan
+            if np.isfinite(fwhm) and fwhm > 0:
+                sigma = fwhm / (2 * math.sqrt(2 * math.log(2)))
+                r = cls.GAUSS_SIGMA_RANGE * sigma
+                i0 = np.searchsorted(xSrc, c - r, side='left')
+                i1 = np.searchsorted(xSrc, c + r, side='right')
+                if i1 <= i0:
+                    continue
+                w = np.exp(-0.5 * ((xSrc[i0:i1] - c) / sigma) ** 2)
+                w /= w.sum()
+                idx = iSrc[i0:i1]
+            else:
+                i = np.searchsorted(xSrc, c, side='left')
+                if i < len(xSrc) and xSrc[i] == c:
+                    idx, w = iSrc[i:i + 1], np.ones(1)
+                elif 0 < i < len(xSrc):
+                    t = (c - xSrc[i - 1]) / (xSrc[i] - xSrc[i - 1])
+                    idx, w = iSrc[i - 1:i + 1], np.asarray([1 - t, t])
+                else:
+                    continue
+            rows.append(np.full(len(idx), j))
+            cols.append(idx)
+            weights.append(w)
+
+        shape = (len(targetX), len(sourceX))
+        if len(rows) == 0:
+            return csr_matrix(shape, dtype=float)
+        return csr_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=shape)
+
+    @classmethod
+    def resampleArray(cls,
+                      Y: np.ndarray,
+                      sourceX,
+                      targetX,
+                      targetFWHM=None,
+                      method: str = 'gaussian',
+                      bbl=None) -> np.ndarray:
+        """
+        Resamples an array of profiles with shape (profiles, source bands) that share the same source axis.
+        NaN values and bad bands (bbl == 0) are excluded from the resampling.
+        :return: numpy.ndarray of shape (profiles, target bands),
+                 with NaN for target bands that are not covered by valid source bands
+        """
+        Y = np.asarray(Y, dtype=float)
+        if Y.ndim == 1:
+            return cls.resampleArray(Y.reshape((1, -1)), sourceX, targetX, targetFWHM, method, bbl)[0, :]
+
+        W = cls.responseMatrix(sourceX, targetX, targetFWHM, method)
+        valid = np.isfinite(Y)
+        if bbl is not None:
+            valid &= np.asarray([b != 0 for b in bbl], dtype=bool).reshape((1, -1))
+
+        if valid.all():
+            # single matrix product
+            result = np.asarray(W.dot(Y.T).T)
+            result[:, W.getnnz(axis=1) == 0] = np.nan
+        else:
+            numerator = np.asarray(W.dot(np.where(valid, Y, 0).T).T)
+            denominator = np.asarray(W.dot(valid.T.astype(float)).T)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result = np.where(denominator > 0, numerator / denominator, np.nan)
+        return result
+
+    @classmethod
+    def resampleProfiles(cls,
+                         profiles: List[dict],
+                         targetX,
+                         targetFWHM=None,
+                         targetXUnit: Optional[str] = None,
+                         method: str = 'gaussian') -> List[Optional[dict]]:
+        """
+        Resamples profile value dictionaries. Profiles with the same spectral setting are resampled
+        with a single matrix product.
+        :param profiles: list of profile value dictionaries
+        :param targetX: target band wavelengths
+        :param targetFWHM: target band FWHM
+        :param targetXUnit: unit of targetX and targetFWHM. Defaults to the unit of the source profile.
+        :param method: 'gaussian' or 'linear'
+        :return: list of resampled profile value dictionaries. None for profiles that cannot be resampled.
+        """
+        targetX = [np.nan if v is None else float(v) for v in targetX]
+        if targetFWHM is not None:
+            targetFWHM = [np.nan if v is None else float(v) for v in targetFWHM]
+
+        groups: Dict[tuple, List[int]] = dict()
+        for i, d in enumerate(profiles):
+            if not isinstance(d, dict) or d.get('x') is None or d.get('y') is None:
+                continue
+            if len(d['x']) == 0 or not isinstance(d['x'][0], (int, float, np.number)):
+                continue
+            bbl = d.get('bbl')
+            key = (cls.axisKey(d['x']), d.get('xUnit'), None if bbl is None else tuple(bbl))
+            groups.setdefault(key, []).append(i)
+
+        results: List[Optional[dict]] = [None] * len(profiles)
+        for (sourceX, xUnit, bbl), indices in groups.items():
+            tX, tFWHM = targetX, targetFWHM
+            if targetXUnit and xUnit and targetXUnit != xUnit:
+                # convert the target axis into the source unit
+                tX = UnitLookup.convertLengthUnit(np.asarray(targetX), targetXUnit, xUnit)
+                if tX is None:
+                    continue
+                if targetFWHM is not None:
+                    tFWHM = UnitLookup.convertLengthUnit(np.asarray(targetFWHM), targetXUnit, xUnit)
+
+            Y = np.vstack([np.asarray(profiles[i]['y'], dtype=float) for i in indices])
+            R = cls.resampleArray(Y, sourceX, tX, tFWHM, method=method, bbl=bbl)
+
+            outUnit = targetXUnit if targetXUnit else xUnit
+            for i, y in zip(indices, R):
+                is_nan = np.isnan(y)
+                results[i] = prepareProfileValueDict(x=list(targetX),
+                                                     y=y.tolist(),
+                                                     xUnit=outUnit,
+                                                     yUnit=profiles[i].get('yUnit'),
+                                                     bbl=np.where(is_nan, 0, 1) if is_nan.any() else None)
+        return results
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._MATRICES.clear()
+
+
+class SpectralResample(QgsExpressionFunction):
+    GROUP = SPECLIB_FUNCTION_GROUP
+    NAME = 'spectral_resample'
+
+    def __init__(self):
+        args = [
+            QgsExpressionFunction.Parameter('profile', optional=False),
+            QgsExpressionFunction.Parameter('target', optional=False),
+            QgsExpressionFunction.Parameter('method', optional=True, defaultValue='gaussian'),
+            QgsExpressionFunction.Parameter('encoding', optional=True, defaultValue='text'),
+        ]
+        helptext = HM.helpText(self.NAME, args)
+        super().__init__(self.NAME, args, self.GROUP, helptext)
+
+    @staticmethod
+    def targetSettings(value, context: QgsExpressionContext) -> Tuple[Optional[list], Optional[list], Optional[str]]:
+        """
+        Returns the target wavelengths, FWHM and wavelength unit from a raster layer (name, id or source),
+        a list of wavelengths or a map / profile with keys 'x', 'fwhm' and 'xUnit'.
+        """
+        lyr = ExpressionFunctionUtils.extractRasterLayer(None, value, context)
+        if isinstance(lyr, QgsRasterLayer):
+            entry = SpectralPropertiesCache.entry(lyr)
+            if entry.wavelengths is None:
+                return None, None, None
+            fwhm = entry.fwhms.tolist() if entry.fwhms is not None else None
+            return entry.wavelengths.tolist(), fwhm, entry.wavelengthUnit
+
+        if isinstance(value, (list, tuple)):
+            return list(value), None, None
+
+        if not isinstance(value, dict):
+            value = decodeProfileValueDict(value)
+        if isinstance(value, dict) and value.get('x'):
+            return list(value['x']), value.get('fwhm'), value.get('xUnit')
+        return None, None, None
+
+    def func(self, values, context: QgsExpressionContext, parent: QgsExpression, node: QgsExpressionNodeFunction):
+
+        method = str(values[2]).lower()
+        if method not in SpectralResampling.METHODS:
+            parent.setEvalErrorString(f'Unknown method "{values[2]}". Use one of {SpectralResampling.METHODS}')
+            return None
+
+        encoding = ExpressionFunctionUtils.extractSpectralProfileEncoding(self.parameters()[3], values[3], context)
+        if not isinstance(encoding, ProfileEncoding):
+            parent.setEvalErrorString('Unable to find profile encoding')
+            return None
+
+        profile = ExpressionFunctionUtils.extractSpectralProfile(self.parameters()[0], values[0], context)
+        if not isinstance(profile, dict):
+            return None
+
+        try:
+            targetX, targetFWHM, targetXUnit = self.targetSettings(values[1], context)
+            if targetX is None:
+                parent.setEvalErrorString(f'Unable to get target wavelengths from "{values[1]}"')
+                return None
+
+            result = SpectralResampling.resampleProfiles([profile], targetX, targetFWHM, targetXUnit, method)[0]
+            if result is None:
+                parent.setEvalErrorString('Unable to resample profile. Profile requires wavelength values.')
+                return None
+            if encoding != ProfileEncoding.Dict:
+                result = encodeProfileValueDict(result, encoding)
+            return result
+        except Exception as ex:
+            parent.setEvalErrorString(str(ex))
+            return None
+
+    def usesGeometry(self, node) -> bool:
+        return False
+
+    def referencedColumns(self, node) -> List[str]:
+        return [QgsFeatureRequest.ALL_ATTRIBUTES]
+
+    def handlesNull(self) -> bool:
+        return True
+
+
 def registerQgsExpressionFunctions():
     """
     Registers functions to support SpectraLibrary handling with QgsExpressions
     """
     # global QGIS_FUNCTION_INSTANCES
-    functions = [Format_Py(), SpectralMath(), SpectralData(), SpectralEncoding(), RasterArray(), RasterProfile()]
+    functions = [Format_Py(), SpectralMath(), SpectralData(), SpectralEncoding(), SpectralResample(), RasterArray(),
+                 RasterProfile()]
     if Qgis.versionInt() > 32400:
         from .speclib.processing.aggregateprofiles import createSpectralProfileFunctions
         functions.extend(createSpectralProfileFunctions())
@@ -3,8 +3,9 @@ import logging
 import os.path
 import re
 import sys
+import threading
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Pattern, Tuple, Union
+from typing import Any, Dict, List, Optional, Pattern, Set, Tuple, Union
 
 import numpy as np
 from osgeo import gdal
@@ -14,7 +15,7 @@ from qgis.PyQt.QtCore import QMetaType
 from qgis.PyQt.QtWidgets import QVBoxLayout, QWidget
 from qgis.PyQt.QtXml import QDomDocument, QDomElement
 from qgis.core import QgsDefaultValue, QgsFeature, QgsField, QgsFieldConstraints, QgsObjectCustomProperties, \
-    QgsRasterDataProvider, QgsRasterLayer, QgsVectorLayer, QgsVectorLayerCache
+    QgsProviderRegistry, QgsRasterDataProvider, QgsRasterLayer, QgsVectorLayer, QgsVectorLayerCache
 from qgis.gui import QgsAttributeTableFilterModel, QgsAttributeTableModel, QgsAttributeTableView, QgsMapCanvas
 from .unitmodel import UnitLookup
 
@@ -934,6 +935,225 @@ class QgsRasterLayerSpectralProperties(QgsObjectCustomProperties):
                 self.setBandValues(None, SpectralPropertyKeys.WavelengthUnit, wlu)
 
 
+class SpectralPropertiesCache(object):
+    """
+    A process-wide cache of parsed spectral properties and no-data values of raster layers.
+
+    Spectral properties are shared by all raster layers with the same source, data provider,
+    modification timestamp and spectral custom layer properties. No-data values are cached per layer,
+    as they can be user-defined. Entries are invalidated if a layer emits dataChanged or is removed.
+    """
+
+    class Entry(object):
+        """
+        Parsed spectral properties of a raster source
+        """
+
+        def __init__(self, properties: Optional[QgsRasterLayerSpectralProperties], bandCount: int):
+            self.bandCount: int = bandCount
+            self.wl: Optional[List[Optional[float]]] = None
+            self.wlu: Optional[List[Optional[str]]] = None
+            self.bbl: Optional[List[Optional[int]]] = None
+            self.fwhm: Optional[List[Optional[float]]] = None
+
+            if isinstance(properties, QgsRasterLayerSpectralProperties):
+                self.wl = properties.wavelengths() if anyValue(properties.wavelengths()) else None
+                self.wlu = properties.wavelengthUnits() if anyValue(properties.wavelengthUnits()) else None
+                self.bbl = properties.badBands() if anyValue(properties.badBands()) else None
+                self.fwhm = properties.fwhm() if anyValue(properties.fwhm()) else None
+
+            self.wavelengthUnit: Optional[str] = None
+            if self.wlu:
+                for u in self.wlu:
+                    if u is not None:
+                        self.wavelengthUnit = u
+                        break
+
+            self.wavelengths: Optional[np.ndarray] = None
+            if self.wl:
+                self.wavelengths = np.asarray([np.nan if v is None else v for v in self.wl], dtype=float)
+
+            self.fwhms: Optional[np.ndarray] = None
+            if self.fwhm:
+                self.fwhms = np.asarray([np.nan if v is None else v for v in self.fwhm], dtype=float)
+
+            self.badBands: Optional[np.ndarray] = None
+            if self.bbl:
+                self.badBands = np.asarray([1 if v is None else v for v in self.bbl], dtype=int)
+
+        def asDict(self) -> dict:
+            """
+            Returns the spectral properties as dictionary with keys 'wl', 'wlu' and 'bbl'.
+            Lists are copied, so the returned dictionary can be modified.
+            """
+            return dict(wl=list(self.wl) if self.wl else None,
+                        wlu=list(self.wlu) if self.wlu else None,
+                        bbl=list(self.bbl) if self.bbl else None)
+
+    class LayerRecord(object):
+        """
+        Per-layer information, i.e. the key of the shared spectral property entry and the no-data values
+        """
+
+        def __init__(self, key: Tuple, noData: Dict[int, List[Union[int, float]]],
+                     scaling: Dict[int, Tuple[float, float]]):
+            self.key: Tuple = key
+            self.noData: Dict[int, List[Union[int, float]]] = noData
+            self.scaling: Dict[int, Tuple[float, float]] = scaling
+
+    MAX_ENTRIES: int = 256
+
+    _LOCK = threading.RLock()
+    _ENTRIES: Dict[Tuple, 'SpectralPropertiesCache.Entry'] = dict()
+    _LAYERS: Dict[str, 'SpectralPropertiesCache.LayerRecord'] = dict()
+    # {layer id: (source, provider type)}, kept when a layer record is invalidated
+    _SOURCES: Dict[str, Tuple[str, str]] = dict()
+    _CONNECTED: Set[str] = set()
+
+    @staticmethod
+    def sourceTimestamp(layer: QgsRasterLayer) -> float:
+        """
+        Returns the modification timestamp of the layer source in seconds.
+        Uses the data provider timestamp, if available, or the file modification time.
+        """
+        dp: QgsRasterDataProvider = layer.dataProvider()
+        ts = dp.dataTimestamp()
+        if ts.isValid():
+            return ts.toMSecsSinceEpoch() * 0.001
+        parts = QgsProviderRegistry.instance().decodeUri(dp.name(), layer.source())
+        path = parts.get('path')
+        if isinstance(path, str) and os.path.isfile(path):
+            return os.path.getmtime(path)
+        return 0.0
+
+    @staticmethod
+    def customPropertySignature(layer: QgsRasterLayer) -> Tuple:
+        """
+        Returns the layer custom properties that can overwrite the spectral properties of the layer source.
+        """
+        rx = QgsRasterLayerSpectralProperties.combinedLookupPattern()
+        signature = []
+        for k in sorted(layer.customPropertyKeys()):
+            cleaned_key = re.sub(r'^(enmapbox|qps)/', '', k, flags=re.I)
+            if rx.match(cleaned_key):
+                signature.append((k, str(layer.customProperty(k))))
+        return tuple(signature)
+
+    @classmethod
+    def sourceKey(cls, layer: QgsRasterLayer) -> Tuple:
+        """
+        Returns the key under which the spectral properties of the layer source are stored.
+        """
+        return (layer.source(),
+                layer.providerType(),
+                cls.sourceTimestamp(layer),
+                cls.customPropertySignature(layer))
+
+    @classmethod
+    def layerRecord(cls, layer: QgsRasterLayer) -> 'SpectralPropertiesCache.LayerRecord':
+        lid = layer.id()
+        with cls._LOCK:
+            record = cls._LAYERS.get(lid)
+            if record is None:
+                from .utils import noDataValues
+                dp: QgsRasterDataProvider = layer.dataProvider()
+                scaling = {b: (dp.bandOffset(b), dp.bandScale(b)) for b in range(1, layer.bandCount() + 1)}
+                record = SpectralPropertiesCache.LayerRecord(cls.sourceKey(layer), noDataValues(dp), scaling)
+                cls._LAYERS[lid] = record
+                cls._SOURCES[lid] = record.key[0:2]
+                cls._connectLayer(layer)
+        return record
+
+    @classmethod
+    def _connectLayer(cls, layer: QgsRasterLayer):
+        lid = layer.id()
+        if lid in cls._CONNECTED:
+            return
+        cls._CONNECTED.add(lid)
+        layer.dataChanged.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid, source=True))
+        layer.customPropertyChanged.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.styleChanged.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.willBeDeleted.connect(lambda *args, _lid=lid: cls.removeLayer(_lid))
+
+    @classmethod
+    def entry(cls, layer: QgsRasterLayer) -> 'SpectralPropertiesCache.Entry':
+        """
+        Returns the cached spectral properties of a raster layer.
+        Reads them from the layer and its data source, if not already cached.
+        """
+        record = cls.layerRecord(layer)
+        with cls._LOCK:
+            e = cls._ENTRIES.get(record.key)
+            if e is None:
+                e = SpectralPropertiesCache.Entry(QgsRasterLayerSpectralProperties.fromRasterLayer(layer),
+                                                  layer.bandCount())
+                while len(cls._ENTRIES) >= cls.MAX_ENTRIES:
+                    cls._ENTRIES.pop(next(iter(cls._ENTRIES)))
+                cls._ENTRIES[record.key] = e
+        return e
+
+    @classmethod
+    def spectralProperties(cls, layer: QgsRasterLayer) -> dict:
+        """
+        Returns the spectral properties as dictionary with keys 'wl', 'wlu' and 'bbl'
+        """
+        return cls.entry(layer).asDict()
+
+    @classmethod
+    def noDataValues(cls, layer: QgsRasterLayer) -> Dict[int, List[Union[int, float]]]:
+        """
+        Returns the no-data values of each band
+        """
+        return {b: list(v) for b, v in cls.layerRecord(layer).noData.items()}
+
+    @classmethod
+    def scaleValues(cls, layer: QgsRasterLayer) -> Dict[int, Tuple[float, float]]:
+        """
+        Returns the (offset, scale) values of each band
+        """
+        return dict(cls.layerRecord(layer).scaling)
+
+    @classmethod
+    def invalidateLayer(cls, layer: Union[str, QgsRasterLayer], source: bool = False):
+        """
+        Removes the cached values of a layer.
+        :param layer: layer or layer id
+        :param source: set True to remove the cached spectral properties of the layer source as well
+        """
+        lid = layer.id() if isinstance(layer, QgsRasterLayer) else layer
+        with cls._LOCK:
+            record = cls._LAYERS.pop(lid, None)
+            if source:
+                if isinstance(record, SpectralPropertiesCache.LayerRecord):
+                    cls._ENTRIES.pop(record.key, None)
+                # the source entry can exist without a layer record, e.g. if the record was invalidated before
+                if isinstance(layer, QgsRasterLayer):
+                    src = (layer.source(), layer.providerType())
+                else:
+                    src = cls._SOURCES.get(lid)
+                if src is not None:
+                    for key in [k for k in cls._ENTRIES.keys() if k[0:2] == src]:
+                        cls._ENTRIES.pop(key)
+
+    @classmethod
+    def removeLayer(cls, layer: Union[str, QgsRasterLayer]):
+        lid = layer.id() if isinstance(layer, QgsRasterLayer) else layer
+        cls.invalidateLayer(lid, source=True)
+        with cls._LOCK:
+            cls._CONNECTED.discard(lid)
+            cls._SOURCES.pop(lid, None)
+
+    @classmethod
+    def clear(cls):
+        """
+        Removes all cached values
+        """
+        with cls._LOCK:
+            cls._ENTRIES.clear()
+            cls._LAYERS.clear()
+            cls._SOURCES.clear()
+
+
 class QgsRasterLayerSpectralPropertiesTable(QgsVectorLayer):
     """
     A container to expose spectral properties of QgsRasterLayers
@@ -492,6 +492,16 @@ class SpectralProfileFileReader(object):
 
     _STANDARD_FIELDS = None
 
+    # file signature to find the reader for a file without opening it multiple times, see sniffFile
+    # lower-case file name suffixes, e.g. ('.csv',)
+    FILE_SUFFIXES: Tuple[str, ...] = ()
+    # regular expression to match the file name with
+    FILE_NAME_PATTERN: Optional[re.Pattern] = None
+    # byte sequences the file content can start with
+    MAGIC_BYTES: Tuple[bytes, ...] = ()
+    # regular expression (bytes) to search the first bytes of the file content for
+    HEADER_PATTERN: Optional[re.Pattern] = None
+
     def __init__(self,
                  path: Union[str, Path],
                  dtg_fmt: Optional[str] = None, **kwds):
@@ -547,6 +557,54 @@ class SpectralProfileFileReader(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def hasFileSignature(cls) -> bool:
+        """
+        Returns True if the reader declares a file signature to be used by sniffFile
+        """
+        return len(cls.FILE_SUFFIXES) > 0 or cls.FILE_NAME_PATTERN is not None \
+            or len(cls.MAGIC_BYTES) > 0 or cls.HEADER_PATTERN is not None
+
+    @classmethod
+    def sniffFile(cls, path: Union[str, Path], header: bytes) -> Optional[bool]:
+        """
+        Checks if the file matches the file signature declared by the reader.
+        The file content is not read, so that the first bytes of a file need to be read only once
+        to test all readers.
+        :param path: file path
+        :param header: the first bytes of the file
+        :return: True if the file matches, False if not, None if the reader has no file signature and
+                 canReadFile needs to be called.
+        """
+        if not cls.hasFileSignature():
+            return None
+        path = Path(path)
+        if len(cls.FILE_SUFFIXES) > 0 and path.suffix.lower() not in cls.FILE_SUFFIXES:
+            return False
+        if cls.FILE_NAME_PATTERN is not None and cls.FILE_NAME_PATTERN.search(path.name) is None:
+            return False
+        if len(cls.MAGIC_BYTES) > 0 and not header.startswith(cls.MAGIC_BYTES):
+            return False
+        if cls.HEADER_PATTERN is not None and cls.HEADER_PATTERN.search(header) is None:
+            return False
+        return True
+
+    @classmethod
+    def readFiles(cls, paths: List[Union[str, Path]], **kwds) -> List[Tuple[List[QgsFeature], Optional[str]]]:
+        """
+        Reads the profiles of many files. Readers can overwrite this method to read a batch of files
+        more efficiently than file by file.
+        :param paths: file paths
+        :return: list with a (features, error) tuple for each file, in the order of the paths
+        """
+        results = []
+        for path in paths:
+            try:
+                results.append((cls(path, **kwds).asFeatures(), None))
+            except Exception as ex:
+                results.append(([], f'Unable to read {path}:\n\t{ex}'))
+        return results
+
     @staticmethod
     def standardFields() -> QgsFields:
         """
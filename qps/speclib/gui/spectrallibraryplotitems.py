@@ -1,8 +1,9 @@
 import collections
 import datetime
+import math
 import sys
 import warnings
-from typing import Any, Generator, List, Optional, Tuple, Union
+from typing import Any, Dict, Generator, List, Optional, Tuple, Union
 
 import numpy as np
 import pyqtgraph as pg
@@ -129,12 +130,29 @@ class SpectralProfilePlotItem(pg.PlotItem):
 
         # self.addLegend()
         self.mTempList = []
+        self.mHitIndex = SpectralProfileHitIndex(self)
+
+    def hitIndex(self) -> 'SpectralProfileHitIndex':
+        """
+        Returns the spatial index to find plotted profiles by position
+        """
+        return self.mHitIndex
 
     def spectralProfilePlotDataItems(self):
         for item in self.listDataItems():
             if isinstance(item, SpectralProfilePlotDataItem):
                 yield item
 
+    def spectralProfileBatchItems(self):
+        for item in self.listDataItems():
+            if isinstance(item, SpectralProfileBatchItem):
+                yield item
+
+    def spectralProfileDensityItems(self):
+        for item in self.items:
+            if isinstance(item, SpectralProfileDensityItem):
+                yield item
+
     # def addLegend(self, *args, **kwargs) -> SpectralProfilePlotLegend:
     #
     #     if self.legend is None:
@@ -358,6 +376,8 @@ class SpectralProfilePlotDataItem(PlotDataItem):
     """
     A pyqtgraph.PlotDataItem to plot a SpectralProfile
     """
+    # incremented each time the data is set, e.g. to update a SpectralProfileHitIndex
+    mDataVersion: int = 0
 
     def __init__(self, *args, **kwds):
         super().__init__(*args, **kwds)
@@ -373,6 +393,12 @@ class SpectralProfilePlotDataItem(PlotDataItem):
         self.mFeatureID: Optional[int] = None
         self.mField: Optional[str] = None
 
+        # the plotted profile data and settings, to decide if the data need to be set again
+        self.mPlotData: Optional[dict] = None
+        self.mPlotDataSettings: Optional[Tuple[bool, bool]] = None
+        # cached data bounds (x, y), used for auto-ranging
+        self.mDataBounds: Optional[Tuple[tuple, tuple]] = None
+
     def curveIsSelected(self) -> bool:
         return self.mIsSelected
 
@@ -415,6 +441,32 @@ class SpectralProfilePlotDataItem(PlotDataItem):
             if self.raiseContextMenu(ev):
                 ev.accept()
 
+    def hasProfileData(self, plot_data: dict, showBadBands: bool = True, sortBands: bool = False) -> bool:
+        """
+        Returns True if this item already shows the profile data dictionary plot_data with the same settings
+        """
+        return plot_data is self.mPlotData and (showBadBands, sortBands) == self.mPlotDataSettings
+
+    def setProfileStyle(self, plot_style: PlotStyle, label: str = None):
+        """
+        Changes the profile style and label without setting the profile data again
+        """
+        if plot_style != self.mDefaultStyle:
+            self.mDefaultStyle = plot_style
+            if self.mIsSelected and callable(self.mSelectedStyle):
+                self.setPlotStyle(self.mSelectedStyle(plot_style))
+            elif self.mIsSelected:
+                self.setPlotStyle(self.mSelectedStyle)
+            else:
+                self.setPlotStyle(plot_style)
+        if label is not None and label != self.opts.get('name'):
+            self.opts['name'] = label
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        if frac >= 1.0 and orthoRange is None and self.mDataBounds is not None:
+            return self.mDataBounds[ax]
+        return super().dataBounds(ax, frac=frac, orthoRange=orthoRange)
+
     def setProfileData(self,
                        plot_data: dict,
                        plot_style: PlotStyle,
@@ -424,13 +476,15 @@ class SpectralProfilePlotDataItem(PlotDataItem):
                        label: str = None):
 
         self.mDefaultStyle = plot_style
-        y = plot_data.get('y')
+        self.mPlotData = plot_data
+        self.mPlotDataSettings = (showBadBands, sortBands)
+        self.mDataBounds = None
+        xy = self.plotDataArrays(plot_data, showBadBands=showBadBands, sortBands=sortBands)
 
-        if y is None:
+        if xy is None:
             self.clear()
             return
-
-        x = plot_data.get('x', list(range(len(y))))
+        x, y = xy
 
         linePen = pg.mkPen(plot_style.linePen)
         symbolPen = pg.mkPen(plot_style.markerPen)
@@ -439,7 +493,41 @@ class SpectralProfilePlotDataItem(PlotDataItem):
         symbol = plot_style.markerSymbol
         symbolSize = plot_style.markerSize
 
-        if isinstance(x[0], (datetime.date, datetime.datetime)):
+        connect = np.isfinite(x) & np.isfinite(y)
+        if np.any(connect):
+            self.mDataBounds = ((np.min(x[connect]), np.max(x[connect])),
+                                (np.min(y[connect]), np.max(y[connect])))
+        else:
+            self.mDataBounds = ((None, None), (None, None))
+
+        self.setData(x=x, y=y, z=zValue,
+                     name=label,
+                     connect=connect,
+                     pen=linePen,
+                     symbol=symbol,
+                     symbolPen=symbolPen,
+                     symbolBrush=symbolBrush,
+                     symbolSize=symbolSize)
+        if self.mIsSelected:
+            # keep the selection style
+            self.mIsSelected = False
+            self.setCurveIsSelected(True)
+
+    @staticmethod
+    def plotDataArrays(plot_data: dict,
+                       showBadBands: bool = True,
+                       sortBands: bool = False) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the x and y values of a profile dictionary as float arrays, with None values and
+        bad bands (if not shown) replaced by NaN. Returns None if the profile has no y values.
+        """
+        y = plot_data.get('y')
+        if y is None:
+            return None
+
+        x = plot_data.get('x', list(range(len(y))))
+
+        if len(x) > 0 and isinstance(x[0], (datetime.date, datetime.datetime)):
             x = np.asarray(x, dtype=np.datetime64)
 
         # replace None by NaN
@@ -455,17 +543,7 @@ class SpectralProfilePlotDataItem(PlotDataItem):
             valid = np.array(plot_data['bbl'], dtype=float) > 0
             valid = valid & np.isfinite(valid)
             y = np.where(valid, y, np.nan)
-
-        connect = np.isfinite(x) & np.isfinite(y)
-
-        self.setData(x=x, y=y, z=zValue,
-                     name=label,
-                     connect=connect,
-                     pen=linePen,
-                     symbol=symbol,
-                     symbolPen=symbolPen,
-                     symbolBrush=symbolBrush,
-                     symbolSize=symbolSize)
+        return x, y
 
     def setPlotStyle(self, plotStyle: PlotStyle):
         """
@@ -512,6 +590,10 @@ class SpectralProfilePlotDataItem(PlotDataItem):
         pw.getPlotItem().addItem(self)
         return pw
 
+    def setData(self, *args, **kwds):
+        self.mDataVersion += 1
+        super().setData(*args, **kwds)
+
     def updateItems(self, *args, **kwds):
         if not self.signalsBlocked():
             super().updateItems(*args, **kwds)
@@ -574,6 +656,718 @@ class SpectralProfilePlotDataItem(PlotDataItem):
         return self.menu
 
 
+class SpectralProfileBatchItem(pg.PlotCurveItem):
+    """
+    Draws many spectral profiles that share the same plot style as a single path.
+    The profile values are concatenated, and a connect array separates the profiles. The identity of each
+    profile is kept in index arrays, which map each vertex to its profile and each profile to its feature.
+    """
+    sigProfileClicked = pyqtSignal(object, int, object)
+    sigProfileHovered = pyqtSignal(object, int, object)
+
+    # incremented each time the data is set, e.g. to update a SpectralProfileHitIndex
+    mDataVersion: int = 0
+
+    def __init__(self, *args, **kwds):
+        super().__init__(*args, **kwds)
+        self.setAcceptHoverEvents(True)
+
+        self.mStyle: PlotStyle = PlotStyle()
+        self.mVisID: Optional[str] = None
+        self.mLayerID: Optional[str] = None
+        self.mField: Optional[str] = None
+        self.mFieldIndex: Optional[int] = None
+        self.mFeatureIDs: np.ndarray = np.empty(0, dtype=np.int64)
+        self.mLabels: List[str] = []
+        # profile index of each vertex
+        self.mProfileIndex: np.ndarray = np.empty(0, dtype=np.int64)
+        # first vertex of each profile, with the total number of vertices as last value
+        self.mOffsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        self.mConnect: np.ndarray = np.empty(0, dtype=bool)
+
+    def setProfiles(self,
+                    profiles: List[Tuple[np.ndarray, np.ndarray]],
+                    featureIDs: List[int],
+                    plot_style: PlotStyle,
+                    labels: List[str] = None):
+        """
+        Sets the profiles to draw
+        :param profiles: list of (x, y) arrays, e.g. as returned by SpectralProfilePlotDataItem.plotDataArrays
+        :param featureIDs: the feature id of each profile
+        :param plot_style: the PlotStyle used to draw all profiles
+        :param labels: optional profile labels
+        """
+        self.mStyle = plot_style
+        self.mFeatureIDs = np.empty(0, dtype=np.int64)
+        self.mLabels = []
+        self.mProfileIndex = np.empty(0, dtype=np.int64)
+        self.mOffsets = np.zeros(1, dtype=np.int64)
+        self.mConnect = np.empty(0, dtype=bool)
+        self.addProfiles(profiles, featureIDs, labels=labels)
+
+    def addProfiles(self,
+                    profiles: List[Tuple[np.ndarray, np.ndarray]],
+                    featureIDs: List[int],
+                    labels: List[str] = None):
+        """
+        Appends profiles to the profiles drawn by this item
+        :param profiles: list of (x, y) arrays
+        :param featureIDs: the feature id of each profile
+        :param labels: optional profile labels
+        """
+        if not (len(profiles) == len(featureIDs)):
+            raise AssertionError
+        if labels is None:
+            labels = [''] * len(profiles)
+
+        n0 = self.profileCount()
+        lengths = np.asarray([len(y) for (_, y) in profiles], dtype=np.int64)
+        profile_index = np.repeat(np.arange(n0, n0 + len(profiles), dtype=np.int64), lengths)
+        if len(profiles) > 0:
+            x = np.concatenate([p[0] for p in profiles])
+            y = np.concatenate([p[1] for p in profiles])
+        else:
+            x = y = np.empty(0, dtype=float)
+
+        # connect a vertex to the next one, if both are finite and belong to the same profile
+        valid = np.isfinite(x) & np.isfinite(y)
+        connect = np.zeros(len(x), dtype=bool)
+        if len(x) > 1:
+            connect[:-1] = valid[:-1] & valid[1:] & (profile_index[:-1] == profile_index[1:])
+
+        if n0 > 0:
+            x = np.concatenate([self.xData, x])
+            y = np.concatenate([self.yData, y])
+        self.mFeatureIDs = np.concatenate([self.mFeatureIDs, np.asarray(featureIDs, dtype=np.int64)])
+        self.mLabels.extend(str(lbl) for lbl in labels)
+        self.mOffsets = np.concatenate([self.mOffsets, self.mOffsets[-1] + np.cumsum(lengths)])
+        self.mProfileIndex = np.concatenate([self.mProfileIndex, profile_index])
+        self.mConnect = np.concatenate([self.mConnect, connect])
+        self.setData(x=x, y=y, connect=self.mConnect, pen=pg.mkPen(self.mStyle.linePen))
+
+    def takeProfiles(self, indices: List[int]) -> List[Tuple[int, np.ndarray, np.ndarray, str]]:
+        """
+        Removes profiles from this item
+        :param indices: profile indices
+        :return: list of (feature id, x, y, label) of the removed profiles
+        """
+        indices = sorted(set(indices))
+        if len(indices) == 0:
+            return []
+        taken = []
+        for i in indices:
+            x, y = self.profileData(i)
+            taken.append((int(self.mFeatureIDs[i]), x.copy(), y.copy(), self.mLabels[i]))
+
+        keep = np.ones(self.profileCount(), dtype=bool)
+        keep[indices] = False
+        lengths = np.diff(self.mOffsets)[keep]
+        keep_vertices = keep[self.mProfileIndex]
+
+        self.mFeatureIDs = self.mFeatureIDs[keep]
+        self.mLabels = [lbl for lbl, k in zip(self.mLabels, keep) if k]
+        self.mOffsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        self.mOffsets[1:] = np.cumsum(lengths)
+        self.mProfileIndex = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        # removing entire profiles keeps the connections within the other profiles
+        self.mConnect = self.mConnect[keep_vertices]
+        self.setData(x=self.xData[keep_vertices], y=self.yData[keep_vertices],
+                     connect=self.mConnect, pen=pg.mkPen(self.mStyle.linePen))
+        return taken
+
+    def setData(self, *args, **kwds):
+        self.mDataVersion += 1
+        super().setData(*args, **kwds)
+
+    def hitIndex(self) -> Optional['SpectralProfileHitIndex']:
+        """
+        Returns the SpectralProfileHitIndex of the plot item this item is shown in
+        """
+        vb = self.getViewBox()
+        if vb is not None and isinstance(vb.parentItem(), SpectralProfilePlotItem):
+            return vb.parentItem().hitIndex()
+        return None
+
+    def plotStyle(self) -> PlotStyle:
+        return self.mStyle
+
+    def layerID(self) -> Optional[str]:
+        return self.mLayerID
+
+    def featureIDs(self) -> List[int]:
+        return self.mFeatureIDs.tolist()
+
+    def profileCount(self) -> int:
+        return len(self.mFeatureIDs)
+
+    def label(self, index: int) -> str:
+        return self.mLabels[index]
+
+    def profileData(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the x and y values of a single profile
+        """
+        i0, i1 = self.mOffsets[index], self.mOffsets[index + 1]
+        return self.xData[i0:i1], self.yData[i0:i1]
+
+    def profilesData(self) -> Generator[Tuple[np.ndarray, np.ndarray], Any, None]:
+        for i in range(self.profileCount()):
+            yield self.profileData(i)
+
+    def profileAt(self, pos: QPointF, tolerance: float = 4) -> Optional[int]:
+        """
+        Returns the index of the profile that is closest to a position in data coordinates,
+        if its distance is less than tolerance pixels. Returns None otherwise.
+        """
+        if self.xData is None or len(self.xData) == 0:
+            return None
+        index = self.hitIndex()
+        if index is not None and index.isAvailable():
+            hit = index.nearest(pos, tolerance=tolerance, items=[self])
+            return None if hit is None else hit[1]
+
+        pw = self.pixelWidth()
+        ph = self.pixelHeight()
+        if not (pw > 0 and ph > 0):
+            return None
+
+        # test only the line segments and vertices whose bounding box overlaps the tolerance rectangle
+        x = (self.xData - pos.x()) / pw
+        y = (self.yData - pos.y()) / ph
+        x0, y0, x1, y1 = x[:-1], y[:-1], x[1:], y[1:]
+        with np.errstate(invalid='ignore'):
+            segments = np.flatnonzero(self.mConnect[:-1]
+                                      & (np.fmin(x0, x1) <= tolerance) & (np.fmax(x0, x1) >= -tolerance)
+                                      & (np.fmin(y0, y1) <= tolerance) & (np.fmax(y0, y1) >= -tolerance))
+            vertices = np.flatnonzero((np.abs(x) <= tolerance) & (np.abs(y) <= tolerance))
+        if len(segments) == 0 and len(vertices) == 0:
+            return None
+
+        # distances of the candidate segments and vertices to pos, in pixel units
+        ax, ay = x[segments], y[segments]
+        dx, dy = x[segments + 1] - ax, y[segments + 1] - ay
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(-(ax * dx + ay * dy) / (dx ** 2 + dy ** 2), 0, 1)
+            t = np.where(np.isfinite(t), t, 0)
+        candidates = np.concatenate([segments, vertices])
+        dist = np.concatenate([np.hypot(ax + t * dx, ay + t * dy), np.hypot(x[vertices], y[vertices])])
+        if not np.any(np.isfinite(dist)):
+            return None
+        i = int(np.nanargmin(dist))
+        if dist[i] > tolerance:
+            return None
+        return int(self.mProfileIndex[candidates[i]])
+
+    def profilesInRect(self, rect: QRectF) -> List[int]:
+        """
+        Returns the indices of profiles with at least one vertex or line segment inside a rectangle
+        in data coordinates
+        """
+        if self.xData is None or len(self.xData) == 0:
+            return []
+        index = self.hitIndex()
+        if index is not None and index.isAvailable():
+            return sorted(index.profilesInRect(rect, items=[self]).get(self, []))
+        rect = rect.normalized()
+        inside = (self.xData >= rect.left()) & (self.xData <= rect.right()) & \
+                 (self.yData >= rect.top()) & (self.yData <= rect.bottom())
+        return np.unique(self.mProfileIndex[inside]).tolist()
+
+    def mouseClickEvent(self, ev):
+        if ev.button() != Qt.LeftButton:
+            return
+        i = self.profileAt(ev.pos())
+        if i is not None:
+            ev.accept()
+            self.sigProfileClicked.emit(self, i, ev)
+
+    def hoverEvent(self, ev):
+        if ev.isExit():
+            self.sigProfileHovered.emit(self, -1, ev)
+            return
+        i = self.profileAt(ev.pos())
+        self.sigProfileHovered.emit(self, -1 if i is None else i, ev)
+
+
+class SpectralProfileDensityItem(pg.ImageItem):
+    """
+    Shows the distribution of many spectral profiles as 2D histogram of their values per band.
+    The histogram has one column per band index, which is drawn at the mean x coordinate of the band
+    (band center) and reaches half way to the neighboured band centers. Profiles are added in chunks.
+    The y bins keep their size when a chunk exceeds the current extent, so already counted values
+    do not need to be binned again. Y bins are merged if their number exceeds MAX_BINS.
+    """
+    # number of y bins
+    BINS = 256
+    MAX_BINS = 1024
+    # maximum number of image columns used to draw the band columns at their band centers
+    MAX_COLUMNS = 4096
+
+    def __init__(self, *args, bins: int = None, colorMap: str = 'viridis', **kwds):
+        super().__init__(*args, **kwds)
+
+        self.mVisID: Optional[str] = None
+        self.mLayerID: Optional[str] = None
+        self.mField: Optional[str] = None
+        self.mFieldIndex: Optional[int] = None
+
+        self.mBins: int = int(bins) if bins else self.BINS
+        # counts[band index, y bin]
+        self.mCounts: Optional[np.ndarray] = None
+        # sum and number of the finite x values of each band index, to get the band centers
+        self.mXSum: np.ndarray = np.zeros(0, dtype=np.float64)
+        self.mXCount: np.ndarray = np.zeros(0, dtype=np.int64)
+        # lower edge of the first y bin and y bin size
+        self.mOrigin: float = 0.0
+        self.mBinSize: float = 1.0
+        self.mProfileCount: int = 0
+        self.setColorMap(colorMap)
+
+    def setColorMap(self, name: str):
+        """
+        Sets the colormap used to show the profile density. Empty bins are transparent.
+        :param name: name of a pyqtgraph colormap, e.g. 'viridis'
+        """
+        lut = pg.colormap.get(name).getLookupTable(nPts=256, alpha=True)
+        lut[0, 3] = 0
+        self.setLookupTable(lut)
+
+    def profileCount(self) -> int:
+        """
+        Returns the number of profiles added to the histogram
+        """
+        return self.mProfileCount
+
+    def counts(self) -> Optional[np.ndarray]:
+        """
+        Returns the histogram counts as array of shape (bands, y bins)
+        """
+        return self.mCounts
+
+    def bandCenters(self) -> np.ndarray:
+        """
+        Returns the mean x coordinate of each band index, NaN for bands without finite x values
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.mXCount > 0, self.mXSum / np.maximum(self.mXCount, 1), np.nan)
+
+    def yBinEdges(self) -> np.ndarray:
+        """
+        Returns the y bin edges
+        """
+        if self.mCounts is None:
+            return np.empty(0)
+        return self.mOrigin + self.mBinSize * np.arange(self.mCounts.shape[1] + 1)
+
+    def clear(self):
+        self.mCounts = None
+        self.mXSum = np.zeros(0, dtype=np.float64)
+        self.mXCount = np.zeros(0, dtype=np.int64)
+        self.mProfileCount = 0
+        super().clear()
+
+    def addProfiles(self, profiles: List[Tuple[np.ndarray, np.ndarray]]):
+        """
+        Adds profiles to the histogram and updates the image
+        :param profiles: list of (x, y) arrays, e.g. as returned by SpectralProfilePlotDataItem.plotDataArrays
+        """
+        if len(profiles) == 0:
+            return
+        self.mProfileCount += len(profiles)
+
+        b = np.concatenate([np.arange(len(p[1])) for p in profiles])
+        x = np.concatenate([p[0] for p in profiles]).astype(np.float64)
+        y = np.concatenate([p[1] for p in profiles]).astype(np.float64)
+        if len(b) == 0:
+            return
+
+        nb = int(b.max()) + 1
+        if nb > len(self.mXSum):
+            n_add = nb - len(self.mXSum)
+            self.mXSum = np.pad(self.mXSum, (0, n_add))
+            self.mXCount = np.pad(self.mXCount, (0, n_add))
+            if self.mCounts is not None:
+                self.mCounts = np.pad(self.mCounts, [(0, n_add), (0, 0)])
+
+        is_x = np.isfinite(x)
+        self.mXSum += np.bincount(b[is_x], weights=x[is_x], minlength=len(self.mXSum))
+        self.mXCount += np.bincount(b[is_x], minlength=len(self.mXCount))
+
+        is_y = np.isfinite(y)
+        b, y = b[is_y], y[is_y]
+        if len(y) > 0:
+            vmin, vmax = float(y.min()), float(y.max())
+            if self.mCounts is None:
+                if vmax <= vmin:
+                    vmin, vmax = vmin - 0.5, vmax + 0.5
+                self.mCounts = np.zeros((len(self.mXSum), self.mBins), dtype=np.int64)
+                self.mOrigin = vmin
+                self.mBinSize = (vmax - vmin) / self.mBins
+            else:
+                self._extendYBins(vmin, vmax)
+
+            n_bands, ny = self.mCounts.shape
+            # values on the upper edge belong to the last bin
+            iy = np.clip(np.floor((y - self.mOrigin) / self.mBinSize).astype(np.int64), 0, ny - 1)
+            self.mCounts += np.bincount(b * ny + iy, minlength=n_bands * ny).reshape((n_bands, ny))
+        self.refreshImage()
+
+    def _extendYBins(self, vmin: float, vmax: float):
+        """
+        Adds y bins to include the value range [vmin, vmax], merging bins if necessary
+        """
+        while True:
+            n = self.mCounts.shape[1]
+            o, w = self.mOrigin, self.mBinSize
+            n_before = math.ceil((o - vmin) / w) if vmin < o else 0
+            n_after = math.ceil((vmax - (o + n * w)) / w) if vmax > o + n * w else 0
+            n_total = n + n_before + n_after
+            if n_total <= self.MAX_BINS:
+                break
+            # merge k neighboured bins
+            k = 2 ** math.ceil(math.log2(n_total / self.MAX_BINS))
+            if k >= n:
+                self.mCounts = self.mCounts.sum(axis=1, keepdims=True)
+            else:
+                counts = np.pad(self.mCounts, [(0, 0), (0, (-n) % k)])
+                self.mCounts = counts.reshape((counts.shape[0], counts.shape[1] // k, k)).sum(axis=2)
+            self.mBinSize = w * k
+
+        if n_before > 0 or n_after > 0:
+            self.mCounts = np.pad(self.mCounts, [(0, 0), (n_before, n_after)])
+            self.mOrigin = o - n_before * w
+
+    def refreshImage(self):
+        """
+        Shows the current histogram counts, with the band columns drawn at their band centers
+        """
+        if self.mCounts is None:
+            return
+        centers = self.bandCenters()
+        bands = np.where(np.isfinite(centers))[0]
+        if len(bands) == 0:
+            return
+
+        # bands with the same center share a column
+        c, inverse = np.unique(centers[bands], return_inverse=True)
+        counts = np.zeros((len(c), self.mCounts.shape[1]), dtype=np.int64)
+        np.add.at(counts, inverse, self.mCounts[bands])
+
+        # columns reach half way to the neighboured band centers
+        if len(c) > 1:
+            mid = 0.5 * (c[1:] + c[:-1])
+            edges = np.concatenate([[2 * c[0] - mid[0]], mid, [2 * c[-1] - mid[-1]]])
+        else:
+            edges = np.asarray([c[0] - 0.5, c[0] + 0.5])
+
+        # an image has columns of equal width. Use as many as needed to show the narrowest band column
+        width = edges[-1] - edges[0]
+        n_cols = int(min(self.MAX_COLUMNS, max(len(c), math.ceil(width / np.diff(edges).min()))))
+        col_centers = edges[0] + (np.arange(n_cols) + 0.5) * (width / n_cols)
+        i_band = np.clip(np.searchsorted(edges, col_centers, side='right') - 1, 0, len(c) - 1)
+
+        # logarithmic scale, so that bins with few profiles remain visible
+        image = np.log1p(counts[i_band].astype(np.float32))
+        if pg.getConfigOption('imageAxisOrder') == 'row-major':
+            image = image.T
+        vmax = float(image.max())
+        self.setImage(image, autoLevels=False, levels=(0, vmax if vmax > 0 else 1))
+        ny = self.mCounts.shape[1]
+        self.setRect(QRectF(edges[0], self.mOrigin, width, ny * self.mBinSize))
+
+
+class SpectralProfileHitIndex(object):
+    """
+    A uniform grid over the line segments of the profiles plotted in a SpectralProfilePlotItem,
+    in pixel units of the current view. It is used to find the profile next to the mouse position
+    or the profiles within a rectangle without testing the vertices of every plotted profile.
+    The grid is rebuilt lazily when the plotted profiles, their data or the view range have changed.
+    """
+    # grid cell size in pixels
+    CELL_SIZE: int = 16
+
+    # maximum number of (cell, segment) entries. The cell size is increased to stay below.
+    MAX_ENTRIES: int = 2 ** 23
+
+    def __init__(self, plotItem: pg.PlotItem):
+        self.mPlotItem = plotItem
+        self.mStateKey = None
+        self.mItems: list = []
+        self.mOrigin: Tuple[float, float] = (0.0, 0.0)
+        self.mPixelSize: Tuple[float, float] = (0.0, 0.0)
+        self.mCellSize: float = float(self.CELL_SIZE)
+        self.mShape: Tuple[int, int] = (0, 0)
+        # vertex coordinates in data units and their item, item vertex and profile index
+        self.mX: np.ndarray = np.empty(0)
+        self.mY: np.ndarray = np.empty(0)
+        self.mVertexItem: np.ndarray = np.empty(0, dtype=np.int64)
+        self.mVertexIndex: np.ndarray = np.empty(0, dtype=np.int64)
+        self.mVertexProfile: np.ndarray = np.empty(0, dtype=np.int64)
+        # line segments as (start, end) vertices. Single vertices are segments with start == end
+        self.mSegmentStart: np.ndarray = np.empty(0, dtype=np.int64)
+        self.mSegmentEnd: np.ndarray = np.empty(0, dtype=np.int64)
+        # segments sorted by grid cell, and the first entry of each cell
+        self.mCellSegments: np.ndarray = np.empty(0, dtype=np.int64)
+        self.mCellOffsets: np.ndarray = np.zeros(1, dtype=np.int64)
+
+    def invalidate(self):
+        self.mStateKey = None
+
+    def profileItems(self) -> list:
+        return [item for item in self.mPlotItem.listDataItems()
+                if isinstance(item, (SpectralProfilePlotDataItem, SpectralProfileBatchItem)) and item.isVisible()]
+
+    def pixelSize(self) -> Tuple[float, float]:
+        """
+        Returns the size of a screen pixel in data units, or (0, 0) if the view is not shown
+        """
+        try:
+            pw, ph = self.mPlotItem.getViewBox().viewPixelSize()
+        except (TypeError, AttributeError):
+            return 0.0, 0.0
+        if not (math.isfinite(pw) and math.isfinite(ph)):
+            return 0.0, 0.0
+        return pw, ph
+
+    def isAvailable(self) -> bool:
+        """
+        Returns True if the index can be used, i.e. the plot is shown in a view with a valid pixel size
+        """
+        self.update()
+        pw, ph = self.mPixelSize
+        return pw > 0 and ph > 0
+
+    def stateKey(self, items: list) -> tuple:
+        (x0, x1), (y0, y1) = self.mPlotItem.getViewBox().viewRange()
+        return (x0, x1, y0, y1, self.pixelSize(),
+                tuple((id(item), item.mDataVersion) for item in items))
+
+    def update(self):
+        """
+        Rebuilds the index if required
+        """
+        items = self.profileItems()
+        key = self.stateKey(items)
+        if key != self.mStateKey:
+            self.build(items)
+            self.mStateKey = key
+
+    @staticmethod
+    def itemData(item) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Returns the x, y, connect and profile index arrays of an item
+        """
+        if isinstance(item, SpectralProfileBatchItem):
+            x, y = item.xData, item.yData
+            if x is None or len(x) == 0:
+                return None, None, None, None
+            return x, y, item.mConnect, item.mProfileIndex
+        else:
+            x, y = item.getData()
+            if x is None or len(x) == 0:
+                return None, None, None, None
+            x = np.asarray(x, dtype=float)
+            y = np.asarray(y, dtype=float)
+            valid = np.isfinite(x) & np.isfinite(y)
+            connect = np.zeros(len(x), dtype=bool)
+            connect[:-1] = valid[:-1] & valid[1:]
+            return x, y, connect, np.zeros(len(x), dtype=np.int64)
+
+    def build(self, items: list):
+        (x0, x1), (y0, y1) = self.mPlotItem.getViewBox().viewRange()
+        pw, ph = self.pixelSize()
+        self.mItems = []
+        self.mPixelSize = (pw, ph)
+        self.mX = self.mY = np.empty(0)
+        self.mSegmentStart = self.mSegmentEnd = np.empty(0, dtype=np.int64)
+        self.mCellSegments = np.empty(0, dtype=np.int64)
+        self.mCellOffsets = np.zeros(1, dtype=np.int64)
+        self.mShape = (0, 0)
+        if not (pw > 0 and ph > 0):
+            return
+
+        X, Y, C, ITEM, PROFILE = [], [], [], [], []
+        for item in items:
+            x, y, connect, profiles = self.itemData(item)
+            if x is None:
+                continue
+            X.append(x)
+            Y.append(y)
+            C.append(connect)
+            PROFILE.append(profiles)
+            ITEM.append(np.full(len(x), len(self.mItems), dtype=np.int64))
+            self.mItems.append(item)
+        if len(self.mItems) == 0:
+            return
+
+        self.mX = np.concatenate(X)
+        self.mY = np.concatenate(Y)
+        self.mVertexItem = np.concatenate(ITEM)
+        self.mVertexProfile = np.concatenate(PROFILE)
+        lengths = np.asarray([len(x) for x in X], dtype=np.int64)
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        self.mVertexIndex = np.arange(len(self.mX), dtype=np.int64) - offsets
+        connect = np.concatenate(C)
+        self.mOrigin = (x0, y0)
+
+        # segments between connected vertices and single, valid vertices
+        valid = np.isfinite(self.mX) & np.isfinite(self.mY)
+        connected_prev = np.zeros(len(connect), dtype=bool)
+        connected_prev[1:] = connect[:-1]
+        start = np.flatnonzero(connect)
+        single = np.flatnonzero(valid & ~connect & ~connected_prev)
+        self.mSegmentStart = np.concatenate([start, single])
+        self.mSegmentEnd = np.concatenate([start + 1, single])
+
+        px = (self.mX - x0) / pw
+        py = (self.mY - y0) / ph
+        ax, bx = px[self.mSegmentStart], px[self.mSegmentEnd]
+        ay, by = py[self.mSegmentStart], py[self.mSegmentEnd]
+        width = (x1 - x0) / pw
+        height = (y1 - y0) / ph
+
+        cell_size = float(self.CELL_SIZE)
+        while True:
+            n_cols = int(width // cell_size) + 1
+            n_rows = int(height // cell_size) + 1
+            if n_cols * n_rows > 2 ** 16:
+                # keep cell numbers in uint16, which numpy sorts with a radix sort
+                cell_size *= 2
+                continue
+            cx0 = np.floor(np.minimum(ax, bx) / cell_size)
+            cx1 = np.floor(np.maximum(ax, bx) / cell_size)
+            cy0 = np.floor(np.minimum(ay, by) / cell_size)
+            cy1 = np.floor(np.maximum(ay, by) / cell_size)
+            # ignore segments outside the view
+            inside = (cx1 >= 0) & (cx0 < n_cols) & (cy1 >= 0) & (cy0 < n_rows)
+            segments = np.flatnonzero(inside)
+            cx0 = np.clip(cx0[inside], 0, n_cols - 1).astype(np.int64)
+            cx1 = np.clip(cx1[inside], 0, n_cols - 1).astype(np.int64)
+            cy0 = np.clip(cy0[inside], 0, n_rows - 1).astype(np.int64)
+            cy1 = np.clip(cy1[inside], 0, n_rows - 1).astype(np.int64)
+            nx = cx1 - cx0 + 1
+            counts = nx * (cy1 - cy0 + 1)
+            if counts.sum() <= self.MAX_ENTRIES:
+                break
+            cell_size *= 2
+
+        # register each segment in all cells of its bounding box
+        entry_segment = np.repeat(np.arange(len(segments)), counts)
+        entry_offset = np.arange(len(entry_segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = cx0[entry_segment] + entry_offset % nx[entry_segment]
+        cy = cy0[entry_segment] + entry_offset // nx[entry_segment]
+        cells = (cy * n_cols + cx).astype(np.uint16)
+        order = np.argsort(cells, kind='stable')
+        self.mCellSegments = segments[entry_segment[order]]
+        self.mCellOffsets = np.zeros(n_cols * n_rows + 1, dtype=np.int64)
+        self.mCellOffsets[1:] = np.cumsum(np.bincount(cells, minlength=n_cols * n_rows))
+        self.mCellSize = cell_size
+        self.mShape = (n_rows, n_cols)
+
+    def _candidates(self, px0: float, px1: float, py0: float, py1: float) -> np.ndarray:
+        """
+        Returns the segments registered in grid cells that overlap a rectangle in pixel units
+        """
+        n_rows, n_cols = self.mShape
+        if n_rows == 0 or n_cols == 0:
+            return np.empty(0, dtype=np.int64)
+        c = self.mCellSize
+        cx0, cx1 = max(0, int(math.floor(px0 / c))), min(n_cols - 1, int(math.floor(px1 / c)))
+        cy0, cy1 = max(0, int(math.floor(py0 / c))), min(n_rows - 1, int(math.floor(py1 / c)))
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+        parts = []
+        for cy in range(cy0, cy1 + 1):
+            i0 = self.mCellOffsets[cy * n_cols + cx0]
+            i1 = self.mCellOffsets[cy * n_cols + cx1 + 1]
+            parts.append(self.mCellSegments[i0:i1])
+        return np.unique(np.concatenate(parts))
+
+    def _selectItems(self, segments: np.ndarray, items: Optional[list]) -> np.ndarray:
+        if items is None or len(segments) == 0:
+            return segments
+        ids = {id(item) for item in items}
+        allowed = np.asarray([id(item) in ids for item in self.mItems], dtype=bool)
+        return segments[allowed[self.mVertexItem[self.mSegmentStart[segments]]]]
+
+    def nearest(self, pos: QPointF, tolerance: float = 4,
+                items: Optional[list] = None) -> Optional[Tuple[Any, int, int]]:
+        """
+        Returns the profile closest to a position in data coordinates as (item, profile index, vertex index),
+        if its distance is less than tolerance pixels. Returns None otherwise.
+        The profile index is the index of a profile in a SpectralProfileBatchItem, and 0 for other items.
+        The vertex index is the index of the closest vertex within the item.
+        :param pos: position in data coordinates
+        :param tolerance: maximum distance in pixels
+        :param items: optional list of items to search in
+        """
+        if not self.isAvailable():
+            return None
+        x0, y0 = self.mOrigin
+        pw, ph = self.mPixelSize
+        px = (pos.x() - x0) / pw
+        py = (pos.y() - y0) / ph
+        segments = self._candidates(px - tolerance, px + tolerance, py - tolerance, py + tolerance)
+        segments = self._selectItems(segments, items)
+        if len(segments) == 0:
+            return None
+
+        a, b = self.mSegmentStart[segments], self.mSegmentEnd[segments]
+        ax, ay = (self.mX[a] - x0) / pw - px, (self.mY[a] - y0) / ph - py
+        bx, by = (self.mX[b] - x0) / pw - px, (self.mY[b] - y0) / ph - py
+        dx, dy = bx - ax, by - ay
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(-(ax * dx + ay * dy) / (dx ** 2 + dy ** 2), 0, 1)
+        t = np.where(np.isfinite(t), t, 0)
+        dist = np.hypot(ax + t * dx, ay + t * dy)
+        i = int(np.argmin(dist))
+        if not dist[i] <= tolerance:
+            return None
+        v = a[i] if t[i] < 0.5 else b[i]
+        return self.mItems[self.mVertexItem[v]], int(self.mVertexProfile[v]), int(self.mVertexIndex[v])
+
+    def profilesInRect(self, rect: QRectF, items: Optional[list] = None) -> Dict[Any, List[int]]:
+        """
+        Returns the profiles with a line segment or vertex inside a rectangle in data coordinates,
+        as dictionary of item -> list of profile indices
+        """
+        if not self.isAvailable():
+            return dict()
+        rect = rect.normalized()
+        x0, y0 = self.mOrigin
+        pw, ph = self.mPixelSize
+        segments = self._candidates((rect.left() - x0) / pw, (rect.right() - x0) / pw,
+                                    (rect.top() - y0) / ph, (rect.bottom() - y0) / ph)
+        segments = self._selectItems(segments, items)
+        if len(segments) == 0:
+            return dict()
+
+        # Liang-Barsky line clipping
+        a, b = self.mSegmentStart[segments], self.mSegmentEnd[segments]
+        ax, ay = self.mX[a], self.mY[a]
+        dx, dy = self.mX[b] - ax, self.mY[b] - ay
+        t0 = np.zeros(len(segments))
+        t1 = np.ones(len(segments))
+        hit = np.ones(len(segments), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for p, q in [(-dx, ax - rect.left()), (dx, rect.right() - ax),
+                         (-dy, ay - rect.top()), (dy, rect.bottom() - ay)]:
+                hit &= ~((p == 0) & (q < 0))
+                r = q / p
+                t0 = np.where(p < 0, np.maximum(t0, r), t0)
+                t1 = np.where(p > 0, np.minimum(t1, r), t1)
+        hit &= t0 <= t1
+        a = a[hit]
+        if len(a) == 0:
+            return dict()
+
+        result: Dict[Any, List[int]] = dict()
+        keys = np.unique(np.stack([self.mVertexItem[a], self.mVertexProfile[a]]), axis=1)
+        for i_item, i_profile in keys.T:
+            result.setdefault(self.mItems[i_item], []).append(int(i_profile))
+        return result
+
+
 class PlotUpdateBlocker(object):
     """
     A blocker for plot updates
@@ -610,6 +1404,8 @@ class SpectralProfilePlotWidget(pg.GraphicsLayoutWidget):
     A widget to plot SpectralProfiles
     """
     sigPlotDataItemSelected = pyqtSignal(SpectralProfilePlotDataItem, Qt.Modifier)
+    # the SpectralProfilePlotDataItem next to the mouse (or None) and the index of its closest vertex
+    sigProfileHovered = pyqtSignal(object, int)
 
     def __init__(self, *args, **kwargs):
 
@@ -830,6 +1626,7 @@ class SpectralProfilePlotWidget(pg.GraphicsLayoutWidget):
             # sx, sy = self.mInfoScatterPoints.getData()
 
             self.updatePositionInfo()
+            self.updateHoveredProfile(mousePoint)
 
             s = self.size()
             pos = QPointF(s.width(), 0)
@@ -845,3 +1642,20 @@ class SpectralProfilePlotWidget(pg.GraphicsLayoutWidget):
             self.mCrosshairLineH.setVisible(False)
             self.mCrosshairLineV.setVisible(False)
             self.mInfoLabelCursor.setVisible(False)
+            self.sigProfileHovered.emit(None, -1)
+
+    def updateHoveredProfile(self, pos: QPointF):
+        """
+        Emits sigProfileHovered with the SpectralProfilePlotDataItem closest to pos, in data coordinates.
+        """
+        if QApplication.mouseButtons() != Qt.NoButton:
+            # do not update the hit index while the view is dragged
+            return
+        pdis = list(self.plotItem1.spectralProfilePlotDataItems())
+        hit = None
+        if len(pdis) > 0:
+            hit = self.plotItem1.hitIndex().nearest(pos, items=pdis)
+        if hit is None:
+            self.sigProfileHovered.emit(None, -1)
+        else:
+            self.sigProfileHovered.emit(hit[0], hit[2])
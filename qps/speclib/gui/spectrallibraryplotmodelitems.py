@@ -2064,11 +2064,16 @@ class ProfileVisualizationGroup(PropertyItemGroup):
             'Color', 'Color of spectral profile', QgsPropertyDefinition.StandardPropertyTemplate.ColorWithAlpha))
         self.mPColor.setProperty(QgsProperty.fromValue('@symbol_color'))
 
+        self.mPDensity = QgsPropertyItemBool('Density',
+                                             tooltip='Show the profile distribution as 2D histogram instead of '
+                                                     'single profiles. Use it to show very large profile sets.',
+                                             value=False)
+
         self.mStats = ProfileStatsGroup()
         # self.mPColor.signals().dataChanged.connect(lambda : self.setPlotStyle(self.generatePlotStyle()))
         for pItem in [self.mPField, self.mPLabel, self.mPFilter, self.mPCode,
                       self.mPColor, self.mPStyle, self.mProfileCandidates,
-                      self.mStats]:
+                      self.mPDensity, self.mStats]:
             self.appendRow(pItem.propertyRow())
 
         self.setUserTristate(False)
@@ -2124,6 +2129,8 @@ class ProfileVisualizationGroup(PropertyItemGroup):
         self.setLayerField(data.get('field', None))
         if name := data.get('name', None):
             self.setText(name)
+        if 'density' in data:
+            self.setShowDensity(data['density'] in [True, 1])
 
     def asMap(self) -> dict:
 
@@ -2159,9 +2166,19 @@ class ProfileVisualizationGroup(PropertyItemGroup):
             'statistics': self.mStats.map(),
             'candidate_style': candidate_style,
             'show_candidates': candidate_show,
+            'density': self.showDensity(),
         }
         return settings
 
+    def setShowDensity(self, b: bool):
+        """
+        Set True to show the profiles as 2D histogram of their (x, y) values
+        """
+        self.mPDensity.setValue(b is True)
+
+    def showDensity(self) -> bool:
+        return self.mPDensity.property().valueAsBool(QgsExpressionContext(), False)[0]
+
     def profileCandidateStyle(self) -> PlotStyle:
         """
         Returns the plot style to be used as default for profile candidates
@@ -7,8 +7,8 @@ from qgis.PyQt.QtCore import pyqtSignal, QAbstractItemModel, QItemSelectionModel
 from qgis.PyQt.QtGui import QColor, QContextMenuEvent, QDragEnterEvent, QDropEvent, QFontMetrics, QIcon, \
     QPainter, QPalette, QPixmap
 from qgis.PyQt.QtWidgets import QAbstractItemView, QAction, QApplication, QComboBox, QDialog, QFrame, QHBoxLayout, \
-    QMenu, QMessageBox, QStyle, QStyledItemDelegate, QStyleOptionButton, QStyleOptionViewItem, QTreeView, \
-    QWidget
+    QMenu, QMessageBox, QProgressBar, QStyle, QStyledItemDelegate, QStyleOptionButton, QStyleOptionViewItem, \
+    QTreeView, QWidget
 from qgis.PyQt.QtWidgets import QLineEdit
 from qgis.core import QgsApplication, QgsField, QgsMapLayerProxyModel, QgsProject, QgsRasterLayer, \
     QgsSettings, QgsVectorLayer, QgsMapLayer
@@ -398,7 +398,14 @@ class SpectralLibraryPlotWidget(QWidget):
         self.mPlotModel.sigMaxProfilesExceeded.connect(self.onMaxProfilesReached)
         self.mINITIALIZED_VISUALIZATIONS = set()
 
-        # self.mPlotControlModel.sigProgressChanged.connect(self.onProgressChanged)
+        # shows the progress of profiles that are loaded in the background
+        self.mProgressBar = QProgressBar()
+        self.mProgressBar.setRange(0, 100)
+        self.mProgressBar.setMaximumHeight(QFontMetrics(self.font()).height())
+        self.mProgressBar.setFormat('Loading profiles %p%')
+        self.mProgressBar.setVisible(False)
+        self.layout().addWidget(self.mProgressBar)
+        self.mPlotModel.sigProgressChanged.connect(self.onProgressChanged)
         self.setAcceptDrops(True)
 
         self.mProxyModel = SpectralProfilePlotModelProxyModel()
@@ -441,6 +448,11 @@ class SpectralLibraryPlotWidget(QWidget):
 
         self.actionClearSelection.triggered.connect(self.plotModel().clearCurveSelection)
         self.btnClearSelection.setDefaultAction(self.actionClearSelection)
+
+        self.actionLoadMoreProfiles: QAction
+        self.actionLoadMoreProfiles.triggered.connect(self.mPlotModel.loadMoreProfiles)
+        self.mPlotModel.sigProfilesLoaded.connect(self.onProfilesLoaded)
+        self.btnLoadMoreProfiles.setDefaultAction(self.actionLoadMoreProfiles)
         # self.sbMaxProfiles: QSpinBox
         # self.sbMaxProfiles.valueChanged.connect(self.mPlotControlModel.setMaxProfiles)
         # self.labelMaxProfiles: QLabel
@@ -549,6 +561,18 @@ class SpectralLibraryPlotWidget(QWidget):
         self.actionRemoveProfileVis.setEnabled(len(groups) > 0)
         self.sigTreeSelectionChanged.emit()
 
+    def onProgressChanged(self, progress: float):
+        self.mProgressBar.setValue(int(progress))
+        self.mProgressBar.setVisible(progress < 100)
+
+    def onProfilesLoaded(self, n: int, more_available: bool):
+        self.actionLoadMoreProfiles.setEnabled(more_available)
+        if more_available:
+            self.actionLoadMoreProfiles.setToolTip(
+                f'{n} profiles shown. Load the next {self.mPlotModel.maxProfiles()} profiles')
+        else:
+            self.actionLoadMoreProfiles.setToolTip(f'All {n} profiles are shown')
+
     def onMaxProfilesReached(self):
 
         if self.SHOW_MAX_PROFILES_HINT:
@@ -1,31 +1,37 @@
 import datetime
 import enum
 import io
+import itertools
 import json
 import logging
 import math
+import threading
 import warnings
-from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import numpy as np
 from pyqtgraph import (LegendItem, mkBrush, mkPen, PlotCurveItem, PlotDataItem, ScatterPlotItem,
                        SpotItem, FillBetweenItem, SignalProxy)
 from pyqtgraph.GraphicsScene.mouseEvents import HoverEvent, MouseClickEvent
 
+from qgis.PyQt import sip
 from qgis.PyQt.QtCore import QRectF
-from qgis.PyQt.QtCore import pyqtSignal, QMimeData, QModelIndex, QSortFilterProxyModel, Qt
+from qgis.PyQt.QtCore import pyqtSignal, QMimeData, QModelIndex, QSortFilterProxyModel, Qt, QTimer
 from qgis.PyQt.QtGui import QColor, QStandardItem, QStandardItemModel
 from qgis.PyQt.QtWidgets import QApplication
 from qgis.PyQt.QtWidgets import QGraphicsSceneMouseEvent
-from qgis.core import QgsExpression, QgsExpressionContext, QgsExpressionContextScope, QgsExpressionContextUtils, \
-    QgsFeature, QgsFeatureRenderer, QgsFeatureRequest, QgsField, QgsMarkerSymbol, QgsProject, QgsProperty, \
-    QgsRenderContext, QgsSingleSymbolRenderer, QgsSymbol, QgsVectorLayer, QgsVectorLayerCache
+from qgis.core import QgsApplication, QgsExpression, QgsExpressionContext, QgsExpressionContextScope, \
+    QgsExpressionContextUtils, QgsFeature, QgsFeatureRenderer, QgsFeatureRequest, QgsField, QgsMarkerSymbol, \
+    QgsProject, QgsProperty, QgsRenderContext, QgsSingleSymbolRenderer, QgsSymbol, QgsTask, QgsTaskManager, \
+    QgsVectorLayer, QgsVectorLayerCache, QgsVectorLayerFeatureSource
 from .spectrallibraryplotitems import SpectralProfilePlotItem, SpectralViewBox
 from .spectrallibraryplotmodelitems import lists_to_numpy_array
 from .spectralprofilecandidates import CUSTOM_PROPERTY_CANDIDATE_FIDs, SpectralProfileCandidates
 from ..core import profile_field_indices, profile_field_list, profile_fields
 from ..core.spectralprofile import decodeProfileValueDict
-from ..gui.spectrallibraryplotitems import PlotUpdateBlocker, SpectralProfilePlotDataItem, SpectralProfilePlotWidget
+from ..gui.spectrallibraryplotitems import PlotUpdateBlocker, SpectralProfileBatchItem, SpectralProfileDensityItem, \
+    SpectralProfilePlotDataItem, SpectralProfilePlotWidget
 from ..gui.spectrallibraryplotmodelitems import GeneralSettingsGroup, ProfileColorPropertyItem, \
     ProfileVisualizationGroup, PropertyItem, PropertyItemGroup, RasterRendererGroup, SpectralProfileLayerFieldItem
 from ..gui.spectrallibraryplotunitmodels import SpectralProfilePlotXAxisUnitModel
@@ -33,7 +39,7 @@ from ..gui.spectralprofilefieldmodel import SpectralProfileFieldListModel
 from ...plotstyling.plotstyling import PlotStyle
 from ...signalproxy import SignalProxyUndecorated
 from ...unitmodel import BAND_INDEX, BAND_NUMBER, datetime64, UnitConverterFunctionModel, UnitWrapper, UNKNOWN_UNIT
-from ...utils import convertDateUnit, xy_pair_matrix
+from ...utils import convertDateUnit, xy_pair_groups, xy_pair_matrix
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +110,720 @@ STATS_FUNCTIONS = {
 NORMALIZED_VIEW = ['stdev', 'rmse', 'mae', 'count', 'range']
 
 
+class ProfileStatistics(object):
+    """
+    Band-wise statistics of spectral profiles.
+    Profiles are added as stacked (n_profiles, n_bands) matrices of profiles with the same x values.
+    Count, mean, stdev (parallel variance update), min and max are accumulated while profiles are added,
+    so that large selections can be added chunk by chunk without keeping the profile values.
+    Statistics that require all values, like the MAE and quantiles, need keepData=True.
+    """
+    STREAMING = ['mean', 'stdev', 'rmse', 'min', 'max', 'range', 'count']
+
+    def __init__(self, keepData: bool = False):
+        self.mKeepData: bool = keepData
+        self.mNProfiles: int = 0
+        self.mX: np.ndarray = np.empty(0)
+        self.mCount: np.ndarray = np.empty(0)
+        self.mMean: np.ndarray = np.empty(0)
+        self.mM2: np.ndarray = np.empty(0)
+        self.mMin: np.ndarray = np.empty(0)
+        self.mMax: np.ndarray = np.empty(0)
+        # (column indices, (n_profiles, n_bands) matrix) for each added matrix
+        self.mData: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def profileCount(self) -> int:
+        return self.mNProfiles
+
+    def x(self) -> np.ndarray:
+        return self.mX
+
+    def keepsData(self) -> bool:
+        return self.mKeepData
+
+    def addPairs(self, pairs: Iterable[Tuple[np.ndarray, np.ndarray]], chunkSize: Optional[int] = None):
+        """
+        Adds (x, y) profile pairs. Pairs with the same x values are stacked and added as one matrix.
+        :param pairs: (x, y) pairs
+        :param chunkSize: optional, maximum number of profiles per matrix
+        """
+        for x, Y in xy_pair_groups(pairs):
+            if chunkSize:
+                for i in range(0, len(Y), chunkSize):
+                    self.addProfiles(x, Y[i:i + chunkSize])
+            else:
+                self.addProfiles(x, Y)
+
+    def addProfiles(self, x: np.ndarray, Y: np.ndarray):
+        """
+        Adds a stack of profiles with the same spectral setting.
+        :param x: unique x values, shape (n_bands,)
+        :param Y: profile values, shape (n_profiles, n_bands)
+        """
+        x = np.asarray(x, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        if Y.ndim == 1:
+            Y = Y.reshape(1, -1)
+        if not Y.shape[1] == len(x):
+            raise AssertionError(f'Number of x values ({len(x)}) differs from number of bands ({Y.shape[1]})')
+        if len(Y) == 0:
+            return
+
+        cols = self._columns(x)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            valid = np.isfinite(Y)
+            n_b = valid.sum(axis=0).astype(float)
+            mean_b = np.where(n_b > 0, np.where(valid, Y, 0).sum(axis=0) / np.maximum(n_b, 1), 0.0)
+            m2_b = np.where(valid, (Y - mean_b) ** 2, 0).sum(axis=0)
+            min_b = np.fmin.reduce(Y, axis=0)
+            max_b = np.fmax.reduce(Y, axis=0)
+
+        n_a = self.mCount[cols]
+        mean_a = self.mMean[cols]
+        n = n_a + n_b
+        n_div = np.maximum(n, 1)
+        delta = mean_b - mean_a
+
+        self.mMean[cols] = mean_a + delta * n_b / n_div
+        self.mM2[cols] = self.mM2[cols] + m2_b + delta ** 2 * n_a * n_b / n_div
+        self.mCount[cols] = n
+        self.mMin[cols] = np.fmin(self.mMin[cols], min_b)
+        self.mMax[cols] = np.fmax(self.mMax[cols], max_b)
+
+        if self.mKeepData:
+            self.mData.append((cols, Y))
+        self.mNProfiles += len(Y)
+
+    def _columns(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the column indices of x values and extends the x values to accumulate statistics for.
+        """
+        cols = np.searchsorted(self.mX, x)
+        if not (np.all(cols < len(self.mX)) and np.array_equal(self.mX[cols], x)):
+            x_new = np.union1d(self.mX, x)
+            old = np.searchsorted(x_new, self.mX)
+
+            def extended(values: np.ndarray, fill) -> np.ndarray:
+                result = np.full(len(x_new), fill, dtype=float)
+                result[old] = values
+                return result
+
+            self.mCount = extended(self.mCount, 0)
+            self.mMean = extended(self.mMean, 0)
+            self.mM2 = extended(self.mM2, 0)
+            self.mMin = extended(self.mMin, np.nan)
+            self.mMax = extended(self.mMax, np.nan)
+            self.mData = [(old[c], Y) for c, Y in self.mData]
+            self.mX = x_new
+            cols = np.searchsorted(self.mX, x)
+        return cols
+
+    def matrix(self) -> np.ndarray:
+        """
+        Returns all kept profile values as (n_profiles, n_x) matrix, filled with NaN for missing x values.
+        """
+        if not self.mKeepData:
+            raise AssertionError('Profile values are not kept. Use keepData=True')
+        M = np.full((self.mNProfiles, len(self.mX)), np.nan)
+        row = 0
+        for cols, Y in self.mData:
+            M[row:row + len(Y), cols] = Y
+            row += len(Y)
+        return M
+
+    def statistic(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the x values and band-wise values of a statistic, e.g. 'mean' or 'stdev'.
+        """
+        x = self.mX
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            empty = self.mCount == 0
+            if name == 'mean':
+                return x, np.where(empty, np.nan, self.mMean)
+            elif name in ['stdev', 'rmse']:
+                return x, np.where(empty, np.nan, np.sqrt(self.mM2 / np.maximum(self.mCount, 1)))
+            elif name == 'min':
+                return x, self.mMin.copy()
+            elif name == 'max':
+                return x, self.mMax.copy()
+            elif name == 'range':
+                return x, self.mMax - self.mMin
+            elif name == 'count':
+                return x, self.mCount.astype(int)
+            elif name in STATS_FUNCTIONS:
+                return STATS_FUNCTIONS[name](x, self.matrix().T)
+        raise AssertionError(f'Unknown statistic: {name}')
+
+
+class ProfileDataCache(object):
+    """
+    A process-wide cache of decoded spectral profiles and evaluated expression values of vector layer features,
+    e.g. profile colors, labels and filters, shared by all SpectralProfilePlotModels.
+
+    Entries are kept in least-recently-used order within a memory budget of MAX_BYTES and are invalidated
+    from the signals of their layers: attribute and geometry changes invalidate the entries of single features,
+    field changes, rollbacks and data changes invalidate the layer. Style and variable changes
+    invalidate the evaluated expression values only.
+    Expression values are cached with the values of the context variables the expression refers to,
+    e.g. @visualization_name or project variables, see contextKey().
+    Expressions that use volatile functions, e.g. rand() or now(), are never cached.
+    """
+    # sentinel for missing values, compared by identity. Cached values can be any value, including -1
+    NOT_CACHED = object()
+
+    MAX_BYTES: int = 256 * 2 ** 20
+
+    # functions whose values depend on more than a feature and its expression context
+    VOLATILE_FUNCTIONS = {'rand', 'randf', 'now', 'uuid', 'eval', 'env', 'layer_property', 'get_feature',
+                          'get_feature_by_id', 'aggregate', 'relation_aggregate', 'array_agg', 'count', 'sum',
+                          'mean', 'minimum', 'maximum', 'overlay_intersects', 'overlay_contains'}
+
+    _LOCK = threading.RLock()
+    # key: (layer id, fid, 'raw', field index)
+    #      (layer id, fid, 'plot', field index, xUnit)
+    #      (layer id, fid, 'expression', expression string, context key)
+    # value: (cached value, estimated size in bytes)
+    _DATA: 'OrderedDict[tuple, Tuple[Any, int]]' = OrderedDict()
+    # layer id -> fid -> keys, to invalidate the entries of single features
+    _INDEX: Dict[str, Dict[int, Set[tuple]]] = dict()
+    _NBYTES: int = 0
+    _CONNECTED: Set[str] = set()
+    _CONNECTED_APP: bool = False
+    # addresses of the projects whose variable changes invalidate expression values
+    _CONNECTED_PROJECTS: Set[int] = set()
+
+    @staticmethod
+    def nBytes(value: Any) -> int:
+        """
+        Returns a rough estimate of the memory used by a cached value
+        """
+        if isinstance(value, np.ndarray):
+            return value.nbytes + 112
+        elif isinstance(value, dict):
+            return 232 + sum(ProfileDataCache.nBytes(v) for v in value.values())
+        elif isinstance(value, (list, tuple)):
+            return 56 + 32 * len(value)
+        elif isinstance(value, str):
+            return 49 + len(value)
+        return 32
+
+    @classmethod
+    def isCacheable(cls, expression: QgsExpression) -> bool:
+        """
+        Returns True if the values of an expression depend on the feature and its context only
+        """
+        if not isinstance(expression, QgsExpression) or expression.hasParserError():
+            return False
+        functions = {f.lower().lstrip('$') for f in expression.referencedFunctions()}
+        return len(functions.intersection(cls.VOLATILE_FUNCTIONS)) == 0
+
+    @staticmethod
+    def contextKey(expression: QgsExpression, context: QgsExpressionContext) -> tuple:
+        """
+        Returns the values of the context variables an expression refers to, e.g. of the
+        visualization scope (@visualization_name, @field_name, @field_index) or the project scope.
+        Expression values evaluated in contexts with different variable values are cached separately.
+        """
+        if not isinstance(expression, QgsExpression) or not isinstance(context, QgsExpressionContext):
+            return tuple()
+        return tuple((name, str(context.variable(name))) for name in sorted(expression.referencedVariables())
+                     if context.hasVariable(name))
+
+    @classmethod
+    def setMaxBytes(cls, nbytes: int):
+        if not (nbytes >= 0):
+            raise AssertionError
+        with cls._LOCK:
+            cls.MAX_BYTES = nbytes
+            cls._evict()
+
+    @classmethod
+    def nBytesCached(cls) -> int:
+        return cls._NBYTES
+
+    @classmethod
+    def value(cls, key: tuple) -> Any:
+        """
+        Returns a cached value or NOT_CACHED
+        """
+        with cls._LOCK:
+            entry = cls._DATA.get(key)
+            if entry is None:
+                return cls.NOT_CACHED
+            cls._DATA.move_to_end(key)
+            return entry[0]
+
+    @classmethod
+    def setValue(cls, layer: Union[str, QgsVectorLayer], key: tuple, value: Any):
+        """
+        Caches a value. The key needs to start with (layer id, feature id).
+        Values of a layer id are cached only if the layer has been connected before in the main thread,
+        e.g. by a former call with the QgsVectorLayer, so that their invalidation is guaranteed.
+        """
+        nbytes = cls.nBytes(value)
+        with cls._LOCK:
+            if isinstance(layer, QgsVectorLayer):
+                cls._connectLayer(layer)
+            elif layer not in cls._CONNECTED:
+                return
+            cls._remove(key)
+            cls._DATA[key] = (value, nbytes)
+            cls._NBYTES += nbytes
+            cls._INDEX.setdefault(key[0], dict()).setdefault(key[1], set()).add(key)
+            cls._evict()
+
+    @classmethod
+    def _remove(cls, key: tuple):
+        entry = cls._DATA.pop(key, None)
+        if entry is not None:
+            cls._NBYTES -= entry[1]
+            keys = cls._INDEX.get(key[0], dict()).get(key[1])
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del cls._INDEX[key[0]][key[1]]
+
+    @classmethod
+    def _evict(cls):
+        while cls._NBYTES > cls.MAX_BYTES and len(cls._DATA) > 0:
+            cls._remove(next(iter(cls._DATA)))
+
+    @classmethod
+    def _connectLayer(cls, layer: QgsVectorLayer):
+        lid = layer.id()
+        if lid in cls._CONNECTED:
+            return
+        if not cls._CONNECTED_APP and isinstance(QgsApplication.instance(), QgsApplication):
+            # global variables can be used in expressions
+            QgsApplication.instance().customVariablesChanged.connect(cls.invalidateExpressions)
+            cls._CONNECTED_APP = True
+        project = layer.project()
+        if isinstance(project, QgsProject):
+            # project variables can be used in expressions
+            pkey = int(sip.unwrapinstance(project))
+            if pkey not in cls._CONNECTED_PROJECTS:
+                cls._CONNECTED_PROJECTS.add(pkey)
+                project.customVariablesChanged.connect(cls.invalidateExpressions)
+                project.destroyed.connect(lambda *args, _pkey=pkey: cls._CONNECTED_PROJECTS.discard(_pkey))
+        cls._CONNECTED.add(lid)
+        layer.attributeValueChanged.connect(
+            lambda fid, idx, *args, _lid=lid: cls.invalidateFeatures(_lid, [fid], fieldIndex=idx))
+        layer.geometryChanged.connect(
+            lambda fid, *args, _lid=lid: cls.invalidateFeatures(_lid, [fid], expressionsOnly=True))
+        layer.featuresDeleted.connect(lambda fids, _lid=lid: cls.invalidateFeatures(_lid, fids))
+        layer.updatedFields.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.afterCommitChanges.connect(lambda *args, _lid=lid: cls.invalidateAddedFeatures(_lid))
+        layer.afterRollBack.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.dataChanged.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.styleChanged.connect(lambda *args, _lid=lid: cls.invalidateExpressions(_lid))
+        layer.rendererChanged.connect(lambda *args, _lid=lid: cls.invalidateExpressions(_lid))
+        layer.customPropertyChanged.connect(lambda *args, _lid=lid: cls.invalidateExpressions(_lid))
+        layer.willBeDeleted.connect(lambda *args, _lid=lid: cls.removeLayer(_lid))
+
+    @classmethod
+    def rawData(cls, layer: QgsVectorLayer, fieldIndex: int, feature: QgsFeature) -> Optional[dict]:
+        """
+        Returns the decoded profile of a feature's profile field, or None if the field has no profile
+        """
+        key = (layer.id(), feature.id(), 'raw', fieldIndex)
+        raw_data = cls.value(key)
+        if raw_data is cls.NOT_CACHED:
+            raw_data = cls.decodeRawData(feature, fieldIndex)
+            cls.setValue(layer, key, raw_data)
+        return raw_data
+
+    @staticmethod
+    def decodeRawData(feature: QgsFeature, fieldIndex: int) -> Optional[dict]:
+        """
+        Decodes the profile of a feature's profile field without caching it
+        """
+        d: dict = decodeProfileValueDict(feature.attribute(fieldIndex))
+        if d is None or len(d) == 0 or 'y' not in d.keys():
+            # no profile
+            return None
+        raw_data = d
+        if raw_data.get('x', None) is None:
+            raw_data['x'] = list(range(len(raw_data['y'])))
+            raw_data['xUnit'] = BAND_INDEX
+
+        # convert None values to NaN so that numpy arrays will become numeric
+        raw_data['y'] = [np.nan if v is None or not math.isfinite(v) else v for v in raw_data['y']]
+        return raw_data
+
+    @classmethod
+    def plotData(cls, layer: QgsVectorLayer, fieldIndex: int, feature: QgsFeature, xUnit: str,
+                 convert: Callable[[dict, str], Optional[dict]]) -> Optional[dict]:
+        """
+        Returns the profile of a feature's profile field, converted to xUnit with convert(rawData, xUnit)
+        """
+        key = (layer.id(), feature.id(), 'plot', fieldIndex, xUnit)
+        plot_data = cls.value(key)
+        if plot_data is cls.NOT_CACHED:
+            raw_data = cls.rawData(layer, fieldIndex, feature)
+            # None if the profile cannot be converted into xUnit
+            plot_data = None if raw_data is None else convert(raw_data, xUnit)
+            cls.setValue(layer, key, plot_data)
+        return plot_data
+
+    @classmethod
+    def expressionValue(cls, layer: Union[str, QgsVectorLayer], fid: int, expression: QgsExpression,
+                        evaluate: Callable[[], Any], contextKey: tuple = tuple()) -> Any:
+        """
+        Returns the value of an expression for a feature, evaluated with evaluate() if not cached.
+        :param contextKey: values of the context variables used by the expression, see contextKey()
+        """
+        if not cls.isCacheable(expression):
+            return evaluate()
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        key = (lid, fid, 'expression', expression.expression(), contextKey)
+        value = cls.value(key)
+        if value is cls.NOT_CACHED:
+            value = evaluate()
+            cls.setValue(layer, key, value)
+        return value
+
+    @classmethod
+    def invalidateFeatures(cls, layer: Union[str, QgsVectorLayer], fids: Iterable[int],
+                           fieldIndex: int = None, expressionsOnly: bool = False):
+        """
+        Removes the cached values of features.
+        :param fieldIndex: if set, removes the profiles of this field only, and all expression values
+        :param expressionsOnly: set True to remove the expression values only
+        """
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            index = cls._INDEX.get(lid)
+            if index is None:
+                return
+            for fid in fids:
+                for key in list(index.get(fid, [])):
+                    if key[2] == 'expression':
+                        cls._remove(key)
+                    elif not expressionsOnly and fieldIndex in [None, key[3]]:
+                        cls._remove(key)
+
+    @classmethod
+    def invalidateAddedFeatures(cls, layer: Union[str, QgsVectorLayer]):
+        """
+        Removes the cached values of features with temporary (negative) feature ids, which
+        are not valid anymore after the edit buffer has been committed.
+        """
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            fids = [fid for fid in cls._INDEX.get(lid, dict()).keys() if fid < 0]
+            cls.invalidateFeatures(lid, fids)
+
+    @classmethod
+    def invalidateExpressions(cls, layer: Union[None, str, QgsVectorLayer] = None):
+        """
+        Removes the cached expression values of a layer, or of all layers
+        """
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            for key in [k for k in cls._DATA.keys() if k[2] == 'expression' and lid in [None, k[0]]]:
+                cls._remove(key)
+
+    @classmethod
+    def invalidateLayer(cls, layer: Union[str, QgsVectorLayer]):
+        """
+        Removes all cached values of a layer
+        """
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            for keys in list(cls._INDEX.get(lid, dict()).values()):
+                for key in list(keys):
+                    cls._remove(key)
+            cls._INDEX.pop(lid, None)
+
+    @classmethod
+    def removeLayer(cls, layer: Union[str, QgsVectorLayer]):
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            cls.invalidateLayer(lid)
+            cls._CONNECTED.discard(lid)
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._DATA.clear()
+            cls._INDEX.clear()
+            cls._NBYTES = 0
+
+
+class XUnitConversionCache(object):
+    """
+    A process-wide cache of x axes converted into other x units.
+    Profiles with the same spectral setting share the same x values, which therefore need to be converted
+    only once, e.g. from nanometers to micrometers or from dates to decimal years.
+    Converted axes are read-only numpy arrays that are shared by all profiles with the same source axis.
+    """
+    NOT_CACHED = object()
+
+    MAX_ENTRIES: int = 1024
+
+    _LOCK = threading.RLock()
+    # key: (axis key, source unit, target unit)
+    # value: converted x values or None, if the conversion is not possible
+    _DATA: 'OrderedDict[tuple, Optional[np.ndarray]]' = OrderedDict()
+
+    @staticmethod
+    def axisKey(x: Any) -> Optional[tuple]:
+        """
+        Returns a hashable key of the x values or None, if the x values can not be hashed
+        """
+        if isinstance(x, np.ndarray):
+            if x.dtype.kind in 'biufcmM':
+                return x.dtype.str, x.shape, x.tobytes()
+            x = x.tolist()
+        try:
+            key = tuple(x)
+            hash(key)
+            return key
+        except TypeError:
+            return None
+
+    @classmethod
+    def convert(cls, x: Any, xUnitSrc: Optional[str], xUnit: Optional[str],
+                func: Callable[[Any, Optional[str], Optional[str]], Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        """
+        Returns the x values converted with func(x, xUnitSrc, xUnit) from xUnitSrc into xUnit
+        """
+        axisKey = cls.axisKey(x)
+        if axisKey is None:
+            return func(x, xUnitSrc, xUnit)
+
+        key = (axisKey, xUnitSrc, xUnit)
+        with cls._LOCK:
+            converted = cls._DATA.get(key, cls.NOT_CACHED)
+            if converted is not cls.NOT_CACHED:
+                cls._DATA.move_to_end(key)
+                return converted
+
+        converted = func(x, xUnitSrc, xUnit)
+        if isinstance(converted, np.ndarray):
+            if isinstance(x, np.ndarray) and np.may_share_memory(converted, x):
+                converted = converted.copy()
+            converted.setflags(write=False)
+
+        with cls._LOCK:
+            cls._DATA[key] = converted
+            while len(cls._DATA) > cls.MAX_ENTRIES:
+                cls._DATA.popitem(last=False)
+        return converted
+
+    @classmethod
+    def count(cls) -> int:
+        return len(cls._DATA)
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._DATA.clear()
+
+
+class FeatureIdCache(object):
+    """
+    A process-wide cache of feature id arrays that require to iterate over all features of a layer,
+    e.g. the loading order of a layer or the ids of the features that match a filter expression.
+    Adding, deleting and committing features invalidates all ids of a layer, attribute and geometry
+    changes invalidate the ids of filter expressions.
+    """
+    NOT_CACHED = object()
+
+    _LOCK = threading.RLock()
+    # layer id -> key -> feature ids, with key ('order',) or ('filter', expression string, context key)
+    _DATA: Dict[str, Dict[tuple, np.ndarray]] = dict()
+    _CONNECTED: Set[str] = set()
+
+    @classmethod
+    def value(cls, layer: QgsVectorLayer, key: tuple) -> Union[object, np.ndarray]:
+        """
+        Returns cached feature ids or NOT_CACHED
+        """
+        with cls._LOCK:
+            return cls._DATA.get(layer.id(), dict()).get(key, cls.NOT_CACHED)
+
+    @classmethod
+    def setValue(cls, layer: QgsVectorLayer, key: tuple, fids: np.ndarray):
+        with cls._LOCK:
+            cls._connectLayer(layer)
+            cls._DATA.setdefault(layer.id(), dict())[key] = fids
+
+    @classmethod
+    def _connectLayer(cls, layer: QgsVectorLayer):
+        lid = layer.id()
+        if lid in cls._CONNECTED:
+            return
+        cls._CONNECTED.add(lid)
+        layer.featureAdded.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.featuresDeleted.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.afterCommitChanges.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.afterRollBack.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.dataChanged.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.subsetStringChanged.connect(lambda *args, _lid=lid: cls.invalidateLayer(_lid))
+        layer.attributeValueChanged.connect(lambda *args, _lid=lid: cls.invalidateFilters(_lid))
+        layer.geometryChanged.connect(lambda *args, _lid=lid: cls.invalidateFilters(_lid))
+        layer.updatedFields.connect(lambda *args, _lid=lid: cls.invalidateFilters(_lid))
+        layer.willBeDeleted.connect(lambda *args, _lid=lid: cls.removeLayer(_lid))
+
+    @classmethod
+    def invalidateLayer(cls, layer: Union[str, QgsVectorLayer]):
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            cls._DATA.pop(lid, None)
+
+    @classmethod
+    def invalidateFilters(cls, layer: Union[str, QgsVectorLayer]):
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            data = cls._DATA.get(lid, dict())
+            for key in [k for k in data.keys() if k[0] == 'filter']:
+                del data[key]
+
+    @classmethod
+    def removeLayer(cls, layer: Union[str, QgsVectorLayer]):
+        lid = layer.id() if isinstance(layer, QgsVectorLayer) else layer
+        with cls._LOCK:
+            cls._DATA.pop(lid, None)
+            cls._CONNECTED.discard(lid)
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._DATA.clear()
+
+
+def fid_ordered_features(source: Union[QgsVectorLayer, QgsVectorLayerCache, QgsVectorLayerFeatureSource],
+                         request: QgsFeatureRequest,
+                         fids: Optional[np.ndarray],
+                         chunkSize: int) -> Iterator[QgsFeature]:
+    """
+    Returns the features of a feature request, or, if fids is given, the features of fids in the order of fids.
+    These are requested chunk by chunk. Providers return the features of a chunk in their own order,
+    so each chunk is reordered by fids.
+    """
+    if fids is None:
+        yield from source.getFeatures(request)
+        return
+    for i in range(0, len(fids), chunkSize):
+        chunk = [int(fid) for fid in fids[i:i + chunkSize]]
+        chunk_request = QgsFeatureRequest(request)
+        chunk_request.setFilterFids(chunk)
+        features = {f.id(): f for f in source.getFeatures(chunk_request)}
+        for fid in chunk:
+            feature = features.get(fid)
+            if feature is not None:
+                yield feature
+
+
+class SpectralProfileDecodingTask(QgsTask):
+    """
+    Reads and decodes the profiles of vector layer features in a background thread.
+    Features are read from feature sources, which are created in the thread that creates the task.
+    Decoded profiles are emitted in chunks with
+    sigProfilesDecoded(generation, job index, [(feature, profile data), ...]).
+    """
+    sigProfilesDecoded = pyqtSignal(int, int, object)
+
+    # number of feature ids requested at once, if features are read in a given order
+    FID_CHUNK_SIZE: int = 1024
+
+    def __init__(self,
+                 generation: int,
+                 jobs: List[Tuple[QgsVectorLayer, int, QgsFeatureRequest, Optional[np.ndarray],
+                                  Optional[Tuple[QgsExpression, QgsExpressionContext, tuple]], int]],
+                 chunkSize: int = 500,
+                 description: str = 'Load spectral profiles'):
+        """
+        :param generation: the plot update generation
+        :param jobs: (layer, profile field index, feature request, feature ids, filter, limit) tuples.
+                     If feature ids are given, their features are read in the order of the ids.
+                     The optional filter (expression, expression context, context key) is evaluated with
+                     cached values, see ProfileDataCache.expressionValue(), and only accepted features are emitted.
+                     Reading stops after limit accepted features, if limit >= 0.
+        :param chunkSize: number of profiles emitted at once
+        :param description: task description
+        """
+        super().__init__(description=description)
+        self.mGeneration: int = generation
+        self.mChunkSize: int = max(1, chunkSize)
+        # (feature source, layer id, profile field index, feature request, feature ids, expected number of features,
+        #  filter, limit)
+        self.mJobs: List[tuple] = []
+        for layer, fieldIndex, request, fids, cachedFilter, limit in jobs:
+            if fids is not None:
+                n = len(fids)
+            elif request.filterType() == QgsFeatureRequest.FilterFids:
+                n = len(request.filterFids())
+            else:
+                n = layer.featureCount()
+            if request.limit() >= 0:
+                n = min(n, request.limit())
+            if limit >= 0:
+                n = min(n, limit)
+            if cachedFilter is not None:
+                expression, context, contextKey = cachedFilter
+                cachedFilter = (expression.expression(), QgsExpressionContext(context), contextKey)
+                # allows to cache filter results of this layer in the task thread
+                ProfileDataCache._connectLayer(layer)
+            self.mJobs.append((QgsVectorLayerFeatureSource(layer), layer.id(), fieldIndex,
+                               QgsFeatureRequest(request), fids, n, cachedFilter, limit))
+        self.mErrors: List[str] = []
+
+    def generation(self) -> int:
+        return self.mGeneration
+
+    def errors(self) -> List[str]:
+        return self.mErrors[:]
+
+    def run(self) -> bool:
+        n_total = max(1, sum(job[5] for job in self.mJobs))
+        n_done = 0
+        try:
+            for i, (source, lid, fieldIndex, request, fids, _, cachedFilter, limit) in enumerate(self.mJobs):
+                chunk = []
+                expression = context = None
+                if cachedFilter is not None:
+                    expression = QgsExpression(cachedFilter[0])
+                    context = QgsExpressionContext(cachedFilter[1])
+                    expression.prepare(context)
+                n_accepted = 0
+                features = fid_ordered_features(source, request, fids, self.FID_CHUNK_SIZE)
+                for feature in features:
+                    if self.isCanceled():
+                        return False
+                    if 0 <= limit <= n_accepted:
+                        break
+                    if expression is not None:
+                        context.setFeature(feature)
+                        if not ProfileDataCache.expressionValue(lid, feature.id(), expression,
+                                                                lambda: bool(expression.evaluate(context)),
+                                                                contextKey=cachedFilter[2]):
+                            continue
+                    n_accepted += 1
+                    raw_data = ProfileDataCache.value((lid, feature.id(), 'raw', fieldIndex))
+                    if raw_data is ProfileDataCache.NOT_CACHED:
+                        raw_data = ProfileDataCache.decodeRawData(feature, fieldIndex)
+                    chunk.append((QgsFeature(feature), raw_data))
+                    if len(chunk) >= self.mChunkSize:
+                        self.sigProfilesDecoded.emit(self.mGeneration, i, chunk)
+                        n_done += len(chunk)
+                        self.setProgress(min(99.0, 100 * n_done / n_total))
+                        chunk = []
+                if len(chunk) > 0:
+                    self.sigProfilesDecoded.emit(self.mGeneration, i, chunk)
+                    n_done += len(chunk)
+                    self.setProgress(min(99.0, 100 * n_done / n_total))
+        except Exception as ex:
+            logger.error(f'Error loading spectral profiles: {ex}')
+            self.mErrors.append(str(ex))
+            return False
+        return True
+
+
 class SpectralProfilePlotModel(QStandardItemModel):
     CIX_NAME = 0
     CIX_VALUE = 1
@@ -111,6 +831,8 @@ class SpectralProfilePlotModel(QStandardItemModel):
     sigProgressChanged = pyqtSignal(float)
     sigPlotWidgetStyleChanged = pyqtSignal()
     sigMaxProfilesExceeded = pyqtSignal()
+    # number of plotted profiles, True if more profiles can be loaded with loadMoreProfiles
+    sigProfilesLoaded = pyqtSignal(int, bool)
     sigOpenAttributeTableRequest = pyqtSignal(str)
     sigOpenLayerPropertiesRequest = pyqtSignal(str)
     sigOpenSpectralProcessingRequest = pyqtSignal(str)
@@ -120,6 +842,18 @@ class SpectralProfilePlotModel(QStandardItemModel):
 
     NOT_INITIALIZED = -1
     MAX_PROFILES_DEFAULT: int = 516
+    # minimum number of profiles to draw profiles that share a style in batches
+    BATCH_RENDERING_THRESHOLD: int = 1000
+    # number of profiles added at once to a density histogram
+    DENSITY_CHUNK_SIZE: int = 2048
+    # minimum number of profiles to load profiles in a background task
+    ASYNC_LOADING_THRESHOLD: int = 2000
+    # number of profiles that are decoded in the background and plotted at once
+    LOADING_CHUNK_SIZE: int = 500
+    # maximum number of profiles stacked into a single matrix to accumulate statistics from
+    STATISTICS_CHUNK_SIZE: int = 10000
+    # number of strata a profile sample is drawn from, if not all profiles can be shown
+    LOADING_STRATA: int = 256
 
     class UpdateBlocker(object):
         """Blocks plot updates and proxy signals"""
@@ -162,6 +896,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
         # self.mPROFILE_CANDIDATE_STYLES: Dict[Tuple[str, str], Dict[int, PlotStyle]] = {}
 
         self.mHoverHTML: Dict[SpotItem, str] = dict()
+        self.mHoveredItem: Optional[SpectralProfilePlotDataItem] = None
         self.mSELECTED_SPOTS: Dict[str, Tuple[int, int]] = dict()
 
         self.mLastSettings: dict = dict()
@@ -181,14 +916,19 @@ class SpectralProfilePlotModel(QStandardItemModel):
         # # workaround https://github.com/qgis/QGIS/issues/45228
         self.mStartedCommitEditWrapper: bool = False
 
-        # data cache organized by: level1: layer id (str),
-        #                          level2: attribute field (int),
-        #                          level3: feature id (int)             = raw data
-        #                                  (feature id (int), xUnit (str))  = unit data
-        #                          items
-        self.mCACHE_PROFILE_DATA: Dict[
-            str, Dict[int, Dict[Union[int, Tuple[int, str]], Union[None, dict, int]]]] = dict()
+        # decoded profiles and expression values are cached in the ProfileDataCache
         self.mEnableCaching: bool = True
+        self.mBatchRenderingThreshold: Optional[int] = self.BATCH_RENDERING_THRESHOLD
+        self.mAsyncLoadingThreshold: Optional[int] = self.ASYNC_LOADING_THRESHOLD
+        # the running plot update and its background loading task
+        self.mUpdate: Optional[dict] = None
+        self.mUpdateGeneration: int = 0
+        self.mLoadingTask: Optional[SpectralProfileDecodingTask] = None
+        # the last finished plot update, which is continued by loadMoreProfiles
+        self.mLastUpdate: Optional[dict] = None
+        # number of profile pages of maximumProfiles size to show
+        self.mProfilePages: int = 1
+        self.mPagedMaxProfiles: int = -1
         self.mProfileFieldModel: SpectralProfileFieldListModel = SpectralProfileFieldListModel()
 
         self.mPlotWidget: Optional[SpectralProfilePlotWidget] = None
@@ -270,6 +1010,21 @@ class SpectralProfilePlotModel(QStandardItemModel):
         style.setAntialias(self.mGeneralSettings.antialias())
         self.mDefaultProfileCandidateStyle = style
 
+        # temporary profiles, e.g. of the live map hover, which are plotted but not stored in a speclib
+        self.mTemporaryProfiles: List[Tuple[dict, Optional[str]]] = []
+        self.mTemporaryPlotItems: List[SpectralProfilePlotDataItem] = []
+
+        # plotted profile items, which are updated incrementally: {(layer id, fid, field name, vis id): item}
+        self.mPlotItems: Dict[Tuple[str, int, str, str], SpectralProfilePlotDataItem] = dict()
+        self.mPlotItemSettings: Optional[tuple] = None
+
+        # density histograms of visualizations, which are filled chunk-wise
+        self.mDensityItems: List[SpectralProfileDensityItem] = []
+        self.mDensityJobs: List[Tuple[SpectralProfileDensityItem, Iterator[Tuple[np.ndarray, np.ndarray]]]] = []
+        self.mDensityTimer = QTimer()
+        self.mDensityTimer.setInterval(0)
+        self.mDensityTimer.timeout.connect(self.processDensityChunk)
+
         self.mCurrentSelectionColor: QColor = QColor('white')
 
     def errors(self) -> List[str]:
@@ -337,6 +1092,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
                 vis.setFilterExpression(visSettings.get('filter_expression', ''))
                 vis.setColorExpression(visSettings.get('color_expression', ''))
                 vis.setLabelExpression(visSettings.get('label_expression', ''))
+                vis.setShowDensity(visSettings.get('density', False) in [True, 1])
                 visGrps.append(vis)
 
         if len(visGrps) > 0:
@@ -535,12 +1291,15 @@ class SpectralProfilePlotModel(QStandardItemModel):
             return
         if isinstance(self.mProject, QgsProject):
             self.mProject.layersWillBeRemoved.disconnect(self.onLayersWillBeRemoved)
+            self.mProject.customVariablesChanged.disconnect(ProfileDataCache.invalidateExpressions)
 
         self.mProject = project
         for item in self.mModelItems:
             if isinstance(item, PropertyItemGroup):
                 item.setProject(project)
         self.mProject.layersWillBeRemoved.connect(self.onLayersWillBeRemoved)
+        # project variables can be used in color, label and filter expressions
+        self.mProject.customVariablesChanged.connect(ProfileDataCache.invalidateExpressions)
 
     def project(self) -> QgsProject:
         return self.mProject
@@ -558,6 +1317,20 @@ class SpectralProfilePlotModel(QStandardItemModel):
         for r in to_remove:
             r.onLayerRemoved()
 
+    def vectorLayer(self, layer_id: str) -> Optional[QgsVectorLayer]:
+        """
+        Returns the vector layer of a layer id, including plotted layers that are not part of the project
+        """
+        layer_cache = self.mLayerCaches.get(layer_id)
+        if isinstance(layer_cache, QgsVectorLayerCache) and isinstance(layer_cache.layer(), QgsVectorLayer):
+            return layer_cache.layer()
+        for project in [self.project(), QgsProject.instance()]:
+            if isinstance(project, QgsProject):
+                layer = project.mapLayer(layer_id)
+                if isinstance(layer, QgsVectorLayer):
+                    return layer
+        return None
+
     def rawData(self,
                 layer_id: str,
                 fieldIndex: int,
@@ -571,41 +1344,21 @@ class SpectralProfilePlotModel(QStandardItemModel):
         NI = SpectralProfilePlotModel.NOT_INITIALIZED
 
         if isinstance(feature, int):
-            return self.mCACHE_PROFILE_DATA[layer_id][fieldIndex].get(feature, NI)
+            value = ProfileDataCache.value((layer_id, feature, 'raw', fieldIndex))
+            return NI if value is ProfileDataCache.NOT_CACHED else value
 
         else:
             if not feature.isValid():
                 return None
-
-            raw_data = self.mCACHE_PROFILE_DATA[layer_id][fieldIndex].get(feature.id(), NI)
-
-            if raw_data == NI or not self.mEnableCaching:
-                # load profile data
-                d: dict = decodeProfileValueDict(feature.attribute(fieldIndex))
-                if d is None or len(d) == 0 or 'y' not in d.keys():
-                    # no profile
-                    raw_data = None
-                else:
-                    raw_data = d
-                    if raw_data.get('x', None) is None:
-                        raw_data['x'] = list(range(len(raw_data['y'])))
-                        raw_data['xUnit'] = BAND_INDEX
-
-                    # convert None values to NaN so that numpy arrays will become numeric
-                    raw_data['y'] = [np.nan if v is None or not math.isfinite(v) else v for v in raw_data['y']]
-
-                self.mCACHE_PROFILE_DATA[layer_id][fieldIndex][feature.id()] = raw_data
-            return raw_data
+            layer = self.vectorLayer(layer_id)
+            if not self.mEnableCaching or not isinstance(layer, QgsVectorLayer):
+                return ProfileDataCache.decodeRawData(feature, fieldIndex)
+            return ProfileDataCache.rawData(layer, fieldIndex, feature)
 
     def plotData2(self, layer_id: str, fieldIndex: int, feature: QgsFeature, xUnit: str) -> Optional[dict]:
 
-        # raw_data = feature.attributes()[fieldIndex]
-        # if raw_data is None:
-        #    return None
-
         try:
             raw_data = self.rawData(layer_id, fieldIndex, feature)
-            # d: dict = decodeProfileValueDict(feature.attribute(fieldIndex))
             if raw_data in [SpectralProfilePlotModel.NOT_INITIALIZED, None]:
                 return None
             return self.profileDataToXUnit(raw_data, xUnit)
@@ -618,28 +1371,22 @@ class SpectralProfilePlotModel(QStandardItemModel):
         """
         if not feature.isValid():
             return None
-        NI = SpectralProfilePlotModel.NOT_INITIALIZED
-        # NA = not initialized
-        # None = not available
-        # id_raw_data = feature.id()
-        id_unit_data = (feature.id(), xUnit)
-
-        FIELD_DATA = self.mCACHE_PROFILE_DATA[layer_id][fieldIndex]
-        plotData = FIELD_DATA.get(id_unit_data, NI)
-        if plotData == NI or not self.mEnableCaching:
-            rawData = self.rawData(layer_id, fieldIndex, feature)
+        layer = self.vectorLayer(layer_id)
+        if not self.mEnableCaching or not isinstance(layer, QgsVectorLayer):
+            rawData = ProfileDataCache.decodeRawData(feature, fieldIndex)
+            return None if rawData is None else self.profileDataToXUnit(rawData, xUnit)
 
-            if rawData is None:
-                # cannot load raw data
-                plotData = None
+        return ProfileDataCache.plotData(layer, fieldIndex, feature, xUnit, self.profileDataToXUnit)
 
-            else:
-                # convert profile data to xUnit
-                # if not possible, entry will be set to None
-                plotData = self.profileDataToXUnit(rawData, xUnit)
-            FIELD_DATA[id_unit_data] = plotData
-
-        return plotData
+    def expressionValue(self, layer: QgsVectorLayer, fid: int, expression: QgsExpression,
+                        evaluate: Callable[[], Any], contextKey: tuple = tuple()) -> Any:
+        """
+        Returns the value of a color, label or filter expression for a feature, evaluated with evaluate()
+        if not cached or if caching is disabled.
+        """
+        if not self.mEnableCaching:
+            return evaluate()
+        return ProfileDataCache.expressionValue(layer, fid, expression, evaluate, contextKey=contextKey)
 
     def plotWidget(self) -> Optional[SpectralProfilePlotWidget]:
         return self.mPlotWidget
@@ -687,6 +1434,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
     def setPlotWidget(self, plotWidget: SpectralProfilePlotWidget):
         self.mPlotWidget = plotWidget
         self.mPlotWidget.sigPlotDataItemSelected.connect(self.onPlotSelectionRequest)
+        self.mPlotWidget.sigProfileHovered.connect(self.onProfileHovered)
         self.mPlotWidget.xAxis().setUnit(self.xUnit())  # required to set x unit in plot widget
         self.mXUnitInitialized = False
 
@@ -707,9 +1455,251 @@ class SpectralProfilePlotModel(QStandardItemModel):
     def setMaxProfiles(self, n: int):
         self.generalSettings().setMaximumProfiles(n)
 
+    def setBatchRenderingThreshold(self, n: Optional[int]):
+        """
+        Sets the minimum number of profiles for which profiles with the same plot style are drawn as a
+        single SpectralProfileBatchItem. Selected profiles, candidates and profiles with marker symbols are
+        always drawn as single SpectralProfilePlotDataItems.
+        :param n: number of profiles, None to disable batch rendering
+        """
+        if not (n is None or n >= 0):
+            raise AssertionError
+        if n != self.mBatchRenderingThreshold:
+            self.mBatchRenderingThreshold = n
+            self.updatePlot()
+
+    def batchRenderingThreshold(self) -> Optional[int]:
+        return self.mBatchRenderingThreshold
+
+    def useBatchRendering(self, visualizations: List[dict], max_profiles: int, show_selected_only: bool) -> bool:
+        """
+        Returns True if the number of profiles that can be shown by the visualizations reaches
+        the batch rendering threshold
+        """
+        if self.mBatchRenderingThreshold is None:
+            return False
+        n = self.estimatedProfileCount(visualizations, max_profiles, show_selected_only)
+        return n >= self.mBatchRenderingThreshold
+
+    def setAsyncLoadingThreshold(self, n: Optional[int]):
+        """
+        Sets the minimum number of profiles for which profiles are read and decoded in a background task
+        and plotted progressively. The loading of a previous plot update is canceled by a newer one.
+        :param n: number of profiles, None to always load profiles synchronously
+        """
+        if not (n is None or n >= 0):
+            raise AssertionError
+        self.mAsyncLoadingThreshold = n
+
+    def asyncLoadingThreshold(self) -> Optional[int]:
+        return self.mAsyncLoadingThreshold
+
+    def estimatedProfileCount(self, visualizations: List[dict], max_profiles: int, show_selected_only: bool) -> int:
+        """
+        Returns the maximum number of profiles that can be shown by the visualizations
+        """
+        n = 0
+        for lid in set(vis.get('layer_id') for vis in visualizations):
+            layer = self.project().mapLayer(lid)
+            if not isinstance(layer, QgsVectorLayer):
+                continue
+            if show_selected_only:
+                n += layer.selectedFeatureCount() + len(layer.customProperty(CUSTOM_PROPERTY_CANDIDATE_FIDs, []))
+            else:
+                n += layer.featureCount()
+        return min(n, max_profiles)
+
     def maxProfiles(self) -> int:
         return self.generalSettings().maximumProfiles()
 
+    def profilePages(self) -> int:
+        """
+        Returns the number of profile pages, each with up to maxProfiles() profiles, which are shown
+        """
+        return self.mProfilePages
+
+    def resetProfilePages(self):
+        """
+        Shows the first page of profiles only
+        """
+        if self.mProfilePages != 1:
+            self.mProfilePages = 1
+            self.updatePlot()
+
+    def canLoadMoreProfiles(self) -> bool:
+        """
+        Returns True if the profile limit was reached by the last plot update and further profiles can be
+        added with loadMoreProfiles
+        """
+        update = self.mLastUpdate
+        return not self.isLoading() and isinstance(update, dict) and update['limit_reached']
+
+    def loadMoreProfiles(self) -> bool:
+        """
+        Adds the next page of up to maxProfiles() profiles to the plot. Profiles that are already plotted
+        are neither read nor plotted again.
+        :return: True, if more profiles are loaded
+        """
+        if not (self.canLoadMoreProfiles() and isinstance(self.mPlotWidget, SpectralProfilePlotWidget)):
+            return False
+        last = self.mLastUpdate
+        self.mLastUpdate = None
+        self.mProfilePages += 1
+        self.mUpdateGeneration += 1
+
+        jobs = []
+        for job in last['jobs']:
+            if job['fids'] is None:
+                # all profiles have been read
+                continue
+            fids = job['fids']
+            fids = fids[~np.isin(fids, np.fromiter(job['done'], dtype=np.int64, count=len(job['done'])))]
+            if len(fids) > 0:
+                jobs.append(dict(job, fids=fids, done=set()))
+
+        update = dict(last)
+        update.update({
+            'generation': self.mUpdateGeneration,
+            'append': True,
+            'max_profiles': last['max_profiles'] + self.maxProfiles(),
+            'limit_reached': False,
+            'plot_items': dict(self.mPlotItems),
+            'plotted_items': set(),
+            'reusable_items': set(),
+            'jobs': jobs,
+            'dt': dict(),
+        })
+        n_expected = min(sum(len(job['fids']) for job in jobs), self.maxProfiles())
+        self.loadProfiles(update, n_expected)
+        return True
+
+    def loadingOrder(self, layer: QgsVectorLayer) -> np.ndarray:
+        """
+        Returns the ids of all layer features in the order of a stratified random sample,
+        so that the first n profiles of this order represent all profiles, and not only the first ones
+        stored in the layer. Features are stratified by location or, for non-spatial layers, by feature id.
+        """
+        order = FeatureIdCache.value(layer, ('order',))
+        if isinstance(order, np.ndarray):
+            return order
+
+        request = QgsFeatureRequest()
+        request.setNoAttributes()
+        spatial = layer.isSpatial()
+        if not spatial:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        fids = []
+        xy = []
+        for f in layer.getFeatures(request):
+            fids.append(f.id())
+            if spatial:
+                g = f.geometry()
+                if g.isNull() or g.isEmpty():
+                    xy.append((np.nan, np.nan))
+                else:
+                    c = g.boundingBox().center()
+                    xy.append((c.x(), c.y()))
+        fids = np.asarray(fids, dtype=np.int64)
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2) if spatial else None
+        order = self.stratifiedFeatureOrder(fids, xy=xy, n_strata=self.LOADING_STRATA)
+        FeatureIdCache.setValue(layer, ('order',), order)
+        return order
+
+    @staticmethod
+    def stratifiedFeatureOrder(fids: np.ndarray,
+                               xy: Optional[np.ndarray] = None,
+                               n_strata: int = 256,
+                               seed: int = 0) -> np.ndarray:
+        """
+        Orders feature ids like a stratified random sample: features are drawn from the strata in turns,
+        one random feature per stratum and turn.
+        :param fids: feature ids
+        :param xy: optional (n, 2) array with feature locations. Strata are the cells of a regular grid with
+                   n_strata cells over the location extent. Features without location form an own stratum.
+                   If not set, the strata are blocks of consecutive feature ids.
+        :param n_strata: number of strata
+        :param seed: seed of the random generator, to return the same order for the same input
+        :return: the ordered feature ids
+        """
+        fids = np.asarray(fids, dtype=np.int64)
+        n = len(fids)
+        if n == 0:
+            return fids
+        n_strata = max(1, min(n_strata, n))
+        if xy is not None:
+            xy = np.asarray(xy, dtype=float)
+            n_cells = max(1, int(math.sqrt(n_strata)))
+            valid = np.all(np.isfinite(xy), axis=1)
+            strata = np.full(n, n_cells * n_cells, dtype=np.int64)
+            if np.any(valid):
+                cells = []
+                for d in range(2):
+                    v = xy[valid, d]
+                    v0, v1 = v.min(), v.max()
+                    scale = n_cells / (v1 - v0) if v1 > v0 else 0
+                    cells.append(np.clip(((v - v0) * scale).astype(np.int64), 0, n_cells - 1))
+                strata[valid] = cells[1] * n_cells + cells[0]
+        else:
+            rank = np.empty(n, dtype=np.int64)
+            rank[np.argsort(fids, kind='stable')] = np.arange(n)
+            strata = rank * n_strata // n
+
+        rng = np.random.default_rng(seed)
+        # random order within each stratum
+        perm = rng.permutation(n)
+        perm = perm[np.argsort(strata[perm], kind='stable')]
+        strata_sorted = strata[perm]
+        starts = np.flatnonzero(np.r_[True, strata_sorted[1:] != strata_sorted[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        turn = np.arange(n) - np.repeat(starts, counts)
+        # strata are visited in a random order in each turn
+        visit = rng.permutation(int(strata.max()) + 1)[strata_sorted]
+        return fids[perm[np.lexsort((visit, turn))]]
+
+    def matchingFeatureIds(self, layer: QgsVectorLayer, request: QgsFeatureRequest) -> np.ndarray:
+        """
+        Returns the ids of the features that match the filter expression of a feature request
+        """
+        expression = request.filterExpression()
+        key = None
+        if isinstance(expression, QgsExpression) and ProfileDataCache.isCacheable(expression):
+            key = ('filter', expression.expression(),
+                   ProfileDataCache.contextKey(expression, request.expressionContext()))
+            fids = FeatureIdCache.value(layer, key)
+            if isinstance(fids, np.ndarray):
+                return fids
+
+        request = QgsFeatureRequest(request)
+        request.setLimit(-1)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        if isinstance(expression, QgsExpression):
+            if expression.needsGeometry():
+                request.setFlags(QgsFeatureRequest.NoFlags)
+            request.setSubsetOfAttributes(list(expression.referencedAttributeIndexes(layer.fields())))
+        else:
+            request.setNoAttributes()
+        fids = np.asarray([f.id() for f in layer.getFeatures(request)], dtype=np.int64)
+        if key is not None:
+            FeatureIdCache.setValue(layer, key, fids)
+        return fids
+
+    def prioritizedFeatureIds(self,
+                              layer: QgsVectorLayer,
+                              request: QgsFeatureRequest,
+                              selected_fids: List[int],
+                              candidate_fids: List[int]) -> np.ndarray:
+        """
+        Returns the ids of the features to read profiles from, ordered by priority:
+        profile candidates first, then selected features, then all other features that match the
+        request filter in the order of a stratified random sample.
+        """
+        order = self.loadingOrder(layer)
+        if request.filterType() == QgsFeatureRequest.FilterExpression:
+            order = order[np.isin(order, self.matchingFeatureIds(layer, request))]
+        first = np.asarray(list(dict.fromkeys(candidate_fids + selected_fids)), dtype=np.int64)
+        first = first[np.isin(first, order)]
+        return np.concatenate([first, order[~np.isin(order, first)]])
+
     def close(self):
         """
         Can be used to deregister signals and disconnect slots.
@@ -718,6 +1708,10 @@ class SpectralProfilePlotModel(QStandardItemModel):
             for proxy in proxies:
                 proxy.disconnect()
         self.mSignalProxies.clear()
+        self.cancelLoading()
+        self.mUpdate = None
+        self.mDensityTimer.stop()
+        self.mDensityJobs.clear()
         SpectralProfileCandidates.SHARED_SIGNALS.candidatesChanged.disconnect(self.onCandidatesChanged)
 
     def __len__(self) -> int:
@@ -883,6 +1877,50 @@ class SpectralProfilePlotModel(QStandardItemModel):
                 html.append(txt)
         self.mPlotWidget.mInfoHover.setHtml('<br>'.join(html))
 
+    def onProfileHovered(self, item: Optional[SpectralProfilePlotDataItem], index: int):
+        """
+        Shows information on the profile next to the mouse
+        """
+        if item is None and self.mHoveredItem is None:
+            return
+        if self.mHoveredItem is not None:
+            self.mHoverHTML.pop(self.mHoveredItem, None)
+        self.mHoveredItem = item
+        if isinstance(item, SpectralProfilePlotDataItem):
+            x, y = item.getData()
+            self.mHoverHTML[item] = f'<i>{item.name()}</i><br>[{index}] {x[index]}, {y[index]}' \
+                                    f'<br>fid: {item.featureID()} field: {item.field()}'
+        self.mPlotWidget.mInfoHover.setHtml('<br>'.join(list(self.mHoverHTML.values())[0:5]))
+
+    def onBatchProfileHovered(self, item: SpectralProfileBatchItem, index: int, event: HoverEvent):
+
+        if index < 0:
+            self.mHoverHTML.pop(item, None)
+        else:
+            fid = item.featureIDs()[index]
+            self.mHoverHTML[item] = f'<i>{item.label(index)}</i><br>fid: {fid} field: {item.mField}'
+        self.mPlotWidget.mInfoHover.setHtml('<br>'.join(list(self.mHoverHTML.values())[0:5]))
+
+    def onBatchProfileClicked(self, item: SpectralProfileBatchItem, index: int, event: MouseClickEvent):
+        """
+        Handles the selection / unselection of a spectral profile drawn in a batch.
+        Batched profiles are never selected, so clicking them selects their features.
+        """
+        if self.showSelectedFeaturesOnly():
+            return
+        layer = self.project().mapLayer(item.layerID())
+        if not isinstance(layer, QgsVectorLayer):
+            return
+        fid = item.featureIDs()[index]
+
+        modifiers = event.modifiers()
+        if modifiers & (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.ShiftModifier):
+            # add to existing selection
+            layer.select(fid)
+        else:
+            # this profile is the new selection
+            layer.selectByIds([fid])
+
     def onPointsClicked(self, item: PlotDataItem, spots: List[SpotItem], event: MouseClickEvent, **kwarg):
         """
         Handles the selection / unselection of spectral profile points
@@ -941,36 +1979,20 @@ class SpectralProfilePlotModel(QStandardItemModel):
         has_ctrl = modifiers & Qt.KeyboardModifier.ControlModifier
         has_shift = modifiers & Qt.KeyboardModifier.ShiftModifier
 
-        scene = self.mPlotWidget.scene()
-
         pi1 = self.mPlotWidget.plotItem1
         vb = pi1.getViewBox()
 
-        srect2 = vb.mapRectToScene(srect)
-
-        # get all items whose shape intersects the rect
-        # items1 = vb.scene().items(srect, Qt.IntersectsItemShape, Qt.AscendingOrder)
-
-        curves = [item
-                  for item in scene.items(srect2, Qt.IntersectsItemShape, Qt.AscendingOrder)
-                  if isinstance(item, PlotCurveItem)
-                  and isinstance(item.parentItem(), SpectralProfilePlotDataItem)]
         srect2 = vb.mapSceneToView(srect).boundingRect().normalized()
 
-        # need a more precise intersection test
-        def intersects(item: PlotDataItem, rect: QRectF) -> bool:
-            x, y = item.getData()
-            # p = item.getPath()
-            # b1 = p.intersects(rect)
-
-            from qgis.core import QgsLineString, QgsGeometry, QgsRectangle
-            ls = QgsGeometry(QgsLineString(x, y))
-
-            rect2 = QgsGeometry.fromWkt(QgsRectangle(rect).asWktPolygon())
-            b2 = ls.intersects(rect2)
-            return b2
-
-        pdis = [c.parentItem() for c in curves if intersects(c, srect2)]
+        # profiles with a line segment or vertex inside the rectangle
+        pdis = []
+        BATCHED_FIDS: Dict[str, List[int]] = dict()
+        for item, profiles in pi1.hitIndex().profilesInRect(srect2).items():
+            if isinstance(item, SpectralProfilePlotDataItem):
+                pdis.append(item)
+            elif isinstance(item, SpectralProfileBatchItem):
+                fids = item.featureIDs()
+                BATCHED_FIDS.setdefault(item.layerID(), []).extend([fids[i] for i in profiles])
 
         selection_changed = False
         if has_shift:
@@ -987,6 +2009,13 @@ class SpectralProfilePlotModel(QStandardItemModel):
 
         if selection_changed:
             self._updateFeatureSelectionFromCurves()
+            for lid, fids in BATCHED_FIDS.items():
+                layer = self.project().mapLayer(lid)
+                if isinstance(layer, QgsVectorLayer) and len(fids) > 0:
+                    if has_shift:
+                        layer.select(fids)
+                    else:
+                        layer.deselect(fids)
 
     def onCurveClicked(self, item: PlotCurveItem, event: MouseClickEvent):
         """
@@ -1131,8 +2160,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
         ITEMS_PI1 = []
         ITEMS_PI2 = []
 
-        DATA_PAIRS = dict()
-        # VIS_STATS = dict()
+        STATS: Dict[str, ProfileStatistics] = dict()
 
         # collect data from plottes SpectraProfilePlotDataItems
         vis_with_stats = []
@@ -1142,28 +2170,38 @@ class SpectralProfilePlotModel(QStandardItemModel):
                 if len(vis.get('statistics', {})) > 0])
 
         if len(vis_with_stats) > 0:
-            vis_ids = [v['vis_id'] for v in vis_with_stats]
             t0 = datetime.datetime.now()
+            DATA_PAIRS: Dict[str, list] = {v['vis_id']: [] for v in vis_with_stats}
             for pdi in p1.spectralProfilePlotDataItems():
-                if pdi.mVisID in vis_ids:
-                    DATA_PAIRS[pdi.mVisID] = DATA_PAIRS.get(pdi.mVisID, []) + [(pdi.xData, pdi.yData)]
+                if pdi.mVisID in DATA_PAIRS and pdi.xData is not None:
+                    DATA_PAIRS[pdi.mVisID].append((pdi.xData, pdi.yData))
+            for item in p1.spectralProfileBatchItems():
+                if item.mVisID in DATA_PAIRS:
+                    DATA_PAIRS[item.mVisID].extend(item.profilesData())
             add_dt('Collect XY Data', t0)
-            # merge data into
-            # x = 1d array with x values,
-            # Y = 2d array with Y values to caluclate statistics from
+
+            # stack profiles of same spectral setting into (n_profiles, n_bands) matrices
+            # and accumulate band-wise statistics
             t1 = datetime.datetime.now()
-            for vis_id in list(DATA_PAIRS.keys()):
-                DATA_PAIRS[vis_id] = xy_pair_matrix(DATA_PAIRS[vis_id])
-            add_dt('run xy_pair_matrix', t1)
-            add_dt('Create XY_PAIR_MATRIZES total', t0)
+            for vis in vis_with_stats:
+                vis_id = vis['vis_id']
+                pairs = DATA_PAIRS[vis_id]
+                if len(pairs) == 0:
+                    continue
+                keep_data = any(stat not in ProfileStatistics.STREAMING for stat in vis['statistics'].keys())
+                stats = ProfileStatistics(keepData=keep_data)
+                stats.addPairs(pairs, chunkSize=self.STATISTICS_CHUNK_SIZE)
+                STATS[vis_id] = stats
+            add_dt('Accumulate statistics', t1)
+            del DATA_PAIRS
 
             for vis in vis_with_stats:
                 vis_id = vis['vis_id']
                 vis_name = vis['name']
-                if vis_id not in DATA_PAIRS:
+                if vis_id not in STATS:
                     continue
 
-                x, Y = DATA_PAIRS[vis_id]
+                stats = STATS[vis_id]
 
                 t0 = datetime.datetime.now()
                 for stat, style in vis['statistics'].items():
@@ -1177,9 +2215,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
                     if stat not in STATS_FUNCTIONS:
                         continue
 
-                    with warnings.catch_warnings():
-                        warnings.simplefilter("ignore", category=RuntimeWarning)
-                        x2, y2 = STATS_FUNCTIONS[stat](x, Y)
+                    x2, y2 = stats.statistic(stat)
 
                     name = f'{vis_name} {stat}'
 
@@ -1199,7 +2235,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
 
                         # b) area around the mean in plot 1
                         else:
-                            x_mean, y_mean = func_mean(x, Y)
+                            x_mean, y_mean = stats.statistic('mean')
                             c_upper = PlotDataItem(x=x_mean.tolist(), y=(y_mean + y2).tolist(),
                                                    name=name, antialias=antialias)
                             c_lower = PlotDataItem(x=x_mean.tolist(), y=(y_mean - y2).tolist(),
@@ -1237,8 +2273,6 @@ class SpectralProfilePlotModel(QStandardItemModel):
     def updatePlot(self,
                    settings: Optional[dict] = None):  #
 
-        self.mCACHE_PROFILE_DATA.clear()
-
         if settings is None:
             settings = self.settingsMap()
 
@@ -1253,6 +2287,15 @@ class SpectralProfilePlotModel(QStandardItemModel):
         logger.debug(f'update #{self.nUpdates}')
 
         self.nUpdates += 1
+        # a newer update cancels the profile loading of the previous one
+        self.cancelLoading()
+        self.mUpdateGeneration += 1
+        self.mLastUpdate = None
+        if isinstance(self.mUpdate, dict) and self.mUpdate['item_settings'] == self.mPlotItemSettings:
+            # reuse the plot items that have been loaded so far
+            self.mPlotItems.update(self.mUpdate['plot_items'])
+        self.mUpdate = None
+
         xunit: str = self.xUnit().unit
         if xunit is None:
             xunit = BAND_NUMBER
@@ -1279,50 +2322,51 @@ class SpectralProfilePlotModel(QStandardItemModel):
                 continue
             else:
                 # lsrc = vis.get('layer_source', speclib.source())
-                lyr = self.project().mapLayer(lid)
+                lyr = self.vectorLayer(lid)
 
                 if isinstance(lyr, QgsVectorLayer) and lyr.isValid():
                     self.mLayerCaches[lid] = QgsVectorLayerCache(lyr, 1024)
 
-        # prepare a profile data cache dict for each layer and spectral profile field
-        for vis in visualizations:
-            layer_cache: QgsVectorLayerCache = self.mLayerCaches[vis['layer_id']]
-            layer = layer_cache.layer()
-            field_name = vis['field_name']
-            field_index = layer.fields().lookupField(field_name)
-            layer_data_cache = self.mCACHE_PROFILE_DATA.get(layer.id(), dict())
-            field_data_cache = layer_data_cache.get(field_index, dict())
-            layer_data_cache[field_index] = field_data_cache
-            self.mCACHE_PROFILE_DATA[layer.id()] = layer_data_cache
-
-        # for v in self.visualizations():
-        #    v.mPlotDataItems.clear()
-        #    if v.isVisible() and v.isComplete() and v.speclib() == self.speclib():
-        #        visualizations.append(v)
-
-        # pdi_generator = PDIGenerator([], onProfileClicked=self.mPlotWidget.onProfileClicked)
-
-        # request.setFilterFids(feature_priority)
-
-        # PROFILE_DATA: Dict[tuple, dict] = dict()
-
-        profile_limit_reached: bool = False
         max_profiles = self.generalSettings().maximumProfiles()
-        show_bad_bands = self.generalSettings().showBadBands()
-        sort_bands = self.generalSettings().sortBands()
+        if max_profiles != self.mPagedMaxProfiles:
+            # a new profile limit starts with the first page
+            self.mPagedMaxProfiles = max_profiles
+            self.mProfilePages = 1
+        max_profiles *= self.mProfilePages
         show_selected_only = self.showSelectedFeaturesOnly()
+        n_expected = self.estimatedProfileCount(visualizations, max_profiles, show_selected_only)
+        # if not all profiles can be shown, read selected profiles first and a representative sample afterwards
+        prioritized = not show_selected_only and \
+            self.estimatedProfileCount(visualizations, math.inf, show_selected_only) > max_profiles
+
+        plotted_items = set(self.mPlotWidget.plotItem.listDataItems())
+        # existing profile items can be reused, unless settings changed that are applied to new items only
+        item_settings = (antialiasing, self.mCurrentSelectionColor.rgba())
+
+        update = {
+            'generation': self.mUpdateGeneration,
+            'settings': settings,
+            'x_unit': xunit,
+            'antialiasing': antialiasing,
+            'show_bad_bands': self.generalSettings().showBadBands(),
+            'sort_bands': self.generalSettings().sortBands(),
+            'show_selected_only': show_selected_only,
+            'max_profiles': max_profiles,
+            'batch_rendering': self.useBatchRendering(visualizations, max_profiles, show_selected_only),
+            'func_selected_style': func_selected_style,
+            'n_profiles': 0,
+            'first_profile': None,
+            'limit_reached': False,
+            # plot items of single profiles: {(layer id, fid, field name, vis id): plot item}
+            'plot_items': dict(),
+            'plotted_items': plotted_items,
+            'reusable_items': plotted_items if item_settings == self.mPlotItemSettings else set(),
+            'item_settings': item_settings,
+            'jobs': [],
+            'dt': dict(),
+        }
 
-        PLOT_ITEMS: List[SpectralProfilePlotDataItem] = []
-
-        DT = dict()
-
-        def add_dt(key: str, t0: datetime.datetime):
-            dt = (datetime.datetime.now() - t0).total_seconds()
-            dtl = DT.get(key, [])
-            dtl.append(dt)
-            DT[key] = dtl
-
-        t0 = datetime.datetime.now()
+        DENSITY_JOBS: List[Tuple[SpectralProfileDensityItem, Iterator[Tuple[np.ndarray, np.ndarray]]]] = []
 
         for i_vis, vis in enumerate(visualizations):
 
@@ -1375,23 +2419,15 @@ class SpectralProfilePlotModel(QStandardItemModel):
             else:
                 referenced_aids.extend(filter_expression.referencedAttributeIndexes(layer.fields()))
 
-            self.mLastReferencedColumns[layer_id] = set(referenced_aids)
-
-            request = QgsFeatureRequest()
-            request.setLimit(max_profiles)
-            request.setFlags(QgsFeatureRequest.NoGeometry)
-
-            if filter_expression:
-                request.setFilterExpression(filter_expression.expression())
-
-            if show_selected_only:
-                request.setFilterFids(selected_fids + candidate_fids)
-
             field_name = vis['field_name']
             field_index = layer.fields().lookupField(field_name)
             if field_index < 0:
                 continue
 
+            # profile data is cached, so changes of the profile field require an update as well
+            referenced_aids.append(field_index)
+            self.mLastReferencedColumns[layer_id] = set(referenced_aids)
+
             vis_context = QgsExpressionContext()
             vis_context.appendScope(QgsExpressionContextUtils.globalScope())
             vis_context.appendScope(QgsExpressionContextUtils.layerScope(layer))
@@ -1405,6 +2441,34 @@ class SpectralProfilePlotModel(QStandardItemModel):
             scope.setVariable('field_name', vis['field_name'])
             scope.setVariable('field_index', field_index)
             scope.setVariable('visualization_name', vis['name'])
+            vis_context.appendScope(scope)
+
+            # cached expression values depend on the variables they use
+            context_keys = {e.expression(): ProfileDataCache.contextKey(e, vis_context)
+                            for e in [color_expression, label_expression, filter_expression]
+                            if isinstance(e, QgsExpression)}
+
+            request = QgsFeatureRequest()
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setExpressionContext(vis_context)
+
+            # evaluate the filter with cached results, if possible
+            cached_filter = None
+            if filter_expression:
+                if ProfileDataCache.isCacheable(filter_expression) and not filter_expression.needsGeometry():
+                    cached_filter = filter_expression
+                else:
+                    request.setFilterExpression(filter_expression.expression())
+            if cached_filter is None:
+                request.setLimit(max_profiles)
+
+            if show_selected_only:
+                request.setFilterFids(selected_fids + candidate_fids)
+
+            # feature ids in the order profiles are read, None to read them in the order of the request
+            fids = None
+            if prioritized and not vis.get('density', False):
+                fids = self.prioritizedFeatureIds(layer, request, selected_fids, candidate_fids)
 
             vis_plot_style: PlotStyle = PlotStyle.fromMap(vis['plot_style'])
 
@@ -1426,132 +2490,398 @@ class SpectralProfilePlotModel(QStandardItemModel):
             else:
                 candidate_style = self.mDefaultProfileCandidateStyle.clone()
 
-            for iFeature, feature in enumerate(layer_cache.getFeatures(request)):
-                feature: QgsFeature
-                fid = feature.id()
-                if len(PLOT_ITEMS) >= max_profiles:
-                    profile_limit_reached = True
+            if vis.get('density', False):
+                # all profiles are binned into a 2D histogram, which is filled chunk-wise and
+                # independent of the profile limit. Selected profiles and candidates are drawn on top.
+                density_request = QgsFeatureRequest(request)
+                density_request.setLimit(-1)
+                item = SpectralProfileDensityItem()
+                item.mVisID = vis_id
+                item.mLayerID = layer_id
+                item.mField = field_name
+                item.mFieldIndex = field_index
+                item.setZValue(-2)
+                profiles = self.densityProfiles(layer, field_index, density_request, xunit,
+                                                cached_filter=cached_filter,
+                                                context=vis_context,
+                                                contextKey=context_keys.get(filter_expression.expression())
+                                                if cached_filter else tuple(),
+                                                data_expression_code=data_expression_code,
+                                                showBadBands=update['show_bad_bands'])
+                DENSITY_JOBS.append((item, profiles))
+                if not show_selected_only:
+                    request.setFilterFids(selected_fids + candidate_fids)
+
+            update['jobs'].append({
+                'layer': layer,
+                'layer_id': layer_id,
+                'vis_id': vis_id,
+                'field_name': field_name,
+                'field_index': field_index,
+                'request': request,
+                'fids': fids,
+                # ids of the features that have been read from fids
+                'done': None if fids is None else set(),
+                'cached_filter': cached_filter,
+                'context': vis_context,
+                'context_keys': context_keys,
+                'color_expression': color_expression,
+                'label_expression': label_expression,
+                'data_expression_code': data_expression_code,
+                'plot_style': vis_plot_style,
+                'feature_renderer': feature_renderer,
+                'add_symbol_scope': add_symbol_scope,
+                'show_candidates': show_candidates,
+                'candidate_style': candidate_style,
+                'selected_fids': set(selected_fids),
+                'candidate_fids': set(candidate_fids),
+            })
+
+        # image items are not data items and need to be removed separately
+        self.clearDensityItems()
+        for item, profiles in DENSITY_JOBS:
+            self.mPlotWidget.plotItem.addItem(item)
+            self.mDensityItems.append(item)
+            self.mDensityJobs.append((item, profiles))
+
+        if len(self.mDensityJobs) > 0:
+            # show the first chunk immediately, add the others in the background of the event loop
+            if self.processDensityChunk():
+                self.mDensityTimer.start()
+
+        self.loadProfiles(update, n_expected)
+
+    def loadProfiles(self, update: dict, n_expected: int):
+        """
+        Reads the profiles of a plot update and adds them to the plot, in a background task if many
+        profiles are expected.
+        """
+        self.mUpdate = update
+        if self.mAsyncLoadingThreshold is not None and n_expected >= self.mAsyncLoadingThreshold:
+            self.startLoadingTask(update)
+        else:
+            for i_job, job in enumerate(update['jobs']):
+                layer_cache: QgsVectorLayerCache = self.mLayerCaches[job['layer_id']]
+                features = ((f, ProfileDataCache.NOT_CACHED) for f in fid_ordered_features(
+                    layer_cache, job['request'], job['fids'], SpectralProfileDecodingTask.FID_CHUNK_SIZE))
+                if not self.addProfiles(update, i_job, features):
                     break
+            self.finishPlotUpdate(update)
 
-                is_candidate = fid in candidate_fids
+    def addProfiles(self, update: dict, i_job: int, features: Iterable[Tuple[QgsFeature, Any]]) -> bool:
+        """
+        Creates or updates the plot items of a plot update for a sequence of features and adds them to the plot.
+        :param update: the plot update, as created by updatePlot
+        :param i_job: index of the visualization job in update['jobs']
+        :param features: (feature, decoded profile data) tuples.
+                         The profile data is decoded on demand if it is ProfileDataCache.NOT_CACHED
+        :return: False, if the profile limit is reached or the update was canceled, True otherwise
+        """
+        job = update['jobs'][i_job]
+        layer: QgsVectorLayer = job['layer']
+        layer_id = job['layer_id']
+        vis_id = job['vis_id']
+        field_name = job['field_name']
+        field_index = job['field_index']
+        cached_filter: Optional[QgsExpression] = job['cached_filter']
+        color_expression: QgsExpression = job['color_expression']
+        label_expression: QgsExpression = job['label_expression']
+        data_expression_code = job['data_expression_code']
+        vis_plot_style: PlotStyle = job['plot_style']
+        feature_renderer: QgsFeatureRenderer = job['feature_renderer']
+        add_symbol_scope: bool = job['add_symbol_scope']
+        selected_fids: Set[int] = job['selected_fids']
+        candidate_fids: Set[int] = job['candidate_fids']
+        done_fids: Optional[Set[int]] = job['done']
+        vis_context: QgsExpressionContext = job['context']
+        context_keys: Dict[str, tuple] = job['context_keys']
+
+        xunit: str = update['x_unit']
+        show_bad_bands = update['show_bad_bands']
+        sort_bands = update['sort_bands']
+        show_selected_only = update['show_selected_only']
+        max_profiles = update['max_profiles']
+        reusable_items: set = update['reusable_items']
+        PLOT_ITEMS: Dict[Tuple[str, int, str, str], SpectralProfilePlotDataItem] = update['plot_items']
+        DT = update['dt']
+
+        # new plot items
+        NEW_ITEMS: List[SpectralProfilePlotDataItem] = []
+        # profiles drawn in batches: {(vis id, line color): [(plot data, feature id, label)]}
+        BATCHES: Dict[Tuple[str, int], List[Tuple[dict, int, str]]] = dict()
+        BATCH_INFO: Dict[Tuple[str, int], Tuple[str, str, int, PlotStyle]] = dict()
 
-                # self.mVectorLayerCache.getFeatures(feature_priority):
-                # feature: QgsFeature = self.mVectorLayerCache.getFeature(fid)
-                # assert fid == feature.id()
-                # fid = feature.id()
+        def add_dt(key: str, t0: datetime.datetime):
+            dt = (datetime.datetime.now() - t0).total_seconds()
+            dtl = DT.get(key, [])
+            dtl.append(dt)
+            DT[key] = dtl
 
-                t0 = datetime.datetime.now()
+        completed = True
+        for iFeature, (feature, raw_data) in enumerate(features):
+            feature: QgsFeature
+            fid = feature.id()
+            if update['n_profiles'] >= max_profiles:
+                update['limit_reached'] = True
+                completed = False
+                break
+            if done_fids is not None:
+                done_fids.add(fid)
 
-                if data_expression_code is None:
-                    plot_data: Optional[dict] = self.plotData1(layer_id, field_index, feature, xunit)
-                    add_dt('plotData1', t0)
-                else:
-                    # override / manipulate data using python code
-                    try:
-                        kwds = self.rawData(layer_id, field_index, feature).copy()
-                        lists_to_numpy_array(kwds)
-                        kwds['f'] = feature
+            feature_context = QgsExpressionContext(vis_context)
+            feature_context.setFeature(feature)
 
-                        exec(data_expression_code, kwds)  # nosec: B102 # user-transparent definition of Python code
+            if cached_filter is not None:
+                t0 = datetime.datetime.now()
+                accepted = self.expressionValue(
+                    layer, fid, cached_filter, lambda: bool(cached_filter.evaluate(feature_context)),
+                    contextKey=context_keys[cached_filter.expression()])
+                add_dt('filter', t0)
+                if not accepted:
+                    continue
 
-                        raw_data = {k: kwds[k] for k in ['x', 'y', 'xUnit', 'yUnit', 'bbl'] if k in kwds}
-                        plot_data = self.profileDataToXUnit(raw_data, xunit)
-                    except Exception as ex:
+            is_candidate = fid in candidate_fids
 
-                        error = f'{vis_id}:{ex}'
-                        self.mErrors.add(error)
-                        continue
+            t0 = datetime.datetime.now()
 
-                # t0 = datetime.datetime.now()
-                # plot_data: Optional[dict] = self.plotData2(layer_id, field_index, feature, xunit)
-                # add_dt('plotData2', t0)
+            if raw_data is not ProfileDataCache.NOT_CACHED and self.mEnableCaching:
+                # profile decoded in the background
+                key = (layer_id, fid, 'raw', field_index)
+                if ProfileDataCache.value(key) is ProfileDataCache.NOT_CACHED:
+                    ProfileDataCache.setValue(layer, key, raw_data)
+                raw_data = ProfileDataCache.NOT_CACHED
 
-                if not isinstance(plot_data, dict):
-                    # profile data cannot be transformed to the requested x-unit
+            if data_expression_code is None:
+                if raw_data is ProfileDataCache.NOT_CACHED:
+                    plot_data: Optional[dict] = self.plotData1(layer_id, field_index, feature, xunit)
+                else:
+                    plot_data = self.profileDataToXUnit(raw_data, xunit)
+                add_dt('plotData1', t0)
+            else:
+                # override / manipulate data using python code
+                try:
+                    if raw_data is ProfileDataCache.NOT_CACHED:
+                        raw_data = self.rawData(layer_id, field_index, feature)
+                    plot_data = self.evaluateDataExpression(raw_data, feature, data_expression_code, xunit)
+                except Exception as ex:
+
+                    error = f'{vis_id}:{ex}'
+                    self.mErrors.add(error)
                     continue
 
-                feature_context = QgsExpressionContext(vis_context)
-                feature_context.setFeature(feature)
+            if not isinstance(plot_data, dict):
+                # profile data cannot be transformed to the requested x-unit
+                continue
 
-                # get the curve plot style
-                if is_candidate:
-                    if show_candidates:
-                        plot_style = candidate_style
-                    else:
-                        continue
+            # get the curve plot style
+            if is_candidate:
+                if job['show_candidates']:
+                    plot_style = job['candidate_style']
                 else:
-                    # get standard visualization style
-                    plot_style = vis_plot_style.clone()
+                    continue
+            else:
+                # get standard visualization style
+                plot_style = vis_plot_style.clone()
+
+                def evaluate_color():
+                    context = feature_context
                     if add_symbol_scope:
+                        context = QgsExpressionContext(feature_context)
                         renderContext = QgsRenderContext()
-                        renderContext.setExpressionContext(feature_context)
+                        renderContext.setExpressionContext(context)
                         feature_renderer.startRender(renderContext, feature.fields())
                         qgssymbol = feature_renderer.symbolForFeature(feature, renderContext)
-                        symbolScope = None
                         if isinstance(qgssymbol, QgsSymbol):
                             symbolScope = qgssymbol.symbolRenderContext().expressionContextScope()
-                            feature_context.appendScope(QgsExpressionContextScope(symbolScope))
+                            context.appendScope(QgsExpressionContextScope(symbolScope))
                         feature_renderer.stopRender(renderContext)
+                    return color_expression.evaluate(context)
 
-                    line_color = color_expression.evaluate(feature_context)
-                    if isinstance(line_color, str):
-                        try:
-                            line_color = QColor(line_color)
-                        except Exception:
-                            line_color = None
+                line_color = self.expressionValue(layer, fid, color_expression, evaluate_color,
+                                                  contextKey=context_keys[color_expression.expression()])
+                if isinstance(line_color, str):
+                    try:
+                        line_color = QColor(line_color)
+                    except Exception:
+                        line_color = None
 
-                    if isinstance(line_color, QColor):
-                        plot_style.setLineColor(line_color)
-                        plot_style.setMarkerColor(line_color)
-                        plot_style.setMarkerLinecolor(line_color)
+                if isinstance(line_color, QColor):
+                    plot_style.setLineColor(line_color)
+                    plot_style.setMarkerColor(line_color)
+                    plot_style.setMarkerLinecolor(line_color)
 
-                add_dt('plotStyle', t0)
+            add_dt('plotStyle', t0)
 
-                t0 = datetime.datetime.now()
-                plot_label = label_expression.evaluate(feature_context)
-
-                is_selected = not show_selected_only and fid in selected_fids
-
-                pdi = SpectralProfilePlotDataItem(antialias=antialiasing)
-                pdi.setClickable(True, 4)
-                pdi.mLayerID = layer_id
-                pdi.mVisID = vis_id
-                pdi.mFeatureID = fid
-                pdi.mField = field_name
-                pdi.mFieldIndex = field_index
-                pdi.mSelectedStyle = func_selected_style
-                if is_candidate:
-                    pdi.setZValue(99999)
+            t0 = datetime.datetime.now()
+            plot_label = self.expressionValue(
+                layer, fid, label_expression, lambda: label_expression.evaluate(feature_context),
+                contextKey=context_keys[label_expression.expression()])
+
+            is_selected = not show_selected_only and fid in selected_fids
+
+            update['n_profiles'] += 1
+            if update['first_profile'] is None:
+                update['first_profile'] = (layer_id, field_index, fid)
+                # check if x unit was different to this one
+                if self.initializeXUnit(layer_id, field_index, fid, xunit):
+                    # setXUnit() has started a new update
+                    return False
+
+            if update['batch_rendering'] and not (is_candidate or is_selected) and plot_style.markerSymbol is None:
+                # profiles of the same visualization differ by their line color only
+                batch_key = (vis_id, plot_style.linePen.color().rgba())
+                if batch_key not in BATCHES:
+                    BATCHES[batch_key] = []
+                    BATCH_INFO[batch_key] = (layer_id, field_name, field_index, plot_style)
+                BATCHES[batch_key].append((plot_data, fid, plot_label))
+                continue
+
+            key = (layer_id, fid, field_name, vis_id)
+            # an item of this update, e.g. created by a selection change while loading, or of the last update
+            pdi = PLOT_ITEMS.get(key)
+            if pdi is None:
+                pdi = self.mPlotItems.get(key)
+                if pdi not in reusable_items:
+                    pdi = self.createProfileItem(update, layer_id, fid, field_name, field_index, vis_id)
+                    NEW_ITEMS.append(pdi)
+            pdi.mSelectedStyle = update['func_selected_style']
+            pdi.setZValue(99999 if is_candidate else 0)
+            if pdi.hasProfileData(plot_data, showBadBands=show_bad_bands, sortBands=sort_bands):
+                # restyle only
+                pdi.setProfileStyle(plot_style, label=plot_label)
+            else:
                 pdi.setProfileData(plot_data, plot_style,
                                    showBadBands=show_bad_bands,
                                    sortBands=sort_bands,
                                    label=plot_label)
-                pdi.setCurveIsSelected(is_selected)
-                PLOT_ITEMS.append(pdi)
-
-        # check if x unit was different to this one
-        if not self.mXUnitInitialized and len(PLOT_ITEMS) > 0:
-            pdi: SpectralProfilePlotDataItem = PLOT_ITEMS[0]
-            rawData = self.rawData(pdi.mLayerID, pdi.mFieldIndex, pdi.mFeatureID)
-
-            if rawData:
-                xunit2 = rawData.get('xUnit', None)
-                if xunit2 is None and isinstance(rawData.get('x'), list):
-                    xunit2 = UNKNOWN_UNIT
-                xunit2 = self.mXUnitModel.findUnit(xunit2)
-                if isinstance(xunit2, str) and xunit2 != xunit:
-                    self.mXUnitInitialized = True
-                    self.setXUnit(xunit2)
-                    # this will call updatePlot again, so we can return afterward
-                    return
+            pdi.setCurveIsSelected(is_selected)
+            PLOT_ITEMS[key] = pdi
 
         t0 = datetime.datetime.now()
-        # self.mPlotWidget.viewBox()._updatingRange = True
-        self.mPlotWidget.plotItem.clearPlots()
-        self.plotWidget().legend().clear()
+        self.addPlotItems(update, NEW_ITEMS, BATCHES, BATCH_INFO)
+        add_dt('add plot items', t0)
+        return completed
 
-        add_dt('clear plot', t0)
-        t0 = datetime.datetime.now()
+    def createProfileItem(self, update: dict, layer_id: str, fid: int, field_name: str, field_index: int,
+                          vis_id: str) -> SpectralProfilePlotDataItem:
+        """
+        Creates the plot item of a single profile. Use addPlotItems to add it to the plot.
+        """
+        pdi = SpectralProfilePlotDataItem(antialias=update['antialiasing'])
+        pdi.setClickable(True, 4)
+        pdi.mLayerID = layer_id
+        pdi.mVisID = vis_id
+        pdi.mFeatureID = fid
+        pdi.mField = field_name
+        pdi.mFieldIndex = field_index
+        pdi.mSelectedStyle = update['func_selected_style']
+        return pdi
+
+    def batchItem(self, update: dict, batch_key: Tuple[str, int],
+                  batch_info: Tuple[str, str, int, PlotStyle]) -> SpectralProfileBatchItem:
+        """
+        Returns the SpectralProfileBatchItem of a plot update that draws the profiles of a batch key
+        (vis id, line color). Creates and adds a new item to the plot, if it does not exist yet.
+        """
+        for item in self.mPlotWidget.plotItem1.spectralProfileBatchItems():
+            if item not in update['plotted_items'] and \
+                    (item.mVisID, item.plotStyle().linePen.color().rgba()) == batch_key:
+                return item
+
+        layer_id, field_name, field_index, plot_style = batch_info
+        item = SpectralProfileBatchItem(antialias=update['antialiasing'])
+        item.mVisID = batch_key[0]
+        item.mLayerID = layer_id
+        item.mField = field_name
+        item.mFieldIndex = field_index
+        item.setProfiles([], [], plot_style)
+        # draw selected profiles and candidates on top
+        item.setZValue(-1)
+        item.sigProfileClicked.connect(self.onBatchProfileClicked)
+        item.sigProfileHovered.connect(self.onBatchProfileHovered)
+        self.mPlotWidget.plotItem.addItem(item)
+        return item
+
+    def updateBatchedProfileSelection(self):
+        """
+        Moves the profiles of selected features from the SpectralProfileBatchItems into single,
+        selected SpectralProfilePlotDataItems, and the profiles of deselected features back into
+        the batch items, without reading the profiles again.
+        """
+        update = self.mUpdate if isinstance(self.mUpdate, dict) else self.mLastUpdate
+        if not (isinstance(update, dict) and update['batch_rendering']):
+            return
+        plotItem = self.mPlotWidget.plotItem
+        PLOT_ITEMS: Dict[Tuple[str, int, str, str], SpectralProfilePlotDataItem] = update['plot_items']
+
+        SELECTED: Dict[str, Set[int]] = dict()
+        CANDIDATES: Dict[str, Set[int]] = dict()
+        for lid in set(job['layer_id'] for job in update['jobs']):
+            layer = self.vectorLayer(lid)
+            if isinstance(layer, QgsVectorLayer):
+                SELECTED[lid] = set(layer.selectedFeatureIds())
+                CANDIDATES[lid] = set(layer.customProperty(CUSTOM_PROPERTY_CANDIDATE_FIDs, []))
+        # profiles that are still to be loaded use the new selection as well
+        for job in update['jobs']:
+            job['selected_fids'] = SELECTED.get(job['layer_id'], set())
+
+        # batched profiles of selected features
+        NEW_ITEMS: List[SpectralProfilePlotDataItem] = []
+        for item in list(plotItem.spectralProfileBatchItems()):
+            selected = SELECTED.get(item.layerID(), set())
+            indices = [i for i, fid in enumerate(item.featureIDs()) if fid in selected]
+            for fid, x, y, label in item.takeProfiles(indices):
+                pdi = self.createProfileItem(update, item.layerID(), fid, item.mField, item.mFieldIndex, item.mVisID)
+                pdi.setProfileData({'x': x, 'y': y}, item.plotStyle(), label=label)
+                pdi.setCurveIsSelected(True)
+                PLOT_ITEMS[(item.layerID(), fid, item.mField, item.mVisID)] = pdi
+                NEW_ITEMS.append(pdi)
+        self.addPlotItems(update, NEW_ITEMS, dict(), dict())
+
+        # single profiles of deselected features, which can be drawn in batches
+        for key, pdi in list(PLOT_ITEMS.items()):
+            layer_id, fid, field_name, vis_id = key
+            plot_style: PlotStyle = pdi.mDefaultStyle
+            if not pdi.curveIsSelected() or fid in SELECTED.get(layer_id, set()) \
+                    or fid in CANDIDATES.get(layer_id, set()) or plot_style.markerSymbol is not None \
+                    or pdi.xData is None:
+                continue
+            batch_key = (vis_id, plot_style.linePen.color().rgba())
+            item = self.batchItem(update, batch_key, (layer_id, field_name, pdi.mFieldIndex, plot_style))
+            item.addProfiles([(pdi.xData, pdi.yData)], [fid], labels=[pdi.name() or ''])
+            del PLOT_ITEMS[key]
+            plotItem.removeItem(pdi)
+            if plotItem.legend is not None:
+                plotItem.legend.removeItem(pdi)
+
+    def initializeXUnit(self, layer_id: str, field_index: int, fid: int, xunit: str) -> bool:
+        """
+        Sets the x unit to that of the first plotted profile, if it has not been initialized before.
+        Returns True if the x unit was changed, which starts a new plot update.
+        """
+        if self.mXUnitInitialized:
+            return False
+        rawData = self.rawData(layer_id, field_index, fid)
+
+        if isinstance(rawData, dict):
+            xunit2 = rawData.get('xUnit', None)
+            if xunit2 is None and isinstance(rawData.get('x'), list):
+                xunit2 = UNKNOWN_UNIT
+            xunit2 = self.mXUnitModel.findUnit(xunit2)
+            if isinstance(xunit2, str) and xunit2 != xunit:
+                self.mXUnitInitialized = True
+                self.setXUnit(xunit2)
+                return True
+        return False
+
+    def addPlotItems(self,
+                     update: dict,
+                     items: List[SpectralProfilePlotDataItem],
+                     batches: Dict[Tuple[str, int], List[Tuple[dict, int, str]]],
+                     batch_info: Dict[Tuple[str, int], Tuple[str, str, int, PlotStyle]]):
+        """
+        Adds new profile plot items and batches of profiles to the plot
+        """
 
         def func_scatter_tooltip(pi: SpectralProfilePlotDataItem):
             """
@@ -1578,7 +2908,7 @@ class SpectralProfilePlotModel(QStandardItemModel):
         with PlotUpdateBlocker(self.mPlotWidget) as _:
             hoverPen = mkPen(self.mCurrentSelectionColor)
             hoverBrush = mkBrush(self.mCurrentSelectionColor)
-            for p in PLOT_ITEMS:
+            for p in items:
                 p: SpectralProfilePlotDataItem
                 p.sigClicked.connect(self.onCurveClicked)
                 p.sigPointsClicked.connect(self.onPointsClicked)
@@ -1595,7 +2925,61 @@ class SpectralProfilePlotModel(QStandardItemModel):
                     hoverSize=p.scatter.opts.get('size', 5) + 2)
 
                 self.mPlotWidget.plotItem.addItem(p)
-        add_dt('add plot items', t0)
+
+            if not update.get('batches_replaced', False):
+                # the batch items of the previous update are replaced by those of this update
+                for item in update['plotted_items']:
+                    if isinstance(item, SpectralProfileBatchItem):
+                        item.setVisible(False)
+                update['batches_replaced'] = True
+
+            for batch_key, profiles in batches.items():
+                arrays, fids, labels = [], [], []
+                for plot_data, fid, plot_label in profiles:
+                    xy = SpectralProfilePlotDataItem.plotDataArrays(plot_data,
+                                                                    showBadBands=update['show_bad_bands'],
+                                                                    sortBands=update['sort_bands'])
+                    if xy is not None:
+                        arrays.append(xy)
+                        fids.append(fid)
+                        labels.append(plot_label)
+                # each chunk of profiles is appended to a single batch item per style
+                item = self.batchItem(update, batch_key, batch_info[batch_key])
+                item.addProfiles(arrays, fids, labels=labels)
+
+    def finishPlotUpdate(self, update: dict):
+        """
+        Removes the plot items which are not shown anymore and updates the statistics
+        """
+        if update is not self.mUpdate:
+            return
+        self.mUpdate = None
+
+        t0 = datetime.datetime.now()
+        # self.mPlotWidget.viewBox()._updatingRange = True
+        # remove all plot items that existed before the update, except the profile items shown again
+        plotItem = self.mPlotWidget.plotItem
+        PLOT_ITEMS = update['plot_items']
+        appended = update.get('append', False)
+        kept_items = set(PLOT_ITEMS.values())
+        for item in update['plotted_items']:
+            if item not in kept_items:
+                plotItem.removeItem(item)
+        self.mPlotItems = PLOT_ITEMS
+        self.mPlotItemSettings = update['item_settings']
+        self.plotWidget().legend().clear()
+        if plotItem.legend is not None:
+            for item in PLOT_ITEMS.values():
+                if item.name():
+                    plotItem.legend.addItem(item, item.name())
+
+        DT = update['dt']
+        DT['clear plot'] = [(datetime.datetime.now() - t0).total_seconds()]
+
+        if not appended:
+            # the temporary profiles have been removed as well
+            self.mTemporaryPlotItems.clear()
+            self.updateTemporaryPlotItems()
 
         infos = ['update durations:']
         for k, dtl in DT.items():
@@ -1603,8 +2987,169 @@ class SpectralProfilePlotModel(QStandardItemModel):
             infos.append(f'\t{k}: {dtl.sum():.2f} s  {dtl.mean():.3f}s n = {len(dtl)}')
         logger.debug('\n'.join(infos))
 
-        self.updateStatistics(settings=settings)
-        self.updateProfileLabel(len(PLOT_ITEMS), profile_limit_reached)
+        self.updateStatistics(settings=update['settings'])
+        self.updateProfileLabel(update['n_profiles'], update['limit_reached'])
+        self.mLastUpdate = update
+        self.sigProgressChanged.emit(100.0)
+        self.sigProfilesLoaded.emit(update['n_profiles'], self.canLoadMoreProfiles())
+
+    def startLoadingTask(self, update: dict) -> 'SpectralProfileDecodingTask':
+        """
+        Starts a background task that reads and decodes the profiles of a plot update.
+        The decoded profiles are plotted progressively by onProfilesDecoded.
+        """
+        jobs = []
+        for job in update['jobs']:
+            cached_filter = job['cached_filter']
+            if cached_filter is None:
+                # the request limits the number of features
+                jobs.append((job['layer'], job['field_index'], job['request'], job['fids'], None, -1))
+            else:
+                context_key = job['context_keys'][cached_filter.expression()]
+                jobs.append((job['layer'], job['field_index'], job['request'], job['fids'],
+                             (cached_filter, job['context'], context_key), update['max_profiles']))
+        task = SpectralProfileDecodingTask(update['generation'], jobs, chunkSize=self.LOADING_CHUNK_SIZE)
+        generation = update['generation']
+        task.sigProfilesDecoded.connect(self.onProfilesDecoded)
+        task.progressChanged.connect(self.sigProgressChanged)
+        task.taskCompleted.connect(lambda *args, g=generation: self.onLoadingTaskFinished(g))
+        task.taskTerminated.connect(lambda *args, g=generation: self.onLoadingTaskFinished(g))
+        self.mLoadingTask = task
+        self.sigProgressChanged.emit(0.0)
+
+        tm = QgsApplication.taskManager()
+        if not (isinstance(tm, QgsTaskManager)):
+            raise AssertionError
+        tm.addTask(task)
+        return task
+
+    def onProfilesDecoded(self, generation: int, i_job: int, chunk: List[Tuple[QgsFeature, Optional[dict]]]):
+        update = self.mUpdate
+        if not (isinstance(update, dict) and update['generation'] == generation):
+            # profiles of a canceled update
+            return
+        if not self.addProfiles(update, i_job, chunk):
+            # profile limit reached or x unit changed
+            if update is self.mUpdate:
+                self.cancelLoading()
+                self.finishPlotUpdate(update)
+
+    def onLoadingTaskFinished(self, generation: int):
+        if isinstance(self.mLoadingTask, SpectralProfileDecodingTask) \
+                and self.mLoadingTask.generation() == generation:
+            self.mLoadingTask = None
+        update = self.mUpdate
+        if isinstance(update, dict) and update['generation'] == generation:
+            self.finishPlotUpdate(update)
+
+    def cancelLoading(self):
+        """
+        Cancels the background loading of the profiles of the current plot update
+        """
+        task = self.mLoadingTask
+        self.mLoadingTask = None
+        if isinstance(task, SpectralProfileDecodingTask):
+            try:
+                task.cancel()
+            except RuntimeError:
+                # task has been deleted already
+                pass
+
+    def isLoading(self) -> bool:
+        """
+        Returns True while profiles are loaded in the background
+        """
+        return isinstance(self.mUpdate, dict)
+
+    def evaluateDataExpression(self, rawData: dict, feature: QgsFeature, code, xUnit: str) -> Optional[dict]:
+        """
+        Modifies raw profile data with compiled python code and returns it converted to xUnit.
+        Raises an exception if the code fails.
+        """
+        kwds = rawData.copy()
+        lists_to_numpy_array(kwds)
+        kwds['f'] = feature
+
+        exec(code, kwds)  # nosec: B102 # user-transparent definition of Python code
+
+        raw_data = {k: kwds[k] for k in ['x', 'y', 'xUnit', 'yUnit', 'bbl'] if k in kwds}
+        return self.profileDataToXUnit(raw_data, xUnit)
+
+    def densityProfiles(self,
+                        layer: QgsVectorLayer,
+                        fieldIndex: int,
+                        request: QgsFeatureRequest,
+                        xUnit: str,
+                        cached_filter: Optional[QgsExpression] = None,
+                        context: Optional[QgsExpressionContext] = None,
+                        contextKey: tuple = tuple(),
+                        data_expression_code=None,
+                        showBadBands: bool = True) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the (x, y) arrays of all profiles to be binned into a density histogram.
+        The profiles are read lazily and not kept in the ProfileDataCache, to not evict the data of
+        plotted profiles. Filter results are cached.
+        """
+        if context is None:
+            context = QgsExpressionContext()
+        layer_id = layer.id()
+        for feature in layer.getFeatures(request):
+            if cached_filter is not None:
+                feature_context = QgsExpressionContext(context)
+                feature_context.setFeature(feature)
+                accepted = self.expressionValue(
+                    layer, feature.id(), cached_filter, lambda: bool(cached_filter.evaluate(feature_context)),
+                    contextKey=contextKey)
+                if not accepted:
+                    continue
+
+            raw_data = ProfileDataCache.decodeRawData(feature, fieldIndex)
+            if not isinstance(raw_data, dict):
+                continue
+            try:
+                if data_expression_code is None:
+                    plot_data = self.profileDataToXUnit(raw_data, xUnit)
+                else:
+                    plot_data = self.evaluateDataExpression(raw_data, feature, data_expression_code, xUnit)
+            except Exception as ex:
+                self.mErrors.add(f'{layer_id}:{ex}')
+                continue
+
+            if isinstance(plot_data, dict):
+                xy = SpectralProfilePlotDataItem.plotDataArrays(plot_data, showBadBands=showBadBands)
+                if xy is not None:
+                    yield xy
+
+    def processDensityChunk(self) -> bool:
+        """
+        Adds the next chunk of profiles to the density histograms.
+        Returns True if there are more profiles to add.
+        """
+        if len(self.mDensityJobs) > 0:
+            item, profiles = self.mDensityJobs[0]
+            chunk = list(itertools.islice(profiles, self.DENSITY_CHUNK_SIZE))
+            item.addProfiles(chunk)
+            if len(chunk) < self.DENSITY_CHUNK_SIZE:
+                self.mDensityJobs.pop(0)
+
+        if len(self.mDensityJobs) == 0:
+            self.mDensityTimer.stop()
+            return False
+        return True
+
+    def clearDensityItems(self):
+        """
+        Stops filling density histograms and removes them from the plot
+        """
+        self.mDensityTimer.stop()
+        self.mDensityJobs.clear()
+        if isinstance(self.mPlotWidget, SpectralProfilePlotWidget):
+            for item in self.mDensityItems:
+                self.mPlotWidget.plotItem.removeItem(item)
+        self.mDensityItems.clear()
+
+    def densityItems(self) -> List[SpectralProfileDensityItem]:
+        return self.mDensityItems[:]
 
     def updateProfileLabel(self, n: int, limit_reached: bool):
         propertyItem = self.generalSettings().mP_MaxProfiles
@@ -1630,6 +3175,25 @@ class SpectralProfilePlotModel(QStandardItemModel):
     def supportedDropActions(self) -> Qt.DropActions:
         return Qt.CopyAction | Qt.MoveAction
 
+    def convertXValues(self, x: Any, xUnitSrc: Optional[str], xUnit: Optional[str]) -> Optional[np.ndarray]:
+        """
+        Converts x values from xUnitSrc into numeric x values of xUnit.
+        Returns None if a conversion is not possible
+        """
+        func = self.mUnitConverterFunctionModel.convertFunction(xUnitSrc, xUnit)
+        x = func(x)
+        if x is None or len(x) == 0:
+            return None
+
+        # convert date units to float values with decimal year and second precision to make them plotable
+        if isinstance(x[0], (datetime.datetime, datetime.date, datetime.time, np.datetime64)):
+            x = convertDateUnit(datetime64(x), 'DecimalYear')
+
+        x = np.asarray(x)
+        if not np.issubdtype(x.dtype, np.number):
+            return None
+        return x
+
     def profileDataToXUnit(self, profileData: dict, xUnit: str) -> Optional[dict]:
         """
         Converts the x values from plotData.get('xUnit') to xUnit.
@@ -1644,22 +3208,17 @@ class SpectralProfilePlotModel(QStandardItemModel):
         if profileData.get('xUnit', None) == xUnit:
             return profileData
 
-        func = self.mUnitConverterFunctionModel.convertFunction(profileData.get('xUnit', None), xUnit)
-        x = func(profileData['x'])
+        x = XUnitConversionCache.convert(profileData['x'], profileData.get('xUnit', None), xUnit,
+                                         self.convertXValues)
         y = profileData['y']
-        if x is None or len(x) == 0 or len(x) != len(y):
+        if x is None or len(x) != len(y):
             return None
         else:
-            # convert date units to float values with decimal year and second precision to make them plotable
-            if isinstance(x[0], (datetime.datetime, datetime.date, datetime.time, np.datetime64)):
-                x = convertDateUnit(datetime64(x), 'DecimalYear')
-
             if isinstance(y[0], (datetime.datetime, datetime.date, datetime.time, np.datetime64)):
                 y = convertDateUnit(datetime64(y), 'DecimalYear')
 
-            x = np.asarray(x)
             y = np.asarray(y)
-            if not (np.issubdtype(x.dtype, np.number) and np.issubdtype(y.dtype, np.number)):
+            if not np.issubdtype(y.dtype, np.number):
                 return None
 
             profileData['x'] = x
@@ -1694,6 +3253,66 @@ class SpectralProfilePlotModel(QStandardItemModel):
     def defaultProfileCandidateStyle(self) -> PlotStyle:
         return self.mDefaultProfileCandidateStyle
 
+    def setTemporaryProfiles(self, profiles: List[dict], labels: List[str] = None):
+        """
+        Shows profiles that are not stored in a spectral library, e.g. the profiles below the cursor
+        of a map tool. They are drawn with the profile candidate style and replace previous temporary profiles.
+        :param profiles: list of profile dictionaries
+        :param labels: optional list of labels
+        """
+        if labels is None:
+            labels = [None] * len(profiles)
+        if not (len(labels) == len(profiles)):
+            raise AssertionError
+        self.mTemporaryProfiles = [(p, lbl) for p, lbl in zip(profiles, labels) if isinstance(p, dict)]
+        self.updateTemporaryPlotItems()
+
+    def clearTemporaryProfiles(self):
+        """
+        Removes all temporary profiles from the plot
+        """
+        if len(self.mTemporaryProfiles) > 0 or len(self.mTemporaryPlotItems) > 0:
+            self.mTemporaryProfiles.clear()
+            self.updateTemporaryPlotItems()
+
+    def temporaryProfiles(self) -> List[dict]:
+        return [p for (p, _) in self.mTemporaryProfiles]
+
+    def updateTemporaryPlotItems(self):
+        """
+        Replaces the plot items of the temporary profiles without updating other profile plot items.
+        """
+        if not isinstance(self.mPlotWidget, SpectralProfilePlotWidget):
+            return
+
+        plotItem = self.mPlotWidget.plotItem
+        for pdi in self.mTemporaryPlotItems:
+            plotItem.removeItem(pdi)
+        self.mTemporaryPlotItems.clear()
+
+        xunit: str = self.xUnit().unit
+        if xunit is None:
+            xunit = BAND_NUMBER
+
+        style = self.mDefaultProfileCandidateStyle.clone()
+        style.linePen.setStyle(Qt.DashLine)
+
+        show_bad_bands = self.generalSettings().showBadBands()
+        sort_bands = self.generalSettings().sortBands()
+        with PlotUpdateBlocker(self.mPlotWidget) as _:
+            for profile, label in self.mTemporaryProfiles:
+                plot_data = self.profileDataToXUnit(profile, xunit)
+                if not isinstance(plot_data, dict):
+                    continue
+                pdi = SpectralProfilePlotDataItem(antialias=self.mGeneralSettings.antialias())
+                pdi.setZValue(100000)
+                pdi.setProfileData(plot_data, style,
+                                   showBadBands=show_bad_bands,
+                                   sortBands=sort_bands,
+                                   label=label)
+                plotItem.addItem(pdi)
+                self.mTemporaryPlotItems.append(pdi)
+
     def hasProfileCandidates(self) -> bool:
         for layer in self.spectralLibraries():
             candidates = layer.customProperty(CUSTOM_PROPERTY_CANDIDATE_FIDs, [])
@@ -1816,6 +3435,9 @@ class SpectralProfilePlotModel(QStandardItemModel):
                 if aidx in self.mLastReferencedColumns.get(lid, set()):
                     self.updatePlot()
 
+        def _features_changed(lid):
+            self.updatePlot()
+
         def _attribute_added(lid, aid):
             lyr = self.project().mapLayer(lid)
             if isinstance(lyr, QgsVectorLayer):
@@ -1837,10 +3459,10 @@ class SpectralProfilePlotModel(QStandardItemModel):
                 SignalProxy(speclib.attributeValueChanged, delay=1, rateLimit=rl * 10,
                             slot=lambda *args, lid=speclib.id(): _plotted_value_changed(lid, args)),
                 SignalProxyUndecorated(speclib.featuresDeleted, rateLimit=rl,
-                                       slot=lambda: self.updatePlot()),
+                                       slot=lambda *args, lid=speclib.id(): _features_changed(lid)),
 
                 SignalProxyUndecorated(speclib.featureAdded, rateLimit=rl,
-                                       slot=lambda *args, lid=speclib.id(): self.updatePlot()),
+                                       slot=lambda *args, lid=speclib.id(): _features_changed(lid)),
 
                 SignalProxy(speclib.styleChanged, rateLimit=rl, slot=self.onSpeclibStyleChanged),
 
@@ -1959,10 +3581,11 @@ class SpectralProfilePlotModel(QStandardItemModel):
     def onSpeclibSelectionChanged(self, *args, **kwds):
 
         if self.showSelectedFeaturesOnly():
+            # the selection defines the profiles to show
             self.updatePlot()
-        else:
+        elif isinstance(self.mPlotWidget, SpectralProfilePlotWidget):
+            self.updateBatchedProfileSelection()
             self._updateCurveSelectionFromFeatures()
-        # self.updatePlot()
 
     def onDualViewSliderMoved(self, *args):
         pass
@@ -5,15 +5,18 @@ import math
 import pathlib
 import re
 import sys
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple, Union, Optional
 
 import numpy as np
 from numpy import nan
 
 from qgis.PyQt.QtCore import (
-    NULL, QAbstractListModel, QItemSelection, QModelIndex, QObject, QRect, QRectF, QSize,
+    NULL, QAbstractListModel, QItemSelection, QModelIndex, QObject, QPoint, QRect, QRectF, QSize,
     QSortFilterProxyModel, Qt, pyqtSignal, QMetaType)
+from qgis.PyQt import sip
 from qgis.PyQt.QtGui import QAbstractTextDocumentLayout, QColor, QFont, QIcon, QPainter, QTextDocument
 from qgis.PyQt.QtGui import QPalette
 from qgis.PyQt.QtWidgets import (
@@ -21,15 +24,15 @@ from qgis.PyQt.QtWidgets import (
     QStyledItemDelegate, QTableView, QTreeView, QWidget
 )
 from qgis.core import (
-    Qgis, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsExpression, QgsExpressionContext,
+    Qgis, QgsCoordinateReferenceSystem, QgsExpression, QgsExpressionContext,
     QgsExpressionContextGenerator, QgsExpressionContextScope, QgsExpressionContextUtils, QgsFeature, QgsField,
     QgsFields, QgsGeometry, QgsLayerItem, QgsMapToPixel, QgsPointXY, QgsProperty, QgsRasterLayer,
-    QgsRectangle, QgsVector, QgsVectorLayer, QgsWkbTypes
+    QgsReferencedGeometry, QgsVectorLayer, QgsWkbTypes
 )
-from qgis.core import QgsProject, QgsMapLayerModel
+from qgis.core import QgsProject, QgsMapLayerModel, QgsApplication, QgsTask, QgsTaskManager
 from qgis.gui import (
     QgsColorButton, QgsDockWidget, QgsDoubleSpinBox, QgsFieldExpressionWidget, QgsFilterLineEdit,
-    QgsMapCanvas)
+    QgsMapCanvas, QgsMapTool)
 from .spectrallibrarylistmodel import SpectralLibraryListModel
 from .spectrallibrarywidget import SpectralLibraryWidget
 from .spectralprofilecandidates import SpectralProfileCandidates
@@ -39,10 +42,12 @@ from ..core import profile_field_names
 from ..core.spectralprofile import encodeProfileValueDict, \
     prepareProfileValueDict
 from ...externals.htmlwidgets import HTMLComboBox
+from ...maptools import SpectralProfileGeometryMapTool, SpectralProfileMapTool
 from ...models import Option, OptionListModel, OptionTreeNode, TreeModel, TreeNode, TreeView, setCurrentComboBoxValue
 from ...plotstyling.plotstyling import PlotStyle, PlotStyleButton
-from ...qgsfunctions import RasterProfile
-from ...utils import HashableRect, SpatialPoint, aggregateArray, iconForFieldType, loadUi, rasterLayerMapToPixel
+from ...qgsrasterlayerproperties import SpectralPropertiesCache
+from ...utils import CoordinateTransformCache, HashableRect, RasterBlockCache, RasterLayerSnapshot, SpatialPoint, \
+    aggregateArray, iconForFieldType, loadUi, rasterLayerMapToPixel, rasterPolygonPixels, rasterTransectPixels
 
 logger = logging.getLogger(__name__)
 
@@ -110,30 +115,48 @@ class ProfileSamplingMode(object):
     AGGREGATE_MIN = 'min'
     AGGREGATE_MAX = 'max'
 
+    # sample a kernel around a point
+    SAMPLE_KERNEL = 'kernel'
+    # sample all pixels along a line
+    SAMPLE_TRANSECT = 'transect'
+    # sample all pixels within a polygon
+    SAMPLE_POLYGON = 'polygon'
+
     RX_KERNEL_SIZE = re.compile(r'(?P<x>\d+)x(?P<y>\d+)')
 
     def __init__(self,
                  kernelSize: Union[QSize, str, Tuple[int, int]] = QSize(1, 1),
-                 aggregation: str = None):
+                 aggregation: str = None,
+                 samplingType: str = None):
 
         if aggregation is None:
             aggregation = self.NO_AGGREGATION
+        if samplingType is None:
+            samplingType = self.SAMPLE_KERNEL
 
         self.mKernelSize = QSize(1, 1)
         self.mAggregation: str = self.NO_AGGREGATION
+        self.mSamplingType: str = self.SAMPLE_KERNEL
 
         self.setKernelSize(kernelSize)
         self.setAggregation(aggregation)
+        self.setSamplingType(samplingType)
 
     def __eq__(self, other):
         if not isinstance(other, ProfileSamplingMode):
             return False
         else:
-            return other.mAggregation == self.mAggregation and other.mKernelSize == self.mKernelSize
+            return other.mAggregation == self.mAggregation and other.mKernelSize == self.mKernelSize \
+                and other.mSamplingType == self.mSamplingType
 
     def numberOfProfiles(self) -> int:
-
+        """
+        Returns the number of profiles per sampling location, or -1 if it depends
+        on the number of pixels along a line transect or within a polygon.
+        """
         if self.mAggregation == ProfileSamplingMode.NO_AGGREGATION:
+            if self.mSamplingType != ProfileSamplingMode.SAMPLE_KERNEL:
+                return -1
             return self.kernelSize().width() * self.kernelSize().height()
         else:
             return 1
@@ -141,8 +164,9 @@ class ProfileSamplingMode(object):
     def clone(self):
 
         mode = ProfileSamplingMode()
-        mode.setKernelSize(*self.kernelSize())
+        mode.setKernelSize(self.kernelSize())
         mode.setAggregation(self.aggregation())
+        mode.setSamplingType(self.samplingType())
         return mode
 
     def setKernelSize(self, x: Union[int, str, QSize, Tuple[int, int]], y: int = None):
@@ -202,15 +226,34 @@ class ProfileSamplingMode(object):
     def aggregation(self) -> str:
         return self.mAggregation
 
+    def samplingTypes(self) -> List[str]:
+        return [self.SAMPLE_KERNEL,
+                self.SAMPLE_TRANSECT,
+                self.SAMPLE_POLYGON]
+
+    def setSamplingType(self, samplingType: str):
+        """
+        Sets how pixels are sampled: in a kernel around a point (default),
+        along a line transect or within a polygon.
+        """
+        if not (samplingType in self.samplingTypes()):
+            raise AssertionError
+        self.mSamplingType = samplingType
+
+    def samplingType(self) -> str:
+        return self.mSamplingType
+
     def profiles(
             self,
-            point: SpatialPoint,
+            point: Union[SpatialPoint, QgsReferencedGeometry],
             profiles: List[Tuple[Dict, QgsExpressionContext]]
     ) -> List[Tuple[Dict, QgsExpressionContext]]:
         """
         Aggregates the profiles collected from a profile source
         in the way as described
         """
+        if isinstance(point, QgsReferencedGeometry):
+            point = SpatialPoint(point.crs(), point.centroid().asPoint())
 
         _ = self.kernelSize()
 
@@ -247,9 +290,7 @@ class ProfileSamplingMode(object):
             g = QgsGeometry.fromPointXY(point)
 
             if isinstance(refContext.variable('_source_crs'), QgsCoordinateReferenceSystem):
-                trans = QgsCoordinateTransform()
-                trans.setSourceCrs(point.crs())
-                trans.setDestinationCrs(refContext.variable('_source_crs'))
+                trans = CoordinateTransformCache.transform(point.crs(), refContext.variable('_source_crs'))
                 g.transform(trans)
                 refContext.setGeometry(g)
 
@@ -261,38 +302,53 @@ class ProfileSamplingMode(object):
         return [(profile, refContext)]
 
 
-class StandardLayerProfileSource(SpectralProfileSource):
-
-    @staticmethod
-    def fromRasterLayer(layer: QgsRasterLayer):
-        warnings.warn(DeprecationWarning('Use StandardLayerProfileSource(raster_layer)'))
-        return StandardLayerProfileSource(layer)
-
-    def __init__(self, layer: Union[QgsRasterLayer, str, pathlib.Path]):
-        if not isinstance(layer, QgsRasterLayer):
-            layer = QgsRasterLayer(str(layer))
-        else:
-            if not (isinstance(layer, QgsRasterLayer)):
-                raise AssertionError
-        if not (layer.isValid()):
-            raise AssertionError
+class LayerProfileSampler(object):
+    """
+    Samples the profiles of a raster layer. All layer properties are taken from a RasterLayerSnapshot
+    and pixels are read from the RasterBlockCache. Therefore, a sampler needs to be created in the
+    thread the raster layer lives in, but can be used to collect profiles in any thread.
+    """
 
-        super().__init__(name=layer.name())
-        self.mLayer: QgsRasterLayer = layer
+    def __init__(self, layer: QgsRasterLayer):
+        self.mLayer = RasterLayerSnapshot(layer)
         self.m2p: QgsMapToPixel = rasterLayerMapToPixel(layer)
-        self.mLayer.willBeDeleted.connect(self.sigRemoveMe)
-        self.mToolTip = '{}<br>{}'.format(layer.name(), layer.source())
 
-    def __eq__(self, other):
-        return isinstance(other, StandardLayerProfileSource) \
-            and other.mLayer == self.mLayer
+        spectral_properties = SpectralPropertiesCache.entry(layer)
+        self.mWavelength = list(spectral_properties.wl) if spectral_properties.wl else None
+        self.mWavelengthUnit = spectral_properties.wavelengthUnit
+        self.mBadBands = list(spectral_properties.bbl) if spectral_properties.bbl else None
 
-    def layer(self) -> QgsRasterLayer:
+        self.mSourceScope: QgsExpressionContextScope = QgsExpressionContextUtils.layerScope(layer)
+        renameScopeVariables(self.mSourceScope, 'layer_', 'source_')
+        renameScopeVariables(self.mSourceScope, '_layer_', '_source_')
+
+    def layer(self) -> RasterLayerSnapshot:
         return self.mLayer
 
+    def sourceScope(self, suffix: str = '') -> QgsExpressionContextScope:
+        """
+        Returns the layer scope of the source layer, with variables renamed from 'layer_*' to 'source_*'
+        """
+        source_scope = QgsExpressionContextScope(self.mSourceScope)
+        if suffix != '':
+            for n1 in list(source_scope.variableNames()):
+                n2 = f'{n1}{suffix}'
+                source_scope.addVariable(QgsExpressionContextScope.StaticVariable(
+                    name=n2, value=source_scope.variable(n1), description=source_scope.description(n1)))
+                source_scope.removeVariable(n1)
+        return source_scope
+
     def expressionContext(self,
                           point: Union[None, QgsPointXY, SpatialPoint] = None,
-                          suffix: str = '') -> QgsExpressionContext:
+                          suffix: str = '',
+                          sourceScope: QgsExpressionContextScope = None) -> QgsExpressionContext:
+        """
+        Returns the expression context for a pixel position
+        :param point: pixel position
+        :param suffix: suffix for variable names
+        :param sourceScope: optional source scope as returned by sourceScope(suffix),
+                            to avoid creating it for each pixel
+        """
         if point is None:
             # dummy point
             point = SpatialPoint.fromMapLayerCenter(self.mLayer)
@@ -303,15 +359,10 @@ class StandardLayerProfileSource(SpectralProfileSource):
             raise AssertionError
 
         context = QgsExpressionContext()
-        source_scope: QgsExpressionContextScope = QgsExpressionContextUtils.layerScope(self.mLayer)
-        renameScopeVariables(source_scope, 'layer_', 'source_')
-        renameScopeVariables(source_scope, '_layer_', '_source_')
-        if suffix != '':
-            for n1 in list(source_scope.variableNames()):
-                n2 = f'{n1}{suffix}'
-                source_scope.addVariable(QgsExpressionContextScope.StaticVariable(
-                    name=n2, value=source_scope.variable(n1), description=source_scope.description(n1)))
-                source_scope.removeVariable(n1)
+        if isinstance(sourceScope, QgsExpressionContextScope):
+            source_scope = QgsExpressionContextScope(sourceScope)
+        else:
+            source_scope = self.sourceScope(suffix)
         context.appendScope(source_scope)
         context.setGeometry(QgsGeometry.fromPointXY(point))
         px = self.m2p.transform(point)
@@ -334,76 +385,255 @@ class StandardLayerProfileSource(SpectralProfileSource):
 
     def collectProfiles(
             self,
-            point: SpatialPoint,
+            point: Union[SpatialPoint, QgsReferencedGeometry],
             kernel_size: QSize = QSize(1, 1),
             snap: bool = False,
             suffix: str = '',
+            aggregation: str = ProfileSamplingMode.NO_AGGREGATION,
+            samplingType: str = ProfileSamplingMode.SAMPLE_KERNEL,
+            cached: bool = False,
             **kwargs
     ) -> List[Tuple[Dict, QgsExpressionContext]]:
-
-        point = point.toCrs(self.mLayer.crs())
+        """
+        Reads the profiles of all pixels within a kernel around a point, along a line transect or within a polygon.
+        The pixels are read with a single request for all bands.
+        :param point: SpatialPoint or QgsReferencedGeometry
+        :param kernel_size: kernel size in pixels
+        :param snap: if True, the point is moved to the center of the pixel it is located in
+        :param suffix: suffix for expression context variable names
+        :param aggregation: aggregation of the profiles into a single profile,
+                            one of ProfileSamplingMode.aggregationModes()
+        :param samplingType: one of ProfileSamplingMode.samplingTypes(). Line transects and polygons
+                             require a line or polygon geometry. Otherwise, the kernel around the
+                             geometry centroid is sampled.
+        :param cached: set True to read the kernel from the tiles of the RasterBlockCache, e.g. for
+                       live hover requests of nearby pixels. By default, only the kernel window is read.
+        :return: [(profile dictionary, expression context), ...]
+        """
+        lyr = self.mLayer
+        if isinstance(point, QgsReferencedGeometry):
+            geometry = QgsGeometry(point)
+            if point.crs().isValid() and point.crs() != lyr.crs():
+                trans = CoordinateTransformCache.transform(point.crs(), lyr.crs())
+                if geometry.transform(trans) != Qgis.GeometryOperationResult.Success:
+                    return []
+            if geometry.isEmpty():
+                return []
+            centroid = geometry.centroid().asPoint()
+
+            if samplingType == ProfileSamplingMode.SAMPLE_TRANSECT \
+                    and geometry.type() == QgsWkbTypes.LineGeometry:
+                px_x, px_y = rasterTransectPixels(lyr, geometry)
+                return self.pixelProfiles(px_x, px_y, suffix=suffix, aggregation=aggregation,
+                                          aggregatedPosition=centroid)
+
+            if samplingType == ProfileSamplingMode.SAMPLE_POLYGON \
+                    and geometry.type() == QgsWkbTypes.PolygonGeometry:
+                px_x, px_y = rasterPolygonPixels(lyr, geometry)
+                if len(px_x) == 0:
+                    # small polygon that does not cover any pixel center
+                    px_x, px_y = rasterPolygonPixels(lyr, geometry, all_touched=True)
+                return self.pixelProfiles(px_x, px_y, suffix=suffix, aggregation=aggregation,
+                                          aggregatedPosition=centroid)
+
+            point = SpatialPoint(lyr.crs(), centroid)
+
+        point = point.toCrs(lyr.crs())
         if not isinstance(point, SpatialPoint):
             return []
+        point_clicked = QgsPointXY(point)
 
-        resX = self.mLayer.rasterUnitsPerPixelX()
-        resY = self.mLayer.rasterUnitsPerPixelY()
-
-        c = self.mLayer.extent().center()
+        resX = lyr.rasterUnitsPerPixelX()
+        resY = lyr.rasterUnitsPerPixelY()
 
         if snap:
-            M2PX = QgsMapToPixel(self.mLayer.rasterUnitsPerPixelX(),
-                                 c.x(), c.y(),
-                                 self.mLayer.width(),
-                                 self.mLayer.height(),
-                                 0
-                                 )
-            px = M2PX.transform(point)
+            px = self.m2p.transform(point)
             px_snapped = QgsPointXY(int(px.x()) + 0.5, int(px.y()) + 0.5)
-            point = M2PX.toMapCoordinatesF(px_snapped.x(), px_snapped.y())
+            point = self.m2p.toMapCoordinatesF(px_snapped.x(), px_snapped.y())
+
+        # kernel window: kx x ky pixels centered around the pixel that contains the point
+        e = lyr.extent()
+        kx, ky = kernel_size.width(), kernel_size.height()
+        fx = (point.x() - e.xMinimum()) / resX
+        fy = (e.yMaximum() - point.y()) / resY
+        x0, y0 = math.floor(fx - 0.5 * (kx - 1)), math.floor(fy - 0.5 * (ky - 1))
+        x1, y1 = min(lyr.width(), x0 + kx), min(lyr.height(), y0 + ky)
+        x0, y0 = max(0, x0), max(0, y0)
+        if x1 <= x0 or y1 <= y0:
+            return []
 
-        context = QgsExpressionContext()
-        context.appendScope(QgsExpressionContextUtils.layerScope(self.mLayer))
+        # single requests read the kernel window only, not the cache tiles it overlaps
+        array = RasterBlockCache.readWindow(lyr, QRect(x0, y0, x1 - x0, y1 - y0), cached=cached)
+        if not isinstance(array, np.ndarray):
+            return []
 
-        # sp = QgsRasterLayerSpectralProperties.fromRasterLayer(self.mLayer)
+        # pixel positions in row-major order
+        px_y, px_x = np.mgrid[y0:y1, x0:x1]
+        positions = None
+        if kx == 1 and ky == 1:
+            # use the point coordinate, not the pixel center
+            positions = [QgsPointXY(point)]
+
+        return self.pixelProfiles(px_x.ravel(), px_y.ravel(), suffix=suffix, aggregation=aggregation,
+                                  positions=positions, aggregatedPosition=point_clicked,
+                                  values=array.reshape((array.shape[0], -1)))
+
+    def pixelProfiles(self,
+                      px_x: np.ndarray,
+                      px_y: np.ndarray,
+                      suffix: str = '',
+                      aggregation: str = ProfileSamplingMode.NO_AGGREGATION,
+                      positions: List[QgsPointXY] = None,
+                      aggregatedPosition: QgsPointXY = None,
+                      values: np.ndarray = None) -> List[Tuple[Dict, QgsExpressionContext]]:
+        """
+        Reads the profiles of raster pixels with a single request for all bands.
+        Pixels whose values are no-data in all bands are skipped.
+        :param px_x: pixel columns
+        :param px_y: pixel rows
+        :param suffix: suffix for expression context variable names
+        :param aggregation: aggregation of the profiles into a single profile
+        :param positions: coordinates of each pixel. Defaults to the pixel centers.
+        :param aggregatedPosition: coordinate of an aggregated profile. Defaults to the center pixel position.
+        :param values: pixel values of shape (bands, pixels), if already read.
+                       Otherwise, the pixels are read from the RasterBlockCache.
+        :return: [(profile dictionary, expression context), ...]
+        """
+        px_x = np.asarray(px_x, dtype=int)
+        px_y = np.asarray(px_y, dtype=int)
+        if px_x.size == 0:
+            return []
 
-        rect = QRectF(0, 0,
-                      resX * kernel_size.width(),
-                      resY * kernel_size.height())
-        rect.moveCenter(point.toQPointF())
+        if isinstance(values, np.ndarray):
+            array = values
+        else:
+            array = RasterBlockCache.readPixels(self.mLayer, px_x, px_y)
+        if not isinstance(array, np.ndarray):
+            return []
+
+        nb = array.shape[0]
+        pixels = array.astype(float)
+        for b, ndvs in self.mLayer.noDataValues().items():
+            if len(ndvs) > 0 and b <= nb:
+                band = pixels[b - 1, :]
+                band[np.isin(band, ndvs)] = np.nan
+
+        # keep pixels where not all bands are NaN -> masked pixels
+        i_valid = np.where(~np.all(np.isnan(pixels), axis=0))[0]
+        if len(i_valid) == 0:
+            return []
+        pixels = pixels[:, i_valid]
+        px_x, px_y = px_x[i_valid], px_y[i_valid]
+
+        wl, wlu, bbl = self.mWavelength, self.mWavelengthUnit, self.mBadBands
+
+        sourceScope = self.sourceScope(suffix)
+        e = self.mLayer.extent()
+        resX = self.mLayer.rasterUnitsPerPixelX()
+        resY = self.mLayer.rasterUnitsPerPixelY()
+
+        def position(i: int) -> QgsPointXY:
+            if positions is not None:
+                return QgsPointXY(positions[i_valid[i]])
+            return QgsPointXY(e.xMinimum() + (px_x[i] + 0.5) * resX,
+                              e.yMaximum() - (px_y[i] + 0.5) * resY)
+
+        if aggregation != ProfileSamplingMode.NO_AGGREGATION and pixels.shape[1] > 1:
+            # aggregate the profiles and create the expression context of the center pixel only
+            y = aggregateArray(aggregation, pixels, axis=1, keepdims=False)
+            profile = prepareProfileValueDict(x=wl, y=y.tolist(), xUnit=wlu, bbl=bbl)
+            context = self.expressionContext(position(int(pixels.shape[1] / 2)),
+                                             suffix=suffix, sourceScope=sourceScope)
+            if isinstance(aggregatedPosition, QgsPointXY):
+                context.setGeometry(QgsGeometry.fromPointXY(aggregatedPosition))
+            return [(profile, context)]
 
         profilesWithContext: List[Tuple[Dict, QgsExpressionContext]] = []
+        for i, y in enumerate(pixels.transpose().tolist()):
+            profile = prepareProfileValueDict(x=wl, y=y, xUnit=wlu, bbl=bbl)
+            context = self.expressionContext(position(i), suffix=suffix, sourceScope=sourceScope)
+            profilesWithContext.append((profile, context))
 
-        if kernel_size == QSize(1, 1):
-            g = QgsGeometry.fromPointXY(point)
+        return profilesWithContext
+
+
+class StandardLayerProfileSource(SpectralProfileSource):
+
+    @staticmethod
+    def fromRasterLayer(layer: QgsRasterLayer):
+        warnings.warn(DeprecationWarning('Use StandardLayerProfileSource(raster_layer)'))
+        return StandardLayerProfileSource(layer)
+
+    def __init__(self, layer: Union[QgsRasterLayer, str, pathlib.Path]):
+        if not isinstance(layer, QgsRasterLayer):
+            layer = QgsRasterLayer(str(layer))
         else:
-            v = QgsVector(-0.5 * kernel_size.width() * resX,
-                          0.5 * kernel_size.height() * resY)
+            if not (isinstance(layer, QgsRasterLayer)):
+                raise AssertionError
+        if not (layer.isValid()):
+            raise AssertionError
 
-            k = QgsRectangle(point + v, point - v)
+        super().__init__(name=layer.name())
+        self.mLayer: QgsRasterLayer = layer
+        self.m2p: QgsMapToPixel = rasterLayerMapToPixel(layer)
+        self.mLayer.willBeDeleted.connect(self.sigRemoveMe)
+        self.mToolTip = '{}<br>{}'.format(layer.name(), layer.source())
 
-            g = QgsGeometry.fromRect(k)
+    def __eq__(self, other):
+        return isinstance(other, StandardLayerProfileSource) \
+            and other.mLayer == self.mLayer
 
-        f = RasterProfile()
-        all_touched = False
-        values = [self.mLayer, point, 'none', all_touched, 'dict']
-        exp = QgsExpression()
-        fcontext = QgsExpressionContext(context)
-        fcontext.setGeometry(g)
-        profiles_at = f.func(values, fcontext, exp, None)
+    def layer(self) -> QgsRasterLayer:
+        return self.mLayer
 
-        if exp.hasParserError() or exp.hasEvalError() or profiles_at is None:
-            return []
+    def sampler(self) -> LayerProfileSampler:
+        """
+        Returns a LayerProfileSampler with the current layer properties, e.g. to collect profiles in another thread.
+        Needs to be called in the thread the layer lives in.
+        """
+        return LayerProfileSampler(self.mLayer)
 
-        if isinstance(profiles_at, dict):
-            profiles_at = [profiles_at]
+    def sourceScope(self, suffix: str = '') -> QgsExpressionContextScope:
+        """
+        Returns the layer scope of the source layer, with variables renamed from 'layer_*' to 'source_*'
+        """
+        return self.sampler().sourceScope(suffix)
 
-        loc_geo = fcontext.variable('raster_array_geo')
+    def expressionContext(self,
+                          point: Union[None, QgsPointXY, SpatialPoint] = None,
+                          suffix: str = '',
+                          sourceScope: QgsExpressionContextScope = None) -> QgsExpressionContext:
+        """
+        Returns the expression context for a pixel position, see LayerProfileSampler.expressionContext
+        """
+        return self.sampler().expressionContext(point, suffix=suffix, sourceScope=sourceScope)
 
-        for pDict, px_geo in zip(profiles_at, loc_geo):
-            context = self.expressionContext(px_geo, suffix=suffix)
-            profilesWithContext.append((pDict, context))
+    def collectProfiles(
+            self,
+            point: Union[SpatialPoint, QgsReferencedGeometry],
+            kernel_size: QSize = QSize(1, 1),
+            snap: bool = False,
+            suffix: str = '',
+            aggregation: str = ProfileSamplingMode.NO_AGGREGATION,
+            samplingType: str = ProfileSamplingMode.SAMPLE_KERNEL,
+            **kwargs
+    ) -> List[Tuple[Dict, QgsExpressionContext]]:
+        """
+        Reads the profiles of all pixels within a kernel around a point, along a line transect or within a polygon.
+        See LayerProfileSampler.collectProfiles
+        """
+        return self.sampler().collectProfiles(point, kernel_size=kernel_size, snap=snap, suffix=suffix,
+                                              aggregation=aggregation, samplingType=samplingType)
 
-        return profilesWithContext
+    def pixelProfiles(self,
+                      px_x: np.ndarray,
+                      px_y: np.ndarray,
+                      **kwargs) -> List[Tuple[Dict, QgsExpressionContext]]:
+        """
+        Reads the profiles of raster pixels with a single request for all bands.
+        See LayerProfileSampler.pixelProfiles
+        """
+        return self.sampler().pixelProfiles(px_x, px_y, **kwargs)
 
 
 class MapCanvasLayerProfileSource(SpectralProfileSource):
@@ -442,6 +672,9 @@ class MapCanvasLayerProfileSource(SpectralProfileSource):
     def toolTip(self) -> str:
         return self.MODE_TOOLTIP[self.mMode]
 
+    def mode(self) -> str:
+        return self.mMode
+
     def expressionContext(self, suffix: str = '') -> QgsExpressionContext:
         if isinstance(self.mLastContext, QgsExpressionContext):
             return self.mLastContext
@@ -452,41 +685,67 @@ class MapCanvasLayerProfileSource(SpectralProfileSource):
                     return src.expressionContext(suffix=suffix)
         return QgsExpressionContext()
 
-    def collectProfiles(
-            self, point: SpatialPoint,
-            kernel_size: QSize = QSize(1, 1),
-            canvas: QgsMapCanvas = None,
-            snap: bool = False,
-            **kwargs
-    ) -> List[Tuple[Dict, QgsExpressionContext]]:
+    def samplers(self, canvas: QgsMapCanvas = None) -> List[LayerProfileSampler]:
+        """
+        Returns the LayerProfileSamplers of the canvas raster layers in the order they are sampled.
+        Needs to be called in the thread the map canvas lives in.
+        :param canvas: QgsMapCanvas. Defaults to the last canvas used.
+        """
         if isinstance(canvas, QgsMapCanvas):
             self.mMapCanvas = canvas
-
-        if not isinstance(self.mMapCanvas, QgsMapCanvas) and isinstance(point, SpatialPoint):
-            self.mLastContext = None
+        if not isinstance(self.mMapCanvas, QgsMapCanvas):
             return []
-
         raster_layers = [layer for layer in self.mMapCanvas.layers()
                          if isinstance(layer, QgsRasterLayer) and layer.isValid()]
-
         if self.mMode == self.MODE_LAST_LAYER:
             raster_layers = reversed(raster_layers)
+        return [LayerProfileSampler(lyr) for lyr in raster_layers]
 
+    @staticmethod
+    def collectSamplerProfiles(samplers: List[LayerProfileSampler],
+                               point: Union[SpatialPoint, QgsReferencedGeometry],
+                               allLayers: bool = False,
+                               **kwargs) -> List[Tuple[Dict, QgsExpressionContext]]:
+        """
+        Collects the profiles of the first sampler with a valid pixel, or, if allLayers is True, of all samplers.
+        Can be called in any thread.
+        """
         results: List[Tuple[dict, QgsExpressionContext]] = []
         # test which raster layer has a valid pixel
-        for lyr in raster_layers:
-            pt = point.toCrs(lyr.crs())
-            if not lyr.extent().contains(pt):
+        for sampler in samplers:
+            lyr = sampler.layer()
+            if isinstance(point, QgsReferencedGeometry):
+                bbox = QgsGeometry(point).boundingBox()
+                if point.crs().isValid() and point.crs() != lyr.crs():
+                    bbox = CoordinateTransformCache.transform(point.crs(), lyr.crs()).transformBoundingBox(bbox)
+                if not lyr.extent().intersects(bbox):
+                    continue
+            elif not lyr.extent().contains(point.toCrs(lyr.crs())):
                 continue
 
-            source = StandardLayerProfileSource(lyr)
-            r = source.collectProfiles(pt, kernel_size=kernel_size, snap=snap)
-
+            r = sampler.collectProfiles(point, **kwargs)
             if isinstance(r, list) and len(r) > 0:
                 results.extend(r)
-                if self.mMode != self.MODE_ALL_LAYERS:
+                if not allLayers:
                     break
+        return results
 
+    def collectProfiles(
+            self, point: Union[SpatialPoint, QgsReferencedGeometry],
+            kernel_size: QSize = QSize(1, 1),
+            canvas: QgsMapCanvas = None,
+            snap: bool = False,
+            samplingType: str = ProfileSamplingMode.SAMPLE_KERNEL,
+            **kwargs
+    ) -> List[Tuple[Dict, QgsExpressionContext]]:
+        samplers = self.samplers(canvas)
+        if len(samplers) == 0:
+            self.mLastContext = None
+            return []
+
+        results = self.collectSamplerProfiles(samplers, point,
+                                              allLayers=self.mMode == self.MODE_ALL_LAYERS,
+                                              kernel_size=kernel_size, snap=snap, samplingType=samplingType)
         if len(results) > 0:
             self.mLastContext = QgsExpressionContext(results[0][1])
         return results
@@ -850,6 +1109,10 @@ class SpectralProfileSamplingModeNode(TreeNode):
         Option(QSize(3, 3), name='3x3', toolTip='Reads the 3x3 pixel around the cursor location'),
         Option(QSize(5, 5), name='5x5', toolTip='Reads the 5x5 pixel around the cursor location'),
         Option(QSize(7, 7), name='7x7', toolTip='Reads the 7x7 pixel around the cursor location'),
+        Option(ProfileSamplingMode.SAMPLE_TRANSECT, name='Line transect',
+               toolTip='Reads all pixels along a line'),
+        Option(ProfileSamplingMode.SAMPLE_POLYGON, name='Polygon',
+               toolTip='Reads all pixels within a polygon'),
     ]
     )
 
@@ -891,7 +1154,7 @@ class SpectralProfileSamplingModeNode(TreeNode):
         # do not show the aggregation and number of profiles node in
         # case we sample a single pixel only
         mode = self.profileSamplingMode()
-        show_nodes = mode.kernelSize() != QSize(1, 1)
+        show_nodes = mode.kernelSize() != QSize(1, 1) or mode.samplingType() != ProfileSamplingMode.SAMPLE_KERNEL
         nodes = [self.nodeAggregation, self.nodeProfilesPerClick]
         if show_nodes:
             to_add = [n for n in nodes if n not in self.childNodes()]
@@ -905,7 +1168,11 @@ class SpectralProfileSamplingModeNode(TreeNode):
         kernel = mode.kernelSize()
         x, y = kernel.width(), kernel.height()
 
-        if (x, y) == (1, 1):
+        if mode.samplingType() == ProfileSamplingMode.SAMPLE_TRANSECT:
+            info = ['Sample all pixels along a line']
+        elif mode.samplingType() == ProfileSamplingMode.SAMPLE_POLYGON:
+            info = ['Sample all pixels within a polygon']
+        elif (x, y) == (1, 1):
             info = ['Sample 1 pixel']
         else:
             info = [f'Sample {x}x{y} pixel']
@@ -916,17 +1183,34 @@ class SpectralProfileSamplingModeNode(TreeNode):
         return '<br>'.join(info)
 
     def settings(self) -> dict:
+        mode = self.profileSamplingMode()
         settings = dict()
-        settings['kernel'] = '{}x{}'.format(*self.kernelSize())
-        settings['aggregation'] = self.aggregation()
+        settings['kernel'] = '{}x{}'.format(*mode.kernelSizeXY())
+        settings['aggregation'] = mode.aggregation()
+        settings['sampling_type'] = mode.samplingType()
         return settings
 
+    def setSettings(self, settings: dict):
+        """
+        Restores the sampling mode from a dictionary returned by .settings()
+        """
+        mode = self.profileSamplingMode().clone()
+        if 'kernel' in settings:
+            mode.setKernelSize(settings['kernel'])
+        if 'aggregation' in settings:
+            mode.setAggregation(settings['aggregation'])
+        if 'sampling_type' in settings:
+            mode.setSamplingType(settings['sampling_type'])
+        self.setProfileSamplingMode(mode)
+        self.sigUpdated.emit(self)
+
     def updateProfilesPerClickNode(self):
         """
         Updates the description on how many profiles will be created
         """
         mode = self.profileSamplingMode()
-        self.nodeProfilesPerClick.setValue(mode.numberOfProfiles())
+        n = mode.numberOfProfiles()
+        self.nodeProfilesPerClick.setValue(n if n >= 0 else 'one per pixel')
 
     def profileSamplingMode(self) -> ProfileSamplingMode:
         return self.mProfileSamplingMode
@@ -1124,6 +1408,8 @@ class SpectralProfileGeneratorNode(FieldGeneratorNode):
         kwargs = copy.copy(kwargs)
         sampling: ProfileSamplingMode = self.sampling()
         kwargs['kernel_size'] = QSize(sampling.kernelSize())
+        kwargs['aggregation'] = sampling.aggregation()
+        kwargs['samplingType'] = sampling.samplingType()
         source = self.mSourceNode.profileSource()
         if isinstance(source, SpectralProfileSource):
             profiles = source.collectProfiles(point, *args, **kwargs)
@@ -1513,17 +1799,24 @@ class SpectralProfileScalingNode(TreeNode):
         return float(self.nOffset.value())
 
     def profiles(self, profiles: List[Tuple[Dict, QgsExpressionContext]]) -> List[Tuple[Dict, QgsExpressionContext]]:
-        scale = self.scale()
-        offset = self.offset()
-        if offset != 0 or scale != 1:
-            for i in range(len(profiles)):
-                d, _ = profiles[i]
-                y = d['y']
-                d['y'] = [v * scale + offset if v not in [None, nan] and math.isfinite(v)
-                          else v for v in y
-                          ]
+        return scaleProfiles(profiles, self.offset(), self.scale())
 
-        return profiles
+
+def scaleProfiles(profiles: List[Tuple[Dict, QgsExpressionContext]],
+                  offset: float,
+                  scale: float) -> List[Tuple[Dict, QgsExpressionContext]]:
+    """
+    Scales the profile values y to offset + scale * y
+    """
+    if offset != 0 or scale != 1:
+        for i in range(len(profiles)):
+            d, _ = profiles[i]
+            y = d['y']
+            d['y'] = [v * scale + offset if v not in [None, nan] and math.isfinite(v)
+                      else v for v in y
+                      ]
+
+    return profiles
 
 
 def addVariablesToScope(scope: QgsExpressionContextScope,
@@ -1557,10 +1850,91 @@ def renameScopeVariables(scope: QgsExpressionContextScope, old_prefix: str, new_
         scope.removeVariable(n1)
 
 
+class ProfileSamplingJob(object):
+    """
+    The settings of a SpectralProfileGeneratorNode for a single sampling request.
+    A job is created in the main thread and resolves its profile source into LayerProfileSamplers,
+    so that its profiles can be collected in any thread without accessing the node, map layers or map canvas.
+    Profiles of other SpectralProfileSource types are collected when the job is created.
+    """
+
+    def __init__(self,
+                 field_name: str,
+                 pgnode: SpectralProfileGeneratorNode,
+                 suffix: str,
+                 point: Union[SpatialPoint, QgsReferencedGeometry],
+                 canvas: QgsMapCanvas = None,
+                 snap: bool = False,
+                 cached: bool = False):
+        self.mFieldName: str = field_name
+        self.mSuffix: str = suffix
+        self.mPoint = point
+        self.mSnap: bool = snap
+        # read raster pixels from the tiles of the RasterBlockCache, e.g. for live hover requests
+        self.mCached: bool = cached
+        self.mSampling: ProfileSamplingMode = pgnode.sampling().clone()
+        self.mOffset: float = pgnode.offset()
+        self.mScale: float = pgnode.scale()
+        self.mSamplers: List[LayerProfileSampler] = []
+        self.mAllLayers: bool = False
+        self.mProfiles: Optional[List[Tuple[Dict, QgsExpressionContext]]] = None
+
+        source = pgnode.profileSource()
+        if isinstance(source, StandardLayerProfileSource):
+            self.mSamplers.append(source.sampler())
+        elif isinstance(source, MapCanvasLayerProfileSource):
+            self.mSamplers.extend(source.samplers(canvas))
+            self.mAllLayers = source.mode() == MapCanvasLayerProfileSource.MODE_ALL_LAYERS
+        elif isinstance(source, SpectralProfileSource):
+            self.mProfiles = pgnode.profiles(point, canvas=canvas, snap=snap, suffix=suffix)
+        else:
+            self.mProfiles = []
+
+    def fieldName(self) -> str:
+        return self.mFieldName
+
+    def layers(self) -> List[RasterLayerSnapshot]:
+        """
+        Returns the snapshots of the raster layers that might be read by this job
+        """
+        return [sampler.layer() for sampler in self.mSamplers]
+
+    def profiles(self) -> List[Tuple[Dict, QgsExpressionContext]]:
+        """
+        Collects, aggregates and scales the profiles. Can be called in any thread.
+        """
+        if self.mProfiles is not None:
+            return self.mProfiles
+        kwargs = dict(kernel_size=QSize(self.mSampling.kernelSize()),
+                      snap=self.mSnap,
+                      suffix=self.mSuffix,
+                      aggregation=self.mSampling.aggregation(),
+                      samplingType=self.mSampling.samplingType(),
+                      cached=self.mCached)
+        if len(self.mSamplers) == 1 and not self.mAllLayers:
+            profiles = self.mSamplers[0].collectProfiles(self.mPoint, **kwargs)
+        else:
+            profiles = MapCanvasLayerProfileSource.collectSamplerProfiles(self.mSamplers, self.mPoint,
+                                                                          allLayers=self.mAllLayers, **kwargs)
+        profiles = self.mSampling.profiles(self.mPoint, profiles)
+        return scaleProfiles(profiles, self.mOffset, self.mScale)
+
+
 class SpectralProfileBridge(TreeModel):
     """
     A TreeModel to be used in a view, and to be used in a view,
     """
+    # emitted with the generation number of a loadProfiles() request when its profiles have been loaded
+    sigProfilesLoaded = pyqtSignal(int)
+
+    # maximum number of threads to sample different raster sources concurrently
+    SAMPLING_THREADS: int = 8
+
+    # thread pool shared by all bridges. Its threads are kept alive between requests,
+    # so that they can re-use their raster data providers
+    _SAMPLING_POOL: Optional[ThreadPoolExecutor] = None
+    _SAMPLING_POOL_SIZE: int = 0
+    _SAMPLING_POOL_LOCK = threading.Lock()
 
     def __init__(self, *args, **kwds):
 
@@ -1575,7 +1949,21 @@ class SpectralProfileBridge(TreeModel):
         self.mDstModel.rowsRemoved.connect(self.updateDestinationReferences)
         self.mClickCount: Dict[str, int] = dict()
 
-        self.mTasks = dict()
+        # generation number of the latest loadProfiles() request.
+        # results of older requests are discarded
+        self.mGeneration: int = 0
+        self.mTasks: Dict[int, SpectralProfileLoadingTask] = dict()
+        self.mAsyncFeatureGenerators: List[SpectralFeatureGeneratorNode] = []
+        self.mAsyncCandidates: Dict[str, List[QgsFeature]] = dict()
+        self.mRunAsync: bool = False
+
+        # live hover requests, see loadHoverProfiles()
+        self.mHoverGeneration: int = 0
+        self.mHoverKey: Optional[tuple] = None
+        self.mHoverTask: Optional[SpectralProfileLoadingTask] = None
+        self.mHoverPending: Optional[Tuple[SpatialPoint, QgsMapCanvas]] = None
+        self.mHoverFeatureGenerators: List[SpectralFeatureGeneratorNode] = []
+        self.mHoverProfiles: Dict[str, List[dict]] = dict()
         self.mSnapToPixelCenter: bool = False
         self.mMinimumSourceNameSimilarity = 0.5
 
@@ -1632,17 +2020,51 @@ class SpectralProfileBridge(TreeModel):
     def showErrors(self, fgnode: SpectralFeatureGeneratorNode, errors: Dict[str, str]):
         pass
 
-    def loadProfiles(self,
-                     spatialPoint: SpatialPoint,
-                     mapCanvas: QgsMapCanvas = None,
-                     runAsync: bool = False) -> Dict[str, List[QgsFeature]]:
+    def setRunAsync(self, b: bool):
         """
-        Loads the spectral profiles as defined in the bridge model
-        :param spatialPoint:
-        :param mapCanvas:
-        :param runAsync:
-        :return:
+        Sets if loadProfiles() collects the profiles in a background task by default.
+        """
+        if not (isinstance(b, bool)):
+            raise AssertionError
+        self.mRunAsync = b
+
+    def runAsync(self) -> bool:
+        return self.mRunAsync
+
+    def generation(self) -> int:
         """
+        Returns the generation number of the latest loadProfiles() request
+        """
+        return self.mGeneration
+
+    def cancelTasks(self):
+        """
+        Cancels all running profile loading tasks
+        """
+        for task in list(self.mTasks.values()):
+            if not sip.isdeleted(task):
+                task.cancel()
+
+    def loadProfiles(self,
+                     spatialPoint: Union[SpatialPoint, QgsReferencedGeometry],
+                     mapCanvas: QgsMapCanvas = None,
+                     runAsync: bool = None) -> Dict[str, List[QgsFeature]]:
+        """
+        Loads the spectral profiles as defined in the bridge model.
+        Each call starts a new request generation. Running requests of older generations are canceled
+        and their results are discarded.
+        :param spatialPoint: SpatialPoint, or QgsReferencedGeometry to sample line transects or polygons
+        :param mapCanvas: QgsMapCanvas
+        :param runAsync: if True, profiles are collected in a background task and added
+                         as candidates when available, see sigProfilesLoaded.
+                         Defaults to runAsync().
+        :return: {layer id: [QgsFeatures]} with the profile candidates. Empty if running async.
+        """
+        if runAsync is None:
+            runAsync = self.mRunAsync
+
+        self.mGeneration += 1
+        self.cancelTasks()
         self.mLastDestinations.clear()
 
         errorNodes: List[FieldGeneratorNode] = []
@@ -1661,27 +2083,46 @@ class SpectralProfileBridge(TreeModel):
             idx1 = self.index(self.rowCount(idx_parent) - 1, 0, idx_parent)
             self.dataChanged.emit(idx0, idx1, [Qt.BackgroundColorRole])
 
+        if runAsync:
+            self.startLoadingTask(featureGenerators, spatialPoint, mapCanvas=mapCanvas)
+            return dict()
+
         # 3. generate features from feature generators
         #    multiple feature generators can create features for the same speclib
         # store as RESULTS[layer id, ([features], {field_name:PlotStyle})
         CANDIDATES: Dict[str, List[QgsFeature]] = dict()
 
-        for fgnode in featureGenerators:
+        jobs = self.samplingJobs(featureGenerators, spatialPoint, mapCanvas=mapCanvas)
+        for fgnode, PROFILE_DATA in zip(featureGenerators, self.iterProfileData(jobs)):
             fgnode: SpectralFeatureGeneratorNode
+            features1 = self.createFeaturesFromProfileData(fgnode, PROFILE_DATA)
+            self.appendCandidates(CANDIDATES, fgnode, features1)
 
-            sid = fgnode.speclib().id()
-
-            features: List[QgsFeature] = CANDIDATES.get(sid, [])
-
-            fid0 = len(features)
+        self.showProfileCandidates(CANDIDATES)
+        self.sigProfilesLoaded.emit(self.mGeneration)
+        return CANDIDATES
 
-            features1 = self.createFeatures(fgnode, spatialPoint, canvas=mapCanvas)
-            for i, f in enumerate(features1):
-                fid = fid0 + i  # the unique feature ID
-                f.setId(fid)
-                features.append(f)
-                CANDIDATES[sid] = features
+    @staticmethod
+    def appendCandidates(candidates: Dict[str, List[QgsFeature]],
+                         fgnode: SpectralFeatureGeneratorNode,
+                         features: List[QgsFeature]):
+        """
+        Appends the features created by a feature generator to the candidates of its spectral library
+        and gives them unique feature ids.
+        """
+        sid = fgnode.speclib().id()
+        sfeatures: List[QgsFeature] = candidates.get(sid, [])
+        fid0 = len(sfeatures)
+        for i, f in enumerate(features):
+            fid = fid0 + i  # the unique feature ID
+            f.setId(fid)
+            sfeatures.append(f)
+            candidates[sid] = sfeatures
 
+    def showProfileCandidates(self, CANDIDATES: Dict[str, List[QgsFeature]]):
+        """
+        Adds the profile candidates to the project layers and informs the linked spectral library widgets
+        """
         # Add profiles as candidates to visualized spectral libraries
         # 1. check all SpectralLibraryWidgets if they are already connected to a speclib
         #    and if so, add the profiles to the speclib
@@ -1711,7 +2152,351 @@ class SpectralProfileBridge(TreeModel):
                                                            add_automatically=add_automatically)
         for model in models:
             model.updatePlot()
-        return CANDIDATES
+
+    def startLoadingTask(self,
+                         featureGenerators: List[SpectralFeatureGeneratorNode],
+                         point: SpatialPoint,
+                         mapCanvas: QgsMapCanvas = None) -> 'SpectralProfileLoadingTask':
+        """
+        Starts a background task that collects the profiles of the current generation.
+        """
+        # resolve profile sources, layer properties and sampling settings in the main thread
+        jobs = self.samplingJobs(featureGenerators, point, mapCanvas=mapCanvas)
+
+        self.mAsyncFeatureGenerators = featureGenerators
+        self.mAsyncCandidates = dict()
+
+        generation = self.mGeneration
+        task = SpectralProfileLoadingTask(generation, jobs)
+        task.sigProfileDataCollected.connect(self.onProfileDataCollected)
+        task.taskCompleted.connect(lambda *args, g=generation: self.onLoadingTaskFinished(g))
+        task.taskTerminated.connect(lambda *args, g=generation: self.onLoadingTaskFinished(g))
+        self.mTasks[generation] = task
+
+        tm = QgsApplication.taskManager()
+        if not (isinstance(tm, QgsTaskManager)):
+            raise AssertionError
+        tm.addTask(task)
+        return task
+
+    def samplingJobs(self,
+                     featureGenerators: List[SpectralFeatureGeneratorNode],
+                     point: Union[SpatialPoint, QgsReferencedGeometry],
+                     mapCanvas: QgsMapCanvas = None,
+                     cached: bool = False) -> List[List[ProfileSamplingJob]]:
+        """
+        Returns the ProfileSamplingJobs of the checked profile generators of each feature generator.
+        Needs to be called in the main thread.
+        :param cached: set True to read pixels from the tiles of the RasterBlockCache, e.g. for live hover
+                       requests, so that moving within a tile does not read from the data provider again.
+        """
+        return [[ProfileSamplingJob(field_name, pgnode, suffix, point,
+                                    canvas=mapCanvas, snap=self.mSnapToPixelCenter, cached=cached)
+                 for (field_name, pgnode, suffix) in self.profileGenerators(fgnode)]
+                for fgnode in featureGenerators]
+
+    @staticmethod
+    def sourceLayers(jobs: List[List[Tuple[str, SpectralProfileGeneratorNode, str]]],
+                     mapCanvas: QgsMapCanvas = None) -> List[QgsRasterLayer]:
+        """
+        Returns the raster layers that might be read by the profile generators of the jobs
+        """
+        layers: List[QgsRasterLayer] = []
+        for generators in jobs:
+            for (_, pgnode, _) in generators:
+                source = pgnode.profileSource()
+                if isinstance(source, StandardLayerProfileSource):
+                    layers.append(source.layer())
+                elif isinstance(source, MapCanvasLayerProfileSource):
+                    canvas = mapCanvas if isinstance(mapCanvas, QgsMapCanvas) else source.mMapCanvas
+                    if isinstance(canvas, QgsMapCanvas):
+                        layers.extend([lyr for lyr in canvas.layers() if isinstance(lyr, QgsRasterLayer)])
+        return [lyr for lyr in layers if isinstance(lyr, QgsRasterLayer) and lyr.isValid()]
+
+    def loadHoverProfiles(self,
+                          spatialPoint: SpatialPoint,
+                          mapCanvas: QgsMapCanvas = None,
+                          runAsync: bool = None) -> bool:
+        """
+        Loads the profiles under a hovered map position and shows them as temporary profiles
+        in the plots of the connected spectral library widgets. Does not add them to a spectral library.
+        The request is skipped if the position is inside the same pixels as the previous one.
+        Pixels are read from the tiles of the RasterBlockCache, so that moving within a tile does not
+        read from the data provider again. While a hover request is running, only the latest new position is kept and
+        loaded when the running request has finished.
+        :param spatialPoint: SpatialPoint
+        :param mapCanvas: QgsMapCanvas
+        :param runAsync: if True, profiles are collected in a background task. Defaults to runAsync().
+        :return: True if a request was started or queued, False if it was skipped.
+        """
+        if runAsync is None:
+            runAsync = self.mRunAsync
+
+        featureGenerators = [fgnode for fgnode in self.featureGenerators(speclib=True, checked=True)
+                             if fgnode.validate()]
+        layers = self.sourceLayers([self.profileGenerators(fgnode) for fgnode in featureGenerators],
+                                   mapCanvas=mapCanvas)
+
+        # moving within the same pixels of all source layers does not change the profiles
+        key = []
+        for lyr in layers:
+            px = spatialPoint.toPixelPosition(lyr, allowOutOfRaster=True)
+            key.append((lyr.id(), px.x(), px.y()) if isinstance(px, QPoint) else (lyr.id(), None, None))
+        key = tuple(key)
+        if key == self.mHoverKey:
+            return False
+        self.mHoverKey = key
+
+        if not runAsync:
+            self.cancelHoverTask()
+            jobs = self.samplingJobs(featureGenerators, spatialPoint, mapCanvas=mapCanvas, cached=True)
+            self.mHoverProfiles = dict()
+            for fgnode, PROFILE_DATA in zip(featureGenerators, self.iterProfileData(jobs)):
+                self.appendHoverProfiles(self.mHoverProfiles, fgnode, PROFILE_DATA)
+            self.showHoverProfiles(self.mHoverProfiles)
+            return True
+
+        if isinstance(self.mHoverTask, SpectralProfileLoadingTask):
+            # coalesce: keep only the latest position until the running request has finished
+            self.mHoverPending = (spatialPoint, mapCanvas)
+            return True
+
+        self.cancelHoverTask()
+        generation = self.mHoverGeneration
+        self.mHoverFeatureGenerators = featureGenerators
+        self.mHoverProfiles = dict()
+        jobs = self.samplingJobs(featureGenerators, spatialPoint, mapCanvas=mapCanvas, cached=True)
+        task = SpectralProfileLoadingTask(generation, jobs, description='Load hovered spectral profiles')
+        task.sigProfileDataCollected.connect(self.onHoverProfileDataCollected)
+        task.taskCompleted.connect(lambda *args, g=generation: self.onHoverTaskFinished(g))
+        task.taskTerminated.connect(lambda *args, g=generation: self.onHoverTaskFinished(g))
+        self.mHoverTask = task
+
+        tm = QgsApplication.taskManager()
+        if not (isinstance(tm, QgsTaskManager)):
+            raise AssertionError
+        tm.addTask(task)
+        return True
+
+    def onHoverProfileDataCollected(self, generation: int, index: int, profileData: dict):
+        if generation != self.mHoverGeneration or index >= len(self.mHoverFeatureGenerators):
+            return
+        fgnode = self.mHoverFeatureGenerators[index]
+        if sip.isdeleted(fgnode):
+            return
+        self.appendHoverProfiles(self.mHoverProfiles, fgnode, profileData)
+        self.showHoverProfiles(self.mHoverProfiles)
+
+    def onHoverTaskFinished(self, generation: int):
+        if generation != self.mHoverGeneration:
+            return
+        self.mHoverTask = None
+        self.mHoverFeatureGenerators = []
+        if self.mHoverPending is not None:
+            spatialPoint, mapCanvas = self.mHoverPending
+            self.mHoverPending = None
+            # the pending position has not been loaded yet
+            self.mHoverKey = None
+            self.loadHoverProfiles(spatialPoint, mapCanvas=mapCanvas, runAsync=True)
+
+    @staticmethod
+    def appendHoverProfiles(results: Dict[str, List[dict]],
+                            fgnode: SpectralFeatureGeneratorNode,
+                            PROFILE_DATA: Dict[str, List[Tuple[dict, QgsExpressionContext]]]):
+        """
+        Appends the profile dictionaries of collected profile data to the hover profiles of a spectral library
+        """
+        speclib = fgnode.speclib()
+        if not isinstance(speclib, QgsVectorLayer):
+            return
+        profiles = results.setdefault(speclib.id(), [])
+        for data in PROFILE_DATA.values():
+            profiles.extend([pdata for (pdata, _) in data])
+
+    def showHoverProfiles(self, results: Dict[str, List[dict]]):
+        """
+        Shows hover profiles {speclib id: [profile dictionaries]} in the plots of the
+        spectral library widgets that visualize the spectral libraries.
+        """
+        for slw in self.mSLWs:
+            profiles = []
+            for lyr in slw.sourceLayers():
+                profiles.extend(results.get(lyr.id(), []))
+            slw.plotModel().setTemporaryProfiles(profiles)
+
+    def hoverProfiles(self) -> Dict[str, List[dict]]:
+        """
+        Returns the hover profiles {speclib id: [profile dictionaries]} of the last hover request
+        """
+        return {k: v[:] for k, v in self.mHoverProfiles.items()}
+
+    def cancelHoverTask(self):
+        """
+        Starts a new hover generation. A running hover task of an older generation is canceled
+        and released, so that its results are discarded and it does not block new hover tasks.
+        """
+        self.mHoverGeneration += 1
+        self.mHoverPending = None
+        if isinstance(self.mHoverTask, SpectralProfileLoadingTask) and not sip.isdeleted(self.mHoverTask):
+            self.mHoverTask.cancel()
+        self.mHoverTask = None
+        self.mHoverFeatureGenerators = []
+
+    def clearHoverProfiles(self):
+        """
+        Cancels running hover requests and removes the hover profiles from the plots
+        """
+        self.cancelHoverTask()
+        self.mHoverKey = None
+        self.mHoverProfiles = dict()
+        for slw in self.mSLWs:
+            slw.plotModel().clearTemporaryProfiles()
+
+    def onProfileDataCollected(self, generation: int, index: int, profileData: dict):
+        # called in the GUI thread for each feature generator whose profiles have been collected
+        if generation != self.mGeneration or index >= len(self.mAsyncFeatureGenerators):
+            # outdated request
+            return
+
+        fgnode = self.mAsyncFeatureGenerators[index]
+        if sip.isdeleted(fgnode) or not isinstance(fgnode.speclib(), QgsVectorLayer):
+            return
+
+        features = self.createFeaturesFromProfileData(fgnode, profileData)
+        if len(features) > 0:
+            self.appendCandidates(self.mAsyncCandidates, fgnode, features)
+            self.showProfileCandidates(self.mAsyncCandidates)
+
+    def onLoadingTaskFinished(self, generation: int):
+        self.mTasks.pop(generation, None)
+        if generation == self.mGeneration:
+            self.mAsyncFeatureGenerators = []
+            self.sigProfilesLoaded.emit(generation)
+
+    def profileGenerators(self,
+                          fgnode: SpectralFeatureGeneratorNode
+                          ) -> List[Tuple[str, SpectralProfileGeneratorNode, str]]:
+        """
+        Returns the checked profile generators of a feature generator that write into existing
+        fields of its spectral library, as (field name, profile generator node, context variable suffix)
+        """
+        speclib: QgsVectorLayer = fgnode.speclib()
+        if not (isinstance(speclib, QgsVectorLayer) and speclib.isValid()):
+            return []
+        speclib_fields = speclib.fields().names()
+
+        generators = []
+        for i, pgnode in enumerate(fgnode.spectralProfileGeneratorNodes()):
+            pgnode: SpectralProfileGeneratorNode
+            if not pgnode.checked():
+                continue
+            suffix = '' if i == 0 else f'{i}'
+
+            field_name = pgnode.field().name()
+            if field_name not in speclib_fields:
+                continue
+            generators.append((field_name, pgnode, suffix))
+        return generators
+
+    @classmethod
+    def collectProfileData(cls, jobs: List[ProfileSamplingJob]) -> Dict[str, List[Tuple[dict, QgsExpressionContext]]]:
+        """
+        Collects the profiles of ProfileSamplingJobs, as returned by samplingJobs().
+        Does not modify the spectral library and can be called from a background thread.
+        :return: {field name: [(profile dictionary, expression context), ...]}
+        """
+        return next(cls.iterProfileData([jobs]))
+
+    @classmethod
+    def iterProfileData(cls,
+                        jobs: List[List[ProfileSamplingJob]],
+                        pooled: bool = False
+                        ) -> Iterator[Dict[str, List[Tuple[dict, QgsExpressionContext]]]]:
+        """
+        Collects the profiles of multiple lists of ProfileSamplingJobs and yields the
+        profile data of each list in the order of the jobs.
+
+        Jobs that read from the same raster source are processed one after another.
+        Different raster sources are sampled concurrently by the threads of the samplingPool(),
+        each reading with its own data provider, see RasterBlockCache.threadProvider().
+        Jobs that read from multiple raster sources, e.g. of a MapCanvasLayerProfileSource,
+        are sampled in the calling thread.
+        :param jobs: lists of ProfileSamplingJobs, as returned by samplingJobs()
+        :param pooled: set True to sample all jobs in the samplingPool(), even a single raster source.
+                       Background tasks use this to re-use the data providers of the pool threads
+                       instead of opening new ones in each task thread.
+        """
+        items = [(j, job) for j, jobList in enumerate(jobs) for job in jobList]
+
+        # group items by raster source
+        groups: Dict[Tuple[str, str], List[int]] = dict()
+        serial: List[int] = []
+        for i, (_, job) in enumerate(items):
+            layers = job.layers()
+            if len(layers) == 1:
+                groups.setdefault(RasterBlockCache.sourceKey(layers[0]), []).append(i)
+            else:
+                serial.append(i)
+
+        results: Dict[int, List[Tuple[dict, QgsExpressionContext]]] = dict()
+
+        def collect(indices: List[int]):
+            for i in indices:
+                results[i] = items[i][1].profiles()
+
+        def profileData(j: int) -> Dict[str, List[Tuple[dict, QgsExpressionContext]]]:
+            PROFILE_DATA: Dict[str, List[Tuple[dict, QgsExpressionContext]]] = dict()
+            for i, (j2, job) in enumerate(items):
+                if j2 == j and len(results.get(i, [])) > 0:
+                    PROFILE_DATA[job.fieldName()] = results[i]
+            return PROFILE_DATA
+
+        n_threads = min(cls.SAMPLING_THREADS, len(groups))
+        if n_threads < 2 and not pooled:
+            # sample in the calling thread
+            for j in range(len(jobs)):
+                collect([i for i, item in enumerate(items) if item[0] == j])
+                yield profileData(j)
+            return
+
+        pool = cls.samplingPool()
+        futures = dict()
+        try:
+            submitted = list(groups.values())
+            if pooled and len(serial) > 0:
+                submitted.append(serial)
+            for indices in submitted:
+                future = pool.submit(collect, indices)
+                for i in indices:
+                    futures[i] = future
+
+            for j in range(len(jobs)):
+                for i, item in enumerate(items):
+                    if item[0] != j:
+                        continue
+                    if i in futures:
+                        futures[i].result()
+                    elif i not in results:
+                        collect(serial)
+                yield profileData(j)
+        finally:
+            for future in futures.values():
+                future.cancel()
+            wait(set(futures.values()))
+
+    @classmethod
+    def samplingPool(cls) -> ThreadPoolExecutor:
+        """
+        Returns the thread pool used to sample different raster sources concurrently.
+        """
+        with cls._SAMPLING_POOL_LOCK:
+            if cls._SAMPLING_POOL is None or cls._SAMPLING_POOL_SIZE != cls.SAMPLING_THREADS:
+                if cls._SAMPLING_POOL is not None:
+                    cls._SAMPLING_POOL.shutdown(wait=False)
+                cls._SAMPLING_POOL = ThreadPoolExecutor(max_workers=cls.SAMPLING_THREADS,
+                                                        thread_name_prefix='ProfileSampling')
+                cls._SAMPLING_POOL_SIZE = cls.SAMPLING_THREADS
+            return cls._SAMPLING_POOL
 
     def createFeatures(self,
                        fgnode: SpectralFeatureGeneratorNode,
@@ -1729,29 +2514,21 @@ class SpectralProfileBridge(TreeModel):
         -------
 
         """
-        fgnode: SpectralFeatureGeneratorNode
+        jobs = self.samplingJobs([fgnode], point, mapCanvas=canvas)
+        PROFILE_DATA = self.collectProfileData(jobs[0])
+        return self.createFeaturesFromProfileData(fgnode, PROFILE_DATA)
 
+    def createFeaturesFromProfileData(self,
+                                      fgnode: SpectralFeatureGeneratorNode,
+                                      PROFILE_DATA: Dict[str, List[Tuple[dict, QgsExpressionContext]]]
+                                      ) -> List[QgsFeature]:
+        """
+        Creates QgsFeatures from collected profile data, as returned by collectProfileData().
+        Other field values are derived from the field expressions of the feature generator.
+        """
         speclib: QgsVectorLayer = fgnode.speclib()
-        speclib_fields = speclib.fields().names()
-        if not isinstance(speclib, QgsVectorLayer) and speclib.isValid():
-            return []
-
         new_features: List[QgsFeature] = []
-        PROFILE_DATA: Dict[str, List[Tuple[dict, QgsExpressionContext]]] = dict()
-        # PLOT_STYLES: Dict[str, PlotStyle] = dict()
-        for i, pgnode in enumerate(fgnode.spectralProfileGeneratorNodes()):
-            pgnode: SpectralProfileGeneratorNode
-            if not pgnode.checked():
-                continue
-            suffix = '' if i == 0 else f'{i}'
-
-            field_name = pgnode.field().name()
-            if field_name not in speclib_fields:
-                continue
-            results = pgnode.profiles(point, canvas=canvas, snap=self.mSnapToPixelCenter, suffix=suffix)
-            if len(results) > 0:
-                PROFILE_DATA[field_name] = results
-                # PLOT_STYLES[pgnode.field().name()] = pgnode.plotStyle().clone()
+        PROFILE_DATA = {k: list(v) for k, v in PROFILE_DATA.items()}
 
         while len(PROFILE_DATA) > 0:
             pfields = list(PROFILE_DATA.keys())
@@ -1778,9 +2555,7 @@ class SpectralProfileBridge(TreeModel):
                     _g = QgsGeometry(pcontext.geometry())
                     crs = pcontext.variable('_source_crs')
                     if speclib.crs().isValid() and isinstance(crs, QgsCoordinateReferenceSystem) and crs.isValid():
-                        trans = QgsCoordinateTransform()
-                        trans.setSourceCrs(crs)
-                        trans.setDestinationCrs(speclib.crs())
+                        trans = CoordinateTransformCache.transform(crs, speclib.crs())
                         if _g.transform(trans) == Qgis.GeometryOperationResult.Success:
                             g = _g
 
@@ -2003,7 +2778,11 @@ class SpectralProfileBridge(TreeModel):
 
                 if c == 1:
                     if role == Qt.DisplayRole:
-                        if mode.kernelSize() == QSize(1, 1):
+                        if mode.samplingType() != ProfileSamplingMode.SAMPLE_KERNEL:
+                            topt = SpectralProfileSamplingModeNode.KERNEL_MODEL.findOption(mode.samplingType())
+                            aopt = SpectralProfileSamplingModeNode.AGGREGATION_MODEL.findOption(mode.aggregation())
+                            return f'{topt.name()} {aopt.name()}'
+                        elif mode.kernelSize() == QSize(1, 1):
                             return 'Single Pixel'
                         else:
                             ksize = mode.kernelSize()
@@ -2118,7 +2897,11 @@ class SpectralProfileBridge(TreeModel):
                 mode = value
             elif isinstance(value, QSize):
                 mode = node.profileSamplingMode()
+                mode.setSamplingType(ProfileSamplingMode.SAMPLE_KERNEL)
                 mode.setKernelSize(value)
+            elif isinstance(value, str) and value in ProfileSamplingMode().samplingTypes():
+                mode = node.profileSamplingMode()
+                mode.setSamplingType(value)
             if isinstance(mode, ProfileSamplingMode):
                 node.setProfileSamplingMode(mode)
 
@@ -2291,6 +3074,48 @@ class SpectralProfileBridge(TreeModel):
             # self.mDstModel.removeSpectralLibraryWidget(slw)
 
 
+class SpectralProfileLoadingTask(QgsTask):
+    """
+    Collects the profile data of feature generators in a background thread.
+    The task gets ProfileSamplingJobs, which have been created in the main thread, and does not access
+    map layers, data providers or map canvases of the main thread. Raster pixels are read by the threads
+    of the SpectralProfileBridge.samplingPool(), which keep their data providers between tasks,
+    see RasterBlockCache.threadProvider().
+    The profile data is emitted for each feature generator
+    with sigProfileDataCollected(generation, feature generator index, profile data).
+    """
+    sigProfileDataCollected = pyqtSignal(int, int, object)
+
+    def __init__(self,
+                 generation: int,
+                 jobs: List[List[ProfileSamplingJob]],
+                 description: str = 'Load spectral profiles'):
+        super().__init__(description=description)
+        self.mGeneration: int = generation
+        self.mJobs = jobs
+        self.mErrors: List[str] = []
+
+    def generation(self) -> int:
+        return self.mGeneration
+
+    def errors(self) -> List[str]:
+        return self.mErrors[:]
+
+    def run(self) -> bool:
+        try:
+            n = len(self.mJobs)
+            for i, PROFILE_DATA in enumerate(SpectralProfileBridge.iterProfileData(self.mJobs, pooled=True)):
+                if self.isCanceled():
+                    return False
+                self.sigProfileDataCollected.emit(self.mGeneration, i, PROFILE_DATA)
+                self.setProgress(100 * (i + 1) / n)
+        except Exception as ex:
+            logger.error(f'Error loading spectral profiles: {ex}')
+            self.mErrors.append(str(ex))
+            return False
+        return True
+
+
 class SpectralProfileBridgeViewDelegate(QStyledItemDelegate):
     """
 
@@ -2460,7 +3285,11 @@ class SpectralProfileBridgeViewDelegate(QStyledItemDelegate):
         elif isinstance(node, SpectralProfileSamplingModeNode) and index.column() == 1:
             if not (isinstance(editor, QComboBox)):
                 raise AssertionError
-            setCurrentComboBoxValue(editor, node.profileSamplingMode().kernelSize())
+            mode = node.profileSamplingMode()
+            if mode.samplingType() == ProfileSamplingMode.SAMPLE_KERNEL:
+                setCurrentComboBoxValue(editor, mode.kernelSize())
+            else:
+                setCurrentComboBoxValue(editor, mode.samplingType())
 
         elif isinstance(node, OptionTreeNode) and index.column() == 1:
             if not (isinstance(editor, QComboBox)):
@@ -2568,6 +3397,10 @@ class SpectralProfileSourcePanel(QgsDockWidget):
         self.actionSnapToPixelCenter.setChecked(self.mBridge.mSnapToPixelCenter)
         self.actionSnapToPixelCenter.toggled.connect(self.mBridge.setSnapToPixelCenter)
 
+        self.mMapTools: List[SpectralProfileMapTool] = []
+        self.btnLiveHover.setDefaultAction(self.actionLiveHover)
+        self.actionLiveHover.toggled.connect(self.setLiveHover)
+
         self.onSelectionChanged([], [])
 
     def spectralProfileBridge(self) -> SpectralProfileBridge:
@@ -2601,7 +3434,7 @@ class SpectralProfileSourcePanel(QgsDockWidget):
         self.mBridge.removeSpectralLibraryWidgets(slws)
 
     def setRunAsync(self, b: bool):
-        self.bridge().setRunAsync(b)
+        self.mBridge.setRunAsync(b)
 
     def onSelectionChanged(self, selected: QItemSelection, deselected: QItemSelection):
         tv: SpectralProfileBridgeTreeView = self.treeView
@@ -2612,11 +3445,70 @@ class SpectralProfileSourcePanel(QgsDockWidget):
         tv: SpectralProfileBridgeTreeView = self.treeView
         self.mBridge.removeFeatureGenerators(tv.selectedFeatureGenerators())
 
+    def connectMapTool(self, mapTool: QgsMapTool):
+        """
+        Connects a map tool to load the profiles at the locations it selects.
+        SpectralProfileMapTool points are sampled with the kernel of each relation,
+        the lines and polygons of a SpectralProfileGeometryMapTool along / within the geometry.
+        The live-hover mode of connected SpectralProfileMapTools follows the actionLiveHover.
+        """
+        if isinstance(mapTool, SpectralProfileMapTool):
+            def onLocationRequest(crs: QgsCoordinateReferenceSystem, pt: QgsPointXY):
+                self.loadCurrentMapSpectra(SpatialPoint(crs, pt), mapCanvas=mapTool.canvas())
+
+            def onHoverLocationRequest(crs: QgsCoordinateReferenceSystem, pt: QgsPointXY):
+                self.loadHoverSpectra(SpatialPoint(crs, pt), mapCanvas=mapTool.canvas())
+
+            mapTool.sigLocationRequest.connect(onLocationRequest)
+            mapTool.sigHoverLocationRequest.connect(onHoverLocationRequest)
+            mapTool.sigHoverFinished.connect(self.clearHoverSpectra)
+            mapTool.setLiveHover(self.liveHover())
+            self.mMapTools.append(mapTool)
+        elif isinstance(mapTool, SpectralProfileGeometryMapTool):
+            def onGeometryRequest(crs: QgsCoordinateReferenceSystem, g: QgsGeometry):
+                self.loadCurrentMapSpectra(QgsReferencedGeometry(g, crs), mapCanvas=mapTool.canvas())
+
+            mapTool.sigGeometryRequest.connect(onGeometryRequest)
+        else:
+            raise AssertionError(f'Unsupported map tool: {mapTool}')
+
     def loadCurrentMapSpectra(self,
-                              spatialPoint: SpatialPoint,
+                              spatialPoint: Union[SpatialPoint, QgsReferencedGeometry],
                               mapCanvas: QgsMapCanvas = None,
                               runAsync: bool = None) -> Dict[str, List[QgsFeature]]:
         return self.mBridge.loadProfiles(spatialPoint, mapCanvas=mapCanvas, runAsync=runAsync)
 
+    def mapTools(self) -> List[SpectralProfileMapTool]:
+        """
+        Returns the connected SpectralProfileMapTools
+        """
+        self.mMapTools = [t for t in self.mMapTools if not sip.isdeleted(t)]
+        return self.mMapTools[:]
+
+    def setLiveHover(self, b: bool):
+        """
+        Enables or disables the live-hover mode of the connected SpectralProfileMapTools
+        """
+        if self.actionLiveHover.isChecked() != b:
+            # calls setLiveHover again
+            self.actionLiveHover.setChecked(b)
+            return
+        for mapTool in self.mapTools():
+            mapTool.setLiveHover(b)
+        if not b:
+            self.clearHoverSpectra()
+
+    def liveHover(self) -> bool:
+        return self.actionLiveHover.isChecked()
+
+    def loadHoverSpectra(self,
+                         spatialPoint: SpatialPoint,
+                         mapCanvas: QgsMapCanvas = None,
+                         runAsync: bool = None) -> bool:
+        return self.mBridge.loadHoverProfiles(spatialPoint, mapCanvas=mapCanvas, runAsync=runAsync)
+
+    def clearHoverSpectra(self):
+        self.mBridge.clearHoverProfiles()
+
     def addCurrentProfilesToSpeclib(self):
         self.mBridge.addCurrentProfilesToSpeclib()
@@ -31,6 +31,7 @@ import re
 
 from qgis.PyQt.QtWidgets import QFileDialog, QMenu
 from qgis.core import QgsFeature, QgsProcessingFeedback
+from .textdata import parse_numeric_block
 from ..core import is_spectral_library
 from ..core.spectrallibraryio import SpectralLibraryIO
 from ...utils import createQgsField
@@ -106,32 +107,23 @@ class ARTMOSpectralLibraryIO(SpectralLibraryIO):
         profiles = []
 
         with open(path, 'r', encoding='utf-8') as f:
-            for iLine, line in enumerate(f.readlines()):
+            lines = f.read().split('\n', firstLine + 1)
 
-                if len(line) == 0:
-                    continue
+        # read the header data
+        xValues = [float(v) for v in lines[firstLine].split(delimiter)[firstXValueColumn:]]
+        data = parse_numeric_block(lines[firstLine + 1] if len(lines) > firstLine + 1 else '', delimiter=delimiter)
 
-                parts = line.split(delimiter)
-                if iLine == firstLine:
-                    # read the header data
+        for values in data:
+            profile = QgsFeature(fields=speclib.fields())  # SpectralProfile(fields=speclib.fields())
 
-                    xValues = [float(v) for v in parts[firstXValueColumn:]]
-                elif iLine > firstLine:
+            name = '{}:{}'.format(bn, len(profiles) + 1)
+            profile.setName(name)
 
-                    yValues = [float(v) for v in parts[firstXValueColumn:]]
-                    profile = QgsFeature(fields=speclib.fields())  # SpectralProfile(fields=speclib.fields())
+            for iCol, name in COLUMNS.items():
+                profile.setAttribute(name, float(values[iCol]))
 
-                    name = None
-                    if name is None:
-                        name = '{}:{}'.format(bn, len(profiles) + 1)
-
-                    profile.setName(name)
-
-                    for iCol, name in COLUMNS.items():
-                        profile.setAttribute(name, float(parts[iCol]))
-
-                    profile.setValues(x=xValues, y=yValues, xUnit=xUnit)
-                    profiles.append(profile)
+            profile.setValues(x=xValues, y=values[firstXValueColumn:].tolist(), xUnit=xUnit)
+            profiles.append(profile)
 
         speclib.startEditing()
         speclib.addProfiles(profiles)
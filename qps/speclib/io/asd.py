@@ -31,7 +31,7 @@ import re
 import struct
 import warnings
 from pathlib import Path
-from typing import Tuple, Union, List
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 
@@ -128,6 +128,66 @@ class InstrumentType(enum.Enum):
     FSFR_UNATTENDED_INSTRUMENT = 7
 
 
+# the 484 byte file header as structured numpy dtype, little-endian and without padding
+ASD_HEADER_DTYPE = np.dtype({
+    'names': ['co', 'comments', 'when', 'program_version', 'file_version', 'itime', 'dc_corr', 'dc_time',
+              'data_type', 'ref_time', 'ch1_wavel', 'wavel_step', 'data_format', 'old_dc_count', 'old_ref_count',
+              'old_sample_count', 'application', 'channels', 'app_data',
+              'gps_true_heading', 'gps_speed', 'gps_latitude', 'gps_longitude', 'gps_altitude', 'gps_flags',
+              'gps_hardware_mode', 'gps_timestamp', 'gps_flags2', 'gps_satellites', 'gps_filler',
+              'it', 'fo', 'dcc', 'calibration', 'instrument_num', 'ymin', 'ymax', 'xmin', 'xmax', 'ip_numbits',
+              'xmode', 'flags', 'dc_count', 'ref_count', 'sample_count', 'instrument', 'bulb',
+              'swir1_gain', 'swir2_gain', 'swir1_offset', 'swir2_offset', 'splice1_wavelength', 'splice2_wavelength',
+              'sd_serial_number', 'sd_signal', 'sd_dark', 'sd_ref', 'sd_status', 'sd_avg', 'sd_humid', 'sd_temp',
+              'spare'],
+    'formats': ['S3', 'S157', ('<i2', 9), 'u1', 'u1', 'u1', 'u1', '<i4',
+                'u1', '<i4', '<f4', '<f4', 'u1', 'u1', 'u1',
+                'u1', 'u1', '<u2', 'V128',
+                '<f8', '<f8', '<f8', '<f8', '<f8', '<u2',
+                'S1', '<i4', '<u2', 'S5', 'S2',
+                '<u4', '<i2', '<i2', '<u2', '<u2', '<f4', '<f4', '<f4', '<f4', '<u2',
+                'i1', ('i1', 4), '<u2', '<u2', '<u2', 'u1', '<u4',
+                '<u2', '<u2', '<u2', '<u2', '<f4', '<f4',
+                '<i4', '<f4', '<f4', '<f4', '<i2', 'i1', '<f4', '<f4',
+                'V5'],
+    'offsets': [0, 3, 160, 178, 179, 180, 181, 182,
+                186, 187, 191, 195, 199, 200, 201,
+                202, 203, 204, 206,
+                334, 342, 350, 358, 366, 374,
+                376, 377, 381, 383, 388,
+                390, 394, 396, 398, 400, 402, 406, 410, 414, 418,
+                420, 421, 425, 427, 429, 431, 432,
+                436, 438, 440, 442, 444, 448,
+                452, 456, 460, 464, 468, 470, 471, 475,
+                479],
+    'itemsize': 484,
+})
+
+# numpy data types of the spectrum data formats
+ASD_DATA_DTYPES = {
+    SpectrumDataFormat.FLOAT_FORMAT.value: np.dtype('<f4'),
+    SpectrumDataFormat.INTEGER_FORMAT.value: np.dtype('<i4'),
+    SpectrumDataFormat.DOUBLE_FORMAT.value: np.dtype('<f8'),
+}
+
+
+def asd_xvalues(ch1_wavel: float, wavel_step: float, channels: int) -> np.ndarray:
+    """
+    Returns the wavelengths of the ASD spectrum channels
+    """
+    ch1_wavel = float(ch1_wavel)
+    return np.linspace(ch1_wavel, ch1_wavel + int(channels) * float(wavel_step) - 1, int(channels))
+
+
+def asd_degree_minutes(values: np.ndarray) -> np.ndarray:
+    """
+    Converts the ASD GPS coordinates, stored as degree * 100 + minutes, into decimal degrees
+    """
+    values = np.asarray(values, dtype=float)
+    degrees = np.trunc(values / 100)
+    return degrees + (values - degrees * 100) / 60
+
+
 class GPS_DATA(object):
 
     # time_t = == long
@@ -287,8 +347,11 @@ class ASDBinaryFile(SpectralProfileFileReader):
     See ASD File Format, version 8, revision B, ASD Inc.,
     a PANalytical company, 2555 55th Street, Suite 100 Boulder, CO 80301.
     """
+    FILE_NAME_PATTERN = RX_ASDFILE
+    # file version 'ASD' (version 1) or 'as2' to 'as8'
+    MAGIC_BYTES = (b'ASD', b'as')
 
-    def __init__(self, path, **kwds):
+    def __init__(self, path, batch: Optional['ASDBinaryFileBatch'] = None, index: int = 0, **kwds):
         super().__init__(path, **kwds)
         self.name: str = ''
         # initialize all variables in the ASD Binary file header
@@ -345,7 +408,9 @@ class ASDBinaryFile(SpectralProfileFileReader):
         self.SpectrumDescription: str = None
         self.Reference = None
 
-        if path is not None:
+        if isinstance(batch, ASDBinaryFileBatch):
+            self.setBatchData(batch, index)
+        elif path is not None:
             self.readFromBinaryFile(path)
 
     @classmethod
@@ -384,128 +449,259 @@ class ASDBinaryFile(SpectralProfileFileReader):
         :param path:
         :return:
         """
-        path = pathlib.Path(path)
-        with open(path, 'rb') as f:
-            DATA = f.read()
+        batch = ASDBinaryFileBatch([path])
+        error = batch.error(0)
+        if error:
+            raise Exception(error)
+        self.setBatchData(batch, 0)
+        return self
+
+    def setBatchData(self, batch: 'ASDBinaryFileBatch', i: int):
+        """
+        Sets the header values and profiles of the i-th file of an ASDBinaryFileBatch
+        """
+        h = batch.header(i)
+        raw = h.tobytes()
+
+        self.co = h['co'].decode('utf-8', errors='replace')
+        self.mMetadata['co'] = self.co
+        self.comments = h['comments'].decode('utf-8', errors='replace')
+        self.mMetadata['comments'] = self.comments
+
+        self.when = TM_STRUCT(raw[160:(160 + 18)])
+        self.mTargetTime = batch.targetTime(i)
+
+        self.program_version = int(h['program_version'])
+        self.file_version = int(h['file_version'])
+        self.itime = int(h['itime'])
+        self.dc_corr = int(h['dc_corr'])
+        self.dc_time = np.datetime64('1970-01-01') + np.timedelta64(int(h['dc_time']), 's')
+        self.data_type = SpectrumDataType(int(h['data_type']))
+        self.ref_time = self.dc_time
+        self.mReferenceTime = batch.referenceTime(i)
+
+        self.ch1_wavel = float(h['ch1_wavel'])
+        self.wavel_step = float(h['wavel_step'])
+        self.data_format = SpectrumDataFormat(int(h['data_format']))
+        self.old_dc_count = int(h['old_dc_count'])
+        self.old_ref_count = int(h['old_ref_count'])
+        self.old_sample_count = int(h['old_sample_count'])
+        self.application = int(h['application'])
+        self.channels = int(h['channels'])
+
+        self.app_data = h['app_data'].tobytes()
+        self.gps_data = GPS_DATA(raw[334:334 + 56])
+        self.mTargetCoordinate = batch.targetCoordinate(i)
+
+        self.it = int(h['it'])
+        self.fo = int(h['fo'])
+        self.dcc = int(h['dcc'])
+        self.calibration = int(h['calibration'])
+        self.instrument_num = int(h['instrument_num'])
+        self.ymin = float(h['ymin'])
+        self.ymax = float(h['ymax'])
+        self.xmin = float(h['xmin'])
+        self.xmax = float(h['xmax'])
+        self.ip_numbits = int(h['ip_numbits'])
+        self.xmode = int(h['xmode'])
+        self.flags = tuple(int(v) for v in h['flags'])
+        self.dc_count = int(h['dc_count'])
+        self.ref_count = int(h['ref_count'])
+        self.sample_count = int(h['sample_count'])
+        self.instrument = InstrumentType(int(h['instrument']))
+        self.bulb = (int(h['bulb']),)
+        self.swir1_gain = int(h['swir1_gain'])
+        self.swir2_gain = int(h['swir2_gain'])
+        self.swir1_offset = int(h['swir1_offset'])
+        self.swir2_offset = int(h['swir2_offset'])
+        self.splice1_wavelength = float(h['splice1_wavelength'])
+        self.splice2_wavelength = float(h['splice2_wavelength'])
+        self.SmartDetectorType = SmartDetectorType(raw[452:452 + 27])
+        self.spare = h['spare'].tobytes()
+
+        self.Spectrum = batch.spectrum(i)
+        self.mTarget = prepareProfileValueDict(x=self.xValues(), xUnit='nm', y=self.Spectrum)
+
+        self.Reference = batch.reference(i)
+        self.ReferenceFlag = self.Reference is not None
+        self.SpectrumDescription = batch.description(i)
+        if self.ReferenceFlag:
+            self.mReference = prepareProfileValueDict(x=self.xValues(), xUnit='nm', y=self.Reference)
 
-            def sub(start, length):
-                return DATA[start:start + length]
+    @classmethod
+    def readFiles(cls, paths: List[Union[str, Path]], **kwds) -> List[Tuple[List[QgsFeature], Optional[str]]]:
+        # decode the headers and spectra of all files at once
+        batch = ASDBinaryFileBatch(paths)
+        results = []
+        for i, path in enumerate(batch.paths()):
+            error = batch.error(i)
+            if error is None:
+                try:
+                    reader = cls(path, batch=batch, index=i, **kwds)
+                    results.append((reader.asFeatures(), None))
+                    continue
+                except Exception as ex:
+                    error = f'Unable to read {path}:\n\t{ex}'
+            results.append(([], error))
+        return results
+
+
+class ASDBinaryFileBatch(object):
+    """
+    Reads the headers and spectra of many ASD binary files at once.
+    The files are memory-mapped, their headers are decoded as a single structured array of ASD_HEADER_DTYPE
+    and spectra with the same data format and number of channels are decoded into stacked arrays.
+    """
 
-            def n_string(start: int) -> Tuple[str, int]:
-                # 2 byte int for length
-                # 2 + length
-                # empty string = 2 byte = 0
-                # h = short, H = unsigned short
-                len_string = struct.unpack('<H', sub(start, 2))[0]
-                result = ''
-                if len_string > 0:
-                    # result = struct.unpack('<c',sub(start + 2, len_string) )[0]
-                    result = sub(start + 2, len_string).decode('ascii')
-                return result, 2 + len_string
-
-            self.co = DATA[0:3].decode('utf-8')
-            self.mMetadata['co'] = self.co
-            self.comments = DATA[3:(3 + 157)].decode('utf-8')
-            self.mMetadata['comments'] = self.comments
-
-            self.when = TM_STRUCT(DATA[160:(160 + 18)])
-
-            self.mTargetTime = datetime.datetime(year=1900 + self.when.tm_year,
-                                                 month=1 + self.when.tm_mon,
-                                                 day=self.when.tm_mday,
-                                                 hour=self.when.tm_hour,
-                                                 second=self.when.tm_sec)
-
-            self.program_version = DATA[178]
-            self.file_version = DATA[179]
-            self.itime = DATA[180]
-            self.dc_corr = DATA[181]
-            self.dc_time = np.datetime64('1970-01-01') + np.timedelta64(struct.unpack('<l', DATA[182:182 + 4])[0], 's')
-            self.data_type = SpectrumDataType(DATA[186])
-            self.ref_time = np.datetime64('1970-01-01') + np.timedelta64(struct.unpack('<l', DATA[182:182 + 4])[0], 's')
-
-            self.mReferenceTime = self.ref_time.astype(datetime.datetime)
-
-            self.ch1_wavel = struct.unpack('<f', sub(191, 4))[0]
-            self.wavel_step = struct.unpack('<f', sub(195, 4))[0]
-            self.data_format = SpectrumDataFormat(DATA[199])
-            self.old_dc_count = DATA[200]
-            self.old_ref_count = DATA[201]
-            self.old_sample_count = DATA[202]
-            self.application = DATA[203]
-
-            self.channels = struct.unpack('<H', sub(204, 2))[0]
-
-            self.app_data = sub(206, 128)
-            self.gps_data = GPS_DATA(sub(334, 56))
-
-            self.mTargetCoordinate = QgsPointXY(self.gps_data.longitude, self.gps_data.latitude)
-
-            self.it = struct.unpack('<L', sub(390, 4))[0]
-            self.fo = struct.unpack('<h', sub(394, 2))[0]
-            self.dcc = struct.unpack('<h', sub(396, 2))[0]
-
-            self.calibration = struct.unpack('<H', sub(398, 2))[0]
-            self.instrument_num = struct.unpack('<H', sub(400, 2))[0]
-
-            self.ymin, self.ymax, self.xmin, self.ymax = struct.unpack('<4f', sub(402, 4 * 4))
-
-            self.ip_numbits = struct.unpack('<H', sub(418, 2))[0]
-            self.xmode = struct.unpack('<b', sub(420, 1))[0]
-            self.flags = struct.unpack('<4b', sub(421, 4))
-
-            self.dc_count, self.ref_count, self.sample_count = struct.unpack('<3H', sub(425, 2 * 3))
-
-            self.instrument = InstrumentType(struct.unpack('<B', sub(431, 1))[0])
-
-            self.bulb = struct.unpack('<L', sub(432, 4))
-            self.swir1_gain, self.swir2_gain, self.swir1_offset, self.swir2_offset = struct.unpack('<4H',
-                                                                                                   sub(436, 2 * 4))
-
-            self.splice1_wavelength, self.splice2_wavelength = struct.unpack('<2f', sub(444, 2 * 4))
-
-            self.SmartDetectorType = SmartDetectorType(sub(452, 27))
-            self.spare = sub(479, 5)
-
-            if self.data_format == SpectrumDataFormat.FLOAT_FORMAT:
-                size = 4 * self.channels
-                fmt = '<{}f'.format(self.channels)
-
-            elif self.data_format == SpectrumDataFormat.DOUBLE_FORMAT:
-                size = 8 * self.channels
-                fmt = '<{}d'.format(self.channels)
-            elif self.data_format == SpectrumDataFormat.INTEGER_FORMAT:
-                size = 4 * self.channels
-                fmt = '<{}i'.format(self.channels)
-            else:
-                raise Exception()
-
-            self.Spectrum = np.array(struct.unpack(fmt, sub(484, size)))
-
-            self.mTarget = prepareProfileValueDict(x=self.xValues(), xUnit='nm',
-                                                   y=self.Spectrum)
-
-            # reference file header = spectrum data size + 1
+    def __init__(self, paths: List[Union[str, Path]]):
+        self.mPaths: List[Path] = [Path(p) for p in paths]
+        n = len(self.mPaths)
+        self.mErrors: Dict[int, str] = dict()
+        self.mDescriptions: List[str] = [''] * n
+        # {file index: (group index, row index)}
+        self.mRows: Dict[int, Tuple[int, int]] = dict()
+        # (x values, spectra, references, has reference) of files with the same spectral setting
+        self.mGroups: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+
+        hdr_size = ASD_HEADER_DTYPE.itemsize
+        raw = np.zeros((n, hdr_size), dtype=np.uint8)
+        buffers: List[Optional[np.ndarray]] = [None] * n
+        for i, path in enumerate(self.mPaths):
+            try:
+                mm = np.memmap(path, dtype=np.uint8, mode='r')
+            except (OSError, ValueError) as ex:
+                self.mErrors[i] = f'Unable to read {path}:\n\t{ex}'
+                continue
+            if len(mm) < hdr_size:
+                self.mErrors[i] = f'Unable to read {path}:\n\tfile is too small for an ASD header'
+                continue
+            raw[i, :] = mm[0:hdr_size]
+            buffers[i] = mm
+
+        self.mHeaders: np.ndarray = raw.view(ASD_HEADER_DTYPE).reshape(n)
+
+        # spectral setting of each file
+        settings = dict()
+        for i in range(n):
+            if buffers[i] is None:
+                continue
+            h = self.mHeaders[i]
+            fmt = int(h['data_format'])
+            if fmt not in ASD_DATA_DTYPES:
+                self.mErrors[i] = f'Unable to read {self.mPaths[i]}:\n\tunknown data format {fmt}'
+                continue
+            key = (fmt, int(h['channels']), float(h['ch1_wavel']), float(h['wavel_step']))
+            settings.setdefault(key, []).append(i)
+
+        for (fmt, channels, ch1_wavel, wavel_step), indices in settings.items():
+            dtype = ASD_DATA_DTYPES[fmt]
+            size = channels * dtype.itemsize
+            o_spectrum = hdr_size
+            # the reference file header follows the spectrum: flag (1), times (2 x 8), description
+            o_flag = hdr_size + size
+            o_description = o_flag + 18
+
+            rows = []
+            block_spectra = np.zeros((len(indices), size), dtype=np.uint8)
+            block_references = np.zeros((len(indices), size), dtype=np.uint8)
+            has_reference = np.zeros(len(indices), dtype=bool)
+            for i in indices:
+                mm = buffers[i]
+                if len(mm) < o_flag:
+                    self.mErrors[i] = f'Unable to read {self.mPaths[i]}:\n\tfile is too small for {channels} channels'
+                    continue
+                r = len(rows)
+                block_spectra[r, :] = mm[o_spectrum:o_flag]
+                if len(mm) >= o_description + 2 and mm[o_flag] != 0:
+                    len_description = int(mm[o_description:o_description + 2].view('<u2')[0])
+                    o_reference = o_description + 2 + len_description
+                    description = mm[o_description + 2:o_reference].tobytes()
+                    self.mDescriptions[i] = description.decode('ascii', errors='replace')
+                    if len(mm) >= o_reference + size:
+                        block_references[r, :] = mm[o_reference:o_reference + size]
+                        has_reference[r] = True
+                rows.append(i)
+
+            if len(rows) == 0:
+                continue
+            n_rows = len(rows)
+            out_type = np.int64 if dtype.kind == 'i' else np.float64
+            spectra = block_spectra[:n_rows].view(dtype).astype(out_type)
+            references = block_references[:n_rows].view(dtype).astype(out_type)
+            x = asd_xvalues(ch1_wavel, wavel_step, channels)
+            g = len(self.mGroups)
+            self.mGroups.append((x, spectra, references, has_reference[:n_rows]))
+            for r, i in enumerate(rows):
+                self.mRows[i] = (g, r)
+
+        # the memory maps are not required anymore
+        del buffers
+
+    def __len__(self) -> int:
+        return len(self.mPaths)
+
+    def paths(self) -> List[Path]:
+        return self.mPaths[:]
+
+    def headers(self) -> np.ndarray:
+        """
+        Returns the file headers as structured array of ASD_HEADER_DTYPE.
+        Headers of files that could not be read are zero.
+        """
+        return self.mHeaders
 
-            #
-            o = 484 + size - 1
-            # o = 484 + size
-            self.ReferenceFlag = struct.unpack('<?', sub(o + 1, 1))[0]
-            if self.ReferenceFlag:
-                #           self.ReferenceTime = np.datetime64('1970-01-01') + np.timedelta64(
-                #                struct.unpack('<l', DATA[(o + 3):(o + 3 + 8)])[0], 's')
-                #           self.SpectrumTime = np.datetime64('1970-01-01') + np.timedelta64(
-                #                struct.unpack('<l', DATA[o + 11:o + 11 + 8])[0], 's')
+    def header(self, i: int) -> np.void:
+        return self.mHeaders[i]
 
-                # np.datetime64('1970-01-01') + np.timedelta64(struct.unpack('<l', DATA[182:182 + 4])[0], 's')
-                # reftime = struct.unpack('<8B', sub(o + 3, 8))
-                # spectime = struct.unpack('<8B', sub(o + 11, 8))
-                self.SpectrumDescription, slen = n_string(o + 19)
+    def error(self, i: int) -> Optional[str]:
+        """
+        Returns the error message for the i-th file, or None if it was read successfully
+        """
+        return self.mErrors.get(i)
 
-                # reference data
-                self.Reference = np.array(struct.unpack(fmt, sub(o + 19 + slen, size)))
+    def groups(self) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Returns the stacked profiles of files with the same spectral setting as
+        (x values, spectra (n, channels), references (n, channels), has reference (n,)) tuples
+        """
+        return self.mGroups[:]
 
-                self.mReference = prepareProfileValueDict(x=self.xValues(), xUnit='nm',
-                                                          y=self.Reference)
+    def xValues(self, i: int) -> Optional[np.ndarray]:
+        if i not in self.mRows:
+            return None
+        g, r = self.mRows[i]
+        return self.mGroups[g][0]
 
-        return self
+    def spectrum(self, i: int) -> Optional[np.ndarray]:
+        if i not in self.mRows:
+            return None
+        g, r = self.mRows[i]
+        return self.mGroups[g][1][r]
+
+    def reference(self, i: int) -> Optional[np.ndarray]:
+        """
+        Returns the (white) reference spectrum of the i-th file, or None if it has no reference
+        """
+        if i not in self.mRows:
+            return None
+        g, r = self.mRows[i]
+        if not self.mGroups[g][3][r]:
+            return None
+        return self.mGroups[g][2][r]
+
+    def description(self, i: int) -> str:
+        return self.mDescriptions[i]
+
+    def targetTime(self, i: int) -> datetime.datetime:
+        tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year = [int(v) for v in self.mHeaders[i]['when'][0:6]]
+        return datetime.datetime(year=1900 + tm_year, month=1 + tm_mon, day=tm_mday, hour=tm_hour, second=tm_sec)
+
+    def referenceTime(self, i: int) -> datetime.datetime:
+        t = np.datetime64('1970-01-01') + np.timedelta64(int(self.mHeaders[i]['dc_time']), 's')
+        return t.astype(datetime.datetime)
+
+    def targetCoordinate(self, i: int) -> QgsPointXY:
+        h = self.mHeaders[i]
+        lat = asd_degree_minutes(h['gps_latitude'])
+        lon = asd_degree_minutes(h['gps_longitude'])
+        return QgsPointXY(-float(lon), float(lat))
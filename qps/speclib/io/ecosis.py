@@ -124,6 +124,7 @@ class EcoSISSpectralLibraryWriter(SpectralProfileFileWriter):
 
 
 class EcoSISSpectralLibraryReader(SpectralProfileFileReader):
+    FILE_SUFFIXES = ('.csv',)
 
     def __init__(self, *args, **kwds):
         super().__init__(*args, **kwds)
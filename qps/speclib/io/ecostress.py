@@ -1,13 +1,22 @@
+import re
 from pathlib import Path
 from typing import Union, List, Tuple
 
+import numpy as np
+
 from qgis.PyQt.QtCore import QMetaType
 from qgis.core import QgsFields, QgsField, QgsFeature
+from .textdata import find_data_section, parse_numeric_block, RX_NUMBER
 from ..core import create_profile_field
 from ..core.spectralprofile import SpectralProfileFileReader, encodeProfileValueDict, ProfileEncoding
 
+# first line of the data section, i.e. the first line that starts with two numbers
+rx_data_line = re.compile(rf'^(?P<data>[ \t]*{RX_NUMBER}[ \t]+{RX_NUMBER}(?:[ \t]|$))', re.M)
+
 
 class ECOSTRESSSpectralProfileReader(SpectralProfileFileReader):
+    FILE_NAME_PATTERN = re.compile(r'spectrum\.txt$')
+    HEADER_PATTERN = re.compile(rb'^Name:', re.M)
     _fields = QgsFields()
     for f in [
         create_profile_field(SpectralProfileFileReader.KEY_Target, encoding=ProfileEncoding.Dict),
@@ -38,74 +47,50 @@ class ECOSTRESSSpectralProfileReader(SpectralProfileFileReader):
 
         return False
 
-    def readDataLines(self, path: Path) -> Tuple[dict, dict]:
-
+    def readDataLines(self, path: Path) -> Tuple[dict, np.ndarray]:
+        """
+        Reads the metadata and the (x, y) data values of an ECOSTRESS text file
+        :param path: file path
+        :return: metadata, data values as (n, 2) array, sorted by x
+        """
         with open(path, 'r') as f:
-            lines = f.readlines()
+            text = f.read()
 
-        metadata = {}
-        data = {}
+        header, data = find_data_section(text, rx_data_line)
 
-        # State tracking
-        in_data_section = False
+        metadata = {}
         current_key = None
         current_value = []
 
-        for line in lines:
-            line = line.rstrip('\n')
-
-            # Check if this is a data line (starts with a number or whitespace followed by number)
-            stripped = line.strip()
-            if stripped and not in_data_section:
-                # Try to parse as data line
-                parts = stripped.split()
-                if len(parts) >= 2:
-                    try:
-                        x_val = float(parts[0])
-                        y_val = float(parts[1])
-                        # This looks like data, so we've entered the data section
-                        in_data_section = True
-                        data[x_val] = y_val
-                        continue
-                    except ValueError:
-                        pass  # Not a data line, continue as metadata
-
-            if in_data_section:
-                # We're in the data section
-                if stripped:
-                    parts = stripped.split()
-                    if len(parts) >= 2:
-                        try:
-                            x_val = float(parts[0])
-                            y_val = float(parts[1])
-                            data[x_val] = y_val
-                        except ValueError:
-                            # Not a valid data line, skip
-                            pass
-            else:
-                # We're in the metadata section
-                if ':' in line:
-                    # Save previous key-value if exists
-                    if current_key is not None:
-                        metadata[current_key] = '\n'.join(current_value).strip()
-
-                    # Start new key-value pair
-                    key, value = line.split(':', 1)
-                    current_key = key.strip()
-                    current_value = [value.strip()]
-                elif current_key is not None and line.strip():
-                    # Continuation of previous value (multiline)
-                    current_value.append(line.strip())
-                elif not line.strip() and current_key is not None:
-                    # Empty line - save current key-value and reset
+        for line in header.splitlines():
+            if ':' in line:
+                # Save previous key-value if exists
+                if current_key is not None:
                     metadata[current_key] = '\n'.join(current_value).strip()
-                    current_key = None
-                    current_value = []
+
+                # Start new key-value pair
+                key, value = line.split(':', 1)
+                current_key = key.strip()
+                current_value = [value.strip()]
+            elif current_key is not None and line.strip():
+                # Continuation of previous value (multiline)
+                current_value.append(line.strip())
+            elif not line.strip() and current_key is not None:
+                # Empty line - save current key-value and reset
+                metadata[current_key] = '\n'.join(current_value).strip()
+                current_key = None
+                current_value = []
 
         # Save last metadata entry if exists
         if current_key is not None:
             metadata[current_key] = '\n'.join(current_value).strip()
 
+        # lines without (x, y) values are skipped
+        data = parse_numeric_block(data, n_cols=2, skip_invalid=True)
+        # sort by x and keep the last y value of duplicated x values
+        _, idx = np.unique(data[::-1, 0], return_index=True)
+        data = data[::-1][idx]
+
         return metadata, data
 
     def asFeatures(self) -> List[QgsFeature]:
@@ -118,9 +103,8 @@ class ECOSTRESSSpectralProfileReader(SpectralProfileFileReader):
             MD2, _ = self.readDataLines(path_ancilliary)
             MD.update(MD2)
 
-        sorted_keys = sorted(DATA.keys())
-        x = [float(k) for k in sorted_keys]
-        y = [float(DATA[k]) for k in sorted_keys]
+        x = DATA[:, 0].tolist()
+        y = DATA[:, 1].tolist()
 
         xUnit = MD.get('X Units', None)
         if xUnit == 'Wavelength (micrometers)':
@@ -36,19 +36,19 @@ from pathlib import Path
 from typing import List, Tuple, Union, Optional
 
 import numpy as np
-from osgeo import gdal, gdal_array
+from osgeo import gdal
 
 from qgis.PyQt.QtCore import NULL, QMetaType
 from qgis.core import QgsExpression, QgsExpressionContext, QgsExpressionContextScope, QgsFeature, QgsFeatureIterator, \
     QgsFeatureRequest, QgsField, QgsFields, QgsProcessingFeedback, QgsVectorLayer
 from .. import EMPTY_VALUES, FIELD_FID, FIELD_NAME, FIELD_VALUES
 from ..core import create_profile_field, profile_field_names
-from ..core.spectrallibrary import LUT_IDL2GDAL, VSI_DIR
+from ..core.spectrallibrary import LUT_IDL2GDAL
 from ..core.spectralprofile import decodeProfileValueDict, encodeProfileValueDict, \
     prepareProfileValueDict, SpectralProfileFileReader, SpectralProfileFileWriter, \
     groupBySpectralProperties
-from ...gdal_utils import GDALConfigChanges
 from ...qgsrasterlayerproperties import stringToType
+from ...utils import chunks
 
 # lookup GDAL Data Type and its size in bytes
 LUT_GDT_SIZE = {gdal.GDT_Byte: 1,
@@ -75,6 +75,21 @@ LUT_GDT_NAME = {gdal.GDT_Byte: 'Byte',
                 gdal.GDT_CFloat32: 'Float32',
                 gdal.GDT_CFloat64: 'Float64'}
 
+# lookup ENVI (IDL) data type and numpy data type
+LUT_IDL2NUMPY = {1: np.dtype(np.uint8),
+                 2: np.dtype(np.int16),
+                 3: np.dtype(np.int32),
+                 4: np.dtype(np.float32),
+                 5: np.dtype(np.float64),
+                 6: np.dtype(np.complex64),
+                 9: np.dtype(np.complex128),
+                 12: np.dtype(np.uint16),
+                 13: np.dtype(np.uint32),
+                 14: np.dtype(np.int64),
+                 15: np.dtype(np.uint64)}
+
+LUT_NUMPY2IDL = {v: k for k, v in LUT_IDL2NUMPY.items()}
+
 FILTER_SLI = 'ENVI Spectral Library (*.sli)'
 CSV_PROFILE_NAME_COLUMN_NAMES = ['spectra names', 'name']
 CSV_GEOMETRY_COLUMN = 'wkt'
@@ -243,12 +258,82 @@ def writeCSVMetadata(pathCSV: str, profiles: List[QgsFeature], profile_names: Li
             writer.writerow(d)
 
 
+def enviDataArray(array: np.ndarray) -> np.ndarray:
+    """
+    Converts an array into little-endian data type that can be written into an ENVI Spectral Library
+    :param array: numpy.ndarray
+    :return: numpy.ndarray
+    """
+    if array.dtype == object:
+        array = array.astype(float)
+    elif array.dtype == np.int64:
+        array = array.astype(np.int32)
+    elif array.dtype == np.int8:
+        array = array.astype(np.int16)
+    elif array.dtype == bool:
+        array = array.astype(np.uint8)
+    elif array.dtype == np.float16:
+        array = array.astype(np.float32)
+
+    dtype = array.dtype.newbyteorder('<')
+    if dtype.newbyteorder('=') not in LUT_NUMPY2IDL:
+        raise AssertionError(f'Unsupported data type: {array.dtype}')
+    return array.astype(dtype, copy=False)
+
+
+def convertENVIData(file, shape: Tuple[int, int], srcType: np.dtype, dstType: np.dtype, chunkSize: int = 1024):
+    """
+    Converts the values of a binary (profiles, bands) array in place into a data type with the same
+    or a larger item size. The file is extended and converted chunk-wise through a memory map, starting with
+    the last rows, so that not-yet converted values are never overwritten.
+    :param file: binary file object, opened for writing
+    :param shape: (profiles, bands) of the array
+    :param srcType: current data type
+    :param dstType: new data type
+    :param chunkSize: number of profiles converted at once
+    """
+    srcType, dstType = np.dtype(srcType), np.dtype(dstType)
+    if dstType.itemsize < srcType.itemsize:
+        raise AssertionError(f'Can not convert {srcType} into {dstType} in place')
+    nRows, nBands = shape
+    file.truncate(nRows * nBands * dstType.itemsize)
+    if nRows * nBands == 0:
+        return
+
+    mm = np.memmap(file, dtype=np.uint8, mode='r+', shape=(nRows * nBands * dstType.itemsize,))
+    src = mm[0:nRows * nBands * srcType.itemsize].view(srcType).reshape(shape)
+    dst = mm.view(dstType).reshape(shape)
+    for i1 in range(nRows, 0, -chunkSize):
+        i0 = max(0, i1 - chunkSize)
+        block = np.array(src[i0:i1])
+        dst[i0:i1] = block.astype(dstType)
+    mm.flush()
+    del src, dst, mm
+
+
+def writeENVIHeader(pathHdr: Union[str, Path], hdr: dict):
+    """
+    Writes an ENVI Header File (*.hdr)
+    :param pathHdr: path of ENVI Header
+    :param hdr: dict with header values. Lists are written as {value1, value2, ...}
+    """
+    lines = ['ENVI']
+    for key, value in hdr.items():
+        lines.append(f'{key} = {value2hdrString(value)}')
+
+    with open(pathHdr, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
 REQUIRED_TAGS = ['byte order', 'data type', 'header offset', 'lines', 'samples', 'bands']
 SINGLE_VALUE_TAGS = REQUIRED_TAGS + ['description', 'wavelength', 'wavelength units']
 
 
 class EnviSpectralLibraryWriter(SpectralProfileFileWriter):
 
+    # number of profiles decoded and written at once
+    CHUNK_SIZE: int = 1024
+
     def __init__(self, *args,
                  name_expression: Optional[str] = None,
                  **kwds):
@@ -292,10 +377,6 @@ class EnviSpectralLibraryWriter(SpectralProfileFileWriter):
 
         os.makedirs(dn, exist_ok=True)
 
-        drv: gdal.Driver = gdal.GetDriverByName('ENVI')
-        if not (isinstance(drv, gdal.Driver)):
-            raise AssertionError('Unable to load ENVI gdal driver')
-
         iGrp = -1
         field = self.mField
         if field is None:
@@ -320,78 +401,74 @@ class EnviSpectralLibraryWriter(SpectralProfileFileWriter):
             scope = QgsExpressionContextScope()
             context.appendScope(scope)
 
-            pData = []
-            for p in profiles:
-                context.setFeature(p)
-                name = expr.evaluate(context)
-                if name is None:
-                    profileNames.append('')
-                else:
-                    profileNames.append(str(name))
-
-                d = decodeProfileValueDict(p.attribute(field))
-                pData.append(np.asarray(d['y']))
-
-            # stack profiles
-            pData = np.vstack(pData)
-
-            # convert array to a data type GDAL is able to write
-            if pData.dtype == np.int64:
-                pData = pData.astype(np.int32)
-            elif pData.dtype == object:
-                pData = pData.astype(float)
-
             if iGrp == 0:
                 pathDst = dn / f'{bn}{ext}'
             else:
                 pathDst = dn / f'{bn}.{iGrp}{ext}'
 
-            eType = gdal_array.NumericTypeCodeToGDALTypeCode(pData.dtype)
-
-            """
-            Create(utf8_path, int xsize, int ysize, int bands=1, GDALDataType eType, char ** options=None) -> Dataset
-            """
-
-            ds: gdal.Dataset = drv.Create(pathDst.as_posix(), pData.shape[1], pData.shape[0], 1, eType)
-            band: gdal.Band = ds.GetRasterBand(1)
-            band.WriteArray(pData)
-
-            # write ENVI header metadata
-            # ds.SetDescription(speclib.name())
-            ds.SetMetadataItem('band names', 'Spectral Library', 'ENVI')
-            ds.SetMetadataItem('spectra names', value2hdrString(profileNames), 'ENVI')
-
-            hdrString = value2hdrString(xValues)
-            if hdrString not in ['', None]:
-                ds.SetMetadataItem('wavelength', hdrString, 'ENVI')
+            # append the profiles chunk-wise to the binary file
+            dtype = None
+            nBands = 0
+            with open(pathDst, 'w+b') as fBin:
+                for chunk in chunks(profiles, size=self.CHUNK_SIZE):
+                    pData = []
+                    for p in chunk:
+                        context.setFeature(p)
+                        name = expr.evaluate(context)
+                        if name is None:
+                            profileNames.append('')
+                        else:
+                            profileNames.append(str(name))
+
+                        d = decodeProfileValueDict(p.attribute(field))
+                        pData.append(np.asarray(d['y']))
+
+                    # stack profiles
+                    pData = enviDataArray(np.vstack(pData))
+                    nBands = pData.shape[1]
+
+                    if dtype is None:
+                        dtype = pData.dtype
+                    elif pData.dtype != dtype:
+                        dtype2 = enviDataArray(np.empty(0, dtype=np.result_type(dtype, pData.dtype))).dtype
+                        if dtype2 != dtype:
+                            # convert the profiles written so far into the wider data type
+                            fBin.flush()
+                            convertENVIData(fBin, (len(profileNames) - len(pData), nBands), dtype, dtype2,
+                                            chunkSize=self.CHUNK_SIZE)
+                            fBin.seek(0, os.SEEK_END)
+                            dtype = dtype2
+                        pData = pData.astype(dtype)
+                    fBin.write(pData.tobytes())
+
+            # write ENVI header
+            hdr = {'description': f'{{{pathDst.name}}}',
+                   'samples': nBands,
+                   'lines': len(profileNames),
+                   'bands': 1,
+                   'header offset': 0,
+                   'file type': 'ENVI Spectral Library',
+                   'data type': LUT_NUMPY2IDL[dtype.newbyteorder('=')],
+                   'interleave': 'bsq',
+                   'byte order': 0,
+                   'band names': ['Spectral Library'],
+                   'spectra names': profileNames,
+                   }
+
+            if xValues not in ['', None]:
+                hdr['wavelength'] = xValues
 
             if wlu not in ['', '-', None]:
-                ds.SetMetadataItem('wavelength units', wlu, 'ENVI')
+                hdr['wavelength units'] = wlu
 
             if bbl not in ['', '-', None]:
-                ds.SetMetadataItem('bbl', value2hdrString(bbl), 'ENVI')
+                hdr['bbl'] = bbl
 
             if fwhm not in ['', '-', None]:
-                ds.SetMetadataItem('fwhm', value2hdrString(fwhm), 'ENVI')
-
-            flushCacheWithoutException(ds)
-
-            pathHDR = [p for p in ds.GetFileList() if p.endswith('.hdr')][0]
-            ds = None
+                hdr['fwhm'] = fwhm
 
-            # re-write ENVI Hdr with a file type = ENVI Spectral Library
-            file = open(pathHDR)
-            hdr = file.readlines()
-            file.close()
-            for iLine in range(len(hdr)):
-                if re.search(r'file type =', hdr[iLine]):
-                    hdr[iLine] = 'file type = ENVI Spectral Library\n'
-                    break
-
-            file = open(pathHDR, 'w', encoding='utf-8')
-            file.writelines(hdr)
-            file.flush()
-            file.close()
+            pathHDR = dn / f'{os.path.splitext(pathDst.name)[0]}.hdr'
+            writeENVIHeader(pathHDR, hdr)
 
             # write JSON properties
             # speclib.writeJSONProperties(pathDst)
@@ -406,10 +483,26 @@ class EnviSpectralLibraryWriter(SpectralProfileFileWriter):
 
 
 class EnviSpectralLibraryReader(SpectralProfileFileReader):
+    HEADER_PATTERN = re.compile(rb'^\s*file type\s*=\s*ENVI Spectral Library', re.M | re.I)
+
+    # number of profiles copied at once from the memory-mapped binary file
+    CHUNK_SIZE: int = 1024
 
     def __init__(self, *args, **kwds):
         super().__init__(*args, **kwds)
 
+    @classmethod
+    def sniffFile(cls, path: Union[str, Path], header: bytes) -> Optional[bool]:
+        # the file type is defined in the header file, which is not the binary file in most cases
+        if header.startswith(b'ENVI'):
+            return cls.HEADER_PATTERN.search(header) is not None
+        path = Path(path)
+        bn = os.path.splitext(path.name)[0]
+        if not ((path.parent / f'{bn}.hdr').is_file() or (path.parent / f'{path.name}.hdr').is_file()):
+            return False
+        # check the header file with canReadFile
+        return None
+
     @classmethod
     def id(cls) -> str:
         return 'ENVI'
@@ -478,21 +571,10 @@ class EnviSpectralLibraryReader(SpectralProfileFileReader):
         pathHdr, pathESL = findENVIHeader(path)
         fields, md = self.sourceFieldsMetadata(pathHdr)
 
-        config_changes = {'GDAL_VRT_ENABLE_RAWRASTERBAND': 'YES',
-                          'GDAL_VRT_RAWRASTERBAND_ALLOWED_SOURCE': 'ALL'}
-
-        with GDALConfigChanges(config_changes) as _:
-            tmpVrt = os.path.join(VSI_DIR, 'ENVIIO', f'tmpESLVrt_{uuid.uuid4()}.esl.vrt')
-            try:
-                ds = esl2vrt(pathESL, tmpVrt)
-            except AssertionError:
-                # feedback.reportError(str(ex))
-                return []
-
-            profileArray = ds.ReadAsArray()
-
-        # remove the temporary VRT, as it was created internally only
-        ds.GetDriver().Delete(ds.GetDescription())
+        try:
+            profileArray = readENVIProfiles(pathESL, md)
+        except AssertionError:
+            return []
 
         nSpectra, nbands = profileArray.shape
         yUnit = None
@@ -522,28 +604,34 @@ class EnviSpectralLibraryReader(SpectralProfileFileReader):
             featureIterator = lyrCSV.getFeatures(request)
             copyFields = [n for n in lyrCSV.fields().names() if n in fields.names()]
 
-        for i in range(nSpectra):
-            f = QgsFeature(fields)
-
-            d = prepareProfileValueDict(y=profileArray[i, :],
-                                        x=xValues,
-                                        xUnit=xUnit,
-                                        yUnit=yUnit,
-                                        bbl=bbl)
-            dump = encodeProfileValueDict(d, f.attribute(FIELD_VALUES))
-            f.setAttribute(FIELD_VALUES, dump)
-            if FIELD_NAME in fields.names():
-                f.setAttribute(FIELD_NAME, spectraNames[i])
-
-            if isinstance(featureIterator, QgsFeatureIterator):
-                csvFeature = featureIterator.__next__()
-                if csvFeature.hasGeometry():
-                    f.setGeometry(csvFeature.geometry())
-                for n in copyFields:
-                    f.setAttribute(n, csvFeature.attribute(n))
-
-            profiles.append(f)
-
+        for i0 in range(0, nSpectra, self.CHUNK_SIZE):
+            # copy a chunk of memory-mapped profiles in native byte order
+            block = np.array(profileArray[i0:i0 + self.CHUNK_SIZE], dtype=profileArray.dtype.newbyteorder('='))
+
+            for i, yValues in enumerate(block, start=i0):
+                f = QgsFeature(fields)
+
+                d = prepareProfileValueDict(y=yValues,
+                                            x=xValues,
+                                            xUnit=xUnit,
+                                            yUnit=yUnit,
+                                            bbl=bbl)
+                dump = encodeProfileValueDict(d, f.attribute(FIELD_VALUES))
+                f.setAttribute(FIELD_VALUES, dump)
+                if FIELD_NAME in fields.names():
+                    f.setAttribute(FIELD_NAME, spectraNames[i])
+
+                if isinstance(featureIterator, QgsFeatureIterator):
+                    csvFeature = featureIterator.__next__()
+                    if csvFeature.hasGeometry():
+                        f.setGeometry(csvFeature.geometry())
+                    for n in copyFields:
+                        f.setAttribute(n, csvFeature.attribute(n))
+
+                profiles.append(f)
+
+        # release the memory map
+        del profileArray
         return profiles
 
 
@@ -599,6 +687,42 @@ def esl2vrt(pathESL, pathVrt=None) -> gdal.Dataset:
     return ds
 
 
+def readENVIProfiles(pathESL: Union[str, Path], hdr: Optional[dict] = None) -> np.memmap:
+    """
+    Returns the profiles of an ENVI Spectral Library as memory-mapped (profiles, bands) array.
+    The profile values are read from disk on access only.
+    :param pathESL: path ENVI Spectral Library file (binary part)
+    :param hdr: (optional) ENVI header values, as returned by readENVIHeader
+    :return: numpy.memmap
+    """
+    if hdr is None:
+        hdr = readENVIHeader(pathESL, typeConversion=True)
+    if not (hdr is not None and RX_SUPPORTED_ENVI_FILETYPES.match(str(hdr.get('file type', '')))):
+        raise AssertionError(f'Not an ENVI Spectral Library: {pathESL}')
+
+    if str(hdr.get('file compression')) == '1':
+        raise Exception('Can not read compressed spectral libraries')
+
+    if int(hdr['bands']) != 1:
+        raise AssertionError(f'ENVI Spectral Library with more than one band: {pathESL}')
+
+    dataType = int(hdr['data type'])
+    if dataType not in LUT_IDL2NUMPY:
+        raise AssertionError(f'Unsupported ENVI data type: {dataType}')
+    byteOrder = '<' if int(hdr['byte order']) == 0 else '>'
+    dtype = LUT_IDL2NUMPY[dataType].newbyteorder(byteOrder)
+
+    shape = (int(hdr['lines']), int(hdr['samples']))
+    offset = int(hdr['header offset'])
+    _, pathBin = findENVIHeader(pathESL)
+    if pathBin is None:
+        raise AssertionError(f'Unable to find binary file of {pathESL}')
+    expected = offset + shape[0] * shape[1] * dtype.itemsize
+    if os.path.getsize(pathBin) < expected:
+        raise AssertionError(f'Binary file is smaller than described by the ENVI header ({expected} bytes): {pathBin}')
+    return np.memmap(pathBin, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
 def readENVIHeader(pathESL: Union[str, Path], typeConversion: bool = False) -> Optional[dict]:
     """
     Reads an ENVI Header File (*.hdr) and returns its values in a dictionary
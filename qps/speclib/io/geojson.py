@@ -190,6 +190,7 @@ class GeoJSONSpectralLibraryWriter(SpectralProfileFileWriter):
 
 
 class GeoJSONSpectralLibraryReader(SpectralProfileFileReader):
+    FILE_SUFFIXES = ('.geojson',)
 
     def __init__(self, *args, **kwds):
         super().__init__(*args, **kwds)
@@ -96,6 +96,8 @@ class GeoPackageSpectralLibraryWriter(SpectralProfileFileWriter):
 
 
 class GeoPackageSpectralLibraryReader(SpectralProfileFileReader):
+    FILE_SUFFIXES = ('.gpkg',)
+    MAGIC_BYTES = (b'SQLite format 3\x00',)
 
     def __init__(self, *args, **kwds):
         super().__init__(*args, **kwds)
@@ -32,6 +32,7 @@ from typing import Union
 
 from qgis.PyQt.QtCore import QMetaType
 from qgis.core import QgsPointXY
+from .textdata import find_data_section, parse_metadata, parse_numeric_block
 from ..core.spectralprofile import prepareProfileValueDict, SpectralProfileFileReader
 
 
@@ -111,8 +112,8 @@ KEY2FIELD = {
     'Channels': SEDAttributes.Channels,
 }
 
-rx_metadata = re.compile('^(?P<key>[^:]+):(?P<value>.*)$')
-rx_table_header = re.compile(r'^Wvl[^:]+')
+rx_metadata = re.compile(r'^(?P<key>[^:\n]+):(?P<value>.*)$', re.M)
+rx_table_header = re.compile(r'^Wvl[^:\n]*\n', re.M)
 rx_sed_file = re.compile(r'\.sed$', re.I)
 
 
@@ -120,6 +121,7 @@ class SEDFile(SpectralProfileFileReader):
     """
     Wrapper class to access a single SED File.
     """
+    FILE_NAME_PATTERN = rx_sed_file
 
     def __init__(self, *args, **kwds):
         super(SEDFile, self).__init__(*args, *kwds)
@@ -149,37 +151,19 @@ class SEDFile(SpectralProfileFileReader):
         """
 
         with open(path, 'r') as f:
-            LINES = list(f.readlines())
-
-            iFirstDataLine = None
-
-            for i, line in enumerate(LINES):
-                match_meta = rx_metadata.match(line)
-                if match_meta:
-                    key = match_meta.group('key')
-                    value = match_meta.group('value').strip()
-                    if value in ['', None]:
-                        continue
-
-                    self.mMetadata[key] = value
-
-                elif rx_table_header.match(line):
-                    iFirstDataLine = i + 1
-                    break
-
-            if iFirstDataLine:
-                wvl = []
-                rad_r = []
-                rad_t = []
-                refl = []
-                for line in LINES[iFirstDataLine:]:
-                    splitted = [float(v) for v in re.split(r'\s+', line.strip())]
-                    if len(splitted) != 4:
-                        break
-                    wvl.append(splitted[0])
-                    rad_r.append(splitted[1])
-                    rad_t.append(splitted[2])
-                    refl.append(splitted[3])
+            text = f.read()
+
+            header, data = find_data_section(text, rx_table_header)
+            if data == '':
+                raise ValueError(f'Could not find data block in {path}')
+            self.mMetadata.update(parse_metadata(header, rx_metadata, skip_empty=True))
+
+            # columns: wavelength, radiance reference, radiance target, reflectance
+            data = parse_numeric_block(data, n_cols=4)
+            wvl = data[:, 0]
+            rad_r = data[:, 1]
+            rad_t = data[:, 2]
+            refl = data[:, 3]
 
             if 'Date' in self.mMetadata and 'Time' in self.mMetadata:
                 d1, d2 = self.mMetadata['Date'].split(',')
@@ -8,6 +8,7 @@ import numpy as np
 
 from qgis.PyQt.QtCore import QDateTime, Qt, QMetaType
 from qgis.core import QgsEditorWidgetSetup, QgsField, QgsFields, QgsPointXY
+from .textdata import find_data_section, parse_metadata, parse_numeric_block
 from ..core.spectralprofile import prepareProfileValueDict, SpectralProfileFileReader
 
 # GPS Longitude  DDDmm.mmmmC
@@ -69,6 +70,9 @@ def match_to_coordinate(matchLon: Match, matchLat: Match) -> QgsPointXY:
 
 
 class SVCSigFile(SpectralProfileFileReader):
+    FILE_NAME_PATTERN = rxSIGFile
+    # '/*** Spectra Vista SIG Data ***/' or 'key= value' lines
+    HEADER_PATTERN = re.compile(rb'Spectra Vista|^\s*\w+=', re.M)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -215,28 +219,18 @@ class SVCSigFile(SpectralProfileFileReader):
         # Remove comment blocks
 
         lines = rx_comment_block.sub('', lines)
-        decimal_separator = rx_decimal_sep.search(lines).group(1)
 
         # Extract decimal separator
+        decimal_separator = rx_decimal_sep.search(lines).group(1)
 
-        # Extract metadata tags
-        for match in rx_metadata.finditer(lines):
-            tag = match.group('tag').strip()
-            val = match.group('val').strip()
-            self.mMetadata[tag] = val
-
-        # Extract data block
-        match = rx_data_block.search(lines.strip())
-        if not match:
+        # Extract metadata tags and data block
+        header, data = find_data_section(lines.strip(), rx_data_block)
+        if data == '':
             raise ValueError(f"Could not find data block in {path}")
+        self.mMetadata.update(parse_metadata(header, rx_metadata))
 
-        data = match.group('data').strip()
-        data = data.replace(decimal_separator, '.')
-        dataLines = data.split('\n')
-        nRows = len(dataLines)
-        data = data.split()
-        nCols = int(len(data) / nRows)
-        data = np.asarray([float(d) for d in data]).reshape((nRows, nCols))
+        data = parse_numeric_block(data, decimal_separator=decimal_separator)
+        nCols = data.shape[1]
 
         # Process wavelength data
         wl = data[:, 0]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# noinspection PyPep8Naming
+"""
+***************************************************************************
+    speclib/io/textdata.py
+
+    Parsing of text files with a metadata header and a block of numeric columns
+    ---------------------
+    Beginning            : 2026-10-18
+    Copyright            : (C) 2026 by Benjamin Jakimow
+    Email                : benjamin.jakimow@geo.hu-berlin.de
+***************************************************************************
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this software. If not, see <https://www.gnu.org/licenses/>.
+***************************************************************************
+"""
+import io
+from typing import Dict, Optional, Pattern, Tuple
+
+import numpy as np
+
+# a decimal number like 1, -1.5, .5 or 1.2E-003
+RX_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+
+
+def find_data_section(text: str, rx_data: Pattern) -> Tuple[str, str]:
+    """
+    Splits a text into the metadata header and the data section.
+    The data section starts at the group 'data' of rx_data, if defined, or after the match of rx_data.
+    :param text: text
+    :param rx_data: regular expression that locates the begin of the data section
+    :return: header, data. data is an empty string if rx_data does not match
+    """
+    match = rx_data.search(text)
+    if match is None:
+        return text, ''
+    if 'data' in rx_data.groupindex:
+        i = match.start('data')
+    else:
+        i = match.end()
+    return text[:i], text[i:]
+
+
+def parse_metadata(header: str, rx_metadata: Pattern, skip_empty: bool = False) -> Dict[str, str]:
+    """
+    Returns the key-value pairs in a metadata header
+    :param header: header text
+    :param rx_metadata: regular expression whose first two groups match a key and its value
+    :param skip_empty: set True to ignore keys without value
+    :return: dict
+    """
+    metadata = dict()
+    for match in rx_metadata.finditer(header):
+        key = match.group(1).strip()
+        value = match.group(2).strip()
+        if skip_empty and value == '':
+            continue
+        metadata[key] = value
+    return metadata
+
+
+def parse_numeric_block(data: str,
+                        n_cols: Optional[int] = None,
+                        delimiter: Optional[str] = None,
+                        decimal_separator: str = '.',
+                        skip_invalid: bool = False) -> np.ndarray:
+    """
+    Parses a block of text lines with numeric columns into a (lines, columns) float array.
+    Well-formed blocks are parsed at once with np.loadtxt. Other blocks are parsed line by line and
+    end at the first invalid line, i.e. a line with non-numeric or less than n_cols values.
+    :param data: text with one row per line
+    :param n_cols: number of columns. Defaults to the number of values in the first line.
+                   Further values in a line are ignored.
+    :param delimiter: value delimiter, defaults to whitespace
+    :param decimal_separator: decimal separator, e.g. ',' for localized numbers
+    :param skip_invalid: set True to skip invalid lines instead of ending the block
+    :return: numpy.ndarray
+    """
+    if decimal_separator != '.':
+        data = data.replace(decimal_separator, '.')
+    data = data.strip()
+    if data == '':
+        return np.empty((0, n_cols if n_cols else 0), dtype=float)
+
+    if n_cols is None:
+        n_cols = len(data.split('\n', 1)[0].split(delimiter))
+
+    try:
+        array = np.loadtxt(io.StringIO(data), dtype=float, delimiter=delimiter, comments=None, ndmin=2)
+        if array.shape[1] >= n_cols:
+            return array[:, 0:n_cols]
+    except ValueError:
+        pass
+
+    rows = []
+    for line in data.split('\n'):
+        if line.strip() == '':
+            continue
+        parts = line.split(delimiter)
+        try:
+            if len(parts) < n_cols:
+                raise ValueError()
+            rows.append([float(v) for v in parts[0:n_cols]])
+        except ValueError:
+            if skip_invalid:
+                continue
+            break
+    return np.asarray(rows, dtype=float).reshape((len(rows), n_cols))
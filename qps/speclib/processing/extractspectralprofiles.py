@@ -19,9 +19,6 @@ from qgis.core import (
     QgsFeatureSink,
     QgsFeature,
     QgsField, QgsFields,
-    QgsCoordinateTransform,
-    QgsProject,
-    QgsGeometry,
     QgsVectorFileWriter
 )
 from qgis.core import QgsProcessing, QgsVectorLayer, QgsFeatureRequest, QgsMapLayer
@@ -32,6 +29,7 @@ from ..core.spectralprofile import (
 )
 from ...fieldvalueconverter import GenericFieldValueConverter
 from ...qgsrasterlayerproperties import QgsRasterLayerSpectralProperties
+from ...utils import chunks, CoordinateTransformCache, transformCoordinateArrays
 
 
 class ExtractSpectralProfiles(QgsProcessingAlgorithm):
@@ -50,6 +48,9 @@ class ExtractSpectralProfiles(QgsProcessingAlgorithm):
     F_PX_X = 'px_x'
     F_PX_Y = 'px_y'
 
+    # number of features whose coordinates are transformed at once
+    CHUNK_SIZE = 1024
+
     def __init__(self):
         super().__init__()
 
@@ -173,7 +174,7 @@ class ExtractSpectralProfiles(QgsProcessingAlgorithm):
 
         transform = None
         if raster_crs != vector_crs:
-            transform = QgsCoordinateTransform(vector_crs, raster_crs, QgsProject.instance())
+            transform = CoordinateTransformCache.transform(vector_crs, raster_crs, context.transformContext())
             feedback.pushInfo(f'Transforming coordinates from {vector_crs.authid()} to {raster_crs.authid()}')
             request_extent = transform.transformBoundingBox(raster_layer.extent(), Qgis.TransformDirection.Reverse)
         else:
@@ -240,83 +241,91 @@ class ExtractSpectralProfiles(QgsProcessingAlgorithm):
         request = QgsFeatureRequest()
         request.setFilterRect(request_extent)
 
-        for feature in vector_layer.getFeatures(request):
+        for featureChunk in chunks(vector_layer.getFeatures(request), size=self.CHUNK_SIZE):
 
             if feedback.isCanceled():
                 break
 
-            if not feature.hasGeometry():
-                features_skipped += 1
+            features = []
+            for feature in featureChunk:
+                if not feature.hasGeometry():
+                    features_skipped += 1
+                    continue
+                features.append(feature)
+
+            if len(features) == 0:
                 continue
 
-            geom = feature.geometry()
+            # Get point coordinate (use centroid for non-point geometries)
+            points = [f.geometry().asPoint() if f.geometry().type() == 0 else f.geometry().centroid().asPoint()
+                      for f in features]
+            geo_x = np.asarray([p.x() for p in points])
+            geo_y = np.asarray([p.y() for p in points])
 
-            # Transform geometry to raster CRS if needed
+            # Transform all coordinates of the chunk to raster CRS in a single call, if needed
             if transform:
-                geom_transformed = QgsGeometry(geom)
-                geom_transformed.transform(transform)
-            else:
-                geom_transformed = geom
-
-            # Get point coordinate (use centroid for non-point geometries)
-            if geom_transformed.type() == 0:  # Point
-                point = geom_transformed.asPoint()
-            else:
-                point = geom_transformed.centroid().asPoint()
+                geo_x, geo_y = transformCoordinateArrays(geo_x, geo_y, transform)
 
             # Convert geographic coordinates to pixel coordinates
-            px = int((point.x() - geotransform[0]) / geotransform[1])
-            py = int((point.y() - geotransform[3]) / geotransform[5])
+            with np.errstate(invalid='ignore'):
+                is_valid = np.isfinite(geo_x) & np.isfinite(geo_y)
+                px_x = np.where(is_valid, (geo_x - geotransform[0]) / geotransform[1], -1).astype(int)
+                px_y = np.where(is_valid, (geo_y - geotransform[3]) / geotransform[5], -1).astype(int)
 
-            # Check if pixel is within raster bounds
-            if px < 0 or py < 0 or px >= ds.RasterXSize or py >= ds.RasterYSize:
-                features_skipped += 1
-                feedback.pushWarning(f'Feature {feature.id()} outside raster bounds - skipped')
-                continue
-
-            # Extract pixel values from all bands
-            yValues = []
-            data = ds.ReadAsArray(px, py, 1, 1)
-            yValues = np.mean(data, axis=(1, 2)).tolist()
-            # exclude no-data values
-            yValues = [v if v != nd else None for nd, v in zip(no_data, yValues)]
-            # Create profile dictionary
-            profile_dict = prepareProfileValueDict(
-                y=yValues,
-                x=xValues,
-                xUnit=xUnit,
-                bbl=bbl
-            )
+            for feature, px, py in zip(features, px_x.tolist(), px_y.tolist()):
 
-            # Create output feature
-            out_feature = QgsFeature(output_fields)
-            out_feature.setId(feature.id())
-            out_feature.setGeometry(feature.geometry())  # Use original geometry
+                if feedback.isCanceled():
+                    break
 
-            # Add profile data
-            pField = output_fields.field(self.F_PROFILE)
-            encoded_profile = encodeProfileValueDict(profile_dict, pField)
-            out_feature.setAttribute(self.F_PROFILE, encoded_profile)
-
-            out_feature.setAttribute(self.F_PX_X, px)
-            out_feature.setAttribute(self.F_PX_Y, py)
-            out_feature.setAttribute(self.F_SOURCE, raster_layer.source())
-
-            # Copy attributes from the input feature
-            for field in vector_layer.fields():
-                if field.name() in [self.F_PROFILE, self.F_SOURCE, self.F_PX_X, self.F_PX_Y]:
+                # Check if pixel is within raster bounds
+                if px < 0 or py < 0 or px >= ds.RasterXSize or py >= ds.RasterYSize:
+                    features_skipped += 1
+                    feedback.pushWarning(f'Feature {feature.id()} outside raster bounds - skipped')
                     continue
-                if field.name() in output_fields.names():
-                    out_feature.setAttribute(field.name(), feature.attribute(field.name()))
-
-            # Write feature
-            if not writer.addFeature(out_feature):
-                pass
-            features_processed += 1
 
-            # Update progress
-            progress = 20 + int(70 * features_processed / total_features)
-            feedback.setProgress(progress)
+                # Extract pixel values from all bands
+                yValues = []
+                data = ds.ReadAsArray(px, py, 1, 1)
+                yValues = np.mean(data, axis=(1, 2)).tolist()
+                # exclude no-data values
+                yValues = [v if v != nd else None for nd, v in zip(no_data, yValues)]
+                # Create profile dictionary
+                profile_dict = prepareProfileValueDict(
+                    y=yValues,
+                    x=xValues,
+                    xUnit=xUnit,
+                    bbl=bbl
+                )
+
+                # Create output feature
+                out_feature = QgsFeature(output_fields)
+                out_feature.setId(feature.id())
+                out_feature.setGeometry(feature.geometry())  # Use original geometry
+
+                # Add profile data
+                pField = output_fields.field(self.F_PROFILE)
+                encoded_profile = encodeProfileValueDict(profile_dict, pField)
+                out_feature.setAttribute(self.F_PROFILE, encoded_profile)
+
+                out_feature.setAttribute(self.F_PX_X, px)
+                out_feature.setAttribute(self.F_PX_Y, py)
+                out_feature.setAttribute(self.F_SOURCE, raster_layer.source())
+
+                # Copy attributes from the input feature
+                for field in vector_layer.fields():
+                    if field.name() in [self.F_PROFILE, self.F_SOURCE, self.F_PX_X, self.F_PX_Y]:
+                        continue
+                    if field.name() in output_fields.names():
+                        out_feature.setAttribute(field.name(), feature.attribute(field.name()))
+
+                # Write feature
+                if not writer.addFeature(out_feature):
+                    pass
+                features_processed += 1
+
+                # Update progress
+                progress = 20 + int(70 * features_processed / total_features)
+                feedback.setProgress(progress)
 
         # Clean up
         if hasattr(writer, 'finalize'):
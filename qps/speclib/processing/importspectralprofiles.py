@@ -1,17 +1,25 @@
 import concurrent.futures
 import datetime
+import itertools
+import math
+import multiprocessing
+import multiprocessing.spawn
 import os.path
 import re
+import sys
+import threading
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Union, Tuple
 
+from qgis.PyQt.QtCore import QMetaType, QVariant
 from qgis.core import QgsCoordinateReferenceSystem, QgsEditorWidgetSetup, QgsExpressionContext, \
-    QgsExpressionContextScope, QgsFeature, QgsFeatureSink, QgsField, QgsFields, QgsMapLayer, QgsProcessing, \
-    QgsProcessingAlgorithm, QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback, \
+    QgsExpressionContextScope, QgsFeature, QgsFeatureSink, QgsField, QgsFields, QgsGeometry, QgsMapLayer, \
+    QgsProcessing, QgsProcessingAlgorithm, QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback, \
     QgsProcessingMultiStepFeedback, QgsProcessingOutputLayerDefinition, QgsProcessingParameterBoolean, \
-    QgsProcessingParameterFeatureSink, QgsProcessingParameterMultipleLayers, QgsProcessingUtils, QgsProject, \
-    QgsProperty, QgsRemappingProxyFeatureSink, QgsRemappingSinkDefinition, QgsVectorFileWriter, QgsVectorLayer, \
-    QgsWkbTypes, QgsProcessingParameterEnum
+    QgsProcessingParameterFeatureSink, QgsProcessingParameterMultipleLayers, QgsProcessingParameterNumber, \
+    QgsProcessingUtils, QgsProject, QgsProperty, QgsRemappingProxyFeatureSink, QgsRemappingSinkDefinition, \
+    QgsVectorFileWriter, QgsVectorLayer, QgsWkbTypes, QgsProcessingParameterEnum, QgsApplication
 from qgis.core import QgsProcessingParameterString, QgsProcessingParameterDefinition
 from ..core import profile_field_names
 from ..core.spectralprofile import SpectralProfileFileReader
@@ -47,6 +55,71 @@ class SpectralLibraryOutputDefinition(QgsProcessingOutputLayerDefinition):
         return True
 
 
+class ProfileReaderSniffer(object):
+    """
+    Finds the SpectralProfileFileReader for a file from its name and its first bytes, which are read once
+    and tested against the file signatures of all readers (see SpectralProfileFileReader.sniffFile).
+    Readers without file signature are tested with canReadFile.
+    The reader found for a file is tested first for the next files in the same directory with the same suffix.
+    """
+    # number of bytes read from the begin of a file
+    HEADER_SIZE: int = 4096
+    MAX_ENTRIES: int = 1024
+
+    _LOCK = threading.RLock()
+    # {(directory, file suffix): reader id}
+    _DIRECTORY_READERS: Dict[Tuple[str, str], str] = dict()
+
+    @classmethod
+    def readHeader(cls, path: Union[str, Path]) -> bytes:
+        try:
+            with open(path, 'rb') as f:
+                return f.read(cls.HEADER_SIZE)
+        except OSError:
+            return b''
+
+    @classmethod
+    def findReader(cls,
+                   path: Union[str, Path],
+                   readers: Optional[Dict[str, type]] = None) -> Optional[type]:
+        """
+        Returns the reader class to read the file with
+        :param path: file path
+        :param readers: {reader id: reader class}, defaults to READERS
+        :return: reader class or None
+        """
+        if readers is None:
+            readers = READERS
+        path = Path(path)
+        key = (path.parent.as_posix(), path.suffix.lower())
+        with cls._LOCK:
+            last_id = cls._DIRECTORY_READERS.get(key)
+
+        candidates = list(readers.values())
+        if last_id in readers:
+            candidates.remove(readers[last_id])
+            candidates.insert(0, readers[last_id])
+
+        header = cls.readHeader(path)
+        for reader in candidates:
+            matched = reader.sniffFile(path, header)
+            if matched is None:
+                matched = reader.canReadFile(path)
+            if matched:
+                if reader.id() != last_id:
+                    with cls._LOCK:
+                        if len(cls._DIRECTORY_READERS) >= cls.MAX_ENTRIES:
+                            cls._DIRECTORY_READERS.clear()
+                        cls._DIRECTORY_READERS[key] = reader.id()
+                return reader
+        return None
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._DIRECTORY_READERS.clear()
+
+
 def file_reader(path: Union[str, Path],
                 **kwds) -> Optional[SpectralProfileFileReader]:
     """
@@ -58,9 +131,9 @@ def file_reader(path: Union[str, Path],
     if not (path.is_file()):
         raise AssertionError(f'Not a file: {path}')
 
-    for reader in READERS.values():
-        if reader.canReadFile(path):
-            return reader(path, **kwds)
+    reader = ProfileReaderSniffer.findReader(path)
+    if reader is not None:
+        return reader(path, **kwds)
     return None
 
 
@@ -98,18 +171,172 @@ def read_profiles(path: Union[str, Path],
     return features, error
 
 
-def read_profile_batch(paths: list) -> Tuple[List[QgsFeature], List[str]]:
+def read_profile_batch(paths: List[Union[str, Path]],
+                       reader: Union[None, str, type] = None,
+                       **kwds) -> Tuple[List[QgsFeature], List[str]]:
+    """
+    Reads the profiles of many files. Files of the same reader are read at once with
+    SpectralProfileFileReader.readFiles.
+    :param paths: file paths
+    :param reader: optional reader id or reader class. Derived from each file if not set.
+    :return: features in order of the paths, errors
+    """
+    if isinstance(reader, str):
+        reader = READERS.get(reader)
+
+    results: List[Optional[Tuple[List[QgsFeature], Optional[str]]]] = [None] * len(paths)
+    # {reader class: [path indices]}
+    batches: Dict[type, List[int]] = dict()
+    for i, path in enumerate(paths):
+        r = reader
+        if r is None:
+            try:
+                r = ProfileReaderSniffer.findReader(path) if Path(path).is_file() else None
+            except Exception:
+                r = None
+        if isinstance(r, type) and issubclass(r, SpectralProfileFileReader):
+            batches.setdefault(r, []).append(i)
+        else:
+            results[i] = read_profiles(path, **kwds)
+
+    for r, indices in batches.items():
+        for i, result in zip(indices, r.readFiles([paths[i] for i in indices], **kwds)):
+            results[i] = result
+
     features = []
     errors = []
-
-    for path in paths:
-        feat, err = read_profiles(path)
+    for feat, err in results:
         features.extend(feat)
         if err:
             errors.append(err)
     return features, errors
 
 
+def field_definition(field: QgsField) -> tuple:
+    """
+    Returns a picklable definition of a QgsField, including its editor widget setup
+    """
+    setup = field.editorWidgetSetup()
+    return (field.name(), int(field.type()), field.typeName(), field.length(), field.precision(),
+            field.comment(), int(field.subType()), setup.type(), setup.config())
+
+
+def field_from_definition(definition: tuple) -> QgsField:
+    """
+    Creates the QgsField described by a field_definition
+    """
+    name, t, typeName, length, precision, comment, subType, setupType, setupConfig = definition
+    field = QgsField(name, QMetaType.Type(t), typeName=typeName, len=length, prec=precision,
+                     comment=comment, subType=QMetaType.Type(subType))
+    if setupType:
+        field.setEditorWidgetSetup(QgsEditorWidgetSetup(setupType, setupConfig))
+    return field
+
+
+def profiles_payload(features: List[QgsFeature]) -> List[Tuple[tuple, List[Tuple[list, Optional[bytes]]]]]:
+    """
+    Converts features into a compact and picklable payload, e.g. to return them from another process.
+    Consecutive features with the same fields are grouped.
+    :param features: list of QgsFeatures
+    :return: [(field definitions, [(attributes, geometry WKB)])]
+    """
+    payload = []
+    last_fields = None
+    for feature in features:
+        fields = feature.fields()
+        if last_fields is None or fields != last_fields:
+            payload.append((tuple(field_definition(f) for f in fields), []))
+            last_fields = fields
+        attributes = [(None if v.isNull() else v.value()) if isinstance(v, QVariant) else v
+                      for v in feature.attributes()]
+        wkb = bytes(feature.geometry().asWkb()) if feature.hasGeometry() else None
+        payload[-1][1].append((attributes, wkb))
+    return payload
+
+
+def payload_profiles(payload: List[Tuple[tuple, List[Tuple[list, Optional[bytes]]]]],
+                     fields_cache: Optional[Dict[tuple, QgsFields]] = None) -> List[List[QgsFeature]]:
+    """
+    Restores the features of a profiles_payload
+    :param payload: the payload
+    :param fields_cache: optional dictionary to reuse QgsFields for equal field definitions
+    :return: lists of features, one for each group of features with the same fields
+    """
+    if fields_cache is None:
+        fields_cache = dict()
+    groups = []
+    for definitions, rows in payload:
+        fields = fields_cache.get(definitions)
+        if fields is None:
+            fields = QgsFields()
+            for definition in definitions:
+                fields.append(field_from_definition(definition))
+            fields_cache[definitions] = fields
+        features = []
+        for attributes, wkb in rows:
+            feature = QgsFeature(fields)
+            feature.setAttributes(attributes)
+            if wkb is not None:
+                g = QgsGeometry()
+                g.fromWkb(wkb)
+                feature.setGeometry(g)
+            features.append(feature)
+        groups.append(features)
+    return groups
+
+
+def read_profile_payloads(paths: List[Union[str, Path]],
+                          reader: Optional[str] = None,
+                          **kwds) -> Tuple[List[Tuple[tuple, List[Tuple[list, Optional[bytes]]]]], List[str]]:
+    """
+    Reads the profiles of a batch of files and returns them as profiles_payload.
+    Used to read files in worker processes.
+    :param paths: file paths
+    :param reader: optional reader id
+    :return: payload, errors
+    """
+    features, errors = read_profile_batch(paths, reader=reader, **kwds)
+    return profiles_payload(features), errors
+
+
+# serializes changes of the process-wide executable used to spawn processes
+_SPAWN_LOCK = threading.Lock()
+
+# the headless QgsApplication of a worker process, see init_worker_qgis
+_WORKER_APP: Optional[QgsApplication] = None
+
+
+def init_worker_qgis(prefix_path: Optional[str] = None):
+    """
+    Starts a headless QgsApplication in a worker process. Readers that open files as QgsVectorLayer,
+    e.g. ENVI CSV sidecar files, GeoJSON, GeoPackage or EcoSIS files, need the QGIS data providers.
+    :param prefix_path: QGIS prefix path of the parent process, to find the data providers
+    """
+    global _WORKER_APP
+    if isinstance(QgsApplication.instance(), QgsApplication):
+        return
+    if prefix_path:
+        QgsApplication.setPrefixPath(prefix_path, True)
+    _WORKER_APP = QgsApplication([], False)
+    _WORKER_APP.initQgis()
+
+
+def python_executable() -> Optional[str]:
+    """
+    Returns the python interpreter to start worker processes with.
+    Inside QGIS, sys.executable might be the QGIS application instead.
+    """
+    exe = Path(sys.executable)
+    if exe.name.lower().startswith('python'):
+        return exe.as_posix()
+    prefix = Path(sys.exec_prefix)
+    for candidate in [prefix / 'python.exe', prefix / 'python3.exe', prefix / 'bin' / 'python3',
+                      prefix / 'bin' / 'python', exe.parent / 'python3', exe.parent / 'bin' / 'python3']:
+        if candidate.is_file():
+            return candidate.as_posix()
+    return None
+
+
 class ImportSpectralProfiles(QgsProcessingAlgorithm):
     NAME = 'importspectralprofiles'
     P_INPUT = 'INPUT'
@@ -119,6 +346,14 @@ class ImportSpectralProfiles(QgsProcessingAlgorithm):
     P_OUTPUT = 'OUTPUT'
     P_USE_RELPATH = 'RELPATH'
     P_DATETIMEFORMAT = 'DATETIMEFORMAT'
+    P_WORKERS = 'WORKERS'
+
+    # minimum number of input files to read them in parallel processes
+    PARALLEL_MIN_FILES: int = 64
+    # number of files read at once by a worker process
+    PARALLEL_BATCH_SIZE: int = 32
+    # maximum number of worker processes
+    PARALLEL_MAX_WORKERS: int = 8
 
     def __init__(self):
         super().__init__()
@@ -131,6 +366,7 @@ class ImportSpectralProfiles(QgsProcessingAlgorithm):
         self._profile_field_names: List[str] = []
         self._dstFields: Optional[QgsFields] = None
         self._input_readers = ['All']
+        self._n_workers: int = 0
 
     def name(self) -> str:
         return self.NAME
@@ -231,6 +467,19 @@ class ImportSpectralProfiles(QgsProcessingAlgorithm):
         p.setFlags(p.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(p)
 
+        p = QgsProcessingParameterNumber(self.P_WORKERS,
+                                         description='Number of parallel processes',
+                                         type=QgsProcessingParameterNumber.Integer,
+                                         defaultValue=configuration.get(self.P_WORKERS, 0),
+                                         minValue=0,
+                                         optional=True)
+        p.setHelp('Number of processes to read input files in parallel. '
+                  f'0 = use up to one process per CPU core, but not more than {self.PARALLEL_MAX_WORKERS}, '
+                  f'if {self.PARALLEL_MIN_FILES} or more files are imported, '
+                  '1 = read all files in the main process.')
+        p.setFlags(p.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p)
+
         p = QgsProcessingParameterFeatureSink(
             self.P_OUTPUT,
             defaultValue=configuration.get(self.P_OUTPUT, QgsProcessing.TEMPORARY_OUTPUT),
@@ -274,8 +523,72 @@ class ImportSpectralProfiles(QgsProcessingAlgorithm):
         self._dtg_fmt = self.parameterAsString(parameters, self.P_DATETIMEFORMAT, context)
         if self._dtg_fmt == '':
             self._dtg_fmt = None
+        self._n_workers = 0
+        if parameters.get(self.P_WORKERS) is not None:
+            self._n_workers = self.parameterAsInt(parameters, self.P_WORKERS, context)
         return len(errors) == 0
 
+    def numberOfWorkers(self) -> int:
+        """
+        Returns the number of processes to read the input files with
+        """
+        n_files = len(self._input_files)
+        n = self._n_workers
+        if n == 0:
+            if n_files < self.PARALLEL_MIN_FILES:
+                return 1
+            n = min(os.cpu_count() or 1, self.PARALLEL_MAX_WORKERS)
+        return max(1, min(n, n_files))
+
+    def readProfilesParallel(self,
+                             reader: Optional[str],
+                             n_workers: int,
+                             feedback: QgsProcessingFeedback,
+                             **kwds) -> Iterator[Tuple[int, List[List[QgsFeature]], List[str]]]:
+        """
+        Reads the input files in worker processes. The parsed profiles are returned as compact payloads
+        and restored to features in the order of the input files.
+        :param reader: optional reader id
+        :param n_workers: number of worker processes
+        :param feedback: feedback to cancel the reading
+        :return: iterator of (number of files read, feature groups, errors)
+        """
+        executable = python_executable()
+        if executable is None:
+            raise OSError('Unable to find a python interpreter for worker processes')
+        # fork is not safe in a process with Qt threads
+        mp_context = multiprocessing.get_context('spawn')
+
+        files = [p.as_posix() for p in self._input_files]
+        batch_size = max(1, min(self.PARALLEL_BATCH_SIZE, math.ceil(len(files) / n_workers)))
+        batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+        fields_cache: Dict[tuple, QgsFields] = dict()
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context,
+                                                          initializer=init_worker_qgis,
+                                                          initargs=(QgsApplication.prefixPath(),))
+        try:
+            # the spawn executable is a process-wide setting. Set it only while the worker processes are
+            # started, which happens when the batches are submitted, and restore it for other users.
+            with _SPAWN_LOCK:
+                previous = multiprocessing.spawn.get_executable()
+                mp_context.set_executable(executable)
+                try:
+                    futures = [executor.submit(read_profile_payloads, batch, reader, **kwds) for batch in batches]
+                finally:
+                    mp_context.set_executable(previous)
+            for batch, future in zip(batches, futures):
+                while True:
+                    if feedback.isCanceled():
+                        return
+                    try:
+                        payload, errors = future.result(timeout=0.5)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        continue
+                yield len(batch), payload_profiles(payload, fields_cache), errors
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def processAlgorithm(self,
                          parameters: Dict[str, Any],
                          context: QgsProcessingContext,
@@ -321,58 +634,44 @@ class ImportSpectralProfiles(QgsProcessingAlgorithm):
             t0 = datetime.datetime.now()
             return dt
 
-        if False:
-            max_workers = min(os.cpu_count() or 1, 8)
-            pt = datetime.datetime.now()
-            batch_size = n_files // max_workers
-            batch_size = 10
-            batches = [self._input_files[i:i + batch_size] for i in range(0, n_files, batch_size)]
-            # Maximal 8 Threads
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_uri = {
-                    executor.submit(read_profile_batch, batch): batch for batch in batches
-                }
-
-                completed = 0
-                for future in concurrent.futures.as_completed(future_to_uri):
-                    # uri = future_to_uri[future]
-                    features, error = future.result()
-
-                    if error:
-                        multiFeedback.reportError(error)
-
-                    if len(features) > 0:
-                        fields: QgsFields = features[0].fields()
-                        key = tuple(fields.names())
-                        PROFILES[key] = PROFILES.get(key, []) + features
-                        for f in fields:
-                            if f.name() not in all_fields.names():
-                                all_fields.append(QgsField(f))
-
-                    completed += 1
-                    # print(f'Completed: {completed}')
-
-                if (datetime.datetime.now() - pt).total_seconds() > 3:
-                    multiFeedback.setProgress(completed / n_files * 100)
-                    pt = datetime.datetime.now()
-        else:
-            for i, uri in enumerate(self._input_files):
-                profiles, error = read_profiles(uri, reader=reader, dtg_fmt=self._dtg_fmt)
-                if error:
-                    feedback.reportError(error)
-                # profiles = SpectralLibraryIO.readProfilesFromUri(uri, feedback=multiFeedback)
-                if len(profiles) > 0:
-                    fields: QgsFields = profiles[0].fields()
-                    key = tuple(fields.names())
-                    PROFILES[key] = PROFILES.get(key, []) + profiles
-                    for f in fields:
-                        if f.name() not in all_fields.names():
-                            all_fields.append(QgsField(f))
-                    # all_fields.extend(fields)
-                    # all_fields.extend(profiles[0].fields())
-                if i % 10 == 0:
-                    multiFeedback.setProgress((i + 1) / n_files * 100)
-                    pt = datetime.datetime.now()
+        def addProfiles(profiles: List[QgsFeature]):
+            if len(profiles) > 0:
+                fields: QgsFields = profiles[0].fields()
+                key = tuple(fields.names())
+                PROFILES.setdefault(key, []).extend(profiles)
+                for f in fields:
+                    if f.name() not in all_fields.names():
+                        all_fields.append(QgsField(f))
+
+        pt = datetime.datetime.now()
+        n_read = 0
+        n_workers = self.numberOfWorkers()
+        if n_workers > 1:
+            feedback.pushInfo(f'Read files with {n_workers} processes')
+            reader_id = reader.id() if reader else None
+            try:
+                for n, groups, errors in self.readProfilesParallel(reader_id, n_workers, multiFeedback,
+                                                                   dtg_fmt=self._dtg_fmt):
+                    for error in errors:
+                        feedback.reportError(error)
+                    for profiles in groups:
+                        addProfiles(profiles)
+                    n_read += n
+                    multiFeedback.setProgress(n_read / n_files * 100)
+            except (OSError, BrokenProcessPool) as ex:
+                feedback.pushWarning(f'Unable to read files in parallel: {ex}\nRead remaining files sequentially')
+
+        for i in range(n_read, n_files, self.PARALLEL_BATCH_SIZE):
+            if feedback.isCanceled():
+                break
+            paths = self._input_files[i:i + self.PARALLEL_BATCH_SIZE]
+            profiles, errors = read_profile_batch(paths, reader=reader, dtg_fmt=self._dtg_fmt)
+            for error in errors:
+                feedback.reportError(error)
+            # profiles of different readers have different fields
+            for key, group in itertools.groupby(profiles, key=lambda p: tuple(p.fields().names())):
+                addProfiles(list(group))
+            multiFeedback.setProgress((i + len(paths)) / n_files * 100)
 
         multiFeedback.pushInfo(f'Reading done {measureTime()}')
         if len(PROFILES) == 0:
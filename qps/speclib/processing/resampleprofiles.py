@@ -0,0 +1,233 @@
+from typing import Any, Dict, List, Optional
+
+from qgis.core import (
+    QgsEditorWidgetSetup, QgsFeature, QgsFeatureSink, QgsFields, QgsMapLayer, QgsProcessing, QgsProcessingAlgorithm,
+    QgsProcessingContext, QgsProcessingException, QgsProcessingFeatureSource, QgsProcessingFeedback,
+    QgsProcessingParameterEnum, QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField, QgsProcessingParameterRasterLayer, QgsProcessingParameterString, QgsProcessingUtils,
+    QgsRasterLayer, QgsVectorLayer)
+from .. import EDITOR_WIDGET_REGISTRY_KEY
+from ..core import is_profile_field
+from ..core.spectralprofile import decodeProfileValueDict, encodeProfileValueDict
+from ...qgsfunctions import SpectralResampling
+from ...qgsrasterlayerproperties import SpectralPropertiesCache
+from ...utils import chunks
+
+
+class ResampleSpectralProfiles(QgsProcessingAlgorithm):
+    """
+    Resamples the spectral profiles of a spectral library to the band settings of another sensor.
+    """
+    P_INPUT = 'INPUT'
+    P_PROFILE_FIELDS = 'PROFILE_FIELDS'
+    P_TARGET_RASTER = 'TARGET_RASTER'
+    P_TARGET_WAVELENGTHS = 'TARGET_WAVELENGTHS'
+    P_TARGET_FWHM = 'TARGET_FWHM'
+    P_TARGET_UNIT = 'TARGET_UNIT'
+    P_METHOD = 'METHOD'
+    P_OUTPUT = 'OUTPUT'
+
+    # number of features whose profiles are resampled at once
+    CHUNK_SIZE = 1024
+
+    def __init__(self):
+        super().__init__()
+
+        self.mSource: Optional[QgsProcessingFeatureSource] = None
+        self.mProfileFields: List[str] = []
+        self.mTargetX: Optional[List[float]] = None
+        self.mTargetFWHM: Optional[List[float]] = None
+        self.mTargetUnit: Optional[str] = None
+        self.mMethod: str = SpectralResampling.METHODS[0]
+        self._results: Dict = dict()
+
+    def name(self) -> str:
+        return 'resamplespectralprofiles'
+
+    def displayName(self) -> str:
+        return 'Resample Spectral Profiles'
+
+    def shortHelpString(self) -> str:
+        info = """Resamples spectral profiles to the band settings of another sensor.
+
+The target band settings are taken from a raster layer with wavelength information
+or from a comma-separated list of wavelengths and optional FWHM values.
+
+The <i>gaussian</i> method models each target band with a gaussian spectral response function
+defined by its FWHM. Target bands without FWHM, and all bands of the <i>linear</i> method,
+are linearly interpolated. Profiles with the same spectral setting are resampled with a single
+matrix product.
+        """
+        return info
+
+    def tags(self) -> List[str]:
+        return 'spectral,resampling,convolution,srf,fwhm,sensor'.split(',')
+
+    def group(self) -> str:
+        return 'Spectral Library'
+
+    def groupId(self) -> str:
+        return 'spectrallibrary'
+
+    def createInstance(self) -> 'ResampleSpectralProfiles':
+        return ResampleSpectralProfiles()
+
+    def initAlgorithm(self, configuration: Dict[str, Any] = None) -> None:
+        if configuration is None:
+            configuration = dict()
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(self.P_INPUT,
+                                                'Input spectral library',
+                                                [QgsProcessing.TypeVector],
+                                                defaultValue=configuration.get(self.P_INPUT)))
+        self.addParameter(
+            QgsProcessingParameterField(self.P_PROFILE_FIELDS,
+                                        'Profile fields (all profile fields if not set)',
+                                        parentLayerParameterName=self.P_INPUT,
+                                        allowMultiple=True,
+                                        optional=True))
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(self.P_TARGET_RASTER,
+                                              'Target band settings from raster layer',
+                                              optional=True,
+                                              defaultValue=configuration.get(self.P_TARGET_RASTER)))
+        self.addParameter(
+            QgsProcessingParameterString(self.P_TARGET_WAVELENGTHS,
+                                         'Target wavelengths (comma-separated)',
+                                         optional=True,
+                                         defaultValue=configuration.get(self.P_TARGET_WAVELENGTHS)))
+        self.addParameter(
+            QgsProcessingParameterString(self.P_TARGET_FWHM,
+                                         'Target FWHM (comma-separated)',
+                                         optional=True,
+                                         defaultValue=configuration.get(self.P_TARGET_FWHM)))
+        self.addParameter(
+            QgsProcessingParameterString(self.P_TARGET_UNIT,
+                                         'Target wavelength unit (profile unit if not set)',
+                                         optional=True,
+                                         defaultValue=configuration.get(self.P_TARGET_UNIT)))
+        self.addParameter(
+            QgsProcessingParameterEnum(self.P_METHOD,
+                                       'Resampling method',
+                                       options=SpectralResampling.METHODS,
+                                       defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.P_OUTPUT,
+                                              description='Resampled spectral library',
+                                              defaultValue=configuration.get(self.P_OUTPUT, None)))
+
+    @staticmethod
+    def parseValues(text: str) -> Optional[List[float]]:
+        values = [v.strip() for v in str(text).replace(';', ',').split(',')]
+        values = [float(v) for v in values if v != '']
+        return values if len(values) > 0 else None
+
+    def prepareAlgorithm(self, parameters: Dict[str, Any], context: QgsProcessingContext,
+                         feedback: QgsProcessingFeedback) -> bool:
+
+        self.mSource = self.parameterAsSource(parameters, self.P_INPUT, context)
+        if self.mSource is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.P_INPUT))
+
+        fields: QgsFields = self.mSource.fields()
+        self.mProfileFields = self.parameterAsFields(parameters, self.P_PROFILE_FIELDS, context)
+        if len(self.mProfileFields) == 0:
+            self.mProfileFields = [f.name() for f in fields if is_profile_field(f)]
+        if len(self.mProfileFields) == 0:
+            raise QgsProcessingException('Input does not contain any spectral profile field')
+
+        raster = self.parameterAsRasterLayer(parameters, self.P_TARGET_RASTER, context)
+        wavelengths = self.parameterAsString(parameters, self.P_TARGET_WAVELENGTHS, context)
+        if isinstance(raster, QgsRasterLayer):
+            entry = SpectralPropertiesCache.entry(raster)
+            if entry.wavelengths is None:
+                raise QgsProcessingException(f'Raster layer {raster.name()} has no wavelength information')
+            self.mTargetX = entry.wavelengths.tolist()
+            self.mTargetFWHM = entry.fwhms.tolist() if entry.fwhms is not None else None
+            self.mTargetUnit = entry.wavelengthUnit
+        elif wavelengths:
+            try:
+                self.mTargetX = self.parseValues(wavelengths)
+                fwhm = self.parameterAsString(parameters, self.P_TARGET_FWHM, context)
+                self.mTargetFWHM = self.parseValues(fwhm) if fwhm else None
+            except ValueError as ex:
+                raise QgsProcessingException(f'Unable to read target band settings: {ex}')
+            if self.mTargetFWHM is not None and len(self.mTargetFWHM) != len(self.mTargetX):
+                raise QgsProcessingException('Number of target FWHM values differs from number of wavelengths')
+            unit = self.parameterAsString(parameters, self.P_TARGET_UNIT, context)
+            self.mTargetUnit = unit if unit else None
+
+        if not self.mTargetX:
+            raise QgsProcessingException('Target band settings require a raster layer or a list of wavelengths')
+
+        self.mMethod = SpectralResampling.METHODS[self.parameterAsEnum(parameters, self.P_METHOD, context)]
+        return True
+
+    def processAlgorithm(self,
+                         parameters: Dict[str, Any],
+                         context: QgsProcessingContext,
+                         feedback: QgsProcessingFeedback) -> Dict[str, Any]:
+
+        fields = self.mSource.fields()
+        sink, destId = self.parameterAsSink(parameters, self.P_OUTPUT, context, fields,
+                                            self.mSource.wkbType(), self.mSource.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.P_OUTPUT))
+
+        profileFields = [fields.field(n) for n in self.mProfileFields]
+        profileIndices = [fields.lookupField(n) for n in self.mProfileFields]
+
+        count = self.mSource.featureCount()
+        progressStep = 100.0 / count if count > 0 else 1
+        n_done = 0
+        n_failed = 0
+
+        for featureChunk in chunks(self.mSource.getFeatures(), size=self.CHUNK_SIZE):
+            if feedback.isCanceled():
+                break
+            features: List[QgsFeature] = list(featureChunk)
+
+            for field, idx in zip(profileFields, profileIndices):
+                profiles = [decodeProfileValueDict(f.attribute(idx), numpy_arrays=True) for f in features]
+                resampled = SpectralResampling.resampleProfiles(profiles,
+                                                                self.mTargetX,
+                                                                targetFWHM=self.mTargetFWHM,
+                                                                targetXUnit=self.mTargetUnit,
+                                                                method=self.mMethod)
+                for f, profile, d in zip(features, profiles, resampled):
+                    if d is None and len(profile) > 0:
+                        n_failed += 1
+                    f.setAttribute(idx, encodeProfileValueDict(d, field) if d else None)
+
+            if not sink.addFeatures(features, QgsFeatureSink.FastInsert):
+                raise QgsProcessingException(self.writeFeatureError(sink, parameters, self.P_OUTPUT))
+
+            n_done += len(features)
+            feedback.setProgress(n_done * progressStep)
+
+        if n_failed > 0:
+            feedback.pushWarning(f'{n_failed} profiles without wavelength information could not be resampled')
+
+        del sink
+        self._results = {self.P_OUTPUT: destId}
+        return self._results
+
+    def postProcessAlgorithm(self, context: QgsProcessingContext, feedback: QgsProcessingFeedback) -> Dict[str, Any]:
+
+        vl = self._results.get(self.P_OUTPUT)
+        if isinstance(vl, str):
+            lyr_id = vl
+            vl = QgsProcessingUtils.mapLayerFromString(vl, context,
+                                                       allowLoadingNewLayers=True,
+                                                       typeHint=QgsProcessingUtils.LayerHint.Vector)
+            if isinstance(vl, QgsVectorLayer) and vl.isValid():
+                for fieldName in self.mProfileFields:
+                    idx = vl.fields().lookupField(fieldName)
+                    if idx > -1:
+                        setup = QgsEditorWidgetSetup(EDITOR_WIDGET_REGISTRY_KEY, {})
+                        vl.setEditorWidgetSetup(idx, setup)
+                vl.saveDefaultStyle(QgsMapLayer.StyleCategory.AllStyleCategories)
+            else:
+                feedback.pushWarning(f'Unable to reload {lyr_id} as vectorlayer and set profile fields')
+        return {self.P_OUTPUT: vl}
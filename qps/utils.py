@@ -37,6 +37,7 @@ import os
 import re
 import shutil
 import sys
+import threading
 import traceback
 import warnings
 import weakref
@@ -44,7 +45,7 @@ import zipfile
 from collections import defaultdict
 from math import floor
 from pathlib import Path
-from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import numpy as np
 from osgeo import gdal, gdal_array, ogr, osr
@@ -53,18 +54,18 @@ from osgeo.ogr import OFSTBoolean, OFSTNone, OFTBinary, OFTDate, OFTDateTime, OF
     OFTStringList, OFTTime
 from osgeo.osr import SpatialReference
 
-from qgis.PyQt import uic
+from qgis.PyQt import sip, uic
 from qgis.PyQt.QtCore import NULL, QByteArray, QDirIterator, QObject, QPoint, QPointF, QRect, Qt, QUrl, \
     QVariant, QMetaType
-from qgis.PyQt.QtGui import QColor, QIcon
+from qgis.PyQt.QtGui import QColor, QIcon, QTransform
 from qgis.PyQt.QtWidgets import (
     QAction, QComboBox, QDialogButtonBox, QGridLayout, QHBoxLayout, QLabel, QMainWindow,
     QMenu, QToolButton, QWidget)
 from qgis.PyQt.QtXml import QDomDocument, QDomElement, QDomNode
 from qgis.core import (Qgis, QgsApplication, QgsCoordinateReferenceSystem,
-                       QgsCoordinateTransform, QgsEditorWidgetSetup,
+                       QgsCoordinateTransform, QgsCoordinateTransformContext, QgsCsException, QgsEditorWidgetSetup,
                        QgsFeature, QgsFeatureRequest, QgsFeatureSource, QgsFeedback, QgsField, QgsFields, QgsGeometry,
-                       QgsMapLayer,
+                       QgsLineString, QgsMapLayer,
                        QgsMapLayerProxyModel, QgsMapLayerStore, QgsMapLayerStyle, QgsMapToPixel, QgsMessageOutput,
                        QgsPointXY,
                        QgsProcessingAlgorithm, QgsProcessingContext, QgsProcessingFeedback, QgsProject, QgsRaster,
@@ -73,7 +74,7 @@ from qgis.core import (Qgis, QgsApplication, QgsCoordinateReferenceSystem,
                        QgsRasterLayer, QgsRasterRenderer, QgsRectangle, QgsTask, QgsVector, QgsVectorDataProvider,
                        QgsVectorFileWriter,
                        QgsVectorLayer, QgsWkbTypes)
-from qgis.core import (QgsExpressionContextScope, QgsExpressionContext,
+from qgis.core import (QgsExpressionContextScope, QgsExpressionContext, QgsDataProvider, QgsProviderRegistry,
                        QgsFeatureRenderer, QgsSingleSymbolRenderer,
                        QgsMarkerSymbol, QgsExpressionContextUtils, QgsRenderContext, QgsSymbol, QgsProcessing)
 from qgis.gui import QgisInterface, QgsDialog, QgsGui, QgsMapCanvas, QgsMapLayerComboBox, QgsMessageViewer
@@ -570,6 +571,143 @@ def findMapLayer(layer: Union[str, QgsMapLayer]) -> Optional[QgsMapLayer]:
     return None
 
 
+class MapLayerIndex(object):
+    """
+    A process-wide index to find map layers in QgsMapLayerStores by layer id, name or source.
+    The index of a store is created on first use and updated by the store's layersAdded and
+    layersWillBeRemoved signals and the nameChanged signals of its layers.
+    Indices are keyed by the address of the C++ store and contain layer ids and strings only,
+    so that they do not keep stores or layers alive. Layers are resolved through the store.
+    """
+
+    class StoreIndex(object):
+
+        def __init__(self, store: QgsMapLayerStore):
+            self.mLayers: Set[str] = set()
+            self.mNames: Dict[str, List[str]] = dict()
+            self.mSources: Dict[str, List[str]] = dict()
+            self.mIndexedNames: Dict[str, str] = dict()
+            self.mIndexedSources: Dict[str, str] = dict()
+            self.mConnected: Set[str] = set()
+            self.mRenamed: Set[str] = set()
+            self.addLayers(list(store.mapLayers().values()))
+
+        def addLayers(self, layers: List[QgsMapLayer]):
+            with MapLayerIndex._LOCK:
+                for lyr in layers:
+                    lid = lyr.id()
+                    self.removeLayers([lid])
+                    self.mLayers.add(lid)
+                    self.mIndexedNames[lid] = lyr.name()
+                    self.mNames.setdefault(lyr.name(), []).append(lid)
+                    source = MapLayerIndex.normalizedSource(lyr.source())
+                    self.mIndexedSources[lid] = source
+                    self.mSources.setdefault(source, []).append(lid)
+                    if lid not in self.mConnected:
+                        self.mConnected.add(lid)
+                        lyr.nameChanged.connect(lambda *args, _lid=lid: self.setRenamed(_lid))
+
+        def removeLayers(self, layerIds: List[str]):
+            with MapLayerIndex._LOCK:
+                for lid in layerIds:
+                    self.mRenamed.discard(lid)
+                    if lid not in self.mLayers:
+                        continue
+                    self.mLayers.remove(lid)
+                    for lookup, key in [(self.mNames, self.mIndexedNames.pop(lid)),
+                                        (self.mSources, self.mIndexedSources.pop(lid))]:
+                        lids = lookup[key]
+                        lids.remove(lid)
+                        if len(lids) == 0:
+                            lookup.pop(key)
+
+        def setRenamed(self, layerId: str):
+            with MapLayerIndex._LOCK:
+                if layerId in self.mLayers:
+                    self.mRenamed.add(layerId)
+
+        def findLayer(self, store: QgsMapLayerStore, value: str, layerType=QgsMapLayer) -> Optional[QgsMapLayer]:
+            with MapLayerIndex._LOCK:
+                if len(self.mRenamed) > 0:
+                    renamed = [store.mapLayer(lid) for lid in self.mRenamed]
+                    self.mRenamed.clear()
+                    self.addLayers([lyr for lyr in renamed if isinstance(lyr, QgsMapLayer)])
+                lids = [value] if value in self.mLayers else []
+                lids.extend(self.mNames.get(value, []))
+                lids.extend(self.mSources.get(MapLayerIndex.normalizedSource(value), []))
+                for lid in lids:
+                    lyr = store.mapLayer(lid)
+                    if isinstance(lyr, layerType) and not sip.isdeleted(lyr):
+                        return lyr
+            return None
+
+    _LOCK = threading.RLock()
+    _STORES: Dict[int, 'MapLayerIndex.StoreIndex'] = dict()
+
+    @staticmethod
+    def normalizedSource(source: str) -> str:
+        return os.path.normcase(os.path.normpath(source.strip())) if source else ''
+
+    @staticmethod
+    def storeKey(store: QgsMapLayerStore) -> int:
+        """
+        Returns the address of the C++ store, which, unlike id(store), does not change with the python wrapper
+        """
+        return int(sip.unwrapinstance(store))
+
+    @classmethod
+    def storeIndex(cls, store: Union[QgsProject, QgsMapLayerStore]) -> 'MapLayerIndex.StoreIndex':
+        """
+        Returns the index of a QgsMapLayerStore. For a QgsProject, the index of its layer store is returned.
+        """
+        if isinstance(store, QgsProject):
+            store = store.layerStore()
+        key = cls.storeKey(store)
+        with cls._LOCK:
+            index = cls._STORES.get(key)
+            if index is None:
+                index = MapLayerIndex.StoreIndex(store)
+                cls._STORES[key] = index
+                store.layersAdded.connect(index.addLayers)
+                store.layersWillBeRemoved.connect(index.removeLayers)
+                store.destroyed.connect(lambda *args, _key=key: cls.removeStore(_key))
+            return index
+
+    @classmethod
+    def removeStore(cls, key: int):
+        with cls._LOCK:
+            cls._STORES.pop(key, None)
+
+    @classmethod
+    def findLayer(cls,
+                  value: str,
+                  stores: List[Union[QgsProject, QgsMapLayerStore]] = None,
+                  layerType=QgsMapLayer) -> Optional[QgsMapLayer]:
+        """
+        Returns the first layer that matches a layer id, layer name or layer source.
+        :param value: str layer id, name or source
+        :param stores: list of QgsMapLayerStores to search in. Defaults to the layer store of QgsProject.instance()
+        :param layerType: the required layer type, e.g. QgsRasterLayer
+        :return: QgsMapLayer or None
+        """
+        if stores is None:
+            stores = [QgsProject.instance()]
+        for store in stores:
+            if sip.isdeleted(store):
+                continue
+            if isinstance(store, QgsProject):
+                store = store.layerStore()
+            lyr = cls.storeIndex(store).findLayer(store, value, layerType=layerType)
+            if isinstance(lyr, QgsMapLayer):
+                return lyr
+        return None
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._STORES.clear()
+
+
 def gdalFileSize(path) -> int:
     """
     Returns the size of a local gdal readible file (including metadata files etc.)
@@ -1103,39 +1241,70 @@ def xy_pair_matrix(pairs: List[Union[Tuple[np.ndarray, np.ndarray], Dict]]) -> T
                np.nan fills if x doesn't exist in the pair.
     """
     # Normalize input into a list of (x, y) numpy arrays
-    pairs2 = []
-    x_order = {}
-    counter = 0
+    xs = []
+    ys = []
     for pair in pairs:
         if isinstance(pair, dict):
-            x, y = np.asarray(pair['x']), np.asarray(pair['y'])
+            x, y = np.asarray(pair['x']), np.asarray(pair['y'], dtype=float)
         else:
-            x, y = np.asarray(pair[0]), np.asarray(pair[1])
+            x, y = np.asarray(pair[0]), np.asarray(pair[1], dtype=float)
         if not (len(x) == len(y)):
             raise AssertionError(f'Input arrays must be of the same length: {len(x)} != {len(y)}')
-        pairs2.append((x, y))
+        xs.append(x)
+        ys.append(y)
+
+    n_pairs = len(xs)
+    if n_pairs == 0:
+        return np.array([]), np.full((0, 0), np.nan)
 
-        # preserve order of first occurrence
-        for xi in x:
-            if xi not in x_order:
-                x_order[xi] = counter
-                counter += 1
+    all_x = np.concatenate(xs)
+    all_y = np.concatenate(ys)
 
     # unique x values, ordered by first occurrence
-    x_values = np.array(sorted(x_order, key=x_order.get))
+    x_unique, first, inverse = np.unique(all_x, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    # fill matrix
+    rows = rank[inverse.ravel()]
+    cols = np.repeat(np.arange(n_pairs), [len(x) for x in xs])
+    Y_VALUES = np.full((len(x_unique), n_pairs), np.nan)
+    Y_VALUES[rows, cols] = all_y
 
-    # map from x to row index
-    x_to_idx = {x: i for i, x in enumerate(x_values)}
+    return x_unique[order], Y_VALUES
 
-    n_pairs = len(pairs2)
-    Y_VALUES = np.full((len(x_values), n_pairs), np.nan)
 
-    # fill matrix
-    for j, (xvec, yvec) in enumerate(pairs2):
-        idxs = [x_to_idx[x] for x in xvec]
-        Y_VALUES[idxs, j] = yvec
+def xy_pair_groups(pairs: List[Union[Tuple[np.ndarray, np.ndarray], Dict]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Groups (x, y) pairs of 1D lists or numpy arrays by their x values, e.g. profiles with the same spectral setting.
+    Returns a list of (x, Y) tuples with sorted, unique and finite x values and a 2D numpy array Y of
+    shape (n_pairs, len(x)). If a pair contains an x value more than once, its last y value is used.
+    """
+    groups: Dict[bytes, Tuple[np.ndarray, List[np.ndarray]]] = dict()
+    for pair in pairs:
+        if isinstance(pair, dict):
+            x, y = np.asarray(pair['x'], dtype=float), np.asarray(pair['y'], dtype=float)
+        else:
+            x, y = np.asarray(pair[0], dtype=float), np.asarray(pair[1], dtype=float)
+        if not (len(x) == len(y)):
+            raise AssertionError(f'Input arrays must be of the same length: {len(x)} != {len(y)}')
+
+        if not (len(x) < 2 or np.all(x[1:] > x[:-1])):
+            valid = np.isfinite(x)
+            x, y = x[valid][::-1], y[valid][::-1]
+            x, idx = np.unique(x, return_index=True)
+            y = y[idx]
+        elif len(x) == 1 and not np.isfinite(x[0]):
+            x, y = x[0:0], y[0:0]
+
+        key = x.tobytes()
+        if key in groups:
+            groups[key][1].append(y)
+        else:
+            groups[key] = (x, [y])
 
-    return x_values, Y_VALUES
+    return [(x, np.vstack(ys)) for x, ys in groups.values()]
 
 
 def qgsFields(source: Union[List[QgsField], QgsFeature, QgsFields, QgsVectorLayer]) -> QgsFields:
@@ -2858,17 +3027,114 @@ def iconForFieldType(field: Union[QgsField, QgsVectorDataProvider.NativeType]) -
     return QgsFields.iconForFieldType(field.type())
 
 
-def createCRSTransform(src: QgsCoordinateReferenceSystem, dst: QgsCoordinateReferenceSystem):
+class CoordinateTransformCache(object):
+    """
+    A bounded, process-wide cache of prepared QgsCoordinateTransforms.
+    Transforms are keyed by (source CRS, destination CRS, transform context)
+    so that the underlying PROJ pipeline is created only once.
     """
+    MAX_ENTRIES: int = 128
+
+    _LOCK = threading.Lock()
+    _CACHE: Dict[Tuple[str, str, int], QgsCoordinateTransform] = dict()
 
+    @staticmethod
+    def crsKey(crs: QgsCoordinateReferenceSystem) -> str:
+        if not (isinstance(crs, QgsCoordinateReferenceSystem) and crs.isValid()):
+            return ''
+        authid = crs.authid()
+        return authid if authid != '' else crs.toWkt()
+
+    @staticmethod
+    def contextKey(context: QgsCoordinateTransformContext) -> int:
+        return hash(str(sorted(context.coordinateOperations().items())))
+
+    @classmethod
+    def transform(cls,
+                  src: QgsCoordinateReferenceSystem,
+                  dst: QgsCoordinateReferenceSystem,
+                  context: Optional[QgsCoordinateTransformContext] = None) -> QgsCoordinateTransform:
+        """
+        Returns a QgsCoordinateTransform from src to dst.
+        :param src: source CRS
+        :param dst: destination CRS
+        :param context: QgsCoordinateTransformContext, defaults to the transform context of the current project
+        :return: QgsCoordinateTransform
+        """
+        if context is None:
+            context = QgsProject.instance().transformContext()
+        key = (cls.crsKey(src), cls.crsKey(dst), cls.contextKey(context))
+        with cls._LOCK:
+            trans = cls._CACHE.pop(key, None)
+            if trans is None:
+                trans = QgsCoordinateTransform(src, dst, context)
+            # re-insert to keep the most recently used transforms at the end
+            cls._CACHE[key] = trans
+            while len(cls._CACHE) > cls.MAX_ENTRIES:
+                cls._CACHE.pop(next(iter(cls._CACHE)))
+        # copies are implicitly shared and can be used in other threads
+        return QgsCoordinateTransform(trans)
+
+    @classmethod
+    def clear(cls):
+        with cls._LOCK:
+            cls._CACHE.clear()
+
+
+def transformCoordinateArrays(x: np.ndarray,
+                              y: np.ndarray,
+                              transform: Union[QgsCoordinateTransform,
+                                               Tuple[QgsCoordinateReferenceSystem, QgsCoordinateReferenceSystem]],
+                              direction: Qgis.TransformDirection = Qgis.TransformDirection.Forward
+                              ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Transforms arrays of x and y coordinates in a single call.
+    Coordinates that cannot be transformed are returned as NaN.
+    :param x: numpy array of x coordinates
+    :param y: numpy array of y coordinates
+    :param transform: QgsCoordinateTransform or (source CRS, destination CRS) tuple
+    :param direction: Qgis.TransformDirection
+    :return: (x, y) arrays with the shape of the input arrays
+    """
+    if isinstance(transform, tuple):
+        transform = CoordinateTransformCache.transform(*transform)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.shape != y.shape:
+        raise AssertionError(f'Differing shapes: {x.shape} vs. {y.shape}')
+
+    shape = x.shape
+    if x.size == 0 or transform.isShortCircuited():
+        return x.copy(), y.copy()
+
+    try:
+        line = QgsLineString(x.ravel().tolist(), y.ravel().tolist())
+        line.transform(transform, direction)
+        xt = np.asarray(line.xVector(), dtype=float)
+        yt = np.asarray(line.yVector(), dtype=float)
+    except QgsCsException:
+        # fallback: transform point by point and keep NaNs for failed transformations
+        xt = np.full(x.size, np.nan)
+        yt = np.full(x.size, np.nan)
+        for i, (xi, yi) in enumerate(zip(x.ravel(), y.ravel())):
+            try:
+                pt = transform.transform(QgsPointXY(xi, yi), direction)
+                xt[i], yt[i] = pt.x(), pt.y()
+            except QgsCsException:
+                pass
+
+    return xt.reshape(shape), yt.reshape(shape)
+
+
+def createCRSTransform(src: QgsCoordinateReferenceSystem, dst: QgsCoordinateReferenceSystem):
+    """
+    Returns a (cached) QgsCoordinateTransform from src to dst
     :param src:
     :param dst:
     :return:
     """
-    t = QgsCoordinateTransform()
-    t.setSourceCrs(src)
-    t.setDestinationCrs(dst)
-    return t
+    return CoordinateTransformCache.transform(src, dst)
 
 
 def saveTransform(geom: Union[QgsPointXY, QgsRectangle, Tuple[np.ndarray, np.ndarray]],
@@ -2881,7 +3147,7 @@ def saveTransform(geom: Union[QgsPointXY, QgsRectangle, Tuple[np.ndarray, np.nda
     :param crs2:
     :return:
     """
-    transform = QgsCoordinateTransform(crs1, crs2, QgsProject.instance())
+    transform = CoordinateTransformCache.transform(crs1, crs2)
 
     result = None
     if isinstance(geom, QgsRectangle):
@@ -2907,16 +3173,9 @@ def saveTransform(geom: Union[QgsPointXY, QgsRectangle, Tuple[np.ndarray, np.nda
     elif isinstance(geom, tuple):
 
         xcoords, ycoords = geom
-        shape = xcoords.shape
         if xcoords.shape != ycoords.shape:
             raise AssertionError(f'Differing shapes: {xcoords.shape} vs. {ycoords.shape}')
-        _ = np.prod(xcoords.shape)
-        results = [transform.transform(QgsPointXY(x, y))
-                   for x, y in zip(xcoords.flatten(), ycoords.flatten())]
-        xresults = np.asarray([r.x() for r in results])
-        yresults = np.asarray([r.y() for r in results])
-
-        result = (xresults.reshape(shape), yresults.reshape(shape))
+        result = transformCoordinateArrays(xcoords, ycoords, transform)
     return result
 
 
@@ -3258,13 +3517,20 @@ class MapGeometryToPixel(object):
         self.yMax = ul.y()
         self.crs: QgsCoordinateReferenceSystem = crs
 
-        # t: QTransform = self.m2p.transform()
+        # affine coefficients to transform map coordinates into pixel coordinates
+        t: QTransform = self.m2p.transform()
+        self.mGeo2Px: Tuple[float, float, float, float, float, float] = \
+            (t.m11(), t.m21(), t.m31(), t.m12(), t.m22(), t.m32())
+
         self.rsMEM: Optional[gdal.Dataset] = None
         self.bandMEM: Optional[gdal.Band] = None
         self.vsMem: Optional[ogr.DataSource] = None
         self.srs: Optional[osr.SpatialReference] = None
         self.wkbTypeLayers: Dict[int, ogr.Layer] = dict()
 
+        # last label raster created by geometriesPixelPositions
+        self.mLabelCache: Tuple[Optional[tuple], Optional[List[np.ndarray]]] = (None, None)
+
     def nSamples(self) -> int:
         return self.m2p.mapWidth()
 
@@ -3279,6 +3545,7 @@ class MapGeometryToPixel(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.wkbTypeLayers.clear()
+        self.mLabelCache = (None, None)
         del self.vsMem
         del self.rsMEM
 
@@ -3300,6 +3567,24 @@ class MapGeometryToPixel(object):
     def geo2pxList(self, xvalues, yvalues) -> List[QPoint]:
         return [self.geo2px(x, y) for x, y in zip(xvalues, yvalues)]
 
+    def geo2pxArrays(self, xvalues, yvalues) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the indices of the pixels that contain the map coordinates.
+        Indices can be outside the pixel grid.
+        """
+        x = np.asarray(xvalues, dtype=float)
+        y = np.asarray(yvalues, dtype=float)
+        m11, m21, m31, m12, m22, m32 = self.mGeo2Px
+        px_x = np.floor(m11 * x + m21 * y + m31).astype(int)
+        px_y = np.floor(m12 * x + m22 * y + m32).astype(int)
+        return px_x, px_y
+
+    def _geoTransform(self) -> Tuple[float, float, float, float, float, float]:
+        t, success = self.m2p.transform().inverted()
+        if not success:
+            raise AssertionError('Matrix is not invertible')
+        return t.m31(), t.m11(), t.m21(), t.m32(), t.m12(), t.m22()
+
     def memoryLayerBand(self, qgsGeometry: QgsGeometry) -> Tuple[gdal.Band, ogr.Layer]:
         if (
                 not isinstance(self.srs, SpatialReference)
@@ -3310,14 +3595,7 @@ class MapGeometryToPixel(object):
         if not isinstance(self.rsMEM, gdal.Dataset):
             self.rsMEM: gdal.Dataset = (gdal.GetDriverByName('MEM')
                                         .Create('', self.nSamples(), self.nLines(), 1, gdal.GDT_Byte))
-            # ul = self.px2geo(0, 0)
-            t, success = self.m2p.transform().inverted()
-            if not success:
-                raise AssertionError('Matrix is not invertible')
-            self.rsMEM.SetGeoTransform((t.m31(), t.m11(), t.m12(),
-                                        t.m32(), t.m21(), t.m22()))
-            #  self.rsMEM.SetGeoTransform((ul.x(), self.pixelWidth(), 0,
-            #                              ul.y(), 0, -self.pixelWidth()))
+            self.rsMEM.SetGeoTransform(self._geoTransform())
 
             if isinstance(self.srs, SpatialReference):
                 self.rsMEM.SetSpatialRef(self.srs)
@@ -3343,6 +3621,9 @@ class MapGeometryToPixel(object):
                                burn_points: bool = False,
                                ) -> Tuple[np.ndarray, np.ndarray]:
         #  rasterizes the feature geometry and returns the pixel positions
+        #  points, multi-points, lines within a single pixel and, with all_touched, short lines
+        #  are handled without rasterization.
+        #  burn_points is kept for compatibility, points always return the pixels they are located in.
         if isinstance(g, QgsFeature):
             if g.hasGeometry():
                 g = g.geometry()
@@ -3350,51 +3631,214 @@ class MapGeometryToPixel(object):
         if not isinstance(g, QgsGeometry) or _geometryIsEmpty(g):
             return None, None
 
-        if g.wkbType() == Qgis.WkbType.Point and not burn_points:
-            g = QgsGeometry(g)
-            g.mapToPixel(self.m2p)
-            px_x = []
-            px_y = []
-            for point in g.constParts():
-                x, y = int(point.x()), int(point.y())
-                if 0 <= x < self.m2p.mapWidth() and 0 <= y < self.m2p.mapHeight():
-                    px_x.append(x)
-                    px_y.append(y)
-                else:
-                    pass
-            if len(px_x) > 0:
-                return np.asarray(px_y), np.asarray(px_x)
+        positions = self._fastPixelPositions(g, all_touched=all_touched)
+        if positions is not None:
+            return positions
+
+        bandMEM, lyr = self.memoryLayerBand(g)
+        bandMEM: gdal.Band
+        lyr: ogr.Layer
+        dsMEM: gdal.Dataset = bandMEM.GetDataset()
+        ogrFeature = ogr.Feature(lyr.GetLayerDefn())
+        ogrFeature.SetFID(1)
+        ogrFeature.SetField("FID_BURN", 1)
+        ogrFeature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(g.asWkb()))
+
+        if ogr.OGRERR_NONE != self._clearAndInsert(lyr, ogrFeature):
+            raise AssertionError('Unable to insert feature')
+        if not (lyr.GetFeatureCount() == 1):
+            raise AssertionError('Failed to insert feature')
+        lyr.ResetReading()
+        bandMEM.Fill(0)  # ensure that no FIDs are left from previous writes
+        if not (
+                gdal.CPLE_None == gdal.RasterizeLayer(dsMEM, [1], lyr,
+                                                      options=[
+                                                          f'ALL_TOUCHED={all_touched}'.upper(),
+                                                          'ATTRIBUTE=FID_BURN'])
+        ):
+            raise AssertionError('Unable to rasterize layer')
+        is_fid = dsMEM.ReadAsArray() == 1
+        px_y, px_x = np.where(is_fid)
+        if len(px_y) > 0:
+            return px_y, px_x
+        else:
+            return None, None
+
+    # max. number of pixel steps along a line that are walked without rasterization
+    MAX_LINE_STEPS: int = 4096
+
+    def _fastPixelPositions(self,
+                            g: QgsGeometry,
+                            all_touched: bool = True) -> Optional[Tuple[Optional[np.ndarray], Optional[np.ndarray]]]:
+        """
+        Returns the pixel positions of (multi-)point geometries, of lines within a single pixel and,
+        if all_touched is True, of (multi-)lines that touch up to MAX_LINE_STEPS pixels.
+        Returns None, if the geometry needs to be rasterized.
+        """
+        flatType = QgsWkbTypes.flatType(g.wkbType())
+        if flatType in [Qgis.WkbType.Point, Qgis.WkbType.MultiPoint]:
+            vertices = [(v.x(), v.y()) for v in g.vertices()]
+            px_x, px_y = self.geo2pxArrays([v[0] for v in vertices], [v[1] for v in vertices])
+        elif g.type() == Qgis.GeometryType.Line:
+            bb = g.boundingBox()
+            px_x, px_y = self.geo2pxArrays([bb.xMinimum(), bb.xMaximum(), bb.xMinimum(), bb.xMaximum()],
+                                           [bb.yMinimum(), bb.yMinimum(), bb.yMaximum(), bb.yMaximum()])
+            if np.all(px_x == px_x[0]) and np.all(px_y == px_y[0]):
+                px_x, px_y = px_x[:1], px_y[:1]
+            elif all_touched:
+                px_x, px_y = self._linePixelPositions(g)
+                if px_x is None:
+                    return None
+            else:
+                return None
+        else:
+            return None
+
+        ns, nl = self.nSamples(), self.nLines()
+        is_in = (px_x >= 0) & (px_x < ns) & (px_y >= 0) & (px_y < nl)
+        if not np.any(is_in):
+            return None, None
+        # unique pixels in row-major order, same as returned for rasterized geometries
+        px_y, px_x = np.divmod(np.unique(px_y[is_in] * ns + px_x[is_in]), ns)
+        return px_y, px_x
+
+    def _linePixelPositions(self, g: QgsGeometry) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        # returns all pixels touched by a (multi-)line, or None, None if the line touches too many pixels
+        if g.constGet().hasCurvedSegments():
+            g = QgsGeometry(g.constGet().segmentize())
+        parts = g.asMultiPolyline() if g.isMultipart() else [g.asPolyline()]
+        m11, m21, m31, m12, m22, m32 = self.mGeo2Px
+
+        segments = []
+        for part in parts:
+            if len(part) == 0:
+                continue
+            x = np.asarray([p.x() for p in part], dtype=float)
+            y = np.asarray([p.y() for p in part], dtype=float)
+            # continuous pixel coordinates
+            segments.append((m11 * x + m21 * y + m31, m12 * x + m22 * y + m32))
+
+        n_steps = sum(int(np.abs(np.diff(np.floor(x))).sum() + np.abs(np.diff(np.floor(y))).sum())
+                      for x, y in segments)
+        if n_steps > self.MAX_LINE_STEPS:
+            return None, None
+
+        px_x, px_y = [], []
+        for x, y in segments:
+            if len(x) == 1:
+                px_x.append(math.floor(x[0]))
+                px_y.append(math.floor(y[0]))
+            for i in range(len(x) - 1):
+                cols, rows = _supercoverPixels(x[i], y[i], x[i + 1], y[i + 1])
+                px_x.extend(cols)
+                px_y.extend(rows)
+        return np.asarray(px_x, dtype=int), np.asarray(px_y, dtype=int)
+
+    def geometriesPixelPositions(self,
+                                 geometries: List[Union[QgsGeometry, QgsFeature]],
+                                 all_touched: bool = True,
+                                 ) -> List[Tuple[Optional[np.ndarray], Optional[np.ndarray]]]:
+        """
+        Returns the pixel positions of multiple geometries, as geometryPixelPositions does for single geometries.
+        Geometries that cannot be handled analytically are burned into a label raster with a single
+        GDAL call. Geometries whose pixel bounding boxes overlap are burned into separate label rasters.
+        The label rasters of the last call are cached and re-used for the same geometries.
+        :param geometries: list of QgsGeometries or QgsFeatures
+        :param all_touched: set True to return all pixels touched by a geometry
+        :return: list of (pixel y, pixel x) array tuples. (None, None) for geometries that do not cover any pixel.
+        """
+        results: List[Tuple[Optional[np.ndarray], Optional[np.ndarray]]] = [(None, None)] * len(geometries)
+        todo: List[Tuple[int, QgsGeometry]] = []
+        for i, g in enumerate(geometries):
+            if isinstance(g, QgsFeature):
+                g = g.geometry() if g.hasGeometry() else None
+            if not isinstance(g, QgsGeometry) or _geometryIsEmpty(g):
+                continue
+            positions = self._fastPixelPositions(g, all_touched=all_touched)
+            if positions is None:
+                todo.append((i, g))
             else:
-                return None, None
+                results[i] = positions
+
+        if len(todo) == 0:
+            return results
+
+        key = (bool(all_touched), tuple(g.asWkb().data() for _, g in todo))
+        if self.mLabelCache[0] == key:
+            labelRasters = self.mLabelCache[1]
         else:
-            bandMEM, lyr = self.memoryLayerBand(g)
-            bandMEM: gdal.Band
-            lyr: ogr.Layer
-            dsMEM: gdal.Dataset = bandMEM.GetDataset()
+            labelRasters = []
+            for group in self._nonOverlappingGroups([g for _, g in todo]):
+                labels = self._labelRaster([todo[j][1] for j in group], all_touched)
+                labelRasters.append((group, labels))
+            self.mLabelCache = (key, labelRasters)
+
+        for group, labels in labelRasters:
+            idx = np.flatnonzero(labels)
+            lab = labels.ravel()[idx]
+            # stable sort keeps the row-major order of pixels with the same label
+            order = np.argsort(lab, kind='stable')
+            idx, lab = idx[order], lab[order]
+            bounds = np.searchsorted(lab, np.arange(1, len(group) + 2))
+            for k, j in enumerate(group):
+                selected = idx[bounds[k]:bounds[k + 1]]
+                if len(selected) > 0:
+                    px_y, px_x = np.divmod(selected, labels.shape[1])
+                    results[todo[j][0]] = (px_y, px_x)
+        return results
+
+    def _nonOverlappingGroups(self, geometries: List[QgsGeometry]) -> List[List[int]]:
+        # groups geometry indices so that the pixel bounding boxes within a group do not overlap
+        bounds = np.empty((len(geometries), 4), dtype=int)
+        for i, g in enumerate(geometries):
+            bb = g.boundingBox()
+            px_x, px_y = self.geo2pxArrays([bb.xMinimum(), bb.xMaximum(), bb.xMinimum(), bb.xMaximum()],
+                                           [bb.yMinimum(), bb.yMinimum(), bb.yMaximum(), bb.yMaximum()])
+            bounds[i, :] = px_x.min(), px_x.max(), px_y.min(), px_y.max()
+
+        groups: List[List[int]] = []
+        for i in range(len(geometries)):
+            x0, x1, y0, y1 = bounds[i]
+            for group in groups:
+                gb = bounds[group]
+                if not np.any((gb[:, 0] <= x1) & (x0 <= gb[:, 1]) & (gb[:, 2] <= y1) & (y0 <= gb[:, 3])):
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        return groups
+
+    def _labelRaster(self, geometries: List[QgsGeometry], all_touched: bool) -> np.ndarray:
+        # burns the geometries into a raster with label = list index + 1
+        if (
+                not isinstance(self.srs, SpatialReference)
+                and isinstance(self.crs, QgsCoordinateReferenceSystem)
+        ):
+            self.srs = SpatialReference(self.crs.toWkt())
+
+        dsMEM: gdal.Dataset = gdal.GetDriverByName('MEM').Create('', self.nSamples(), self.nLines(), 1,
+                                                                 gdal.GDT_UInt32)
+        dsMEM.SetGeoTransform(self._geoTransform())
+        if isinstance(self.srs, SpatialReference):
+            dsMEM.SetSpatialRef(self.srs)
+
+        vsMEM: ogr.DataSource = ogr.GetDriverByName('Memory').CreateDataSource('')
+        lyr: ogr.Layer = vsMEM.CreateLayer('labels', srs=self.srs, geom_type=ogr.wkbUnknown)
+        lyr.CreateField(ogr.FieldDefn('LABEL', ogr.OFTInteger))
+        for label, g in enumerate(geometries, start=1):
             ogrFeature = ogr.Feature(lyr.GetLayerDefn())
-            ogrFeature.SetFID(1)
-            ogrFeature.SetField("FID_BURN", 1)
+            ogrFeature.SetField('LABEL', label)
             ogrFeature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(g.asWkb()))
-
-            if ogr.OGRERR_NONE != self._clearAndInsert(lyr, ogrFeature):
+            if ogr.OGRERR_NONE != lyr.CreateFeature(ogrFeature):
                 raise AssertionError('Unable to insert feature')
-            if not (lyr.GetFeatureCount() == 1):
-                raise AssertionError('Failed to insert feature')
-            lyr.ResetReading()
-            bandMEM.Fill(0)  # ensure that no FIDs are left from previous writes
-            if not (
-                    gdal.CPLE_None == gdal.RasterizeLayer(dsMEM, [1], lyr,
-                                                          options=[
-                                                              f'ALL_TOUCHED={all_touched}'.upper(),
-                                                              'ATTRIBUTE=FID_BURN'])
-            ):
-                raise AssertionError('Unable to rasterize layer')
-            is_fid = dsMEM.ReadAsArray() == 1
-            px_y, px_x = np.where(is_fid)
-            if len(px_y) > 0:
-                return px_y, px_x
-            else:
-                return None, None
+
+        if not (
+                gdal.CPLE_None == gdal.RasterizeLayer(dsMEM, [1], lyr,
+                                                      options=[f'ALL_TOUCHED={all_touched}'.upper(),
+                                                               'ATTRIBUTE=LABEL'])
+        ):
+            raise AssertionError('Unable to rasterize layer')
+        return dsMEM.ReadAsArray()
 
     def _clearAndInsert(self, lyr: ogr.Layer, ogrFeature: ogr.Feature):
         for feature in lyr:
@@ -3603,13 +4047,12 @@ def rasterizeFeatures(
             tileRequest.setInvalidGeometryCheck(QgsFeatureRequest.InvalidGeometryCheck.GeometrySkipInvalid)
             tileRequest.setFilterFids(fids)
 
-            for feature in featureSource.getFeatures(tileRequest):
-                fid = feature.id()
+            features = list(featureSource.getFeatures(tileRequest))
+            # pixel coordinates of tile subset / in array
+            positions = MG2PX.geometriesPixelPositions(features, all_touched=all_touched)
 
-                # pixel coordinates of tile subset / in array
-                iy, ix = MG2PX.geometryPixelPositions(feature.geometry(),
-                                                      burn_points=True,
-                                                      all_touched=all_touched)
+            for feature, (iy, ix) in zip(features, positions):
+                fid = feature.id()
 
                 if iy is None:
                     # no pixels covered by this feature
@@ -3809,6 +4252,550 @@ def rasterArray(rasterInterface: Union[QgsRasterInterface, str, QgsRasterLayer],
         return result_array
 
 
+class RasterLayerSnapshot(object):
+    """
+    The properties of a raster layer that are required to read its pixels in another thread.
+    A snapshot needs to be created in the thread the layer lives in. It can be used instead of
+    the layer by rasterPixelWindow, rasterTransectPixels, rasterPolygonPixels and the RasterBlockCache,
+    which reads its pixels with a data provider owned by the reading thread.
+    """
+
+    def __init__(self, layer: QgsRasterLayer):
+        if not (isinstance(layer, QgsRasterLayer) and layer.isValid()):
+            raise AssertionError('Requires a valid QgsRasterLayer')
+        dp: QgsRasterDataProvider = layer.dataProvider()
+        self.mId: str = layer.id()
+        self.mName: str = layer.name()
+        self.mSource: str = layer.source()
+        self.mProviderType: str = layer.providerType()
+        self.mCrs = QgsCoordinateReferenceSystem(layer.crs())
+        self.mExtent = QgsRectangle(layer.extent())
+        self.mWidth: int = layer.width()
+        self.mHeight: int = layer.height()
+        self.mBandCount: int = layer.bandCount()
+        self.mResX: float = layer.rasterUnitsPerPixelX()
+        self.mResY: float = layer.rasterUnitsPerPixelY()
+        self.mDataTypeSize: int = dp.dataTypeSize(1)
+        self.mNoDataValues: Dict[int, List[Union[int, float]]] = noDataValues(dp)
+        # remove cached tiles of the source if the layer data changes
+        RasterBlockCache._connectLayer(layer)
+
+    def id(self) -> str:
+        return self.mId
+
+    def name(self) -> str:
+        return self.mName
+
+    def source(self) -> str:
+        return self.mSource
+
+    def providerType(self) -> str:
+        return self.mProviderType
+
+    def crs(self) -> QgsCoordinateReferenceSystem:
+        return QgsCoordinateReferenceSystem(self.mCrs)
+
+    def extent(self) -> QgsRectangle:
+        return QgsRectangle(self.mExtent)
+
+    def width(self) -> int:
+        return self.mWidth
+
+    def height(self) -> int:
+        return self.mHeight
+
+    def bandCount(self) -> int:
+        return self.mBandCount
+
+    def rasterUnitsPerPixelX(self) -> float:
+        return self.mResX
+
+    def rasterUnitsPerPixelY(self) -> float:
+        return self.mResY
+
+    def dataTypeSize(self) -> int:
+        return self.mDataTypeSize
+
+    def noDataValues(self) -> Dict[int, List[Union[int, float]]]:
+        return {b: v[:] for b, v in self.mNoDataValues.items()}
+
+
+def rasterPixelWindow(layer: QgsRasterLayer, rect: QgsRectangle) -> Optional[QRect]:
+    """
+    Returns the pixel window of all pixels whose centers are within a rectangle.
+    If the rectangle has no width or height, e.g. for a single point, the window
+    contains the pixel(s) the rectangle is located in.
+    :param layer: QgsRasterLayer or RasterLayerSnapshot
+    :param rect: QgsRectangle in layer CRS coordinates
+    :return: QRect in pixel coordinates or None, if the window does not overlap the raster
+    """
+    e = layer.extent()
+    resX = layer.rasterUnitsPerPixelX()
+    resY = layer.rasterUnitsPerPixelY()
+
+    def bounds(f0: float, f1: float) -> Tuple[int, int]:
+        if f1 > f0:
+            return math.ceil(f0 - 0.5), math.ceil(f1 - 0.5)
+        i0 = math.floor(f0)
+        return i0, i0 + 1
+
+    x0, x1 = bounds((rect.xMinimum() - e.xMinimum()) / resX, (rect.xMaximum() - e.xMinimum()) / resX)
+    y0, y1 = bounds((e.yMaximum() - rect.yMaximum()) / resY, (e.yMaximum() - rect.yMinimum()) / resY)
+    x0, x1 = max(x0, 0), min(x1, layer.width())
+    y0, y1 = max(y0, 0), min(y1, layer.height())
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return QRect(x0, y0, x1 - x0, y1 - y0)
+
+
+def rasterPixelWindowExtent(layer: QgsRasterLayer, window: QRect) -> QgsRectangle:
+    """
+    Returns the spatial extent of a pixel window, as returned by rasterPixelWindow.
+    """
+    e = layer.extent()
+    resX = layer.rasterUnitsPerPixelX()
+    resY = layer.rasterUnitsPerPixelY()
+    return QgsRectangle(e.xMinimum() + window.x() * resX,
+                        e.yMaximum() - (window.y() + window.height()) * resY,
+                        e.xMinimum() + (window.x() + window.width()) * resX,
+                        e.yMaximum() - window.y() * resY)
+
+
+def _supercoverPixels(x0: float, y0: float, x1: float, y1: float) -> Tuple[List[int], List[int]]:
+    """
+    Returns all grid cells touched by the segment between the continuous pixel coordinates (x0, y0) and (x1, y1),
+    ordered from start to end. Cells are walked one grid line crossing after the other (Amanatides & Woo).
+    If the segment passes exactly through a cell corner, both cells adjacent to the corner are included.
+    :return: pixel columns, pixel rows
+    """
+    ix, iy = math.floor(x0), math.floor(y0)
+    ix1, iy1 = math.floor(x1), math.floor(y1)
+    dx, dy = x1 - x0, y1 - y0
+    stepX = 1 if dx > 0 else -1
+    stepY = 1 if dy > 0 else -1
+    # segment parameter t in [0, 1] needed to cross one cell, and to reach the next vertical / horizontal grid line
+    tDeltaX = abs(1. / dx) if dx != 0 else math.inf
+    tDeltaY = abs(1. / dy) if dy != 0 else math.inf
+    tMaxX = ((ix + 1 - x0) if dx > 0 else (x0 - ix)) * tDeltaX if dx != 0 else math.inf
+    tMaxY = ((iy + 1 - y0) if dy > 0 else (y0 - iy)) * tDeltaY if dy != 0 else math.inf
+
+    cols, rows = [ix], [iy]
+    for _ in range(abs(ix1 - ix) + abs(iy1 - iy)):
+        if (ix, iy) == (ix1, iy1):
+            break
+        if tMaxX < tMaxY:
+            ix += stepX
+            tMaxX += tDeltaX
+        elif tMaxY < tMaxX:
+            iy += stepY
+            tMaxY += tDeltaY
+        else:
+            # corner crossing
+            cols.extend([ix + stepX, ix])
+            rows.extend([iy, iy + stepY])
+            ix += stepX
+            iy += stepY
+            tMaxX += tDeltaX
+            tMaxY += tDeltaY
+        cols.append(ix)
+        rows.append(iy)
+    return cols, rows
+
+
+def rasterTransectPixels(layer: Union[QgsRasterLayer, RasterLayerSnapshot],
+                         line: QgsGeometry) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the pixels along a line, ordered by their first occurrence along the line.
+    Each line segment is walked from grid line to grid line, so that every pixel touched by the line
+    is returned exactly once (supercover), independent of the segment length.
+    :param layer: QgsRasterLayer or RasterLayerSnapshot
+    :param line: QgsGeometry (multi)line in layer CRS coordinates
+    :return: pixel columns, pixel rows
+    """
+    e = layer.extent()
+    resX = layer.rasterUnitsPerPixelX()
+    resY = layer.rasterUnitsPerPixelY()
+
+    if line.constGet().hasCurvedSegments():
+        line = QgsGeometry(line.constGet().segmentize())
+    parts = line.asMultiPolyline() if line.isMultipart() else [line.asPolyline()]
+
+    px_x, px_y = [], []
+    for part in parts:
+        if len(part) == 0:
+            continue
+        x = [(p.x() - e.xMinimum()) / resX for p in part]
+        y = [(e.yMaximum() - p.y()) / resY for p in part]
+        if len(part) == 1:
+            px_x.append(math.floor(x[0]))
+            px_y.append(math.floor(y[0]))
+        for i in range(len(part) - 1):
+            cols, rows = _supercoverPixels(x[i], y[i], x[i + 1], y[i + 1])
+            px_x.extend(cols)
+            px_y.extend(rows)
+
+    if len(px_x) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    px_x = np.asarray(px_x, dtype=int)
+    px_y = np.asarray(px_y, dtype=int)
+    # remove positions outside the raster
+    is_inside = (px_x >= 0) & (px_x < layer.width()) & (px_y >= 0) & (px_y < layer.height())
+    px_x, px_y = px_x[is_inside], px_y[is_inside]
+
+    # unique pixels in order of first occurrence
+    _, i_first = np.unique(px_y * layer.width() + px_x, return_index=True)
+    i_first = np.sort(i_first)
+    return px_x[i_first], px_y[i_first]
+
+
+def rasterPolygonPixels(layer: Union[QgsRasterLayer, RasterLayerSnapshot],
+                        polygon: QgsGeometry,
+                        all_touched: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the pixels within a polygon in row-major order.
+    :param layer: QgsRasterLayer or RasterLayerSnapshot
+    :param polygon: QgsGeometry (multi)polygon in layer CRS coordinates
+    :param all_touched: if True, returns all pixels touched by the polygon.
+                        Otherwise only pixels whose center is within the polygon.
+    :return: pixel columns, pixel rows
+    """
+    empty = np.empty(0, dtype=int), np.empty(0, dtype=int)
+    e = layer.extent()
+    resX = layer.rasterUnitsPerPixelX()
+    resY = layer.rasterUnitsPerPixelY()
+
+    bbox = polygon.boundingBox()
+    x0 = max(0, math.floor((bbox.xMinimum() - e.xMinimum()) / resX))
+    x1 = min(layer.width(), math.ceil((bbox.xMaximum() - e.xMinimum()) / resX))
+    y0 = max(0, math.floor((e.yMaximum() - bbox.yMaximum()) / resY))
+    y1 = min(layer.height(), math.ceil((e.yMaximum() - bbox.yMinimum()) / resY))
+    if x1 <= x0 or y1 <= y0:
+        return empty
+
+    window = QRect(x0, y0, x1 - x0, y1 - y0)
+    MG2P = MapGeometryToPixel.fromExtent(rasterPixelWindowExtent(layer, window),
+                                         window.width(), window.height(),
+                                         mapUnitsPerPixel=resX,
+                                         crs=layer.crs())
+    i_y, i_x = MG2P.geometryPixelPositions(polygon, all_touched=all_touched)
+    if not isinstance(i_x, np.ndarray):
+        return empty
+    return i_x + x0, i_y + y0
+
+
+class RasterBlockCache(object):
+    """
+    A process-wide LRU cache of raster tiles.
+
+    Tiles are aligned to the pixel grid of a raster source, have a size of
+    tileSize(layer) x tileSize(layer) pixels and contain the values of all bands in an array of
+    shape (bands, tile height, tile width). The tile size decreases with the number of bands,
+    so that a single tile does not use more than tileBytes() bytes. Tiles are shared by all layers with the same source
+    and data provider and are removed if a layer emits dataChanged or is deleted.
+    Tiles of a QgsRasterLayer are read with its data provider. Tiles of a RasterLayerSnapshot are read
+    with a data provider that is created from the layer source by and for the reading thread.
+    If the memory used by all tiles exceeds the memory budget, the least recently used tiles are removed.
+    """
+    TILE_SIZE: int = 256
+    MIN_TILE_SIZE: int = 16
+    TILE_BYTES: int = 2 * 2 ** 20  # bytes
+    MEMORY_BUDGET: int = 256 * 2 ** 20  # bytes
+
+    _LOCK = threading.RLock()
+    _TILES: Dict[Tuple[Tuple[str, str], int, int, int], np.ndarray] = dict()
+    _NBYTES: int = 0
+    _CONNECTED: Set[str] = set()
+    _THREAD_PROVIDERS = threading.local()
+    _PROVIDER_VERSIONS: Dict[Tuple[str, str], int] = dict()
+    # number of provider reads, i.e. of tiles or windows not served from the cache
+    _READS: int = 0
+
+    @classmethod
+    def tileSize(cls, layer: Optional[QgsRasterLayer] = None) -> int:
+        """
+        Returns the maximum tile size in pixels or, if a layer is given, the tile size used for the layer.
+        """
+        if isinstance(layer, RasterLayerSnapshot):
+            itemsize = layer.dataTypeSize()
+        elif isinstance(layer, QgsRasterLayer):
+            itemsize = layer.dataProvider().dataTypeSize(1)
+        else:
+            return cls.TILE_SIZE
+        nbytes = max(1, layer.bandCount() * itemsize)
+        size = int(math.sqrt(cls.TILE_BYTES / nbytes))
+        return max(1, min(cls.TILE_SIZE, max(cls.MIN_TILE_SIZE, size)))
+
+    @classmethod
+    def setTileSize(cls, tileSize: int):
+        """
+        Sets the maximum tile size in pixels. Removes all cached tiles.
+        """
+        if not tileSize > 0:
+            raise AssertionError('tileSize must be > 0')
+        cls.TILE_SIZE = int(tileSize)
+        cls.clear()
+
+    @classmethod
+    def tileBytes(cls) -> int:
+        return cls.TILE_BYTES
+
+    @classmethod
+    def setTileBytes(cls, nbytes: int):
+        """
+        Sets the number of bytes a single tile should not exceed. Removes all cached tiles.
+        """
+        if not nbytes > 0:
+            raise AssertionError('tile bytes must be > 0')
+        cls.TILE_BYTES = int(nbytes)
+        cls.clear()
+
+    @classmethod
+    def memoryBudget(cls) -> int:
+        return cls.MEMORY_BUDGET
+
+    @classmethod
+    def setMemoryBudget(cls, nbytes: int):
+        """
+        Sets the maximum number of bytes used by cached tiles.
+        """
+        if not nbytes >= 0:
+            raise AssertionError('memory budget must be >= 0')
+        cls.MEMORY_BUDGET = int(nbytes)
+        with cls._LOCK:
+            cls._evict()
+
+    @classmethod
+    def memoryUsage(cls) -> int:
+        """
+        Returns the number of bytes used by cached tiles.
+        """
+        return cls._NBYTES
+
+    @classmethod
+    def readCount(cls) -> int:
+        """
+        Returns the number of blocks that have been read from data providers, i.e. that were not cached.
+        """
+        return cls._READS
+
+    @staticmethod
+    def sourceKey(layer: QgsRasterLayer) -> Tuple[str, str]:
+        return layer.source(), layer.providerType()
+
+    @classmethod
+    def threadProvider(cls, layer: Union[QgsRasterLayer, RasterLayerSnapshot]) -> Optional[QgsRasterDataProvider]:
+        """
+        Returns a data provider for the layer source that is owned by the calling thread.
+        The provider is created from the layer source on first use and re-used by later calls
+        in the same thread, until the source is invalidated.
+        :return: QgsRasterDataProvider or None, if the source can not be opened
+        """
+        key = cls.sourceKey(layer)
+        with cls._LOCK:
+            version = cls._PROVIDER_VERSIONS.get(key, 0)
+        providers: Dict[Tuple[str, str], Tuple[int, QgsRasterDataProvider]] = \
+            cls._THREAD_PROVIDERS.__dict__.setdefault('providers', dict())
+        if key in providers and providers[key][0] == version:
+            return providers[key][1]
+        providers.pop(key, None)
+        provider = QgsProviderRegistry.instance().createProvider(key[1], key[0], QgsDataProvider.ProviderOptions())
+        if not (isinstance(provider, QgsRasterDataProvider) and provider.isValid()):
+            return None
+        providers[key] = (version, provider)
+        return provider
+
+    @classmethod
+    def _readingProvider(cls,
+                         layer: Union[QgsRasterLayer, RasterLayerSnapshot],
+                         provider: Optional[QgsRasterDataProvider] = None) -> Optional[QgsRasterDataProvider]:
+        if provider is None:
+            if isinstance(layer, QgsRasterLayer):
+                provider = layer.dataProvider()
+            else:
+                provider = cls.threadProvider(layer)
+        return provider
+
+    @classmethod
+    def _connectLayer(cls, layer: QgsRasterLayer):
+        lid = layer.id()
+        if lid in cls._CONNECTED:
+            return
+        cls._CONNECTED.add(lid)
+        key = cls.sourceKey(layer)
+        layer.dataChanged.connect(lambda *args, _key=key: cls.invalidateSource(_key))
+        layer.willBeDeleted.connect(lambda *args, _key=key, _lid=lid: cls._onLayerDeleted(_key, _lid))
+
+    @classmethod
+    def _onLayerDeleted(cls, key: Tuple[str, str], lid: str):
+        cls.invalidateSource(key)
+        with cls._LOCK:
+            cls._CONNECTED.discard(lid)
+
+    @classmethod
+    def _evict(cls, keepLast: bool = False):
+        # remove the least recently used tiles, i.e. the first ones in the dictionary
+        nMin = 1 if keepLast else 0
+        while cls._NBYTES > cls.MEMORY_BUDGET and len(cls._TILES) > nMin:
+            cls._NBYTES -= cls._TILES.pop(next(iter(cls._TILES))).nbytes
+
+    @classmethod
+    def invalidateSource(cls, source: Union[QgsRasterLayer, Tuple[str, str]]):
+        """
+        Removes all cached tiles of a raster source
+        """
+        if isinstance(source, QgsRasterLayer):
+            source = cls.sourceKey(source)
+        with cls._LOCK:
+            for k in [k for k in cls._TILES.keys() if k[0] == source]:
+                cls._NBYTES -= cls._TILES.pop(k).nbytes
+            # let threads re-open their providers of this source
+            cls._PROVIDER_VERSIONS[source] = cls._PROVIDER_VERSIONS.get(source, 0) + 1
+
+    @classmethod
+    def clear(cls):
+        """
+        Removes all cached tiles
+        """
+        with cls._LOCK:
+            cls._TILES.clear()
+            cls._NBYTES = 0
+
+    @classmethod
+    def tile(cls,
+             layer: Union[QgsRasterLayer, RasterLayerSnapshot],
+             tx: int, ty: int,
+             provider: Optional[QgsRasterDataProvider] = None) -> Optional[np.ndarray]:
+        """
+        Returns the tile at tile position (tx, ty) as numpy array of shape (bands, height, width).
+        Tiles at the right and bottom raster border can be smaller than tileSize(layer) x tileSize(layer).
+        :param layer: QgsRasterLayer or RasterLayerSnapshot
+        :param tx: tile column
+        :param ty: tile row
+        :param provider: QgsRasterDataProvider to read missing tiles with.
+                         Defaults to the layer's data provider or, for a RasterLayerSnapshot,
+                         to the threadProvider() of the calling thread.
+        :return: numpy.ndarray or None, if the tile is outside the raster
+        """
+        T = cls.tileSize(layer)
+        key = (cls.sourceKey(layer), T, tx, ty)
+        with cls._LOCK:
+            array = cls._TILES.pop(key, None)
+            if array is not None:
+                cls._TILES[key] = array
+                return array
+
+        x0, y0 = tx * T, ty * T
+        w = min(T, layer.width() - x0)
+        h = min(T, layer.height() - y0)
+        if tx < 0 or ty < 0 or w <= 0 or h <= 0:
+            return None
+
+        provider = cls._readingProvider(layer, provider)
+        if provider is None:
+            return None
+        with cls._LOCK:
+            cls._READS += 1
+        array = rasterArray(provider, rect=QRect(x0, y0, w, h))
+        if not isinstance(array, np.ndarray):
+            return None
+        array.flags.writeable = False
+
+        with cls._LOCK:
+            if key not in cls._TILES:
+                cls._NBYTES += array.nbytes
+            else:
+                cls._NBYTES += array.nbytes - cls._TILES.pop(key).nbytes
+            cls._TILES[key] = array
+            if isinstance(layer, QgsRasterLayer):
+                cls._connectLayer(layer)
+            cls._evict(keepLast=True)
+        return array
+
+    @classmethod
+    def readWindow(cls,
+                   layer: Union[QgsRasterLayer, RasterLayerSnapshot],
+                   rect: QRect,
+                   provider: Optional[QgsRasterDataProvider] = None,
+                   cached: bool = True) -> Optional[np.ndarray]:
+        """
+        Returns the pixel values within a pixel window as numpy array of shape (bands, height, width).
+        The window is clipped to the raster extent.
+        :param layer: QgsRasterLayer or RasterLayerSnapshot
+        :param rect: QRect in pixel coordinates. Upper-Left pixel = (0,0)
+        :param provider: optional QgsRasterDataProvider to read missing tiles with
+        :param cached: set False to read the window only, without reading and caching the tiles it overlaps.
+                       Use this for small windows that are unlikely to be read again, e.g. a profile kernel.
+        :return: numpy.ndarray or None, if the window does not intersect with the raster
+        """
+        x0, y0 = max(0, rect.x()), max(0, rect.y())
+        x1 = min(layer.width(), rect.x() + rect.width())
+        y1 = min(layer.height(), rect.y() + rect.height())
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        if not cached:
+            provider = cls._readingProvider(layer, provider)
+            if provider is None:
+                return None
+            with cls._LOCK:
+                cls._READS += 1
+            array = rasterArray(provider, rect=QRect(x0, y0, x1 - x0, y1 - y0))
+            return array if isinstance(array, np.ndarray) else None
+
+        T = cls.tileSize(layer)
+        result: Optional[np.ndarray] = None
+        for ty in range(y0 // T, (y1 - 1) // T + 1):
+            for tx in range(x0 // T, (x1 - 1) // T + 1):
+                tile = cls.tile(layer, tx, ty, provider=provider)
+                if tile is None:
+                    return None
+                if result is None:
+                    result = np.empty((tile.shape[0], y1 - y0, x1 - x0), dtype=tile.dtype)
+                tx0, ty0 = tx * T, ty * T
+                ox0, ox1 = max(x0, tx0), min(x1, tx0 + tile.shape[2])
+                oy0, oy1 = max(y0, ty0), min(y1, ty0 + tile.shape[1])
+                result[:, oy0 - y0:oy1 - y0, ox0 - x0:ox1 - x0] = tile[:, oy0 - ty0:oy1 - ty0, ox0 - tx0:ox1 - tx0]
+        return result
+
+    @classmethod
+    def readPixels(cls,
+                   layer: Union[QgsRasterLayer, RasterLayerSnapshot],
+                   px_x: np.ndarray,
+                   px_y: np.ndarray,
+                   provider: Optional[QgsRasterDataProvider] = None) -> Optional[np.ndarray]:
+        """
+        Returns the values of single pixels as numpy array of shape (bands, number of pixels).
+        :param layer: QgsRasterLayer or RasterLayerSnapshot
+        :param px_x: pixel columns
+        :param px_y: pixel rows
+        :param provider: optional QgsRasterDataProvider to read missing tiles with
+        :return: numpy.ndarray or None, if a pixel is outside the raster
+        """
+        px_x = np.asarray(px_x, dtype=int).ravel()
+        px_y = np.asarray(px_y, dtype=int).ravel()
+        if px_x.shape != px_y.shape:
+            raise AssertionError(f'Differing shapes: {px_x.shape} vs. {px_y.shape}')
+        if px_x.size == 0:
+            return None
+        if px_x.min() < 0 or px_y.min() < 0 or px_x.max() >= layer.width() or px_y.max() >= layer.height():
+            return None
+
+        T = cls.tileSize(layer)
+        tile_x = px_x // T
+        tile_y = px_y // T
+        result: Optional[np.ndarray] = None
+        for tx, ty in set(zip(tile_x.tolist(), tile_y.tolist())):
+            tile = cls.tile(layer, tx, ty, provider=provider)
+            if tile is None:
+                return None
+            if result is None:
+                result = np.empty((tile.shape[0], px_x.size), dtype=tile.dtype)
+            is_tile = np.where((tile_x == tx) & (tile_y == ty))[0]
+            result[:, is_tile] = tile[:, px_y[is_tile] - ty * T, px_x[is_tile] - tx * T]
+        return result
+
+
 def setToolButtonDefaultActionMenu(toolButton: QToolButton, actions: List[QAction]):
     if isinstance(toolButton, QAction):
         for btn in toolButton.parent().findChildren(QToolButton):
@@ -4,9 +4,11 @@ import re
 import unittest
 from typing import List
 
+import numpy as np
+
 from qgis.core import Qgis, QgsCoordinateReferenceSystem, QgsFeature, QgsVectorLayerExporter
 from qps.speclib.core import is_spectral_feature
-from qps.speclib.io.asd import ASDBinaryFile, ASDCSVFile
+from qps.speclib.io.asd import ASD_HEADER_DTYPE, ASDBinaryFile, ASDBinaryFileBatch, ASDCSVFile
 from qps.testing import TestCase, start_app
 from qps.utils import file_search
 
@@ -67,6 +69,44 @@ class TestSpeclibIO_ASD(TestCase):
             for p in profiles:
                 self.assertTrue(is_spectral_feature(p))
 
+    def test_read_asd_batch(self):
+
+        files = self.asdBinFiles()
+        invalid = self.createTestOutputDirectory() / 'invalid.asd'
+        with open(invalid, 'wb') as f:
+            f.write(b'as7 no header')
+        paths = files + [invalid]
+
+        batch = ASDBinaryFileBatch(paths)
+        self.assertEqual(len(paths), len(batch))
+        self.assertEqual(ASD_HEADER_DTYPE, batch.headers().dtype)
+        self.assertEqual(len(paths), len(batch.headers()))
+        self.assertIsInstance(batch.error(len(paths) - 1), str)
+
+        for i, file in enumerate(files):
+            self.assertIsNone(batch.error(i))
+            asd1 = ASDBinaryFile(file)
+            asd2 = ASDBinaryFile(file, batch=batch, index=i)
+            self.assertTrue(np.array_equal(asd1.Spectrum, batch.spectrum(i)))
+            self.assertTrue(np.array_equal(asd1.xValues(), batch.xValues(i)))
+            self.assertEqual(asd1.ReferenceFlag, batch.reference(i) is not None)
+            for asd in [asd1, asd2]:
+                self.assertEqual(asd.mTargetTime, batch.targetTime(i))
+                self.assertEqual(asd.mReferenceTime, batch.referenceTime(i))
+                self.assertEqual(asd.mTargetCoordinate, batch.targetCoordinate(i))
+            if asd1.ReferenceFlag:
+                self.assertTrue(np.array_equal(asd1.Reference, asd2.Reference))
+
+        results = ASDBinaryFile.readFiles(paths)
+        self.assertEqual(len(paths), len(results))
+        for profiles, error in results[:-1]:
+            self.assertIsNone(error)
+            self.assertEqual(1, len(profiles))
+            self.assertTrue(is_spectral_feature(profiles[0]))
+        profiles, error = results[-1]
+        self.assertEqual([], profiles)
+        self.assertIsInstance(error, str)
+
     def asdBinFiles(self) -> List[str]:
         import qpstestdata
         ASD_DIR = pathlib.Path(qpstestdata.__file__).parent / 'asd'
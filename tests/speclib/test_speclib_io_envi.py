@@ -4,9 +4,11 @@ import unittest
 
 import numpy as np
 
+from qps.speclib import FIELD_VALUES
 from qps.speclib.core import is_spectral_feature, profile_field_names
-from qps.speclib.core.spectralprofile import decodeProfileValueDict
-from qps.speclib.io.envi import findENVIHeader, EnviSpectralLibraryReader, EnviSpectralLibraryWriter
+from qps.speclib.core.spectralprofile import decodeProfileValueDict, encodeProfileValueDict
+from qps.speclib.io.envi import findENVIHeader, EnviSpectralLibraryReader, EnviSpectralLibraryWriter, \
+    readENVIHeader, readENVIProfiles
 from qps.testing import start_app, TestCase, TestObjects
 from qpstestdata import enmap, envi_sli as envi_sli_path
 
@@ -87,6 +89,45 @@ class TestSpeclibIO_ENVI(TestCase):
                     dump = json.dumps(data, sort_keys=True, ensure_ascii=False)
                     self.assertTrue(dump in p_jsons_in)
 
+    def test_ENVI_memmap(self):
+        hdr = readENVIHeader(envi_sli_path, typeConversion=True)
+        array = readENVIProfiles(envi_sli_path)
+        self.assertIsInstance(array, np.memmap)
+        self.assertEqual((hdr['lines'], hdr['samples']), array.shape)
+
+        reader = EnviSpectralLibraryReader(envi_sli_path)
+        reader.CHUNK_SIZE = 3
+        profiles = reader.asFeatures()
+        self.assertEqual(array.shape[0], len(profiles))
+        for i, p in enumerate(profiles):
+            data = decodeProfileValueDict(p.attribute(FIELD_VALUES))
+            self.assertEqual(array[i, :].tolist(), list(data['y']))
+        del array
+
+        # integer profiles, followed by float profiles in a later chunk
+        speclib = TestObjects.createSpectralLibrary(n=5, n_bands=[10])
+        field_name = profile_field_names(speclib)[0]
+        profiles = list(speclib.getFeatures())
+        for i, p in enumerate(profiles):
+            data = decodeProfileValueDict(p.attribute(field_name))
+            y = np.arange(len(data['y'])) + i
+            data['y'] = (y + 0.5 if i == 4 else y).tolist()
+            p.setAttribute(field_name, encodeProfileValueDict(data, p.fields().field(field_name)))
+
+        path = self.createTestOutputDirectory() / 'exampleENVI_chunks.sli'
+        writer = EnviSpectralLibraryWriter(path, field=field_name)
+        writer.CHUNK_SIZE = 2
+        files = writer.writeFeatures(path, profiles)
+        self.assertEqual(1, len(files))
+
+        array = readENVIProfiles(files[0])
+        self.assertEqual(np.float64, array.dtype)
+        self.assertEqual((5, 10), array.shape)
+        for i, p in enumerate(profiles):
+            data = decodeProfileValueDict(p.attribute(field_name))
+            self.assertEqual(data['y'], array[i, :].tolist())
+        del array
+
 
 if __name__ == '__main__':
     unittest.main(buffer=False)
@@ -1,4 +1,5 @@
 # noinspection PyPep8Naming
+import os
 import re
 import unittest
 from datetime import datetime
@@ -13,7 +14,8 @@ from qps.speclib.core.spectralprofile import decodeProfileValueDict, SpectralPro
 from qps.speclib.io.asd import ASDBinaryFile
 from qps.speclib.io.spectralevolution import SEDFile
 from qps.speclib.io.svc import SVCSigFile
-from qps.speclib.processing.importspectralprofiles import ImportSpectralProfiles
+from qps.speclib.processing.importspectralprofiles import ImportSpectralProfiles, payload_profiles, \
+    ProfileReaderSniffer, profiles_payload, read_profiles
 from qps.testing import start_app, TestCase, TestObjects
 from qps.utils import file_search
 from qpstestdata import DIR_TESTDATA
@@ -69,6 +71,70 @@ class TestSpeclibIO_SpectralProfileReaders(TestCase):
         self.assertTrue(is_spectral_library(lyr))
         self.assertTrue(lyr.featureCount() > 0)
 
+    def test_ProfileReaderSniffer(self):
+
+        ProfileReaderSniffer.clear()
+        expected = {'.asd': ASDBinaryFile, '.sed': SEDFile, '.sig': SVCSigFile}
+        for file in self.profileFiles():
+            header = ProfileReaderSniffer.readHeader(file)
+            self.assertTrue(0 < len(header) <= ProfileReaderSniffer.HEADER_SIZE)
+            reader = ProfileReaderSniffer.findReader(file)
+            self.assertEqual(reader, expected[os.path.splitext(file)[1]], msg=file)
+
+        # the file content has to match the file signature
+        test_dir = self.createTestOutputDirectory() / 'sniffing'
+        os.makedirs(test_dir, exist_ok=True)
+        path = test_dir / 'not_an_asd_file.asd'
+        with open(path, 'w') as f:
+            f.write('no ASD binary file')
+        self.assertFalse(ASDBinaryFile.sniffFile(path, ProfileReaderSniffer.readHeader(path)))
+        self.assertIsNone(ProfileReaderSniffer.findReader(path))
+
+    def test_profiles_payload(self):
+
+        for file in self.profileFiles():
+            features, error = read_profiles(file)
+            self.assertTrue(error is None, msg=error)
+            groups = payload_profiles(profiles_payload(features))
+            features2 = [f for group in groups for f in group]
+            self.assertEqual(len(features2), len(features))
+            for f1, f2 in zip(features, features2):
+                self.assertEqual(f1.fields().names(), f2.fields().names())
+                self.assertEqual(profile_field_names(f1), profile_field_names(f2))
+                self.assertEqual(f1.hasGeometry(), f2.hasGeometry())
+                for name in profile_field_names(f1):
+                    self.assertEqual(decodeProfileValueDict(f1.attribute(name)),
+                                     decodeProfileValueDict(f2.attribute(name)))
+
+    def test_import_files_parallel(self):
+
+        from processing import run
+        # ENVI (with CSV sidecar) and GeoJSON are read via QgsVectorLayer and need QGIS in the workers
+        files = self.profileFiles() + [str(qpstestdata.envi_sli), str(qpstestdata.speclib_geojson)]
+        paths = []
+        profiles = []
+        for n_workers in [1, 2]:
+            alg = ImportSpectralProfiles()
+            alg.initAlgorithm({})
+            par = {
+                ImportSpectralProfiles.P_INPUT: files,
+                ImportSpectralProfiles.P_WORKERS: n_workers,
+            }
+            context, feedback = self.createProcessingContextFeedback()
+            results = run(alg, par, context=context, feedback=feedback)
+            lyr = results[alg.P_OUTPUT]
+            self.assertTrue(is_spectral_library(lyr))
+            features = list(lyr.getFeatures())
+            self.assertGreater(len(features), 0)
+            paths.append([f.attribute(SpectralProfileFileReader.KEY_Path) for f in features])
+            # compare string representations, NaN values are not equal to themselves
+            profiles.append([[str(decodeProfileValueDict(f.attribute(n))) for n in profile_field_names(f)]
+                             for f in features])
+        # profiles are written in the same order
+        self.assertEqual(paths[0], paths[1])
+        # and workers do not lose profiles of readers that use QgsVectorLayer
+        self.assertEqual(profiles[0], profiles[1])
+
     def test_readFiles(self):
 
         for file in self.profileFiles():
@@ -0,0 +1,56 @@
+import re
+import unittest
+
+import numpy as np
+
+from qps.speclib.io.textdata import find_data_section, parse_metadata, parse_numeric_block
+from qps.testing import start_app, TestCase
+
+start_app()
+
+
+class TestSpeclibIO_TextData(TestCase):
+
+    def test_find_data_section(self):
+        text = 'name= profile\nunits= nm\ndata= \n400 1.5\n401 1.6\n'
+
+        header, data = find_data_section(text, re.compile(r'^data=', re.M))
+        self.assertEqual('name= profile\nunits= nm\ndata=', header)
+        self.assertEqual(' \n400 1.5\n401 1.6\n', data)
+
+        header, data = find_data_section(text, re.compile(r'^(?P<data>400)', re.M))
+        self.assertTrue(header.endswith('data= \n'))
+        self.assertTrue(data.startswith('400 1.5'))
+
+        header, data = find_data_section(text, re.compile(r'^Wvl', re.M))
+        self.assertEqual(text, header)
+        self.assertEqual('', data)
+
+        md = parse_metadata(text, re.compile(r'^(?P<key>[^=\n]+)=(?P<value>.*)$', re.M))
+        self.assertEqual({'name': 'profile', 'units': 'nm', 'data': ''}, md)
+        md = parse_metadata(text, re.compile(r'^(?P<key>[^=\n]+)=(?P<value>.*)$', re.M), skip_empty=True)
+        self.assertEqual({'name': 'profile', 'units': 'nm'}, md)
+
+    def test_parse_numeric_block(self):
+        array = parse_numeric_block(' 350.0\t2.3E-002  3.8\n 351.0\t2.4E-002  3.9\n')
+        self.assertIsInstance(array, np.ndarray)
+        self.assertEqual((2, 3), array.shape)
+        self.assertEqual([350.0, 0.023, 3.8], array[0].tolist())
+
+        array = parse_numeric_block('338,5  93,65\n340,0  106,79', decimal_separator=',')
+        self.assertEqual([[338.5, 93.65], [340.0, 106.79]], array.tolist())
+
+        array = parse_numeric_block('1,2,3\n4,5,6', delimiter=',', n_cols=2)
+        self.assertEqual([[1, 2], [4, 5]], array.tolist())
+
+        # invalid lines end the block or are skipped
+        text = '1 2\n3 4\n\nno data\n5 6 7\n8'
+        self.assertEqual([[1, 2], [3, 4]], parse_numeric_block(text).tolist())
+        self.assertEqual([[1, 2], [3, 4], [5, 6]], parse_numeric_block(text, skip_invalid=True).tolist())
+
+        self.assertEqual((0, 4), parse_numeric_block('\n', n_cols=4).shape)
+        self.assertEqual((0, 0), parse_numeric_block('').shape)
+
+
+if __name__ == '__main__':
+    unittest.main(buffer=False)
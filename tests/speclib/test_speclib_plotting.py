@@ -2,20 +2,23 @@ import json
 import logging
 import os.path
 import unittest
+import warnings
 
 import numpy as np
 from osgeo import gdal
-from pyqtgraph import InfiniteLine
+from pyqtgraph import InfiniteLine, PlotWidget
 
-from qgis.PyQt.QtCore import QEvent, QPointF, Qt, QMetaType
+from qgis.PyQt.QtCore import QEvent, QEventLoop, QPointF, QRectF, Qt, QTimer, QMetaType
 from qgis.PyQt.QtGui import QColor, QMouseEvent, QPen
 from qgis.PyQt.QtWidgets import QHBoxLayout, QVBoxLayout, QWidget
 from qgis.PyQt.QtXml import QDomDocument, QDomElement
 from qgis.core import (
     edit, QgsApplication, QgsCategorizedSymbolRenderer, QgsClassificationRange, QgsEditorWidgetSetup,
-    QgsExpressionContextScope, QgsFeature, QgsField, QgsGraduatedSymbolRenderer, QgsMarkerSymbol,
+    QgsExpression, QgsExpressionContext, QgsExpressionContextScope, QgsExpressionContextUtils, QgsFeature,
+    QgsFeatureRequest, QgsField, QgsGraduatedSymbolRenderer, QgsMarkerSymbol,
     QgsMultiBandColorRenderer, QgsNullSymbolRenderer, QgsProject, QgsProperty, QgsReadWriteContext, QgsRenderContext,
-    QgsRendererCategory, QgsRendererRange, QgsSingleBandGrayRenderer, QgsSingleSymbolRenderer, QgsVectorLayer)
+    QgsRendererCategory, QgsRendererRange, QgsSingleBandGrayRenderer, QgsSingleSymbolRenderer, QgsVectorLayer,
+    QgsVectorLayerCache)
 from qgis.gui import QgsMapCanvas
 from qps import DIR_REPO, initAll
 from qps.plotstyling.plotstyling import MarkerSymbol, PlotStyle
@@ -23,7 +26,7 @@ from qps.speclib.core import create_profile_field, profile_field_list, profile_f
 from qps.speclib.core.spectrallibrary import SpectralLibraryUtils
 from qps.speclib.core.spectralprofile import decodeProfileValueDict, encodeProfileValueDict, prepareProfileValueDict
 from qps.speclib.gui.spectrallibraryplotitems import (
-    SpectralProfilePlotDataItem, SpectralProfilePlotWidget,
+    SpectralProfileBatchItem, SpectralProfileDensityItem, SpectralProfilePlotDataItem, SpectralProfilePlotWidget,
     SpectralXAxis)
 from qps.speclib.gui.spectrallibraryplotmodelitems import (
     PlotStyleItem, ProfileVisualizationGroup, RasterRendererGroup,
@@ -31,10 +34,12 @@ from qps.speclib.gui.spectrallibraryplotmodelitems import (
 from qps.speclib.gui.spectrallibraryplotwidget import SpectralLibraryPlotWidget
 from qps.speclib.gui.spectrallibrarywidget import SpectralLibraryWidget
 from qps.speclib.gui.spectralprofilecandidates import SpectralProfileCandidates
-from qps.speclib.gui.spectralprofileplotmodel import copy_items, SpectralProfilePlotModel, STATS_FUNCTIONS
+from qps.speclib.gui.spectralprofileplotmodel import copy_items, FeatureIdCache, fid_ordered_features, \
+    ProfileDataCache, ProfileStatistics, SpectralProfileDecodingTask, SpectralProfilePlotModel, STATS_FUNCTIONS, \
+    XUnitConversionCache
 from qps.testing import start_app, TestCase, TestObjects
 from qps.unitmodel import BAND_INDEX, BAND_NUMBER
-from qps.utils import file_search, nextColor, parseWavelength, writeAsVectorFormat
+from qps.utils import file_search, nextColor, parseWavelength, writeAsVectorFormat, xy_pair_matrix
 from qpstestdata import speclib_geojson_no_geometry
 
 start_app()
@@ -111,6 +116,27 @@ class TestSpeclibPlotting(TestCase):
                 self.assertTrue(np.array_equal(x, x1))
                 self.assertEqual(x1.shape, y1.shape, msg=f'failed to calculate {n}')
 
+            # streaming statistics over different spectral settings, added in chunks
+            pairs = [(x, Y[:, 0]), (x, Y[:, 1]), (np.asarray([2, 3, 4]), np.asarray([40, np.nan, 10]))]
+            x2, Y2 = xy_pair_matrix(pairs)
+            stats = ProfileStatistics(keepData=True)
+            stats.addPairs(pairs, chunkSize=1)
+            self.assertEqual(stats.profileCount(), 3)
+            self.assertTrue(np.array_equal(stats.x(), x2))
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                for n, func in STATS_FUNCTIONS.items():
+                    _, y_expected = func(x2, Y2)
+                    x3, y3 = stats.statistic(n)
+                    self.assertTrue(np.array_equal(x3, x2))
+                    self.assertTrue(np.allclose(y3, y_expected, equal_nan=True), msg=f'failed to accumulate {n}')
+
+            stats = ProfileStatistics(keepData=False)
+            stats.addPairs(pairs)
+            self.assertTrue(np.allclose(stats.statistic('mean')[1], [10, 30, 20, 10]))
+            with self.assertRaises(AssertionError):
+                stats.statistic('median')
+
         if True:
             # model.generalSettings().mProfileStats.mNormalized.setValue(False)
             for vis in model.visualizations():
@@ -489,6 +515,534 @@ class TestSpeclibPlotting(TestCase):
         self.assertListEqual(data['y'], y2)
         slw.project().removeAllMapLayers()
 
+    def test_ProfileDataCache(self):
+
+        sl = TestObjects.createSpectralLibrary(n=5, n_bands=[10], profile_field_names=['p1'])
+        sl.startEditing()
+        sl.addAttribute(QgsField('name', QMetaType.QString))
+        sl.commitChanges(False)
+        slw = SpectralLibraryWidget(speclib=sl)
+        model = slw.plotModel()
+        model.updatePlot()
+
+        idx_p = sl.fields().lookupField('p1')
+        idx_n = sl.fields().lookupField('name')
+        fid = sl.allFeatureIds()[0]
+        key_raw = (sl.id(), fid, 'raw', idx_p)
+        self.assertIsInstance(ProfileDataCache.value(key_raw), dict)
+        n_bytes = ProfileDataCache.nBytesCached()
+        self.assertTrue(n_bytes > 0)
+
+        # updates without changes re-use the cached profiles
+        model.updatePlot()
+        self.assertEqual(ProfileDataCache.nBytesCached(), n_bytes)
+
+        # expression values are cached per feature, but not for volatile expressions
+        expr = QgsExpression('upper("name")')
+        values = []
+        self.assertEqual(ProfileDataCache.expressionValue(sl, fid, expr, lambda: values.append(1) or 'A'), 'A')
+        self.assertEqual(ProfileDataCache.expressionValue(sl, fid, expr, lambda: values.append(1) or 'B'), 'A')
+        self.assertEqual(len(values), 1)
+        self.assertFalse(ProfileDataCache.isCacheable(QgsExpression('rand(0, 10)')))
+
+        # changing another attribute invalidates the expression values of the feature only
+        with edit(sl):
+            sl.changeAttributeValue(fid, idx_n, 'foo')
+        self.assertIsInstance(ProfileDataCache.value(key_raw), dict)
+        self.assertIs(ProfileDataCache.value((sl.id(), fid, 'expression', expr.expression(), tuple())),
+                      ProfileDataCache.NOT_CACHED)
+
+        # values of expressions with variables are cached per variable value
+        expr = QgsExpression("@visualization_name || @project_var")
+        QgsExpressionContextUtils.setProjectVariable(slw.project(), 'project_var', 'X')
+        contexts = []
+        for name in ['vis1', 'vis2']:
+            context = QgsExpressionContext([QgsExpressionContextUtils.projectScope(slw.project())])
+            scope = QgsExpressionContextScope('profile_visualization')
+            scope.setVariable('visualization_name', name)
+            context.appendScope(scope)
+            contexts.append(context)
+        keys = [ProfileDataCache.contextKey(expr, c) for c in contexts]
+        self.assertNotEqual(keys[0], keys[1])
+        for context, key in zip(contexts, keys):
+            value = ProfileDataCache.expressionValue(sl, fid, expr, lambda: expr.evaluate(context), contextKey=key)
+            self.assertEqual(value, context.variable('visualization_name') + 'X')
+        # changing a project variable invalidates the expression values
+        QgsExpressionContextUtils.setProjectVariable(slw.project(), 'project_var', 'Y')
+        self.assertIs(ProfileDataCache.value((sl.id(), fid, 'expression', expr.expression(), keys[0])),
+                      ProfileDataCache.NOT_CACHED)
+
+        # cached values can be any value, including -1
+        expr = QgsExpression('-1')
+        evaluated = []
+        for _ in range(2):
+            value = ProfileDataCache.expressionValue(sl, fid, expr, lambda: evaluated.append(1) or -1)
+            self.assertEqual(value, -1)
+        self.assertEqual(len(evaluated), 1)
+
+        # profiles of plotted layers outside the project are cached as well
+        sl2 = TestObjects.createSpectralLibrary(n=2, n_bands=[10], profile_field_names=['p1'])
+        self.assertNotIsInstance(model.project().mapLayer(sl2.id()), QgsVectorLayer)
+        model.mLayerCaches[sl2.id()] = QgsVectorLayerCache(sl2, 10)
+        self.assertEqual(model.vectorLayer(sl2.id()), sl2)
+        f2 = list(sl2.getFeatures())[0]
+        idx_p2 = sl2.fields().lookupField('p1')
+        self.assertIsInstance(model.rawData(sl2.id(), idx_p2, f2), dict)
+        self.assertIsInstance(ProfileDataCache.value((sl2.id(), f2.id(), 'raw', idx_p2)), dict)
+        del model.mLayerCaches[sl2.id()]
+
+        # changing the profile invalidates the profile
+        profile = prepareProfileValueDict(x=[1, 2, 3], y=[3, 2, 1])
+        with edit(sl):
+            sl.changeAttributeValue(fid, idx_p, encodeProfileValueDict(profile, sl.fields()[idx_p]))
+        self.assertIs(ProfileDataCache.value(key_raw), ProfileDataCache.NOT_CACHED)
+
+        # deleted features are removed
+        model.updatePlot()
+        self.assertIsInstance(ProfileDataCache.value(key_raw), dict)
+        with edit(sl):
+            sl.deleteFeature(fid)
+        self.assertIs(ProfileDataCache.value(key_raw), ProfileDataCache.NOT_CACHED)
+
+        # the cache does not exceed its memory budget
+        max_bytes = ProfileDataCache.MAX_BYTES
+        ProfileDataCache.setMaxBytes(0)
+        self.assertEqual(ProfileDataCache.nBytesCached(), 0)
+        ProfileDataCache.setMaxBytes(max_bytes)
+
+        model.updatePlot()
+        ProfileDataCache.invalidateLayer(sl)
+        self.assertFalse(sl.id() in ProfileDataCache._INDEX)
+
+        # background loading with a cached filter stops at the profile limit
+        filter_expression = QgsExpression('$id >= 0')
+        context = QgsExpressionContext([QgsExpressionContextUtils.layerScope(sl)])
+        request = QgsFeatureRequest()
+        task = SpectralProfileDecodingTask(0, [(sl, idx_p, request, None,
+                                                (filter_expression, context, tuple()), 2)])
+        chunks = []
+        task.sigProfilesDecoded.connect(lambda g, i, chunk: chunks.append(chunk))
+        self.assertTrue(task.run())
+        self.assertEqual(sum(len(c) for c in chunks), 2)
+        self.assertIsInstance(ProfileDataCache.value(
+            (sl.id(), chunks[0][0][0].id(), 'expression', filter_expression.expression(), tuple())), bool)
+        slw.project().removeAllMapLayers()
+
+    def test_XUnitConversionCache(self):
+
+        model = SpectralProfilePlotModel()
+        XUnitConversionCache.clear()
+
+        x = np.asarray([400, 500, 600], dtype=float)
+        p1 = prepareProfileValueDict(x=x, y=[1, 2, 3], xUnit='Nanometers')
+        p2 = prepareProfileValueDict(x=x.copy(), y=[3, 2, 1], xUnit='Nanometers')
+
+        d1 = model.profileDataToXUnit(p1, 'Micrometers')
+        d2 = model.profileDataToXUnit(p2, 'Micrometers')
+        self.assertTrue(np.allclose(d1['x'], [0.4, 0.5, 0.6]))
+        self.assertListEqual(d2['y'].tolist(), [3, 2, 1])
+
+        # profiles with the same x values share the converted axis
+        self.assertIs(d1['x'], d2['x'])
+        self.assertFalse(d1['x'].flags.writeable)
+        self.assertTrue(x.flags.writeable)
+        self.assertEqual(XUnitConversionCache.count(), 1)
+
+        d3 = model.profileDataToXUnit(p1, BAND_NUMBER)
+        self.assertListEqual(d3['x'].tolist(), [1, 2, 3])
+        self.assertEqual(XUnitConversionCache.count(), 2)
+
+        # conversions that are not possible are cached as well
+        self.assertIsNone(model.profileDataToXUnit(p1, 'DecimalYear'))
+        self.assertIsNone(model.profileDataToXUnit(p2, 'DecimalYear'))
+        self.assertEqual(XUnitConversionCache.count(), 3)
+
+        XUnitConversionCache.clear()
+        self.assertEqual(XUnitConversionCache.count(), 0)
+
+    def test_batch_rendering(self):
+
+        sl = TestObjects.createSpectralLibrary(n=20, n_bands=[10], profile_field_names=['p1'])
+        slw = SpectralLibraryWidget(speclib=sl)
+        model = slw.plotModel()
+        pw = model.plotWidget()
+        model.setBatchRenderingThreshold(None)
+        self.assertEqual(len(list(pw.plotItem1.spectralProfileBatchItems())), 0)
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 20)
+
+        model.setBatchRenderingThreshold(10)
+        batches = list(pw.plotItem1.spectralProfileBatchItems())
+        self.assertTrue(len(batches) > 0)
+        self.assertEqual(sum(b.profileCount() for b in batches), 20)
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 0)
+
+        # profiles keep their identity
+        batch: SpectralProfileBatchItem = batches[0]
+        fid = batch.featureIDs()[0]
+        x, y = batch.profileData(0)
+        d = decodeProfileValueDict(sl.getFeature(fid).attribute('p1'))
+        self.assertEqual(len(y), len(d['y']))
+        rect = QRectF(QPointF(x[0], y[0]), QPointF(x[0], y[0])).adjusted(-1e-6, -1e-6, 1e-6, 1e-6)
+        self.assertIn(0, batch.profilesInRect(rect))
+
+        # selected profiles are moved out of the batches without a plot update
+        n_updates = model.nUpdates
+        sl.selectByIds([fid])
+        model.flushProxySignals()
+        self.assertEqual(model.nUpdates, n_updates)
+        pdis = list(pw.spectralProfilePlotDataItems())
+        self.assertEqual(len(pdis), 1)
+        self.assertEqual(pdis[0].featureID(), fid)
+        self.assertTrue(pdis[0].curveIsSelected())
+        self.assertListEqual(pdis[0].yData.tolist(), y.tolist())
+        self.assertIs(batch, list(pw.plotItem1.spectralProfileBatchItems())[0])
+        self.assertNotIn(fid, batch.featureIDs())
+        self.assertEqual(sum(b.profileCount() for b in batches), 19)
+
+        # and back into them when deselected
+        sl.removeSelection()
+        model.flushProxySignals()
+        self.assertEqual(model.nUpdates, n_updates)
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 0)
+        self.assertEqual(sum(b.profileCount() for b in pw.plotItem1.spectralProfileBatchItems()), 20)
+        i = batch.featureIDs().index(fid)
+        self.assertListEqual(batch.profileData(i)[1].tolist(), y.tolist())
+
+        # a full update draws selected profiles separately as well
+        sl.selectByIds([fid])
+        model.updatePlot()
+        pdis = list(pw.spectralProfilePlotDataItems())
+        self.assertEqual(len(pdis), 1)
+        self.assertTrue(pdis[0].curveIsSelected())
+        batches = list(pw.plotItem1.spectralProfileBatchItems())
+        self.assertEqual(sum(b.profileCount() for b in batches), 19)
+
+        self.showGui(slw)
+        slw.project().removeAllMapLayers()
+
+    def test_SpectralProfileBatchItem(self):
+
+        x = np.arange(5, dtype=float)
+        item = SpectralProfileBatchItem()
+        item.setProfiles([(x, x + 1), (x[0:3], x[0:3] + 2)], [10, 11], PlotStyle(), labels=['a', 'b'])
+        item.addProfiles([(x, x + 3)], [12], labels=['c'])
+        self.assertListEqual(item.featureIDs(), [10, 11, 12])
+        self.assertListEqual(item.profileData(2)[1].tolist(), (x + 3).tolist())
+        self.assertFalse(item.mConnect[7])
+
+        taken = item.takeProfiles([1])
+        self.assertEqual(len(taken), 1)
+        fid, x1, y1, label = taken[0]
+        self.assertEqual((fid, label), (11, 'b'))
+        self.assertListEqual(y1.tolist(), [2, 3, 4])
+        self.assertListEqual(item.featureIDs(), [10, 12])
+        self.assertListEqual(item.profileData(1)[1].tolist(), (x + 3).tolist())
+        self.assertListEqual(item.mConnect.tolist(), [True] * 4 + [False] + [True] * 4 + [False])
+        self.assertEqual(item.label(1), 'c')
+
+    def test_SpectralProfileHitIndex(self):
+
+        pw = SpectralProfilePlotWidget()
+        pw.resize(800, 600)
+        pi = pw.plotItem1
+
+        pdi = SpectralProfilePlotDataItem()
+        pdi.setData(x=[0, 5, 10], y=[1, 1, 1])
+        pi.addItem(pdi)
+
+        x = np.arange(11, dtype=float)
+        batch = SpectralProfileBatchItem()
+        batch.setProfiles([(x, np.full(11, 5.0)), (x, np.full(11, 8.0))], [10, 11], PlotStyle())
+        pi.addItem(batch)
+
+        pw.show()
+        pi.setXRange(0, 10, padding=0)
+        pi.setYRange(0, 10, padding=0)
+        QgsApplication.instance().processEvents()
+
+        index = pi.hitIndex()
+        self.assertTrue(index.isAvailable())
+
+        item, profile, vertex = index.nearest(QPointF(4.9, 1.01))
+        self.assertEqual(item, pdi)
+        self.assertEqual(vertex, 1)
+        item, profile, vertex = index.nearest(QPointF(2.5, 8.02))
+        self.assertEqual(item, batch)
+        self.assertEqual(profile, 1)
+        self.assertIsNone(index.nearest(QPointF(2.5, 3)))
+        self.assertIsNone(index.nearest(QPointF(2.5, 1), items=[batch]))
+        self.assertEqual(batch.profileAt(QPointF(7, 5.01)), 0)
+
+        # segments that cross the rectangle are found as well
+        hits = index.profilesInRect(QRectF(QPointF(2, 0), QPointF(3, 6)))
+        self.assertEqual(hits[pdi], [0])
+        self.assertEqual(hits[batch], [0])
+        self.assertListEqual(batch.profilesInRect(QRectF(QPointF(2, 4), QPointF(3, 9))), [0, 1])
+
+        # the index is updated after data changes
+        pdi.setData(x=[0, 5, 10], y=[3, 3, 3])
+        self.assertIsNone(index.nearest(QPointF(4.9, 1.01)))
+        self.assertEqual(index.nearest(QPointF(4.9, 3.01))[0], pdi)
+
+        # without index, only the segments close to the position are tested
+        pw2 = PlotWidget()
+        pw2.resize(800, 600)
+        batch2 = SpectralProfileBatchItem()
+        batch2.setProfiles([(x, np.full(11, 5.0)), (np.asarray([0, 10.]), np.asarray([0, 10.]))],
+                           [10, 11], PlotStyle())
+        pw2.plotItem.addItem(batch2)
+        pw2.show()
+        pw2.plotItem.setXRange(0, 10, padding=0)
+        pw2.plotItem.setYRange(0, 10, padding=0)
+        QgsApplication.instance().processEvents()
+        self.assertIsNone(batch2.hitIndex())
+        self.assertEqual(batch2.profileAt(QPointF(7.5, 5.01)), 0)
+        self.assertEqual(batch2.profileAt(QPointF(2.5, 2.51)), 1)
+        self.assertIsNone(batch2.profileAt(QPointF(2.5, 8)))
+
+        self.showGui(pw)
+
+    def test_incremental_updates(self):
+
+        sl = TestObjects.createSpectralLibrary(n=10, n_bands=[10], profile_field_names=['p1'])
+        slw = SpectralLibraryWidget(speclib=sl)
+        model = slw.plotModel()
+        model.setBatchRenderingThreshold(None)
+        pw = model.plotWidget()
+        pdis1 = {pdi.featureID(): pdi for pdi in pw.spectralProfilePlotDataItems()}
+        self.assertEqual(len(pdis1), 10)
+
+        # selecting a feature keeps the plot items
+        fids = sorted(pdis1.keys())
+        sl.selectByIds(fids[0:1])
+        model.updatePlot()
+        pdis2 = {pdi.featureID(): pdi for pdi in pw.spectralProfilePlotDataItems()}
+        self.assertEqual(len(pdis2), 10)
+        for fid, pdi in pdis2.items():
+            self.assertIs(pdi, pdis1[fid])
+            self.assertEqual(pdi.curveIsSelected(), fid == fids[0])
+        self.assertIsInstance(pdis2[fids[0]].dataBounds(0), tuple)
+
+        # filtered profiles are removed, changed profiles are updated
+        model.visualizations()[0].setFilterExpression(f'$id != {fids[1]}')
+        model.updatePlot()
+        pdis3 = {pdi.featureID(): pdi for pdi in pw.spectralProfilePlotDataItems()}
+        self.assertEqual(set(pdis3.keys()), set(fids[0:1] + fids[2:]))
+
+        d = decodeProfileValueDict(sl.getFeature(fids[2]).attribute('p1'))
+        d['y'] = [v + 1 for v in d['y']]
+        with edit(sl):
+            sl.changeAttributeValue(fids[2], sl.fields().lookupField('p1'),
+                                    encodeProfileValueDict(d, sl.fields()['p1']))
+        model.updatePlot()
+        pdis4 = {pdi.featureID(): pdi for pdi in pw.spectralProfilePlotDataItems()}
+        self.assertIs(pdis4[fids[3]], pdis3[fids[3]])
+        x, y = pdis4[fids[2]].getData()
+        self.assertEqual(y[0], d['y'][0])
+
+        self.showGui(slw)
+        slw.project().removeAllMapLayers()
+
+    def test_async_loading(self):
+
+        sl = TestObjects.createSpectralLibrary(n=30, n_bands=[10], profile_field_names=['p1'])
+        slw = SpectralLibraryWidget(speclib=sl)
+        model = slw.plotModel()
+        model.setBatchRenderingThreshold(None)
+        model.setAsyncLoadingThreshold(0)
+        model.LOADING_CHUNK_SIZE = 7
+        pw = model.plotWidget()
+
+        progress = []
+        model.sigProgressChanged.connect(progress.append)
+
+        def wait():
+            loop = QEventLoop()
+            model.sigProgressChanged.connect(lambda p: loop.quit() if p >= 100 else None)
+            QTimer.singleShot(10000, loop.quit)
+            if model.isLoading():
+                loop.exec_()
+            self.assertFalse(model.isLoading())
+
+        # a newer update cancels the older one
+        model.updatePlot()
+        model.updatePlot()
+        self.assertTrue(model.isLoading())
+        wait()
+        self.assertEqual(progress[-1], 100)
+        pdis = list(pw.spectralProfilePlotDataItems())
+        self.assertEqual(len(pdis), 30)
+        self.assertEqual(len(set(pdi.featureID() for pdi in pdis)), 30)
+
+        # the profile limit stops the loading
+        model.setMaxProfiles(10)
+        model.updatePlot()
+        wait()
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 10)
+
+        # chunks of batched profiles are appended to a single batch item per style
+        model.setMaxProfiles(30)
+        model.setBatchRenderingThreshold(0)
+        wait()
+        batches = list(pw.plotItem1.spectralProfileBatchItems())
+        keys = [(b.mVisID, b.plotStyle().linePen.color().rgba()) for b in batches]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(sum(b.profileCount() for b in batches), 30)
+        self.assertTrue(all(b.isVisible() for b in batches))
+
+        self.showGui(slw)
+        slw.project().removeAllMapLayers()
+
+    def test_profile_paging(self):
+
+        fids = np.arange(100) * 2
+        order = SpectralProfilePlotModel.stratifiedFeatureOrder(fids, n_strata=10)
+        self.assertEqual(sorted(order.tolist()), fids.tolist())
+        # each stratum is sampled once before the second turn starts
+        self.assertEqual(len(set(order[0:10] // 20)), 10)
+        xy = np.random.random((100, 2))
+        order = SpectralProfilePlotModel.stratifiedFeatureOrder(fids, xy=xy, n_strata=16)
+        self.assertEqual(sorted(order.tolist()), fids.tolist())
+
+        sl = TestObjects.createSpectralLibrary(n=25, n_bands=[10], profile_field_names=['p1'])
+        all_fids = sorted(sl.allFeatureIds())
+        selected = all_fids[-3:]
+        sl.selectByIds(selected)
+        slw = SpectralLibraryWidget(speclib=sl)
+        model = slw.plotModel()
+        model.setBatchRenderingThreshold(None)
+        model.setMaxProfiles(10)
+        model.updatePlot()
+        pw = model.plotWidget()
+
+        # selected profiles are loaded first
+        pdis1 = {pdi.featureID(): pdi for pdi in pw.spectralProfilePlotDataItems()}
+        self.assertEqual(len(pdis1), 10)
+        self.assertTrue(set(selected).issubset(pdis1.keys()))
+        self.assertTrue(model.canLoadMoreProfiles())
+
+        loaded = []
+        model.sigProfilesLoaded.connect(lambda n, more: loaded.append((n, more)))
+
+        # the next page adds profiles and keeps the plotted ones
+        self.assertTrue(model.loadMoreProfiles())
+        self.assertEqual(model.profilePages(), 2)
+        pdis2 = {pdi.featureID(): pdi for pdi in pw.spectralProfilePlotDataItems()}
+        self.assertEqual(len(pdis2), 20)
+        for fid, pdi in pdis1.items():
+            self.assertIs(pdis2[fid], pdi)
+        self.assertEqual(loaded[-1], (20, True))
+
+        self.assertTrue(model.loadMoreProfiles())
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 25)
+        self.assertEqual(loaded[-1], (25, False))
+        self.assertFalse(model.loadMoreProfiles())
+
+        # plot updates keep the number of pages, until the profile limit changes
+        model.updatePlot()
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 25)
+        model.setMaxProfiles(5)
+        model.updatePlot()
+        self.assertEqual(model.profilePages(), 1)
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 5)
+
+        # features are read in the order of the feature ids, also within a chunk
+        order = np.asarray(all_fids[::-1], dtype=np.int64)
+        features = list(fid_ordered_features(sl, QgsFeatureRequest(), order, 10))
+        self.assertListEqual([f.id() for f in features], order.tolist())
+
+        # loading orders and filtered feature ids are cached until the features change
+        self.assertIs(model.loadingOrder(sl), model.loadingOrder(sl))
+        request = QgsFeatureRequest()
+        request.setFilterExpression(f'$id > {all_fids[5]}')
+        matching = model.matchingFeatureIds(sl, request)
+        self.assertEqual(len(matching), len(all_fids) - 6)
+        self.assertIs(matching, model.matchingFeatureIds(sl, request))
+        with edit(sl):
+            sl.deleteFeature(all_fids[-1])
+        self.assertNotIsInstance(FeatureIdCache.value(sl, ('order',)), np.ndarray)
+        self.assertEqual(len(model.matchingFeatureIds(sl, request)), len(all_fids) - 7)
+        self.assertEqual(len(model.loadingOrder(sl)), len(all_fids) - 1)
+
+        self.showGui(slw)
+        slw.project().removeAllMapLayers()
+
+    def test_density_rendering(self):
+
+        item = SpectralProfileDensityItem(bins=10)
+        x = np.arange(10, dtype=float)
+        item.addProfiles([(x, x), (x, x * 0.5)])
+        self.assertEqual(item.profileCount(), 2)
+        # one column per band
+        self.assertEqual(item.counts().shape, (10, 10))
+        self.assertEqual(item.counts().sum(), 20)
+        self.assertTrue(np.array_equal(item.counts().sum(axis=1), np.full(10, 2)))
+
+        # values outside the histogram extent add y bins of the same size,
+        # band columns are drawn at the mean x coordinate of each band
+        item.addProfiles([(x + 0.5, x + 20), (x, np.full(10, np.nan))])
+        self.assertEqual(item.profileCount(), 4)
+        self.assertEqual(item.counts().sum(), 30)
+        self.assertEqual(item.counts().shape[0], 10)
+        self.assertTrue(np.allclose(item.bandCenters(), x + 0.125))
+        yEdges = item.yBinEdges()
+        self.assertTrue(yEdges[0] <= 0 and yEdges[-1] >= 29)
+
+        # outliers merge bins instead of adding too many of them
+        item.addProfiles([(np.asarray([1.0]), np.asarray([1e6]))])
+        self.assertTrue(item.counts().shape[1] <= SpectralProfileDensityItem.MAX_BINS)
+        self.assertEqual(item.counts().sum(), 31)
+
+        # profiles with more bands add band columns
+        item.addProfiles([(np.arange(12, dtype=float), np.ones(12))])
+        self.assertEqual(item.counts().shape[0], 12)
+
+        # irregular band centers: each band column is centered at its band center
+        item = SpectralProfileDensityItem(bins=4)
+        item.addProfiles([(np.asarray([400., 410., 500.]), np.asarray([0., 1., 2.]))])
+        rect = item.boundingRect()
+        self.assertTrue(rect.width() > 0)
+        self.assertAlmostEqual(item.mapRectToParent(rect).left(), 395.0)
+        self.assertAlmostEqual(item.mapRectToParent(rect).right(), 545.0)
+
+        sl = TestObjects.createSpectralLibrary(n=20, n_bands=[10], profile_field_names=['p1'])
+        slw = SpectralLibraryWidget(speclib=sl)
+        model = slw.plotModel()
+        model.DENSITY_CHUNK_SIZE = 8
+        pw = model.plotWidget()
+        vis = model.visualizations()[0]
+        vis.setShowDensity(True)
+        self.assertTrue(vis.asMap()['density'])
+        model.updatePlot()
+        while model.processDensityChunk():
+            pass
+
+        items = list(pw.plotItem1.spectralProfileDensityItems())
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].profileCount(), 20)
+        self.assertEqual(len(list(pw.spectralProfilePlotDataItems())), 0)
+
+        # selected profiles are drawn on top of the histogram
+        fid = sl.allFeatureIds()[0]
+        sl.selectByIds([fid])
+        model.updatePlot()
+        while model.processDensityChunk():
+            pass
+        items = list(pw.plotItem1.spectralProfileDensityItems())
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].profileCount(), 20)
+        pdis = list(pw.spectralProfilePlotDataItems())
+        self.assertEqual(len(pdis), 1)
+        self.assertEqual(pdis[0].featureID(), fid)
+
+        vis.setShowDensity(False)
+        model.updatePlot()
+        self.assertEqual(len(list(pw.plotItem1.spectralProfileDensityItems())), 0)
+        self.assertEqual(len(model.densityItems()), 0)
+
+        self.showGui(slw)
+        slw.project().removeAllMapLayers()
+
     def test_SpectralProfilePlotModel_add_current_profiles(self):
 
         sl1 = TestObjects.createSpectralLibrary(n=2, name='speclib1',
@@ -4,25 +4,28 @@ import random
 import unittest
 from typing import Iterator, List, Tuple
 
+import numpy as np
+
 from qps import initAll
-from qps.maptools import CursorLocationMapTool
+from qps.maptools import CursorLocationMapTool, MapTools, SpectralProfileMapTool
 from qps.speclib.core.spectrallibrary import SpectralLibraryUtils
 from qps.speclib.core.spectralprofile import isProfileValueDict
 from qps.speclib.gui.spectrallibrarywidget import SpectralLibraryWidget
 from qps.speclib.gui.spectralprofilesources import (
-    MapCanvasLayerProfileSource, ProfileSamplingMode,
-    SpectralFeatureGeneratorNode, SpectralProfileBridge, SpectralProfileBridgeTreeView,
+    MapCanvasLayerProfileSource, ProfileSamplingJob, ProfileSamplingMode,
+    SpectralFeatureGeneratorNode, SpectralProfileBridge, SpectralProfileBridgeTreeView, SpectralProfileSamplingModeNode,
     SpectralProfileBridgeViewDelegate, SpectralProfileGeneratorNode, SpectralProfileSource,
-    SpectralProfileSourceModel, SpectralProfileSourcePanel, SpectralProfileSourceProxyModel,
-    StandardFieldGeneratorNode, StandardLayerProfileSource)
+    SpectralProfileLoadingTask, SpectralProfileSourceModel, SpectralProfileSourcePanel,
+    SpectralProfileSourceProxyModel, StandardFieldGeneratorNode, StandardLayerProfileSource)
 from qps.testing import start_app, TestCase, TestObjects
-from qps.utils import rasterArray, SpatialExtent, SpatialPoint
+from qps.utils import rasterArray, RasterBlockCache, RasterLayerSnapshot, SpatialExtent, SpatialPoint
 from qpstestdata import enmap
 
-from qgis.PyQt.QtCore import QSize, Qt, QMetaType
+from qgis.PyQt.QtCore import QEventLoop, QPoint, QRect, QSize, Qt, QMetaType, QTimer
 from qgis.PyQt.QtWidgets import QHBoxLayout, QPushButton, QSplitter, QVBoxLayout, QWidget
 from qgis.core import edit, Qgis, QgsExpressionContext, QgsFeature, QgsField, QgsGeometry, QgsMapToPixel, QgsPoint, \
-    QgsPointXY, QgsProject, QgsRaster, QgsRasterDataProvider, QgsRasterLayer, QgsVectorLayer, QgsWkbTypes
+    QgsPointXY, QgsProject, QgsRaster, QgsRasterDataProvider, QgsRasterLayer, QgsRectangle, QgsReferencedGeometry, \
+    QgsVectorLayer, QgsWkbTypes
 from qgis.gui import QgsDualView, QgsMapCanvas
 
 start_app()
@@ -471,6 +474,220 @@ class SpectralProcessingTests(TestCase):
                 pass
             self.assertListEqual(yValues, yValuesR)
 
+    def test_loadProfilesAsync(self):
+
+        (src1, src2), (slw1, slw2) = self.createTestObjects()
+        sl1 = slw1.plotModel().visualizations()[0].layer()
+
+        panel = SpectralProfileSourcePanel()
+        panel.addSources([src1, src2])
+        panel.addSpectralLibraryWidgets([slw1, slw2])
+        bridge = panel.spectralProfileBridge()
+        fgnode = panel.createRelation()
+        fgnode.setSpeclib(sl1)
+        for pgnode in fgnode.spectralProfileGeneratorNodes():
+            pgnode.setProfileSource(src1)
+            pgnode.setCheckState(Qt.Checked)
+
+        pt = SpatialPoint.fromMapLayerCenter(src1)
+        RESULTS = bridge.loadProfiles(pt, runAsync=False)
+        n_expected = sum(len(features) for features in RESULTS.values())
+        self.assertTrue(n_expected > 0)
+
+        loaded = []
+        bridge.sigProfilesLoaded.connect(loaded.append)
+
+        # a newer request discards the results of an older one
+        self.assertEqual(bridge.loadProfiles(pt, runAsync=True), dict())
+        g0 = bridge.generation()
+        bridge.setRunAsync(True)
+        self.assertEqual(bridge.loadProfiles(pt), dict())
+        g1 = bridge.generation()
+        self.assertTrue(g1 > g0)
+
+        loop = QEventLoop()
+        bridge.sigProfilesLoaded.connect(lambda g: loop.quit() if g == g1 else None)
+        QTimer.singleShot(10000, loop.quit)
+        if g1 not in loaded:
+            loop.exec_()
+
+        self.assertEqual(loaded, [g1])
+        self.assertNotIn(g1, bridge.mTasks)
+        n_async = sum(len(features) for features in bridge.mAsyncCandidates.values())
+        self.assertEqual(n_async, n_expected)
+
+        QgsProject.instance().removeAllMapLayers()
+
+    def test_loadHoverProfiles(self):
+
+        (src1, src2), (slw1, slw2) = self.createTestObjects()
+        sl1 = slw1.plotModel().visualizations()[0].layer()
+
+        panel = SpectralProfileSourcePanel()
+        panel.addSources([src1, src2])
+        panel.addSpectralLibraryWidgets([slw1, slw2])
+        bridge = panel.spectralProfileBridge()
+        fgnode = panel.createRelation()
+        fgnode.setSpeclib(sl1)
+        for pgnode in fgnode.spectralProfileGeneratorNodes():
+            pgnode.setProfileSource(src1)
+            pgnode.setCheckState(Qt.Checked)
+
+        n_features = sl1.featureCount()
+        pt = SpatialPoint.fromMapLayerCenter(src1)
+        RasterBlockCache.clear()
+        self.assertTrue(panel.loadHoverSpectra(pt, runAsync=False))
+        self.assertTrue(RasterBlockCache.memoryUsage() > 0, msg='hover requests read through the tile cache')
+        profiles = slw1.plotModel().temporaryProfiles()
+        self.assertTrue(len(profiles) > 0)
+        self.assertEqual(len(profiles), len(bridge.hoverProfiles()[sl1.id()]))
+        # hover profiles are not added to the speclib
+        self.assertEqual(sl1.featureCount(), n_features)
+
+        # moving inside the same pixel does not start a new request
+        pt2 = SpatialPoint(pt.crs(), pt.x() + 0.1 * src1.rasterUnitsPerPixelX(), pt.y())
+        if pt2.toPixelPosition(src1) == pt.toPixelPosition(src1):
+            self.assertFalse(panel.loadHoverSpectra(pt2, runAsync=False))
+
+        # moving to another pixel of the same tile does not read from the data provider
+        T = RasterBlockCache.tileSize(src1)
+        px = pt.toPixelPosition(src1)
+        dx = -1 if px.x() % T == T - 1 else 1
+        pt2 = SpatialPoint(pt.crs(), pt.x() + dx * src1.rasterUnitsPerPixelX(), pt.y())
+        self.assertEqual(pt2.toPixelPosition(src1).x() // T, px.x() // T)
+        n_reads = RasterBlockCache.readCount()
+        self.assertTrue(panel.loadHoverSpectra(pt2, runAsync=False))
+        self.assertEqual(RasterBlockCache.readCount(), n_reads)
+
+        # async requests are coalesced
+        pt3 = SpatialPoint(pt.crs(), pt.x() + 2 * src1.rasterUnitsPerPixelX(), pt.y())
+        pt4 = SpatialPoint(pt.crs(), pt.x() + 3 * src1.rasterUnitsPerPixelX(), pt.y())
+        self.assertTrue(panel.loadHoverSpectra(pt3, runAsync=True))
+        self.assertTrue(panel.loadHoverSpectra(pt4, runAsync=True))
+        self.assertIsInstance(bridge.mHoverPending, tuple)
+
+        loop = QEventLoop()
+
+        def onTimeout():
+            if bridge.mHoverTask is None and bridge.mHoverPending is None:
+                loop.quit()
+
+        timer = QTimer()
+        timer.timeout.connect(onTimeout)
+        timer.start(50)
+        QTimer.singleShot(10000, loop.quit)
+        loop.exec_()
+        timer.stop()
+
+        self.assertIsNone(bridge.mHoverTask)
+        self.assertTrue(len(slw1.plotModel().temporaryProfiles()) > 0)
+
+        # a synchronous request supersedes a running async request and releases its task
+        pt5 = SpatialPoint(pt.crs(), pt.x() + 5 * src1.rasterUnitsPerPixelX(), pt.y())
+        self.assertTrue(panel.loadHoverSpectra(pt3, runAsync=True))
+        self.assertIsInstance(bridge.mHoverTask, SpectralProfileLoadingTask)
+        self.assertTrue(panel.loadHoverSpectra(pt5, runAsync=False))
+        self.assertIsNone(bridge.mHoverTask)
+        self.assertIsNone(bridge.mHoverPending)
+        self.assertTrue(panel.loadHoverSpectra(pt4, runAsync=True))
+        self.assertIsInstance(bridge.mHoverTask, SpectralProfileLoadingTask)
+
+        panel.clearHoverSpectra()
+        self.assertIsNone(bridge.mHoverTask)
+        self.assertEqual(slw1.plotModel().temporaryProfiles(), [])
+        self.assertEqual(sl1.featureCount(), n_features)
+
+        # map tool throttling
+        canvas = QgsMapCanvas()
+        canvas.setLayers([src1])
+        canvas.setDestinationCrs(src1.crs())
+        canvas.setExtent(src1.extent())
+        mt = SpectralProfileMapTool(canvas)
+        requests = []
+        mt.sigHoverLocationRequest.connect(lambda crs, p: requests.append(p))
+        mt.mPendingHoverPixel = QPoint(5, 5)
+        mt.emitHoverLocationRequest()
+        self.assertEqual(requests, [], msg='live hover is disabled by default')
+        mt.setLiveHover(True)
+        for _ in range(2):
+            mt.mPendingHoverPixel = QPoint(5, 5)
+            mt.emitHoverLocationRequest()
+        self.assertEqual(len(requests), 1, msg='same screen pixel should not be requested twice')
+
+        # the live hover action of the panel controls connected map tools
+        hovered = []
+        panel.loadHoverSpectra = lambda p, mapCanvas=None, runAsync=None: hovered.append(p)
+        mt2 = SpectralProfileMapTool(canvas)
+        panel.connectMapTool(mt2)
+        self.assertFalse(mt2.liveHover())
+        panel.actionLiveHover.setChecked(True)
+        self.assertTrue(panel.liveHover())
+        self.assertTrue(mt2.liveHover())
+        mt2.mPendingHoverPixel = QPoint(5, 5)
+        mt2.emitHoverLocationRequest()
+        self.assertEqual(len(hovered), 1)
+        self.assertIsInstance(hovered[0], SpatialPoint)
+        panel.setLiveHover(False)
+        self.assertFalse(panel.actionLiveHover.isChecked())
+        self.assertFalse(mt2.liveHover())
+
+        QgsProject.instance().removeAllMapLayers()
+
+    def test_parallelSampling(self):
+
+        (src1, src2), (slw1, slw2) = self.createTestObjects()
+        sl1 = slw1.plotModel().visualizations()[0].layer()
+
+        bridge = SpectralProfileBridge()
+        bridge.addSources([src1, src2])
+        bridge.addSpectralLibraryWidgets([slw1, slw2])
+        fgnode1 = bridge.createFeatureGenerator()
+        fgnode2 = bridge.createFeatureGenerator()
+        for fgnode, sources in [(fgnode1, [src1, src2]), (fgnode2, [src2, src1])]:
+            fgnode.setSpeclib(sl1)
+            for pgnode, src in zip(fgnode.spectralProfileGeneratorNodes(), sources):
+                pgnode.setProfileSource(src)
+                pgnode.setCheckState(Qt.Checked)
+
+        pt = SpatialPoint.fromMapLayerCenter(src1)
+        jobs = bridge.samplingJobs([fgnode1, fgnode2], pt)
+        self.assertTrue(all(len(jobList) > 1 for jobList in jobs))
+        for jobList in jobs:
+            for job in jobList:
+                self.assertIsInstance(job, ProfileSamplingJob)
+                for lyr in job.layers():
+                    # jobs contain plain layer properties only
+                    self.assertIsInstance(lyr, RasterLayerSnapshot)
+
+        n_threads = SpectralProfileBridge.SAMPLING_THREADS
+        SpectralProfileBridge.SAMPLING_THREADS = 1
+        serial = list(bridge.iterProfileData(jobs))
+        # a single sampling thread of the pool
+        pooled = list(bridge.iterProfileData(jobs, pooled=True))
+        SpectralProfileBridge.SAMPLING_THREADS = n_threads
+        parallel = list(bridge.iterProfileData(jobs))
+        self.assertIs(SpectralProfileBridge.samplingPool(), SpectralProfileBridge.samplingPool())
+
+        self.assertEqual(len(serial), len(jobs))
+        self.assertEqual(len(parallel), len(jobs))
+        self.assertEqual(len(pooled), len(jobs))
+        for data1, data2 in list(zip(serial, parallel)) + list(zip(serial, pooled)):
+            self.assertEqual(list(data1.keys()), list(data2.keys()))
+            for field_name in data1.keys():
+                profiles1 = [list(d['y']) for d, _ in data1[field_name]]
+                profiles2 = [list(d['y']) for d, _ in data2[field_name]]
+                self.assertEqual(profiles1, profiles2)
+
+        # features of a single feature generator
+        features = bridge.createFeatures(fgnode1, pt)
+        self.assertTrue(len(features) > 0)
+        for feature in features:
+            self.assertIsInstance(feature, QgsFeature)
+            self.assertEqual(feature.fields().names(), sl1.fields().names())
+        self.assertEqual(len(features), max(len(v) for v in serial[0].values()))
+
+        QgsProject.instance().removeAllMapLayers()
+
     def test_SpectralProfileSourceModel(self):
 
         lyr1 = TestObjects.createRasterLayer(nb=2, ns=5, nl=5)
@@ -548,7 +765,9 @@ class SpectralProcessingTests(TestCase):
 
                 self.assertEqual(aggregation, mode.aggregation())
 
+                RasterBlockCache.clear()
                 profiles = source.collectProfiles(center, mode.kernelSize())
+                self.assertEqual(RasterBlockCache.memoryUsage(), 0, msg='kernels are read without caching tiles')
 
                 self.assertEqual(len(profiles), x * y)
 
@@ -558,6 +777,20 @@ class SpectralProcessingTests(TestCase):
                     self.assertEqual(len(profiles), len(profiles_aggr))
                 else:
                     self.assertEqual(len(profiles_aggr), 1)
+
+                # aggregation while reading the kernel window returns the same profiles
+                profiles_direct = source.collectProfiles(center, mode.kernelSize(), aggregation=aggregation)
+                self.assertEqual(len(profiles_direct), len(profiles_aggr))
+                for (p1, c1), (p2, c2) in zip(profiles_aggr, profiles_direct):
+                    self.assertTrue(np.allclose(p1['y'], p2['y'], equal_nan=True))
+                    self.assertEqual(c1.geometry().asWkt(), c2.geometry().asWkt())
+                # kernel profiles in row-major order of the kernel window
+                px = source.m2p.transform(center)
+                x0, y0 = int(px.x()) - x // 2, int(px.y()) - y // 2
+                block = rasterArray(lyr, QRect(x0, y0, x, y)).astype(float)
+                self.assertTrue(np.allclose(block.reshape((block.shape[0], x * y)).transpose(),
+                                            [p['y'] for p, _ in profiles]))
+
                 for t in profiles:
                     self.assertIsInstance(t, tuple)
                     self.assertEqual(len(t), 2)
@@ -570,6 +803,70 @@ class SpectralProcessingTests(TestCase):
                     else:
                         self.assertEqual(c.geometry().type(), Qgis.GeometryType.Point)
 
+    def test_transectAndPolygonSampling(self):
+
+        lyr = QgsRasterLayer(enmap.as_posix())
+        source = StandardLayerProfileSource(lyr)
+        e = lyr.extent()
+        res = lyr.rasterUnitsPerPixelX()
+
+        def geo(px: float, py: float) -> QgsPointXY:
+            return QgsPointXY(e.xMinimum() + px * res, e.yMaximum() - py * res)
+
+        line = QgsReferencedGeometry(QgsGeometry.fromPolylineXY([geo(10.5, 20.5), geo(30.5, 20.5)]), lyr.crs())
+        polygon = QgsReferencedGeometry(QgsGeometry.fromRect(QgsRectangle(geo(10, 25), geo(15, 20))), lyr.crs())
+
+        mode = ProfileSamplingMode(samplingType=ProfileSamplingMode.SAMPLE_TRANSECT)
+        self.assertEqual(mode.numberOfProfiles(), -1)
+        self.assertEqual(mode.clone(), mode)
+
+        profiles = source.collectProfiles(line, samplingType=ProfileSamplingMode.SAMPLE_TRANSECT)
+        self.assertEqual(len(profiles), 21)
+        block = rasterArray(lyr, QRect(10, 20, 21, 1)).astype(float)
+        for i, (p, c) in enumerate(profiles):
+            self.assertTrue(np.allclose(p['y'], block[:, 0, i]))
+            self.assertEqual(c.variable('px_x'), 10 + i)
+            self.assertEqual(c.variable('px_y'), 20)
+
+        profiles = source.collectProfiles(polygon, samplingType=ProfileSamplingMode.SAMPLE_POLYGON)
+        self.assertEqual(len(profiles), 25)
+
+        profiles = source.collectProfiles(polygon, samplingType=ProfileSamplingMode.SAMPLE_POLYGON,
+                                          aggregation=ProfileSamplingMode.AGGREGATE_MEAN)
+        self.assertEqual(len(profiles), 1)
+        block = rasterArray(lyr, QRect(10, 20, 5, 5)).astype(float)
+        self.assertTrue(np.allclose(profiles[0][0]['y'], block.reshape((block.shape[0], 25)).mean(axis=1)))
+
+        # kernel sampling uses the geometry centroid
+        profiles = source.collectProfiles(polygon, samplingType=ProfileSamplingMode.SAMPLE_KERNEL)
+        self.assertEqual(len(profiles), 1)
+
+        # the sampling type is restored with the other sampling settings
+        node = SpectralProfileSamplingModeNode()
+        node.setProfileSamplingMode(ProfileSamplingMode(kernelSize=QSize(3, 3),
+                                                        aggregation=ProfileSamplingMode.AGGREGATE_MEAN,
+                                                        samplingType=ProfileSamplingMode.SAMPLE_POLYGON))
+        settings = node.settings()
+        self.assertEqual(settings['sampling_type'], ProfileSamplingMode.SAMPLE_POLYGON)
+        node2 = SpectralProfileSamplingModeNode()
+        node2.setSettings(settings)
+        self.assertEqual(node2.profileSamplingMode(), node.profileSamplingMode())
+
+        # transect and polygon map tools load the profiles along / within the drawn geometry
+        canvas = QgsMapCanvas()
+        canvas.setLayers([lyr])
+        canvas.setDestinationCrs(lyr.crs())
+        canvas.setExtent(lyr.extent())
+        panel = SpectralProfileSourcePanel()
+        panel.setRunAsync(False)
+        requests = []
+        panel.loadCurrentMapSpectra = lambda g, mapCanvas=None, runAsync=None: requests.append(g)
+        mt = MapTools.create(MapTools.SpectralProfileTransect, canvas)
+        panel.connectMapTool(mt)
+        mt.sigGeometryRequest.emit(lyr.crs(), QgsGeometry(line))
+        self.assertIsInstance(requests[-1], QgsReferencedGeometry)
+        self.assertEqual(requests[-1].type(), QgsWkbTypes.LineGeometry)
+
     def test_MapCanvasLayerProfileSource(self):
 
         source1 = MapCanvasLayerProfileSource()
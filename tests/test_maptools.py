@@ -16,11 +16,12 @@ import unittest
 
 from qgis.PyQt.QtCore import QEvent, QPointF, Qt, pyqtSlot
 from qgis.PyQt.QtGui import QMouseEvent
-from qgis.core import QgsCoordinateReferenceSystem, QgsProject, QgsRectangle, QgsVectorLayer, QgsWkbTypes
+from qgis.core import QgsCoordinateReferenceSystem, QgsGeometry, QgsProject, QgsRectangle, QgsVectorLayer, \
+    QgsWkbTypes
 from qgis.gui import QgsAdvancedDigitizingDockWidget, QgsMapCanvas, QgsMapMouseEvent, QgsMapTool, QgsMapToolCapture, \
     QgsMapToolZoom
 from qps.maptools import FullExtentMapTool, MapToolCenter, MapTools, PixelScaleExtentMapTool, QgsMapToolAddFeature, \
-    QgsMapToolSelect, QgsMapToolSelectionHandler, SpatialExtentMapTool
+    QgsMapToolSelect, QgsMapToolSelectionHandler, SpatialExtentMapTool, SpectralProfileGeometryMapTool
 from qps.testing import TestCase, TestObjects, start_app
 from qps.utils import SpatialExtent
 
@@ -182,6 +183,65 @@ class TestMapTools(TestCase):
         del canvas, mt
         QgsProject.instance().removeAllMapLayers()
 
+    def test_SpectralProfileGeometryMapTool(self):
+
+        canvas, lyr = self.createCanvas()
+        canvas.show()
+        size = canvas.size()
+
+        def click(x: float, y: float, button=Qt.LeftButton):
+            point = QPointF(x * size.width(), y * size.height())
+            canvas.mousePressEvent(QMouseEvent(QEvent.MouseButtonPress, point, button, button, Qt.NoModifier))
+            canvas.mouseReleaseEvent(QMouseEvent(QEvent.MouseButtonRelease, point, button, button, Qt.NoModifier))
+
+        def doubleClick(x: float, y: float):
+            # Qt sends press, release, double click, release
+            point = QPointF(x * size.width(), y * size.height())
+            click(x, y)
+            canvas.mouseDoubleClickEvent(
+                QMouseEvent(QEvent.MouseButtonDblClick, point, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier))
+            canvas.mouseReleaseEvent(
+                QMouseEvent(QEvent.MouseButtonRelease, point, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier))
+
+        for mte, geometryType, n in [(MapTools.SpectralProfileTransect, QgsWkbTypes.LineGeometry, 2),
+                                     (MapTools.SpectralProfilePolygon, QgsWkbTypes.PolygonGeometry, 3)]:
+            mt = MapTools.create(mte, canvas)
+            self.assertIsInstance(mt, SpectralProfileGeometryMapTool)
+            self.assertEqual(mt.geometryType(), geometryType)
+
+            geometries = []
+            mt.sigGeometryRequest.connect(lambda crs, g: geometries.append(QgsGeometry(g)))
+
+            # not enough vertices: nothing is emitted
+            click(0.2, 0.2)
+            click(0.5, 0.5, button=Qt.RightButton)
+            self.assertEqual(geometries, [])
+            self.assertEqual(mt.points(), [])
+
+            for i in range(n):
+                click(0.2 + 0.2 * i, 0.2 + 0.3 * (i % 2))
+            self.assertEqual(len(mt.points()), n)
+            click(0.5, 0.5, button=Qt.RightButton)
+            self.assertEqual(len(geometries), 1)
+            self.assertEqual(geometries[0].type(), geometryType)
+            self.assertEqual(mt.points(), [])
+
+            # a double click adds the last vertex and finishes the geometry
+            for i in range(n - 1):
+                click(0.2 + 0.2 * i, 0.2 + 0.3 * (i % 2))
+            doubleClick(0.8, 0.7)
+            self.assertEqual(len(geometries), 2)
+            self.assertEqual(geometries[1].type(), geometryType)
+            self.assertEqual(len(geometries[1].asPolyline() if geometryType == QgsWkbTypes.LineGeometry
+                                 else geometries[1].asPolygon()[0][:-1]), n)
+            # the next drawing starts empty
+            self.assertEqual(mt.points(), [])
+            click(0.3, 0.3)
+            self.assertEqual(len(mt.points()), 1)
+            mt.reset()
+
+        QgsProject.instance().removeAllMapLayers()
+
     # @unittest.skip('')
     def test_QgsFeatureSelectByRadius(self):
 
@@ -32,6 +32,7 @@ from qps.speclib.core.spectralprofile import decodeProfileValueDict, encodeProfi
 from qps.speclib.processing.aggregateprofiles import AggregateProfiles
 from qps.speclib.processing.exportspectralprofiles import ExportSpectralProfiles
 from qps.speclib.processing.importspectralprofiles import ImportSpectralProfiles
+from qps.speclib.processing.resampleprofiles import ResampleSpectralProfiles
 from qps.testing import ExampleAlgorithmProvider, get_iface, start_app, TestCase, TestObjects
 from qpstestdata import ecosis_csv, asd_with_gps, spectral_evolution_sed, svc_sig
 
@@ -268,6 +269,50 @@ class ProcessingToolsTest(TestCase):
         reg.removeProvider(pid)
         QgsProject.instance().removeAllMapLayers()
 
+    def test_resample_profiles(self):
+        enc = ProfileEncoding.Json
+        sl1: QgsVectorLayer = SpectralLibraryUtils.createSpectralLibrary(
+            name='SL', profile_fields=['profiles'], encoding=enc)
+
+        content = [
+            {'y': [1, 2, 3, 4], 'x': [400, 500, 600, 700], 'xUnit': 'nm'},
+            {'y': [2, 4, 6, 8], 'x': [400, 500, 600, 700], 'xUnit': 'nm'},
+            {'y': [5, 5, 5], 'x': [0.4, 0.5, 0.6], 'xUnit': 'μm'},
+            {'y': [1, 2, 3]},
+        ]
+        with edit(sl1):
+            for c in content:
+                f = QgsFeature(sl1.fields())
+                f.setAttribute('profiles', encodeProfileValueDict(c, enc))
+                self.assertTrue(sl1.addFeature(f))
+
+        parameters = {
+            ResampleSpectralProfiles.P_INPUT: sl1,
+            ResampleSpectralProfiles.P_TARGET_WAVELENGTHS: '450, 550, 800',
+            ResampleSpectralProfiles.P_TARGET_UNIT: 'nm',
+            ResampleSpectralProfiles.P_METHOD: 1,
+            ResampleSpectralProfiles.P_OUTPUT: QgsProcessing.TEMPORARY_OUTPUT,
+        }
+        context, feedback = self.createProcessingContextFeedback()
+        alg = ResampleSpectralProfiles()
+        alg.initAlgorithm({})
+        results, success = alg.run(parameters, context, feedback, {})
+        self.assertTrue(success)
+        sl2 = results[ResampleSpectralProfiles.P_OUTPUT]
+        self.assertIsInstance(sl2, QgsVectorLayer)
+        self.assertEqual(sl2.featureCount(), len(content))
+        self.assertEqual(profile_field_names(sl2), ['profiles'])
+
+        profiles = [decodeProfileValueDict(f['profiles']) for f in sl2.getFeatures()]
+        self.assertEqual(profiles[0]['x'], [450, 550, 800])
+        self.assertEqual(profiles[0]['xUnit'], 'nm')
+        self.assertEqual(profiles[0]['y'][0:2], [1.5, 2.5])
+        self.assertEqual(profiles[1]['y'][0:2], [3.0, 5.0])
+        self.assertEqual(profiles[2]['y'][0:2], [5.0, 5.0])
+        self.assertEqual(profiles[0]['bbl'], [1, 1, 0])
+        self.assertEqual(profiles[3], {})
+        QgsProject.instance().removeAllMapLayers()
+
     @unittest.skipIf(TestCase.runsInCI(), 'Benchmark only. Requires local data')
     def test_spectralprofile_import_many(self):
 
@@ -12,7 +12,7 @@ from qgis.core import edit, Qgis, QgsProcessing, QgsExpression, QgsExpressionCon
     QgsPointXY, QgsProject, QgsProperty, QgsRasterLayer, QgsVectorLayer, QgsWkbTypes, QgsProcessingContext
 from qgis.gui import QgsFieldCalculator
 from qps.qgsfunctions import ExpressionFunctionUtils, Format_Py, HelpStringMaker, RasterArray, RasterProfile, \
-    ReadSpectralProfile, SpectralData, SpectralEncoding, SpectralMath
+    ReadSpectralProfile, SpectralData, SpectralEncoding, SpectralMath, SpectralResample, SpectralResampling
 from qps.speclib.core import profile_fields
 from qps.speclib.core.spectrallibrary import SpectralLibraryUtils
 from qps.speclib.core.spectralprofile import decodeProfileValueDict, isProfileValueDict, ProfileEncoding, \
@@ -322,6 +322,12 @@ class QgsFunctionTests(TestCase):
                 profile_ref = RASTER_ARRAY[:, px.y(), px.x()].tolist()
                 self.assertListEqual(profile1, profile_ref)
 
+                # raster_array_geo returns the pixel center, not the point coordinate
+                geo = context.variable('raster_array_geo')[0]
+                e = lyrR.extent()
+                self.assertAlmostEqual(geo.x(), e.xMinimum() + (px.x() + 0.5) * lyrR.rasterUnitsPerPixelX())
+                self.assertAlmostEqual(geo.y(), e.yMaximum() - (px.y() + 0.5) * lyrR.rasterUnitsPerPixelY())
+
         context = QgsExpressionContext()
         context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(lyrMP))
 
@@ -628,6 +634,64 @@ class QgsFunctionTests(TestCase):
         self.assertTrue(QgsExpression.unregisterFunction(f.name()))
         QgsProject.instance().removeAllMapLayers()
 
+    def test_SpectralResample(self):
+        f = SpectralResample()
+        self.registerFunction(f)
+
+        HM = HelpStringMaker()
+        html = HM.helpText(f.name(), f.parameters())
+        self.assertIsInstance(html, str)
+
+        # resampling with cached response matrices
+        SpectralResampling.clear()
+        x = np.arange(400, 1001, 1.0)
+        Y = np.vstack([np.ones_like(x), x / 100])
+        R = SpectralResampling.resampleArray(Y, x, [450, 550, 2000], [20, 30, 10])
+        self.assertEqual(R.shape, (2, 3))
+        self.assertTrue(np.allclose(R[:, 0:2], [[1, 1], [4.5, 5.5]]))
+        self.assertTrue(np.all(np.isnan(R[:, 2])))
+        self.assertEqual(len(SpectralResampling._MATRICES), 1)
+        SpectralResampling.resampleArray(Y, x, [450, 550, 2000], [20, 30, 10])
+        self.assertEqual(len(SpectralResampling._MATRICES), 1)
+
+        R = SpectralResampling.resampleArray(Y, x, [450.5, 300], method='linear')
+        self.assertTrue(np.allclose(R[:, 0], [1, 4.505]))
+        self.assertTrue(np.all(np.isnan(R[:, 1])))
+
+        # NaN values are excluded
+        Y[1, 450 - 400] = np.nan
+        R = SpectralResampling.resampleArray(Y, x, [450], [20])
+        self.assertTrue(np.isfinite(R).all())
+
+        lyr = QgsRasterLayer(enmap.as_posix(), 'enmap')
+        QgsProject.instance().addMapLayer(lyr)
+
+        sl = TestObjects.createSpectralLibrary(1, n_bands=[20], profile_field_names=['p1'])
+        profileFeature = list(sl.getFeatures())[0]
+        context = QgsExpressionContextUtils.createFeatureBasedContext(profileFeature, profileFeature.fields())
+
+        expressions = {
+            f"{f.NAME}(\"p1\", 'enmap', encoding:='map')": lyr.bandCount(),
+            f"{f.NAME}(\"p1\", '{lyr.id()}', method:='linear')": lyr.bandCount(),
+            f"{f.NAME}(\"p1\", map('x', array(500, 600), 'fwhm', array(10, 10), 'xUnit', 'nm'))": 2,
+        }
+        for e, nb in expressions.items():
+            exp = QgsExpression(e)
+            exp.prepare(context)
+            self.assertEqual(exp.parserErrorString(), '', msg=exp.parserErrorString())
+            result = exp.evaluate(context)
+            self.assertEqual(exp.evalErrorString(), '', msg=exp.evalErrorString())
+            d = decodeProfileValueDict(result)
+            self.assertEqual(len(d['x']), nb)
+            self.assertEqual(len(d['y']), nb)
+
+        exp = QgsExpression(f"{f.NAME}(\"p1\", 'enmap', method:='nearest')")
+        exp.evaluate(context)
+        self.assertNotEqual(exp.evalErrorString(), '')
+
+        self.assertTrue(QgsExpression.unregisterFunction(f.name()))
+        QgsProject.instance().removeAllMapLayers()
+
     def test_Format_Py(self):
         f = Format_Py()
         self.registerFunction(f)
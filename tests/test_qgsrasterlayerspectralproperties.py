@@ -12,7 +12,8 @@ from osgeo import gdal
 from qgis.core import QgsMapLayer, QgsRasterLayer
 from qps import DIR_REPO
 from qps.qgsrasterlayerproperties import QgsRasterLayerSpectralProperties, QgsRasterLayerSpectralPropertiesTable, \
-    QgsRasterLayerSpectralPropertiesTableWidget, SpectralPropertyKeys, SpectralPropertyOrigin, stringToType, GCI_WL_WLU
+    QgsRasterLayerSpectralPropertiesTableWidget, SpectralPropertiesCache, SpectralPropertyKeys, \
+    SpectralPropertyOrigin, stringToType, GCI_WL_WLU
 from qps.testing import start_app, TestCase, TestObjects
 from qps.utils import bandClosestToWavelength, file_search
 from qpstestdata import DIR_WAVELENGTH, envi_bsq
@@ -400,6 +401,47 @@ class TestQgsRasterLayerProperties(TestCase):
         prop4.setWavelengthUnits('um')
         self.assertEqual(prop4.wavelengthUnits(), ['um', 'um'])
 
+    def test_SpectralPropertiesCache(self):
+
+        SpectralPropertiesCache.clear()
+        lyr1 = TestObjects.createRasterLayer(nb=5)
+        lyr2 = QgsRasterLayer(lyr1.source(), 'copy', lyr1.providerType())
+
+        prop = QgsRasterLayerSpectralProperties.fromRasterLayer(lyr1)
+        e1 = SpectralPropertiesCache.entry(lyr1)
+        self.assertIsInstance(e1, SpectralPropertiesCache.Entry)
+        self.assertEqual(e1.wl, prop.wavelengths())
+        self.assertIsInstance(e1.wavelengths, np.ndarray)
+        self.assertEqual(e1.wavelengths.shape, (5,))
+
+        # layers with the same source share the parsed spectral properties
+        e2 = SpectralPropertiesCache.entry(lyr2)
+        self.assertIs(e1, e2)
+
+        d = SpectralPropertiesCache.spectralProperties(lyr1)
+        self.assertEqual(set(d.keys()), {'wl', 'wlu', 'bbl'})
+        d['wl'].clear()
+        self.assertEqual(SpectralPropertiesCache.entry(lyr1).wl, prop.wavelengths())
+
+        ndv = SpectralPropertiesCache.noDataValues(lyr1)
+        self.assertEqual(set(ndv.keys()), {1, 2, 3, 4, 5})
+
+        # custom layer properties overwrite source properties
+        lyr2.setCustomProperty('wavelengths', [1, 2, 3, 4, 5])
+        e3 = SpectralPropertiesCache.entry(lyr2)
+        self.assertIsNot(e1, e3)
+        self.assertEqual(e3.wl, [1, 2, 3, 4, 5])
+
+        # dataChanged invalidates the cached values
+        lyr1.dataChanged.emit()
+        self.assertIsNot(e1, SpectralPropertiesCache.entry(lyr1))
+
+        # the source entry is removed even if the layer record was invalidated before
+        e4 = SpectralPropertiesCache.entry(lyr1)
+        SpectralPropertiesCache.invalidateLayer(lyr1.id())
+        SpectralPropertiesCache.invalidateLayer(lyr1.id(), source=True)
+        self.assertIsNot(e4, SpectralPropertiesCache.entry(lyr1))
+
     def test_QgsRasterLayerSpectralPropertiesTable(self):
         rasterLayer = TestObjects.createRasterLayer()
         properties = QgsRasterLayerSpectralPropertiesTable()
@@ -19,6 +19,7 @@ import random
 import re
 import unittest
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from math import nan
 from typing import Dict
 
@@ -30,14 +31,16 @@ from qps.speclib.core.spectralprofile import decodeProfileValueDict
 from qps.testing import start_app, TestCase, TestObjects
 from qps.unitmodel import UnitLookup
 from qps.utils import (
-    aggregateArray, appendItemsToMenu, createQgsField, defaultBands, displayBandNames, dn,
+    aggregateArray, appendItemsToMenu, CoordinateTransformCache, createQgsField, defaultBands, displayBandNames, dn,
     ExtentTileIterator, fid2pixelindices, file_search, filenameFromString, findMapLayerStores, findParent, gdalDataset,
-    gdalFileSize, geo2px, layerGeoTransform, loadUi, MapGeometryToPixel, nextColor, nodeXmlString, optimize_block_size,
-    osrSpatialReference, parseFWHM, parseWavelength, px2geo, px2geocoordinates, px2spatialPoint, qgsField,
-    qgsRasterLayer, qgsRasterLayers, rasterArray, rasterBlockArray, rasterizeFeatures,
+    gdalFileSize, geo2px, layerGeoTransform, loadUi, MapGeometryToPixel, MapLayerIndex, nextColor, nodeXmlString,
+    optimize_block_size, osrSpatialReference, parseFWHM, parseWavelength, px2geo, px2geocoordinates, px2spatialPoint,
+    qgsField, qgsRasterLayer, qgsRasterLayers, rasterArray, rasterBlockArray, RasterBlockCache, rasterizeFeatures,
+    RasterLayerSnapshot, rasterPixelWindow, rasterPixelWindowExtent, rasterPolygonPixels, rasterTransectPixels,
     relativePath, SelectMapLayerDialog, SelectMapLayersDialog, snapGeoCoordinates, SpatialExtent, SpatialPoint,
-    spatialPoint2px, value2str, writeAsVectorFormat, create_picture_viewer_config, xy_pair_matrix, featureSymbolScope,
-    TemporaryGlobalLayerContext, stringToByteArray, stringFromByteArray)
+    spatialPoint2px, value2str, writeAsVectorFormat, create_picture_viewer_config, xy_pair_groups, xy_pair_matrix,
+    featureSymbolScope,
+    TemporaryGlobalLayerContext, stringToByteArray, stringFromByteArray, transformCoordinateArrays)
 from qpstestdata import enmap, enmap_multipoint, enmap_multipolygon, enmap_pixel, hymap, landcover
 
 from qgis.PyQt.QtCore import NULL, QByteArray, QObject, QPoint, QRect, QUrl
@@ -201,6 +204,44 @@ class TestUtils(TestCase):
         for s in ref:
             self.assertTrue(s in found)
 
+    def test_MapLayerIndex(self):
+
+        store = QgsMapLayerStore()
+        lyrR = TestObjects.createRasterLayer()
+        lyrR.setName('Layer')
+        lyrV = TestObjects.createVectorLayer()
+        lyrV.setName('Layer')
+        store.addMapLayers([lyrR, lyrV])
+
+        self.assertEqual(MapLayerIndex.findLayer(lyrR.id(), stores=[store]), lyrR)
+        self.assertEqual(MapLayerIndex.findLayer(lyrR.source(), stores=[store]), lyrR)
+        self.assertEqual(MapLayerIndex.findLayer('Layer', stores=[store], layerType=QgsRasterLayer), lyrR)
+        self.assertEqual(MapLayerIndex.findLayer('Layer', stores=[store], layerType=QgsVectorLayer), lyrV)
+        self.assertIsNone(MapLayerIndex.findLayer('Layer', stores=[QgsMapLayerStore()]))
+
+        lyrR.setName('Renamed')
+        self.assertEqual(MapLayerIndex.findLayer('Renamed', stores=[store]), lyrR)
+        self.assertIsNone(MapLayerIndex.findLayer('Layer', stores=[store], layerType=QgsRasterLayer))
+
+        lyr2 = TestObjects.createRasterLayer()
+        lyr2.setName('Added')
+        store.addMapLayer(lyr2)
+        self.assertEqual(MapLayerIndex.findLayer('Added', stores=[store]), lyr2)
+
+        lid = lyr2.id()
+        store.removeMapLayer(lyr2)
+        self.assertIsNone(MapLayerIndex.findLayer(lid, stores=[store]))
+        self.assertIsNone(MapLayerIndex.findLayer('Added', stores=[store]))
+
+        # the index neither keeps the store nor its layers alive
+        store2 = QgsMapLayerStore()
+        store2.addMapLayer(TestObjects.createVectorLayer())
+        key = MapLayerIndex.storeKey(store2)
+        self.assertIsInstance(MapLayerIndex.storeIndex(store2), MapLayerIndex.StoreIndex)
+        self.assertIn(key, MapLayerIndex._STORES)
+        del store2
+        self.assertNotIn(key, MapLayerIndex._STORES)
+
     def test_findwavelength(self):
 
         lyr = TestObjects.createRasterLayer()
@@ -387,6 +428,23 @@ class TestUtils(TestCase):
         self.assertTrue(np.array_equal(y_sum, np.asarray([10, 20, 30, 10, 0]), equal_nan=True))
         self.assertTrue(np.array_equal(y_mean, np.asarray([10, 20, 15, 10, np.nan]), equal_nan=True))
 
+    def test_xy_pair_groups(self):
+        p1 = ([1, 2, 3], [10, 20, 10])
+        p2 = {'x': [1, 2, 3], 'y': [None, 20, 30]}
+        p3 = ([3, 2, nan, 3], [1, 2, 3, 4])
+
+        groups = xy_pair_groups([p1, p2, p3])
+        self.assertEqual(len(groups), 2)
+        x, Y = groups[0]
+        self.assertTrue(np.array_equal(x, [1, 2, 3]))
+        self.assertTrue(np.array_equal(Y, [[10, 20, 10], [nan, 20, 30]], equal_nan=True))
+        x, Y = groups[1]
+        self.assertTrue(np.array_equal(x, [2, 3]))
+        self.assertTrue(np.array_equal(Y, [[2, 4]]))
+
+        with self.assertRaises(AssertionError):
+            xy_pair_groups([([1, 2], [1])])
+
     def test_fid2pixelIndices(self):
 
         # create test datasets
@@ -593,6 +651,50 @@ class TestUtils(TestCase):
                     self.assertEqual(profiles.shape, (rl.bandCount(), npx_nat))
                 pass
 
+    def test_MapGeometryToPixel_batch(self):
+        rl = QgsRasterLayer(enmap.as_posix())
+        request = QgsFeatureRequest()
+        request.setDestinationCrs(rl.crs(), QgsProject.instance().transformContext())
+
+        features = []
+        for path in [enmap_multipolygon, enmap_pixel, enmap_multipoint]:
+            vl = QgsVectorLayer(path.as_posix())
+            features.extend(vl.getFeatures(request))
+
+        # a line within a single pixel
+        mg2p = MapGeometryToPixel.fromRaster(rl)
+        c = mg2p.px2geo(10.5, 20.5)
+        line = QgsGeometry.fromPolylineXY([QgsPointXY(c.x() - 1, c.y() - 1), QgsPointXY(c.x() + 1, c.y() + 1)])
+        ay, ax = mg2p.geometryPixelPositions(line)
+        self.assertListEqual(ax.tolist(), [10])
+        self.assertListEqual(ay.tolist(), [20])
+        features.append(line)
+
+        # a line across multiple pixels is walked pixel by pixel, same as rasterized with ALL_TOUCHED
+        p0, p1, p2 = mg2p.px2geo(10.3, 20.2), mg2p.px2geo(14.7, 22.9), mg2p.px2geo(12.6, 25.4)
+        line = QgsGeometry.fromPolylineXY([p0, p1, p2])
+        self.assertIsNotNone(mg2p._fastPixelPositions(line, all_touched=True))
+        self.assertIsNone(mg2p._fastPixelPositions(line, all_touched=False))
+        ay, ax = mg2p.geometryPixelPositions(line, all_touched=True)
+        by, bx = np.where(mg2p._labelRaster([line], True) == 1)
+        self.assertListEqual(ay.tolist(), by.tolist())
+        self.assertListEqual(ax.tolist(), bx.tolist())
+        features.append(line)
+
+        for all_touched in [True, False]:
+            positions = mg2p.geometriesPixelPositions(features, all_touched=all_touched)
+            self.assertEqual(len(positions), len(features))
+            cached = mg2p.mLabelCache[1]
+            mg2p.geometriesPixelPositions(features, all_touched=all_touched)
+            self.assertIs(cached, mg2p.mLabelCache[1])
+            for f, (by, bx) in zip(features, positions):
+                ay, ax = mg2p.geometryPixelPositions(f, all_touched=all_touched)
+                if ay is None:
+                    self.assertIsNone(by)
+                else:
+                    self.assertTrue(np.array_equal(ay, by))
+                    self.assertTrue(np.array_equal(ax, bx))
+
     def test_snapGeoCoordinates(self):
 
         rl = QgsRasterLayer(enmap.as_posix())
@@ -1025,6 +1127,150 @@ class TestUtils(TestCase):
         self.assertEqual(pxCoordinate.y(), 0)
         self.assertAlmostEqual(px2geo(pxCoordinate, gt), geoCoordinateUL + shiftToCenter)
 
+    def test_CoordinateTransformCache(self):
+
+        CoordinateTransformCache.clear()
+        crs1 = QgsCoordinateReferenceSystem('EPSG:4326')
+        crs2 = QgsCoordinateReferenceSystem('EPSG:32633')
+
+        t1 = CoordinateTransformCache.transform(crs1, crs2)
+        t2 = CoordinateTransformCache.transform(crs1, crs2)
+        self.assertEqual(t1.sourceCrs(), crs1)
+        self.assertEqual(t1.destinationCrs(), crs2)
+        self.assertEqual(len(CoordinateTransformCache._CACHE), 1)
+        self.assertIsNot(t1, t2)
+
+        CoordinateTransformCache.transform(crs2, crs1)
+        self.assertEqual(len(CoordinateTransformCache._CACHE), 2)
+
+        x = np.asarray([13.0, 13.5, 14.0])
+        y = np.asarray([52.0, 52.5, 53.0])
+        xt, yt = transformCoordinateArrays(x, y, t1)
+        self.assertEqual(xt.shape, x.shape)
+        for i in range(len(x)):
+            pt = t1.transform(QgsPointXY(x[i], y[i]))
+            self.assertAlmostEqual(pt.x(), xt[i], 4)
+            self.assertAlmostEqual(pt.y(), yt[i], 4)
+
+        xb, yb = transformCoordinateArrays(xt, yt, (crs2, crs1))
+        self.assertTrue(np.allclose(xb, x))
+        self.assertTrue(np.allclose(yb, y))
+
+        x2, y2 = transformCoordinateArrays(x.reshape((3, 1)), y.reshape((3, 1)), t1)
+        self.assertEqual(x2.shape, (3, 1))
+
+    def test_RasterBlockCache(self):
+
+        lyr = TestObjects.createRasterLayer(ns=100, nl=70, nb=3)
+        dp = lyr.dataProvider()
+        RasterBlockCache.clear()
+        RasterBlockCache.setTileSize(32)
+
+        full = rasterArray(dp)
+        window = QRect(20, 10, 50, 40)
+        block = RasterBlockCache.readWindow(lyr, window)
+        self.assertEqual(block.shape, (3, 40, 50))
+        self.assertTrue(np.array_equal(block, full[:, 10:50, 20:70]))
+        self.assertTrue(RasterBlockCache.memoryUsage() > 0)
+
+        px_x = np.asarray([0, 33, 99, 64])
+        px_y = np.asarray([0, 69, 12, 40])
+        values = RasterBlockCache.readPixels(lyr, px_x, px_y)
+        self.assertTrue(np.array_equal(values, full[:, px_y, px_x]))
+        self.assertIsNone(RasterBlockCache.readPixels(lyr, [100], [0]))
+
+        # the window of a rectangle covers the pixels whose centers are inside
+        e = lyr.extent()
+        res = lyr.rasterUnitsPerPixelX()
+        rect = QgsRectangle(e.xMinimum() + 2 * res, e.yMaximum() - 5 * res,
+                            e.xMinimum() + 6.6 * res, e.yMaximum() - 1.2 * res)
+        w = rasterPixelWindow(lyr, rect)
+        self.assertEqual(w, QRect(2, 1, 5, 4))
+        ext = rasterPixelWindowExtent(lyr, w)
+        self.assertAlmostEqual(ext.xMinimum(), e.xMinimum() + 2 * res)
+        self.assertAlmostEqual(ext.yMaximum(), e.yMaximum() - 1 * res)
+
+        pt = QgsRectangle(e.xMinimum() + 3.5 * res, e.yMaximum() - 2.5 * res,
+                          e.xMinimum() + 3.5 * res, e.yMaximum() - 2.5 * res)
+        self.assertEqual(rasterPixelWindow(lyr, pt), QRect(3, 2, 1, 1))
+
+        # least recently used tiles are removed if the memory budget is exceeded
+        budget = RasterBlockCache.memoryBudget()
+        RasterBlockCache.setMemoryBudget(1)
+        self.assertEqual(RasterBlockCache.memoryUsage(), 0)
+        block2 = RasterBlockCache.readWindow(lyr, window)
+        self.assertTrue(np.array_equal(block, block2))
+        RasterBlockCache.setMemoryBudget(budget)
+
+        RasterBlockCache.readWindow(lyr, window)
+        self.assertTrue(RasterBlockCache.memoryUsage() > 0)
+        lyr.dataChanged.emit()
+        self.assertEqual(RasterBlockCache.memoryUsage(), 0)
+
+        # snapshots are read with a data provider owned by the reading thread
+        snapshot = RasterLayerSnapshot(lyr)
+        self.assertEqual(RasterBlockCache.sourceKey(snapshot), RasterBlockCache.sourceKey(lyr))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            block4 = pool.submit(RasterBlockCache.readWindow, snapshot, window).result()
+            provider1 = pool.submit(RasterBlockCache.threadProvider, snapshot).result()
+            provider2 = pool.submit(RasterBlockCache.threadProvider, snapshot).result()
+        self.assertTrue(np.array_equal(block, block4))
+        self.assertIsInstance(provider1, QgsRasterDataProvider)
+        self.assertIs(provider1, provider2, msg='providers are re-used by the same thread')
+
+        # the tile size decreases with the number of bytes per pixel
+        self.assertEqual(RasterBlockCache.tileSize(lyr), 32)
+        tileBytes = RasterBlockCache.tileBytes()
+        RasterBlockCache.setTileBytes(3 * dp.dataTypeSize(1) * 20 * 20)
+        self.assertEqual(RasterBlockCache.tileSize(lyr), 20)
+        block3 = RasterBlockCache.readWindow(lyr, window)
+        self.assertTrue(np.array_equal(block, block3))
+        self.assertTrue(RasterBlockCache.memoryUsage() <= 3 * dp.dataTypeSize(1) * 20 * 20 * 9)
+        RasterBlockCache.setTileBytes(tileBytes)
+
+        RasterBlockCache.setTileSize(256)
+
+    def test_rasterTransectAndPolygonPixels(self):
+
+        lyr = TestObjects.createRasterLayer(ns=100, nl=70, nb=3)
+        e = lyr.extent()
+        res = lyr.rasterUnitsPerPixelX()
+
+        def geo(px: float, py: float) -> QgsPointXY:
+            return QgsPointXY(e.xMinimum() + px * res, e.yMaximum() - py * res)
+
+        # horizontal line from pixel (2, 3) to pixel (9, 3), then down to pixel (9, 6)
+        line = QgsGeometry.fromPolylineXY([geo(2.5, 3.5), geo(9.5, 3.5), geo(9.5, 6.5)])
+        px_x, px_y = rasterTransectPixels(lyr, line)
+        self.assertEqual(px_x.tolist(), list(range(2, 10)) + [9, 9, 9])
+        self.assertEqual(px_y.tolist(), [3] * 8 + [4, 5, 6])
+
+        # diagonal lines return every pixel they touch, including both pixels at a corner crossing
+        line = QgsGeometry.fromPolylineXY([geo(0.5, 0.5), geo(2.5, 2.5)])
+        px_x, px_y = rasterTransectPixels(lyr, line)
+        self.assertEqual(list(zip(px_x.tolist(), px_y.tolist())),
+                         [(0, 0), (1, 0), (0, 1), (1, 1), (2, 1), (1, 2), (2, 2)])
+
+        line = QgsGeometry.fromPolylineXY([geo(0.2, 0.1), geo(3.9, 1.7)])
+        px_x, px_y = rasterTransectPixels(lyr, line)
+        self.assertEqual(list(zip(px_x.tolist(), px_y.tolist())), [(0, 0), (1, 0), (2, 0), (2, 1), (3, 1)])
+
+        # pixels outside the raster are skipped
+        line = QgsGeometry.fromPolylineXY([geo(-5.5, 0.5), geo(1.5, 0.5)])
+        px_x, px_y = rasterTransectPixels(lyr, line)
+        self.assertEqual(px_x.tolist(), [0, 1])
+
+        # pixel centers within a polygon
+        polygon = QgsGeometry.fromRect(QgsRectangle(geo(2, 8), geo(6, 4)))
+        px_x, px_y = rasterPolygonPixels(lyr, polygon)
+        self.assertEqual(len(px_x), 16)
+        self.assertEqual(set(zip(px_x.tolist(), px_y.tolist())),
+                         {(x, y) for x in range(2, 6) for y in range(4, 8)})
+
+        polygon = QgsGeometry.fromRect(QgsRectangle(geo(-10, -10), geo(-5, -5)))
+        px_x, px_y = rasterPolygonPixels(lyr, polygon)
+        self.assertEqual(len(px_x), 0)
+
     def test_createQgsField(self):
 
         values = [1, 2.3, 'text',